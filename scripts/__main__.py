@@ -10,24 +10,16 @@ from model.desired_state import DesiredState
 from model.user_credentials import UserCredentials
 from model.run_config import RunConfig, DeploymentPlatform, ScaleConfig, RepaveConfig
 from model.status import State, get_fresh_state
-from util.env_validation import EnvValidator
+from model.spec_store import SpecStore
 from util.file_helper import FileHelper
 from util.git_helper import Git
 from util.logger_helper import LoggerHelper
-from util.tanzu_utils import TanzuUtils
-from workflows.ra_alb_workflow import RALBWorkflow
-from workflows.ra_mgmt_cluster_workflow import RaMgmtClusterWorkflow
-from workflows.ra_shared_cluster_workflow import RaSharedClusterWorkflow
-from workflows.ra_mgmt_upgrade_workflow import RaMgmtUpgradeWorkflow
-from workflows.ra_shared_cluster_upgrade import RaSharedUpgradeWorkflow
-from workflows.ra_workload_cluster_workflow import RaWorkloadClusterWorkflow
-from workflows.ra_workload_cluster_upgrade import RaWorkloadUpgradeWorkflow
-from workflows.ra_scale_workflow import ScaleWorkflow
-from workflows.ra_repave_workflow import RepaveWorkflow
-from workflows.ra_deploy_ext_workflow import RaDeployExtWorkflow
-from pre_setup.pre_setup import PreSetup
-from util.cleanup_util import CleanUpUtil
-from pre_setup.tkn_docker_img import GenerateTektonDockerImage
+from util.tracing import configure_tracing
+from util.workflow_context import WorkflowContext
+from util.pipeline_dag import DAY0_STAGES, stage_levels, cluster_network, network_lock
+from util.state_merge import merge_state_fragments, merge_kubeconfig_fragments
+
+# Workflow modules pull in the vCenter, NSX-T and AVI clients, commands import only the ones they run
 
 logger = LoggerHelper.get_logger(name="__main__")
 
@@ -55,6 +47,9 @@ def load_scale_config(root_dir):
     scale_config = ScaleConfig(scaledetails=scale_state)
     return scale_config
 
+def load_jsonspec(root_dir):
+    return SpecStore.jsonspec(os.path.join(root_dir, Paths.MASTER_SPEC_PATH))
+
 def load_repave_config(root_dir):
     repave_file_path = os.path.join(root_dir, Paths.REPAVE_PATH)
     repave_state = FileHelper.load_repave(repave_file_path)
@@ -67,6 +62,7 @@ def load_repave_config(root_dir):
 def cli(ctx, root_dir):
     ctx.ensure_object(dict)
     ctx.obj["ROOT_DIR"] = root_dir
+    configure_tracing(root_dir, ctx.invoked_subcommand or "cli")
 
     deployment_config_filepath = os.path.join(ctx.obj["ROOT_DIR"], Paths.MASTER_SPEC_PATH)
     # file_linker(json_spec_path, deployment_config_filepath)
@@ -83,6 +79,7 @@ def tkn_docker(ctx):
 @tkn_docker.command(name="build")
 @click.pass_context
 def build_docker(ctx):
+    from pre_setup.tkn_docker_img import GenerateTektonDockerImage
     run_config = load_run_config(ctx.obj["ROOT_DIR"])
     GenerateTektonDockerImage(root_dir=ctx.obj["ROOT_DIR"], run_config=run_config).generate_tkn_docker_image()
 
@@ -95,6 +92,8 @@ def avi(ctx):
 @avi.command(name="deploy")
 @click.pass_context
 def avi_deploy(ctx):
+    from pre_setup.pre_setup import PreSetup
+    from workflows.ra_alb_workflow import RALBWorkflow
     run_config = load_run_config(ctx.obj["ROOT_DIR"])
     pre_setup_obj = PreSetup(root_dir=ctx.obj["ROOT_DIR"], run_config=run_config)
     result_dict, msg = pre_setup_obj.pre_check_avi()
@@ -119,9 +118,11 @@ def mgmt(ctx):
 @mgmt.command(name="deploy")
 @click.pass_context
 def mgmt_deploy(ctx):
+    from pre_setup.pre_setup import PreSetup
+    from workflows.ra_mgmt_cluster_workflow import RaMgmtClusterWorkflow
     run_config = load_run_config(ctx.obj["ROOT_DIR"])
     pre_setup_obj = PreSetup(root_dir=ctx.obj["ROOT_DIR"], run_config=run_config)
-    cleanup_obj = CleanUpUtil()
+    cleanup_obj = WorkflowContext.of(run_config).cleanup_util()
     result_dict, msg = pre_setup_obj.pre_check_mgmt()
     if not result_dict["mgmt"]["deployed"]:
         logger.warning(msg)
@@ -137,6 +138,8 @@ def mgmt_deploy(ctx):
 @mgmt.command(name="enable-wcp")
 @click.pass_context
 def enable_wcp(ctx):
+    from pre_setup.pre_setup import PreSetup
+    from workflows.ra_mgmt_cluster_workflow import RaMgmtClusterWorkflow
     run_config = load_run_config(ctx.obj["ROOT_DIR"])
     pre_setup_obj = PreSetup(root_dir=ctx.obj["ROOT_DIR"], run_config=run_config)
     result_dict, msg = pre_setup_obj.pre_check_enable_wcp()
@@ -151,6 +154,7 @@ def enable_wcp(ctx):
 @mgmt.command(name="upgrade")
 @click.pass_context
 def mgmt_upgrade(ctx):
+    from workflows.ra_mgmt_upgrade_workflow import RaMgmtUpgradeWorkflow
     run_config = load_run_config(ctx.obj["ROOT_DIR"])
     RaMgmtUpgradeWorkflow(run_config).upgrade_workflow()
 
@@ -164,17 +168,22 @@ def shared_services(ctx):
 @shared_services.command(name="deploy-cluster")
 @click.pass_context
 def ss_cluster_deploy(ctx):
+    from pre_setup.pre_setup import PreSetup
+    from workflows.ra_shared_cluster_workflow import RaSharedClusterWorkflow
     run_config = load_run_config(ctx.obj["ROOT_DIR"])
     pre_setup_obj = PreSetup(root_dir=ctx.obj["ROOT_DIR"], run_config=run_config)
-    cleanup_obj = CleanUpUtil()
+    cleanup_obj = WorkflowContext.of(run_config).cleanup_util()
     result_dict, msg = pre_setup_obj.pre_check_shrd()
+    network = cluster_network(load_jsonspec(ctx.obj["ROOT_DIR"]), "shared-services")
     if not result_dict["shared_services"]["deployed"]:
         logger.warning(msg)
-        RaSharedClusterWorkflow(run_config).deploy()
+        with network_lock(ctx.obj["ROOT_DIR"], network):
+            RaSharedClusterWorkflow(run_config).deploy()
     elif "UP" not in result_dict["shared_services"]["health"]:
         logger.warning(msg)
-        cleanup_obj.delete_cluster(result_dict["name"])
-        RaSharedClusterWorkflow(run_config).deploy()
+        with network_lock(ctx.obj["ROOT_DIR"], network):
+            cleanup_obj.delete_cluster(result_dict["name"])
+            RaSharedClusterWorkflow(run_config).deploy()
     else:
         logger.info(msg)
         logger.debug(result_dict)
@@ -183,6 +192,7 @@ def ss_cluster_deploy(ctx):
 @shared_services.command(name="upgrade")
 @click.pass_context
 def ss_cluster_upgrade(ctx):
+    from workflows.ra_shared_cluster_upgrade import RaSharedUpgradeWorkflow
     run_config = load_run_config(ctx.obj["ROOT_DIR"])
     RaSharedUpgradeWorkflow(run_config).upgrade_workflow()
 
@@ -195,36 +205,55 @@ def workload_clusters(ctx):
 @workload_clusters.command(name="deploy")
 @click.pass_context
 def wl_deploy(ctx):
+    from pre_setup.pre_setup import PreSetup
+    from workflows.ra_workload_cluster_workflow import RaWorkloadClusterWorkflow
     run_config = load_run_config(ctx.obj["ROOT_DIR"])
     pre_setup_obj = PreSetup(root_dir=ctx.obj["ROOT_DIR"], run_config=run_config)
-    cleanup_obj = CleanUpUtil()
+    cleanup_obj = WorkflowContext.of(run_config).cleanup_util()
     result_dict, msg = pre_setup_obj.pre_check_wrkld()
+    network = cluster_network(load_jsonspec(ctx.obj["ROOT_DIR"]), "workload")
     if not result_dict["workload_clusters"]["deployed"]:
         logger.warning(msg)
-        RaWorkloadClusterWorkflow(run_config).deploy()
+        with network_lock(ctx.obj["ROOT_DIR"], network):
+            RaWorkloadClusterWorkflow(run_config).deploy()
     elif "UP" not in result_dict["workload_clusters"]["health"]:
         logger.warning(msg)
-        cleanup_obj.delete_cluster(result_dict["name"])
-        RaWorkloadClusterWorkflow(run_config).deploy()
+        with network_lock(ctx.obj["ROOT_DIR"], network):
+            cleanup_obj.delete_cluster(result_dict["name"])
+            RaWorkloadClusterWorkflow(run_config).deploy()
     else:
         logger.info(msg)
         logger.debug(result_dict)
 
+@workload_clusters.command(name="deploy-all")
+@click.option("--workers", default=4, show_default=True, help="Clusters deployed at the same time")
+@click.pass_context
+def wl_deploy_all(ctx, workers):
+    """Deploy every cluster of tkgWorkloadClusters concurrently"""
+    from workflows.ra_workload_fanout_workflow import RaWorkloadFanoutWorkflow
+    run_config = load_run_config(ctx.obj["ROOT_DIR"])
+    results = RaWorkloadFanoutWorkflow(run_config, workers=workers).deploy_all()
+    if any(health != "UP" for health in results.values()):
+        raise click.exceptions.Exit(1)
+
 @workload_clusters.command(name="upgrade")
 @click.pass_context
 def wl_upgrade(ctx):
+    from workflows.ra_workload_cluster_upgrade import RaWorkloadUpgradeWorkflow
     run_config = load_run_config(ctx.obj["ROOT_DIR"])
     RaWorkloadUpgradeWorkflow(run_config).upgrade_workflow()
 
 @workload_clusters.command(name="tkgs-wld-setup")
 @click.pass_context
 def tkgs_workload(ctx):
+    from workflows.ra_workload_cluster_workflow import RaWorkloadClusterWorkflow
     run_config = load_run_config(ctx.obj["ROOT_DIR"])
     RaWorkloadClusterWorkflow(run_config).create_workload()
 
 @workload_clusters.command(name="tkgs-wld-ns-setup")
 @click.pass_context
 def tkgs_namespace(ctx):
+    from workflows.ra_workload_cluster_workflow import RaWorkloadClusterWorkflow
     run_config = load_run_config(ctx.obj["ROOT_DIR"])
     RaWorkloadClusterWorkflow(run_config).create_name_space()
 
@@ -236,20 +265,78 @@ def extns(ctx):
 @extns.command(name="deploy")
 @click.pass_context
 def extns_deploy(ctx):
+    from workflows.ra_deploy_ext_workflow import RaDeployExtWorkflow
     run_config = load_run_config(ctx.obj["ROOT_DIR"])
     RaDeployExtWorkflow(run_config).deploy_tkg_extensions()
 
 @extns.command(name="upgrade")
 @click.pass_context
 def extns_upgrade(ctx):
+    from workflows.ra_deploy_ext_workflow import RaDeployExtWorkflow
     run_config = load_run_config(ctx.obj["ROOT_DIR"])
     Upgrade_Extensions.UPGRADE_EXTN = True
     RaDeployExtWorkflow(run_config).deploy_tkg_extensions()
 
 
+@cli.group()
+@click.pass_context
+def state(ctx):
+    ctx.ensure_object(dict)
+
+@state.command(name="merge")
+@click.pass_context
+def state_merge(ctx):
+    """Fold the state and kubeconfig fragments of parallel tasks back into the workspace"""
+    merge_state_fragments(ctx.obj["ROOT_DIR"])
+    merge_kubeconfig_fragments(ctx.obj["ROOT_DIR"])
+
+@state.command(name="reset-checkpoints")
+@click.argument("scope")
+@click.argument("steps", nargs=-1)
+@click.pass_context
+def state_reset_checkpoints(ctx, scope, steps):
+    """Forget completed steps of a workflow scope (avi, mgmt) so the next run repeats them"""
+    from util.checkpoint import Checkpoints
+    Checkpoints(ctx.obj["ROOT_DIR"], scope).reset(*steps)
+
+@cli.group()
+@click.pass_context
+def pipeline(ctx):
+    ctx.ensure_object(dict)
+
+@pipeline.command(name="dag")
+@click.pass_context
+def pipeline_dag(ctx):
+    """Print the day 0 stages grouped by what can run in parallel"""
+    for i, level in enumerate(stage_levels()):
+        click.echo(f"{i}: " + ", ".join(f"{name} ({DAY0_STAGES[name]['command']})" for name in level))
+    try:
+        jsonspec = load_jsonspec(ctx.obj["ROOT_DIR"])
+    except (OSError, ValueError):
+        return
+    networks = [cluster_network(jsonspec, name) for name in DAY0_STAGES if DAY0_STAGES[name].get("parallel")]
+    if len(set(networks)) < len(networks):
+        click.echo("Shared services and workload clusters use the same network, they will deploy one after the other")
+
+@cli.command(name="reconcile")
+@click.option("--dry-run", is_flag=True, default=False, help="Only print the objects that are missing or drifted")
+@click.pass_context
+def reconcile(ctx, dry_run):
+    """Diff the spec against the deployed stack and re-run only the day 0 steps that are out of sync"""
+    from workflows.ra_reconcile_workflow import RaReconcileWorkflow
+    run_config = load_run_config(ctx.obj["ROOT_DIR"])
+    workflow = RaReconcileWorkflow(run_config)
+    for step, resource, status, reason in workflow.plan():
+        click.echo(f"{step}: {resource} {status}" + (f" ({reason})" if reason else ""))
+    msg, status = workflow.reconcile(dry_run=dry_run)
+    click.echo(msg)
+    if status != 200:
+        raise click.exceptions.Exit(1)
+
 @cli.command(name="execute-scale")
 @click.pass_context
 def scale_op(ctx):
+    from workflows.ra_scale_workflow import ScaleWorkflow
     run_config = load_run_config(ctx.obj["ROOT_DIR"])
     scale_config = load_scale_config(ctx.obj["ROOT_DIR"])
     ScaleWorkflow(run_config, scale_config).execute_scale()
@@ -257,6 +344,7 @@ def scale_op(ctx):
 @cli.command(name="execute-repave")
 @click.pass_context
 def repave_op(ctx):
+    from workflows.ra_repave_workflow import RepaveWorkflow
     run_config = load_run_config(ctx.obj["ROOT_DIR"])
     repave_config = load_repave_config(ctx.obj["ROOT_DIR"])
     RepaveWorkflow(run_config, repave_config).execute_repave()
@@ -265,6 +353,7 @@ def repave_op(ctx):
 @cli.command(name="pull-kubeconfig")
 @click.pass_context
 def pull_kubeconfig(ctx):
+    from util.tanzu_utils import TanzuUtils
     TanzuUtils(ctx.obj["ROOT_DIR"]).pull_config()
 
 
@@ -317,6 +406,7 @@ def validate_spec(ctx):
 @cli.command(name="prepare-env")
 @click.pass_context
 def validate(ctx):
+    from util.env_validation import EnvValidator
     root_dir = ctx.obj["ROOT_DIR"]
     EnvValidator(root_dir).prepare_env()
 
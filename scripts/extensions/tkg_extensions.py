@@ -38,14 +38,15 @@ class deploy_tkg_extensions():
         logger.info("Deploying extentions: {}".format(self.extension_name))
 
     def deploy(self, extention):       
+        # dispatch on the argument, extensions are deployed from several threads at once
         self.extension_name = extention
-        if str(self.extension_name).__contains__("Fluent"):
-            status = self.fluent_bit(self.extension_name)
+        if str(extention).__contains__("Fluent"):
+            status = self.fluent_bit(extention)
             return status[0], status[1]
-        elif str(self.extension_name) == Tkg_Extention_names.GRAFANA:
+        elif str(extention) == Tkg_Extention_names.GRAFANA:
             status = self.grafana()
             return status[0], status[1]
-        elif str(self.extension_name) == Tkg_Extention_names.PROMETHEUS:
+        elif str(extention) == Tkg_Extention_names.PROMETHEUS:
             status = self.prometheus()
             return status[0], status[1]
 
@@ -14,7 +14,7 @@ from constants.constants import Tkgs_Extension_Details, RegexPattern, Tkg_Extent
     AppName, Paths
 from util.common_utils import getVersionOfPackage,\
      checkToEnabled, installExtentionFor14, checkRepositoryAdded, \
-    checkTmcEnabled, waitForGrepProcessWithoutChangeDir, connect_to_workload, isClusterRunning, \
+    checkTmcEnabled, waitForPackageReconciled, connect_to_workload, isClusterRunning, \
      deploy_fluent_bit, checkFluentBitInstalled, fluent_bit_enabled, getClusterID, configureKubectl, createClusterFolder
 
 
@@ -22,8 +22,12 @@ from util.extensions_helper import checkTanzuExtensionEnabled, checkPromethusEna
 from .tkg_extensions import generateYamlFile, getRepo
 
 from util.shared_config import certChanging
+from util.extension_scheduler import ExtensionScheduler
+from lib.kube_context import default_kubeconfig
+from util.vcenter_session import VcenterRestSession, vcenter_request
 
 from util.logger_helper import LoggerHelper, log
+from model.spec_store import decode_secret
 
 logger = LoggerHelper.get_logger(Path(__file__).stem)
 
@@ -46,24 +50,19 @@ def deploy_tkgs_extensions(jsonspec):
             #env="vpshere"
             vcenter_ip = jsonspec['envSpec']['vcenterDetails']['vcenterAddress']
             vcenter_username = jsonspec['envSpec']['vcenterDetails']['vcenterSsoUser']
-            str_enc = str(jsonspec['envSpec']['vcenterDetails']["vcenterSsoPasswordBase64"])
-            base64_bytes = str_enc.encode('ascii')
-            enc_bytes = base64.b64decode(base64_bytes)
-            password = enc_bytes.decode('ascii').rstrip("\n")
+            password = decode_secret(jsonspec['envSpec']['vcenterDetails']["vcenterSsoPasswordBase64"])
             cluster = jsonspec["envSpec"]["vcenterDetails"]["vcenterCluster"]
 
             # Code added to configure KubeCtl
             url_ = "https://" + vcenter_ip + "/"
-            sess = requests.post(url_ + "rest/com/vmware/cis/session", auth=(vcenter_username, password), verify=False)
-            if sess.status_code != 200:
+            session_id = VcenterRestSession.get(vcenter_ip, vcenter_username, password).session_id
+            if session_id is None:
                 d = {
                     "responseType": "ERROR",
                     "msg": "Failed to fetch session ID for vCenter - " + vcenter_ip,
                     "ERROR_CODE": 500
                 }
                 return json.dumps(d), 500
-            else:
-                session_id = sess.json()['value']
             header = {
                 "Accept": "application/json",
                 "Content-Type": "application/json",
@@ -72,9 +71,9 @@ def deploy_tkgs_extensions(jsonspec):
             id = getClusterID(vcenter_ip, vcenter_username, password, cluster, jsonspec)
             if id[1] != 200:
                 return None, id[0]
-            clusterip_resp = requests.get(url_ + "api/vcenter/namespace-management/clusters/" + str(id[0]),
-                                          verify=False,
-                                          headers=header)
+            clusterip_resp = vcenter_request("GET", url_ + "api/vcenter/namespace-management/clusters/" + str(id[0]),
+                                             verify=False,
+                                             headers=header)
             if clusterip_resp.status_code != 200:
                 d = {
                     "responseType": "ERROR",
@@ -383,29 +382,26 @@ def configurePackagesRepository(jsonspec):
 def deploy_extensions(cluster_name, jsonspec):
     try:
         listOfExtention = []
-        service = "all"
-        repo_address = Repo.PUBLIC_REPO
         checkHarborEnabled = jsonspec['tanzuExtensions']['harborSpec']['enableHarborExtension']
 
         if checkPromethusEnabled(jsonspec):
             listOfExtention.append(Tkg_Extention_names.PROMETHEUS)
             listOfExtention.append(Tkg_Extention_names.GRAFANA)
 
-        status = tkgsCertManagerandContour(cluster_name, service, jsonspec)
-        #status = json.loads(status[0]), status[1]
-        if status[1] != 200:
+        status_ = checkRepositoryAdded(jsonspec)
+        if status_[1] != 200:
             d = {
                 "responseType": "ERROR",
-                "msg": "Failed to deploy extension" + str(status[0]),
+                "msg": "Failed to deploy extension" + str(status_[0]),
                 "ERROR_CODE": 500
             }
             return json.dumps(d), 500
+        # kubectl vsphere login of the precheck added the guest cluster context to the default kubeconfig
+        scheduler = ExtensionScheduler(cluster_name, kubeconfig=default_kubeconfig(), context=cluster_name)
+        scheduler.add(AppName.CERT_MANAGER, lambda: installExtentionFor14("certmanager", cluster_name, jsonspec))
+        scheduler.add(AppName.CONTOUR, lambda: installExtentionFor14("ingress", cluster_name, jsonspec))
         if str(checkHarborEnabled).lower() == "true":
-            logger.info("Installing harbor...")
-            str_enc = str(jsonspec['tanzuExtensions']['harborSpec']['harborPasswordBase64'])
-            base64_bytes = str_enc.encode('ascii')
-            enc_bytes = base64.b64decode(base64_bytes)
-            password = enc_bytes.decode('ascii').rstrip("\n")
+            password = decode_secret(jsonspec['tanzuExtensions']['harborSpec']['harborPasswordBase64'])
             harborPassword = password
             host = jsonspec['tanzuExtensions']['harborSpec']['harborFqdn']
             harborCertPath = jsonspec['tanzuExtensions']['harborSpec']['harborCertPath']
@@ -420,49 +416,19 @@ def deploy_extensions(cluster_name, jsonspec):
                     "ERROR_CODE": 500
                 }
                 return json.dumps(d), 500
-            state = installHarborTkgs(harborCertPath, harborCertKeyPath, harborPassword, host, cluster_name)
-            #state = json.loads(state[0]), state[1]
-            if state[1] != 200:
-                d = {
-                    "responseType": "ERROR",
-                    "msg": state[0],
-                    "ERROR_CODE": 500
-                }
-                return json.dumps(d), 500
-            else:
-                logger.info(state[0])
+            scheduler.add(AppName.HARBOR, lambda: installHarborTkgs(harborCertPath, harborCertKeyPath, harborPassword,
+                                                                    host, cluster_name))
 
         #to_enable = jsonspec["envSpec"]["saasEndpoints"]["tanzuObservabilityDetails"]["tanzuObservabilityAvailability"]
         if checkToEnabled(jsonspec):
             logger.info("Tanzu observability is enabled, skipping prometheus and grafana deployment")
-            '''d = {
-                "responseType": "ERROR",
-                "msg": "Tanzu observability is enabled, skipping prometheus and grafana deployment",
-                "ERROR_CODE": 200
-            }
-            return json.dumps(d), 200'''
+        elif len(listOfExtention) == 0:
+            logger.info("Prometheus and Grafana are disabled")
         else:
-            if len(listOfExtention) == 0:
-                logger.info("Prometheus and Grafana are disabled")
-                '''d = {
-                    "responseType": "SUCCESS",
-                    "msg": "Prometheus and Grafana are disabled",
-                    "ERROR_CODE": 200
-                }
-                return json.dumps(d), 200'''
-            else:
-                for extension_name in listOfExtention:
-                    monitor_status = deploy_monitoring_extentions(extension_name, cluster_name, jsonspec)
-                    monitor_status = json.loads(monitor_status[0]), monitor_status[1]
-                    if monitor_status[1] != 200:
-                        logger.error(monitor_status[0])
-                        d = {
-                            "responseType": "ERROR",
-                            "msg": monitor_status[0],
-                            "ERROR_CODE": 500
-                        }
-                        return json.dumps(d), 500
-                    logger.info("Extension - " + extension_name + " deployed successfully")
+            scheduler.add(AppName.PROMETHUS, lambda: deploy_monitoring_extentions(Tkg_Extention_names.PROMETHEUS,
+                                                                                  cluster_name, jsonspec))
+            scheduler.add(AppName.GRAFANA, lambda: deploy_monitoring_extentions(Tkg_Extention_names.GRAFANA,
+                                                                                cluster_name, jsonspec))
 
         is_enabled = fluent_bit_enabled(jsonspec)
         if is_enabled[0]:
@@ -470,28 +436,13 @@ def deploy_extensions(cluster_name, jsonspec):
             if not is_deployed[0]:
                 end_point = is_enabled[1]
                 workload_cluster = jsonspec['tanzuExtensions']['tkgClustersName']
-                response = deploy_fluent_bit(end_point, workload_cluster, jsonspec)
-                response = json.loads(response[0]), response[1]
-                if response[1] != 200:
-                    logger.error(response[0])
-                    d = {
-                        "responseType": "ERROR",
-                        "msg": response[0],
-                        "ERROR_CODE": 500
-                    }
-                    return json.dumps(d), 500
-                logger.info("Fluent-bit deployed successfully")
+                scheduler.add(AppName.FLUENT_BIT, lambda: deploy_fluent_bit(end_point, workload_cluster, jsonspec))
             else:
                 logger.info("Fluent-bit is already deployed and its status is - " + is_deployed[1])
         else:
             logger.info("Fluent-bit deployment is not enabled. Hence, skipping it.")
 
-        d = {
-            "responseType": "SUCCESS",
-            "msg": "Extensions deployed successfully",
-            "ERROR_CODE": 200
-        }
-        return json.dumps(d), 200
+        return scheduler.run()
 
     except Exception as e:
         logger.error(str(e))
@@ -930,8 +881,7 @@ def installHarborTkgs(harborCertPath, harborCertKeyPath, harborPassword, host, c
             logger.info("Applying overlay and re-checking...")
 
         logger.info("Waiting for harbor installation to complete post pods re-creation...")
-        state = waitForGrepProcessWithoutChangeDir(main_command, sub_command, AppName.HARBOR,
-                                                   RegexPattern.RECONCILE_SUCCEEDED)
+        state = waitForPackageReconciled(AppName.HARBOR)
         #state = json.loads(state[0]), state[1]
         if state[1] != 200:
             logger.info("Harbor Deployment Failed.")
@@ -0,0 +1,248 @@
+#  Copyright 2022 VMware, Inc
+#  SPDX-License-Identifier: BSD-2-Clause
+
+import os
+import re
+import tempfile
+import threading
+from pathlib import Path
+
+import yaml
+from yaml.loader import SafeLoader
+
+from constants.constants import Paths
+from util import command_engine
+from util.logger_helper import LoggerHelper
+from util.ShellHelper import runShellCommandAndReturnOutputAsList
+
+logger = LoggerHelper.get_logger(Path(__file__).stem)
+
+KUBECONFIGS_DIR = "kubeconfigs"
+
+_bound = threading.local()
+
+
+def default_kubeconfig():
+    return os.environ.get("KUBECONFIG", "").split(os.pathsep)[0] or os.path.expanduser("~/.kube/config")
+
+
+def bound_kubeconfig():
+    """
+    :return: (kubeconfig, context) the calling thread was switched to, (None, None) when it runs
+             against the default kubeconfig
+    """
+    return getattr(_bound, "target", None) or (None, None)
+
+
+def _bind(kubeconfig, context):
+    _bound.target = (kubeconfig, context) if kubeconfig else None
+    command_engine.set_thread_env(KUBECONFIG=kubeconfig)
+
+
+def admin_context(cluster):
+    return cluster + "-admin@" + cluster
+
+
+def _load(path):
+    if not os.path.exists(path):
+        return dict()
+    with open(path) as f:
+        return yaml.load(f, Loader=SafeLoader) or dict()
+
+
+def _dump(config, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".config", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            yaml.safe_dump(config, f, default_flow_style=False)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _upsert(entries, entry):
+    """
+    Replace the entry with the same name, append it when there is none
+    :return: True when the list changed
+    """
+    for index, existing in enumerate(entries):
+        if existing.get("name") == entry.get("name"):
+            if existing == entry:
+                return False
+            entries[index] = entry
+            return True
+    entries.append(entry)
+    return True
+
+
+class KubeContexts:
+    """
+    Admin kubeconfigs of the clusters, exported once per process with
+    `tanzu [management-]cluster kubeconfig get <cluster> --admin --export-file` under
+    .tmp/kubeconfigs/<pid>, so parallel processes never export over each other. kubectl runs against a cluster with an explicit --kubeconfig/--context,
+    so operations on different clusters do not depend on the current-context of ~/.kube/config.
+    """
+
+    _instance = None
+    _instance_lock = threading.Lock()
+
+    def __init__(self, cache_dir=None):
+        self.cache_dir = os.path.abspath(cache_dir or os.path.join(Paths.TMP_DIR, KUBECONFIGS_DIR, str(os.getpid())))
+        self._configs = dict()
+        self._lock = threading.Lock()
+        self._default_lock = threading.Lock()
+
+    @classmethod
+    def get(cls):
+        with cls._instance_lock:
+            if cls._instance is None:
+                cls._instance = KubeContexts()
+            return cls._instance
+
+    def admin_kubeconfig(self, cluster, management=False, namespace=None):
+        """
+        :return: (kubeconfig path, context name), (None, error msg) when the export failed
+        """
+        key = (cluster, management, namespace)
+        with self._lock:
+            if key in self._configs:
+                return self._configs[key]
+            path = os.path.join(self.cache_dir, ("mgmt-" if management else "") + cluster + ".yaml")
+            os.makedirs(self.cache_dir, exist_ok=True)
+            command = ["tanzu", "management-cluster" if management else "cluster", "kubeconfig", "get", cluster,
+                       "--admin", "--export-file", path]
+            if namespace:
+                command.extend(["-n", namespace])
+            output = runShellCommandAndReturnOutputAsList(command)
+            if output[1] != 0 or not os.path.exists(path):
+                logger.error("Failed to get admin kubeconfig of cluster " + cluster + " " + str(output[0]))
+                return None, "Failed get admin cluster context of cluster " + cluster + " " + str(output[0])
+            context = _load(path).get("current-context") or admin_context(cluster)
+            self._configs[key] = (path, context)
+            logger.info("Exported admin kubeconfig of cluster " + cluster + " to " + path)
+            return self._configs[key]
+
+    def forget(self, cluster=None):
+        """
+        Drop the cached kubeconfig of a cluster that was deleted or re-created, of every cluster
+        when cluster is None
+        """
+        with self._lock:
+            for key in [key for key in self._configs if cluster is None or key[0] == cluster]:
+                path = self._configs.pop(key)[0]
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def args(self, cluster, management=False, namespace=None):
+        """
+        :return: --kubeconfig/--context arguments selecting the cluster, None when the export failed
+        """
+        path, context = self.admin_kubeconfig(cluster, management, namespace)
+        if path is None:
+            return None
+        return ["--kubeconfig", path, "--context", context]
+
+    def kubectl(self, cluster, args, management=False, namespace=None):
+        """
+        Run kubectl against the cluster without touching the current-context
+        :return: (output lines, return code)
+        """
+        selector = self.args(cluster, management, namespace)
+        if selector is None:
+            return ["Failed get admin cluster context of cluster " + cluster], 1
+        return runShellCommandAndReturnOutputAsList(["kubectl"] + selector + list(args))
+
+    def use(self, cluster, management=False, namespace=None):
+        """
+        Run the commands of the calling thread against the cluster, for the tanzu CLI and the
+        kubectl commands that name no context. The thread is bound to the cached admin export,
+        other threads and the current-context of the default kubeconfig are left alone. The
+        contexts of the export are also added to the default kubeconfig.
+        :return: (context name, msg), (None, error msg) when the export failed
+        """
+        path, context = self.admin_kubeconfig(cluster, management, namespace)
+        if path is None:
+            return None, context
+        try:
+            self._merge_default(_load(path))
+        except Exception as e:
+            logger.error("Failed to switch to " + cluster + " cluster context " + str(e))
+            return None, "Failed to switch to " + cluster + " cluster context " + str(e)
+        _bind(path, context)
+        logger.info("Switched to " + cluster + " context")
+        return context, "Switched to " + cluster + " context"
+
+    def use_context(self, context):
+        """
+        Run the commands of the calling thread against a context of the default kubeconfig
+        :return: (context name, msg), (None, error msg) when the context is not there
+        """
+        return self.bind(default_kubeconfig(), context)
+
+    def bind(self, kubeconfig, context):
+        """
+        Run the commands of the calling thread against a context of kubeconfig. When it is not
+        the current-context of the file, the context is extracted into a kubeconfig of its own.
+        :return: (context name, msg), (None, error msg) when the context is not there
+        """
+        try:
+            config = _load(kubeconfig)
+            if config.get("current-context") != context:
+                kubeconfig = self._extract(config, context)
+        except Exception as e:
+            logger.error("Failed to switch to context " + context + " " + str(e))
+            return None, "Failed to switch to context " + context + " " + str(e)
+        _bind(kubeconfig, context)
+        return context, "Switched to " + context + " context"
+
+    def release(self):
+        """
+        Run the commands of the calling thread against the default kubeconfig again, e.g. before
+        kubectl vsphere login adds its contexts to it
+        """
+        _bind(None, None)
+
+    def _extract(self, config, context):
+        """
+        :return: path of a kubeconfig holding only the context, its cluster and user
+        """
+        entry = next((c for c in config.get("contexts") or [] if c.get("name") == context), None)
+        if entry is None:
+            raise Exception("context " + context + " not found in kubeconfig")
+        details = entry.get("context") or dict()
+        extracted = {
+            "apiVersion": "v1",
+            "kind": "Config",
+            "clusters": [c for c in config.get("clusters") or [] if c.get("name") == details.get("cluster")],
+            "users": [u for u in config.get("users") or [] if u.get("name") == details.get("user")],
+            "contexts": [entry],
+            "current-context": context
+        }
+        path = os.path.join(self.cache_dir, "context-" + re.sub(r"[^A-Za-z0-9_.-]", "_", context) + ".yaml")
+        with self._default_lock:
+            if _load(path) != extracted:
+                _dump(extracted, path)
+        return path
+
+    def _merge_default(self, exported):
+        """
+        Upsert the clusters, users and contexts of an exported kubeconfig into the default
+        kubeconfig, its current-context is never changed. The file is rewritten only when
+        something changed.
+        """
+        with self._default_lock:
+            target = default_kubeconfig()
+            config = _load(target)
+            changed = not config
+            config.setdefault("apiVersion", "v1")
+            config.setdefault("kind", "Config")
+            for section in ["clusters", "users", "contexts"]:
+                entries = config.get(section) or []
+                config[section] = entries
+                for entry in exported.get(section) or []:
+                    changed = _upsert(entries, entry) or changed
+            if changed:
+                _dump(config, target)
@@ -1,7 +1,7 @@
 #  Copyright 2021 VMware, Inc
 #  SPDX-License-Identifier: BSD-2-Clause
 
-import time
+import os
 from pathlib import Path
 
 import yaml
@@ -10,6 +10,8 @@ from util.cmd_helper import CmdHelper
 from util.logger_helper import LoggerHelper, log, log_debug
 from util.ssh_helper import SshHelper
 from util.cmd_runner import RunCmd
+from lib.kube_context import KubeContexts, admin_context, bound_kubeconfig
+from lib.kubectl_watch import wait_for_ready_nodes
 
 logger = LoggerHelper.get_logger(Path(__file__).stem)
 
@@ -17,38 +19,58 @@ logger = LoggerHelper.get_logger(Path(__file__).stem)
 class KubectlClient:
     def __init__(self):
         self.rcmd = RunCmd()
+        self.kubeconfig = None
+        self.context = None
 
     def set_cluster_context(self, cluster_name):
+        """
+        Bind the client to the admin context of the cluster, the kubectl commands of the client run
+        with a KUBECONFIG whose current-context is that context. The calling thread is switched to
+        it too, for the tanzu commands that follow.
+        """
         logger.info(f"Setting kubectl context to {cluster_name} cluster")
-        set_kubectl_context = KubectlCommands.SET_KUBECTL_CONTEXT.format(cluster=cluster_name)
-        return self.rcmd.run_cmd_only(set_kubectl_context)
+        context, msg = KubeContexts.get().use_context(admin_context(cluster_name))
+        if context is not None:
+            self.kubeconfig, self.context = bound_kubeconfig()
+        return context, msg
+
+    def _env(self):
+        if self.kubeconfig is None:
+            return None
+        return dict(os.environ, KUBECONFIG=self.kubeconfig)
+
+    def _run_cmd_only(self, cmd):
+        return self.rcmd.run_cmd_only(cmd, env=self._env())
+
+    def _run_cmd_output(self, cmd):
+        return self.rcmd.run_cmd_output(cmd, env=self._env())
 
     def get_all_pods(self):
         logger.info("Listing all pods...")
-        exit_code, output = self.rcmd.run_cmd_output(KubectlCommands.GET_ALL_PODS)
+        exit_code, output = self._run_cmd_output(KubectlCommands.GET_ALL_PODS)
         return output
 
     def get_vsphere_template_json(self, worker_name):
         logger.info(f"Getting machine template for {worker_name}")
         # kubectl get VsphereMachineTemplate tekton-shared-cluster-worker -o json
         get_template = KubectlCommands.GET_VSPHERE_TEMPLATE.format(workername=worker_name)
-        return self.rcmd.run_cmd_output(get_template)
+        return self._run_cmd_output(get_template)
 
     def get_machinedeployment_json(self, deployment_name):
         logger.info(f"Getting machine deployment for {deployment_name}")
         # k get machinedeployment  tekton-shared-cluster-md-0 -o json
         get_template = KubectlCommands.GET_MACHINE_DEPLOYMENT.format(deployment_name=
                                                                      deployment_name)
-        return self.rcmd.run_cmd_output(get_template)
+        return self._run_cmd_output(get_template)
 
     def get_all_namespaces(self, options=""):
         logger.info("Listing all namespaces...")
-        exit_code, output = self.rcmd.run_cmd_output(KubectlCommands.LIST_NAMESPACES.format(options=options))
+        exit_code, output = self._run_cmd_output(KubectlCommands.LIST_NAMESPACES.format(options=options))
         return output
 
     def list_secrets(self, namespace: str, options=""):
         logger.info("Listing all secrets...")
-        exit_code, output = self.rcmd.run_cmd_output(
+        exit_code, output = self._run_cmd_output(
             KubectlCommands.LIST_SECRETS.format(namespace=namespace, options=options)
         )
         return output
@@ -60,7 +82,7 @@ class KubectlClient:
                 cd {work_dir};
                 {KubectlCommands.APPLY.format(config_file=config_file_path)}
             """
-        return self.rcmd.run_cmd_only(deploy_cert_mgr)
+        return self._run_cmd_only(deploy_cert_mgr)
 
     def install_tmc_extensions_mgr(self, cluster_name, work_dir, config_file_path):
         self.set_cluster_context(cluster_name)
@@ -76,14 +98,14 @@ class KubectlClient:
                     cd {work_dir};
                     {KubectlCommands.APPLY.format(config_file=config_file_path)}
                 """
-        return self.rcmd.run_cmd_only(create_namespace)
+        return self._run_cmd_only(create_namespace)
 
     def create_secret(self, secret_name, work_dir, config_file_path, namespace):
         cmd = f"""
                 cd {work_dir};
                 {KubectlCommands.CREATE_SECRET.format(name=secret_name, config_file=config_file_path, namespace=namespace)}
                 """
-        return self.rcmd.run_cmd_only(cmd)
+        return self._run_cmd_only(cmd)
 
     @log("Checking if namespace exists")
     def check_namespace_exists(self, namespace):
@@ -102,14 +124,14 @@ class KubectlClient:
 
     def list_apps(self, namespace, options=""):
         logger.info(f"Listing all apps in namespace: {namespace}...")
-        exit_code, output = self.rcmd.run_cmd_output(
+        exit_code, output = self._run_cmd_output(
             KubectlCommands.LIST_APPS.format(namespace=namespace, options=options)
         )
         return output
 
     def get_app_details(self, app_name, namespace, options):
         contour_status = KubectlCommands.GET_APP_DETAILS.format(app_name=app_name, namespace=namespace, options=options)
-        exit_code, output = self.rcmd.run_cmd_output(contour_status)
+        exit_code, output = self._run_cmd_output(contour_status)
         return output
 
     def deploy_extension(self, cluster_name, work_dir, config_file_path):
@@ -124,11 +146,11 @@ class KubectlClient:
         self.set_cluster_context(mgmt_cluster_name)
 
         logger.info(f"Adding shared services label to cluster: {cluster_name}")
-        self.rcmd.run_cmd_only(KubectlCommands.ADD_SERVICES_LABEL.format(cluster=cluster_name))
+        self._run_cmd_only(KubectlCommands.ADD_SERVICES_LABEL.format(cluster=cluster_name))
 
     def list_service_accounts(self, namespace, options=""):
         logger.info(f"Listing all service accounts in namespace: {namespace}...")
-        exit_code, output = self.rcmd.run_cmd_output(
+        exit_code, output = self._run_cmd_output(
             KubectlCommands.LIST_SERVICE_ACCOUNTS.format(namespace=namespace, options=options)
         )
         return output
@@ -139,7 +161,7 @@ class KubectlClient:
         return f"serviceaccount/{sa_name}" in apps.split("\r\n")
 
     def get_harbor_cert(self, namespace, options=""):
-        exit_code, output = self.rcmd.run_cmd_output(
+        exit_code, output = self._run_cmd_output(
             KubectlCommands.GET_HARBOR_CERT.format(namespace=namespace, options=options)
         )
         return output
@@ -147,7 +169,7 @@ class KubectlClient:
     def delete_extension(self, cluster_name, extension_name, namespace):
         self.set_cluster_context(cluster_name=cluster_name)
         logger.info(f"Deleting extension {extension_name} in namespace {namespace}")
-        return self.rcmd.run_cmd_only(KubectlCommands.DELETE_EXTENSION.format(app_name=extension_name, namespace=namespace))
+        return self._run_cmd_only(KubectlCommands.DELETE_EXTENSION.format(app_name=extension_name, namespace=namespace))
 
     def delete_tmc_extensions_mgr(self, cluster_name, work_dir, config_file_path):
         self.set_cluster_context(cluster_name)
@@ -156,7 +178,7 @@ class KubectlClient:
                     cd {work_dir};
                     {KubectlCommands.DELETE.format(config_file=config_file_path)}
                 """
-        return self.rcmd.run_cmd_only(cmd)
+        return self._run_cmd_only(cmd)
 
     def install_kapp_controller(self, cluster_name, work_dir, config_file_path):
         self.set_cluster_context(cluster_name)
@@ -165,14 +187,14 @@ class KubectlClient:
                     cd {work_dir};
                     {KubectlCommands.APPLY.format(config_file=config_file_path)}
             """
-        return self.rcmd.run_cmd_only(cmd)
+        return self._run_cmd_only(cmd)
 
     def get_secret_details(self, secret_name, namespace, work_dir, options=""):
         cmd = f"""
                 cd {work_dir};
                 {KubectlCommands.GET_SECRET_DETAILS.format(name=secret_name, namespace=namespace, options=options)}
             """
-        output = self.rcmd.run_cmd_only(cmd)
+        output = self._run_cmd_only(cmd)
         return output
 
     def update_secret(self, secret_name, work_dir, config_file_path, namespace):
@@ -184,11 +206,11 @@ class KubectlClient:
 
     def get_oldest_node(self):
         logger.info("Worker Nodes: ")
-        self.rcmd.run_cmd_only(RepaveTkgCommands.GET_NODES_WITH_TIMESTAMP)
-        return self.rcmd.run_cmd_output(RepaveTkgCommands.GET_OLDEST_WORKER_NODE)[1].strip()
+        self._run_cmd_only(RepaveTkgCommands.GET_NODES_WITH_TIMESTAMP)
+        return self._run_cmd_output(RepaveTkgCommands.GET_OLDEST_WORKER_NODE)[1].strip()
 
     def add_node(self, cluster_name, control_plane_node_count, worker_node_count):
-        self.rcmd.run_cmd_only(
+        self._run_cmd_only(
             RepaveTkgCommands.ADD_NODES.format(
                 cluster_name=cluster_name,
                 control_plane_node_count=control_plane_node_count,
@@ -198,27 +220,24 @@ class KubectlClient:
 
     def drain_pods_from_node(self, node_name):
         logger.info(f"Drain pods from node: {node_name}")
-        self.rcmd.run_cmd_only(RepaveTkgCommands.DRAIN_PODS.format(node_name=node_name))
+        self._run_cmd_only(RepaveTkgCommands.DRAIN_PODS.format(node_name=node_name))
 
     def delete_node(self, node_name):
         logger.info(f"Delete node: {node_name}")
-        self.rcmd.run_cmd_only(RepaveTkgCommands.DELETE_NODE.format(node_name=node_name))
+        self._run_cmd_only(RepaveTkgCommands.DELETE_NODE.format(node_name=node_name))
 
     def get_node_count(self) -> int:
-        output = CmdHelper.escape_ansi(self.rcmd.run_cmd_output(RepaveTkgCommands.NODE_COUNT)[1].strip())
+        output = CmdHelper.escape_ansi(self._run_cmd_output(RepaveTkgCommands.NODE_COUNT)[1].strip())
         return int(output)
 
     def wait_for_ready_nodes(self, initial_count: int, retry: int):
-        r = retry
-        while initial_count != self.get_ready_node_count() and r > 0:
-            logger.warn("Waiting for node to be up...")
-            time.sleep(30)
-            r -= 1
-        if initial_count != self.get_ready_node_count():
+        logger.warn("Waiting for node to be up...")
+        if not wait_for_ready_nodes(initial_count, timeout=retry * 30, kubeconfig=self.kubeconfig,
+                                    context=self.context):
             raise ValueError(f"Nodes are not in correct count after {retry} retries")
 
     def get_ready_node_count(self) -> int:
-        node_status_str = self.rcmd.run_cmd_output(RepaveTkgCommands.NODE_STATUS)[1]
+        node_status_str = self._run_cmd_output(RepaveTkgCommands.NODE_STATUS)[1]
         logger.debug(f"Node Status: {node_status_str}")
         node_status = yaml.safe_load(node_status_str)
         return len([node for node in node_status if bool(node["status"])])
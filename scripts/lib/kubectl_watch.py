@@ -0,0 +1,351 @@
+#  Copyright 2022 VMware, Inc
+#  SPDX-License-Identifier: BSD-2-Clause
+
+import json
+import queue
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from lib.kube_context import bound_kubeconfig
+from util.logger_helper import LoggerHelper
+from util.wait_helper import WaitResult, record_wait
+
+logger = LoggerHelper.get_logger(Path(__file__).stem)
+
+PODS = "pods"
+NODES = "nodes"
+APPS = "apps.kappctrl.k14s.io"
+PACKAGE_INSTALLS = "packageinstalls.packaging.carvel.dev"
+
+
+def pod_running(obj):
+    return obj.get("status", {}).get("phase") in ["Running", "Succeeded"]
+
+
+def node_ready(obj):
+    for condition in obj.get("status", {}).get("conditions", []):
+        if condition.get("type") == "Ready":
+            return condition.get("status") == "True"
+    return False
+
+
+def _reconcile_condition(obj, condition_type):
+    for condition in obj.get("status", {}).get("conditions", []) or []:
+        if condition.get("type") == condition_type and condition.get("status") == "True":
+            return True
+    return False
+
+
+def reconcile_succeeded(obj):
+    return _reconcile_condition(obj, "ReconcileSucceeded")
+
+
+def reconcile_failed(obj):
+    return _reconcile_condition(obj, "ReconcileFailed")
+
+
+class KubectlWatch:
+    """
+    Keeps one long lived `kubectl get <resource> -w -o json` process and an in memory
+    snapshot of the watched objects, so readiness checks do not fork kubectl on every poll.
+    """
+
+    def __init__(self, resource, namespace=None, kubeconfig=None, context=None):
+        self.resource = resource
+        self.namespace = namespace
+        self.kubeconfig = kubeconfig
+        self.context = context
+        self.objects = dict()
+        self._events = queue.Queue()
+        self._process = None
+
+    def _command(self):
+        cmd = ["kubectl", "get", self.resource, "--watch", "--output-watch-events", "-o", "json"]
+        if self.namespace:
+            cmd.extend(["-n", self.namespace])
+        elif self.resource != NODES:
+            cmd.append("-A")
+        if self.kubeconfig:
+            cmd.extend(["--kubeconfig", self.kubeconfig])
+        if self.context:
+            cmd.extend(["--context", self.context])
+        return cmd
+
+    def start(self):
+        cmd = self._command()
+        logger.debug(f"Starting watch: \n\"{' '.join(cmd)}\"")
+        self.objects = dict()
+        self._process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                         universal_newlines=True)
+        threading.Thread(target=self._read_events, args=(self._process,), daemon=True).start()
+        threading.Thread(target=self._log_errors, args=(self._process,), daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+        self._process = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _read_events(self, process):
+        decoder = json.JSONDecoder()
+        buffer = ""
+        for line in iter(process.stdout.readline, ""):
+            buffer += line
+            # kubectl pretty prints every event, a top level document always ends with a bare "}"
+            if line.rstrip() != "}":
+                continue
+            try:
+                event, _ = decoder.raw_decode(buffer.strip())
+            except ValueError:
+                continue
+            buffer = ""
+            self._events.put(event)
+        process.stdout.close()
+        self._events.put(None)
+
+    def _log_errors(self, process):
+        """
+        kubectl reports auth and context failures on stderr while stdout stays empty
+        """
+        for line in iter(process.stderr.readline, ""):
+            if line.strip():
+                logger.warning("Watch on " + self.resource + ": " + line.strip())
+        process.stderr.close()
+
+    def _apply(self, event):
+        obj = event.get("object", {})
+        metadata = obj.get("metadata", {})
+        key = (metadata.get("namespace"), metadata.get("name"))
+        if event.get("type") == "DELETED":
+            self.objects.pop(key, None)
+        elif event.get("type") in ["ADDED", "MODIFIED"]:
+            self.objects[key] = obj
+
+    def wait(self, condition, timeout, description=None):
+        """
+        Block until condition(objects) returns a truthy value or timeout expires
+        :param condition: callable receiving the list of currently known objects
+        :param timeout: seconds to wait
+        :param description: text used in logs and metrics
+        :return: WaitResult, attempts counts the events received
+        """
+        description = description or self.resource
+        start = time.monotonic()
+        deadline = start + timeout
+        if self._process is None:
+            self.start()
+        events = 0
+        value = condition(list(self.objects.values()))
+        while not value:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                event = self._events.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if event is None:
+                # watch closed by the API server or kubectl failed, open a new one
+                logger.debug("Watch on " + self.resource + " closed, restarting")
+                time.sleep(min(2, max(0, deadline - time.monotonic())))
+                self.start()
+                continue
+            events += 1
+            self._apply(event)
+            value = condition(list(self.objects.values()))
+        result = WaitResult(description, value, time.monotonic() - start, events)
+        record_wait(result)
+        return result
+
+
+class SharedWatch(KubectlWatch):
+    """
+    KubectlWatch whose events are applied by a background thread, so several threads can wait
+    on the same watch at once, e.g. packages installed side by side followed by one kubectl process.
+    """
+
+    def __init__(self, resource, namespace=None, kubeconfig=None, context=None):
+        super().__init__(resource, namespace, kubeconfig, context)
+        self._changed = threading.Condition()
+        self._events_seen = 0
+        self._stopped = False
+        self.users = 0
+
+    def start(self):
+        super().start()
+        threading.Thread(target=self._follow, args=(self._events,), daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopped = True
+        super().stop()
+        with self._changed:
+            self._changed.notify_all()
+
+    def _follow(self, events):
+        while not self._stopped:
+            event = events.get()
+            if event is None:
+                if self._stopped:
+                    return
+                # watch closed by the API server or kubectl failed, open a new one
+                logger.debug("Shared watch on " + self.resource + " closed, restarting")
+                time.sleep(2)
+                self._events = queue.Queue()
+                self.start()
+                return
+            with self._changed:
+                self._apply(event)
+                self._events_seen += 1
+                self._changed.notify_all()
+
+    def wait(self, condition, timeout, description=None):
+        description = description or self.resource
+        start = time.monotonic()
+        deadline = start + timeout
+        with self._changed:
+            seen = self._events_seen
+            value = condition(list(self.objects.values()))
+            while not value and not self._stopped:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._changed.wait(remaining)
+                value = condition(list(self.objects.values()))
+            events = self._events_seen - seen
+        result = WaitResult(description, value, time.monotonic() - start, events)
+        record_wait(result)
+        return result
+
+
+_shared_watches = dict()
+_shared_lock = threading.Lock()
+_targets = threading.local()
+
+
+@contextmanager
+def watch_target(kubeconfig, context):
+    """
+    Make the waits of this thread that name no cluster watch the given kubeconfig and context
+    instead of the current-context, which other threads may switch meanwhile
+    """
+    previous = getattr(_targets, "target", None)
+    _targets.target = (kubeconfig, context)
+    try:
+        yield
+    finally:
+        _targets.target = previous
+
+
+def _target(kubeconfig, context):
+    if kubeconfig is None and context is None:
+        return getattr(_targets, "target", None) or bound_kubeconfig()
+    return kubeconfig, context
+
+
+@contextmanager
+def shared_watch(resource, namespace=None, kubeconfig=None, context=None):
+    """
+    Keep one watch open for the block, waits on the same resource and cluster made meanwhile,
+    from any thread, are answered by it instead of starting their own kubectl watch
+    """
+    key = (resource, namespace, kubeconfig, context)
+    with _shared_lock:
+        watch = _shared_watches.get(key)
+        if watch is None:
+            watch = SharedWatch(resource, namespace, kubeconfig, context).start()
+            _shared_watches[key] = watch
+        watch.users += 1
+    try:
+        yield watch
+    finally:
+        with _shared_lock:
+            watch.users -= 1
+            if watch.users == 0:
+                _shared_watches.pop(key, None)
+                watch.stop()
+
+
+def _shared_for(resource, namespace, kubeconfig, context):
+    """
+    :return: the shared watch covering the resource of the namespace, or of all namespaces
+    """
+    with _shared_lock:
+        return _shared_watches.get((resource, namespace, kubeconfig, context)) or \
+            _shared_watches.get((resource, None, kubeconfig, context))
+
+
+def _named(objects, name, generated=False):
+    """
+    :param generated: also match names generated from name, e.g. the pods of a deployment or job
+    """
+    found = []
+    for obj in objects:
+        obj_name = obj.get("metadata", {}).get("name", "")
+        if obj_name == name or (generated and obj_name.startswith(name + "-")):
+            found.append(obj)
+    return found
+
+
+def wait_for_pods_running(name, namespace=None, timeout=1800, kubeconfig=None, context=None):
+    kubeconfig, context = _target(kubeconfig, context)
+    with KubectlWatch(PODS, namespace, kubeconfig, context) as watch:
+        return watch.wait(lambda objects: any(pod_running(pod) for pod in _named(objects, name, generated=True)),
+                          timeout, description="pod " + name)
+
+
+def wait_for_ready_nodes(count, timeout=1800, kubeconfig=None, context=None):
+    kubeconfig, context = _target(kubeconfig, context)
+    with KubectlWatch(NODES, kubeconfig=kubeconfig, context=context) as watch:
+        return watch.wait(lambda objects: len([node for node in objects if node_ready(node)]) == count,
+                          timeout, description=str(count) + " ready nodes")
+
+
+def _wait_for_reconcile(resource, name, namespace, timeout, kubeconfig, context, stop_on_failure):
+    def _state(objects):
+        for obj in _named(objects, name):
+            if namespace and obj.get("metadata", {}).get("namespace") != namespace:
+                continue
+            if reconcile_succeeded(obj):
+                return "SUCCEEDED"
+            if stop_on_failure and reconcile_failed(obj):
+                return "FAILED"
+        return None
+
+    kubeconfig, context = _target(kubeconfig, context)
+    shared = _shared_for(resource, namespace, kubeconfig, context)
+    if shared is not None:
+        return shared.wait(_state, timeout, description=name + " reconcile")
+    with KubectlWatch(resource, namespace, kubeconfig, context) as watch:
+        return watch.wait(_state, timeout, description=name + " reconcile")
+
+
+def wait_for_package_reconciled(name, namespace=None, timeout=1800, kubeconfig=None, context=None,
+                                stop_on_failure=False):
+    """
+    Wait until a PackageInstall reconciles. The result value is "SUCCEEDED", or "FAILED" when
+    stop_on_failure is set and the reconcile failed, None on timeout.
+    """
+    return _wait_for_reconcile(PACKAGE_INSTALLS, name, namespace, timeout, kubeconfig, context, stop_on_failure)
+
+
+def wait_for_app_reconciled(name, namespace=None, timeout=1800, kubeconfig=None, context=None,
+                            stop_on_failure=False):
+    """
+    Wait until a kapp-controller App CR reconciles. The result value is "SUCCEEDED", or "FAILED" when
+    stop_on_failure is set and the reconcile failed, None on timeout.
+    """
+    return _wait_for_reconcile(APPS, name, namespace, timeout, kubeconfig, context, stop_on_failure)
@@ -14,24 +14,161 @@ import requests
 import struct
 import time
 import fcntl
+import threading
 from model.run_config import RunConfig
 
 from util.logger_helper import LoggerHelper
 from constants.nsxt_constants import  VCF
+from util.tracing import trace_methods
+from util.wait_helper import wait_until
+from util.vcenter_session import VcenterRestSession, vcenter_request
+from model.spec_store import SpecStore, decode_secret
 
 logger = LoggerHelper.get_logger(Path(__file__).stem)
 
 
+def list_all(headers, url):
+    """
+    GET every page of an NSX-T list API, following the cursor until the last page
+    :return: (results, 200), (response text, status code) when a page can not be read
+    """
+    results = []
+    params = {}
+    while True:
+        response = requests.request("GET", url, headers=headers, params=params, verify=False)
+        if response.status_code != 200:
+            return response.text, response.status_code
+        body = response.json()
+        page = body.get("results", [])
+        results.extend(page)
+        cursor = body.get("cursor")
+        if not page or not cursor or cursor == params.get("cursor") or \
+                len(results) >= int(body.get("result_count", len(results) + 1)):
+            return results, 200
+        params = {"cursor": cursor}
+
+
+class NsxtCollection:
+    """
+    One NSX-T collection as listed by the manager, indexed by display_name and id
+    """
+
+    def __init__(self, results):
+        self.results = results
+        self.by_name = dict()
+        self.by_id = dict()
+        for obj in results:
+            self._index(obj)
+
+    def _index(self, obj):
+        if 'display_name' in obj:
+            self.by_name.setdefault(obj['display_name'], obj)
+        if 'id' in obj:
+            self.by_id[obj['id']] = obj
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def find(self, name):
+        """
+        :return: object with the display name, None when there is none
+        """
+        return self.by_name.get(name)
+
+    def record(self, obj):
+        """
+        Add or replace an object written by this process
+        """
+        old = self.by_id.get(obj.get('id'))
+        if old is not None:
+            self.results[self.results.index(old)] = obj
+            if self.by_name.get(old.get('display_name')) is old:
+                del self.by_name[old['display_name']]
+        else:
+            self.results.append(obj)
+        self._index(obj)
+
+
+class NsxtInventory:
+    """
+    Snapshot of the NSX-T collections read by this process, one per manager. Every collection is
+    listed once with full cursor pagination, objects written through NsxtClient are recorded in
+    it and collections changed in bulk are dropped so the next lookup lists them again.
+    """
+
+    _inventories = dict()
+    _lock = threading.Lock()
+
+    def __init__(self, address):
+        self.address = address
+        self._collections = dict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, address):
+        """
+        :return: inventory of the NSX-T manager at address
+        """
+        with cls._lock:
+            if address not in cls._inventories:
+                cls._inventories[address] = cls(address)
+            return cls._inventories[address]
+
+    def collection(self, headers, path):
+        """
+        :param headers: request headers with the NSX-T credentials
+        :param path: list API path, e.g. /policy/api/v1/infra/segments
+        :return: (NsxtCollection, 200), (response text, status code) when it can not be listed
+        """
+        path = path.rstrip("/")
+        with self._lock:
+            if path in self._collections:
+                return self._collections[path], 200
+        output = list_all(headers, "https://" + self.address + path)
+        if output[1] != 200:
+            return output
+        collection = NsxtCollection(output[0])
+        with self._lock:
+            self._collections[path] = collection
+        return collection, 200
+
+    def record(self, path, obj):
+        """
+        Record an object written to the collection at path, when the collection is cached
+        """
+        with self._lock:
+            collection = self._collections.get(path.rstrip("/"))
+            if collection is not None and isinstance(obj, dict) and 'id' in obj:
+                collection.record(obj)
+                return
+            self._collections.pop(path.rstrip("/"), None)
+
+    def invalidate(self, *paths):
+        """
+        Forget collections changed in bulk, they are listed again on their next lookup
+        """
+        with self._lock:
+            for path in paths:
+                self._collections.pop(path.rstrip("/"), None)
+
+
+@trace_methods("nsxt")
 class NsxtClient:
     def __init__(self, run_config: RunConfig):
         self.run_config = run_config
         self.jsonpath = os.path.join(self.run_config.root_dir, Paths.MASTER_SPEC_PATH)
 
-        with open(self.jsonpath) as f:
-            self.jsonspec = json.load(f)
+        self.jsonspec = SpecStore.jsonspec(self.jsonpath)
+
 
+    @property
+    def inventory(self):
+        return NsxtInventory.get(str(self.jsonspec['envSpec']['vcenterDetails']["nsxtAddress"]))
 
     def checkObjectIsPresentAndReturnPath(self,listOfSegments, name):
+        if isinstance(listOfSegments, NsxtCollection):
+            obj = listOfSegments.find(name)
+            return (True, obj['path']) if obj is not None else (False, None)
         try:
             for segmentName in listOfSegments:
                 if segmentName['display_name'] == name:
@@ -51,14 +188,10 @@ class NsxtClient:
 
     def getTransportZone(self, address, transport_zone_name, headers_):
         try:
-            url = "https://" + address + "/api/v1/transport-zones/"
-            payload = {}
-            tzone_response = requests.request("GET", url, headers=headers_,
-                                            data=payload,
-                                            verify=False)
-            if tzone_response.status_code != 200:
-                return None, tzone_response.text
-            for tzone in tzone_response.json()["results"]:
+            tzones = NsxtInventory.get(address).collection(headers_, "/api/v1/transport-zones")
+            if tzones[1] != 200:
+                return None, tzones[0]
+            for tzone in tzones[0]:
                 if str(tzone["transport_type"]) == "OVERLAY" and str(tzone["display_name"]) == transport_zone_name:
                     return tzone["id"], "FOUND"
             return None, "NOT_FOUND"
@@ -66,15 +199,47 @@ class NsxtClient:
             return None, str(e)
 
     def getList(self, headers, url):
-        payload = {}
-        list_all_segments_url = url
-        list_all_segments_response = requests.request("GET", list_all_segments_url, headers=headers,
-                                                    data=payload,
-                                                    verify=False)
-        if list_all_segments_response.status_code != 200:
-            return list_all_segments_response.text, list_all_segments_response.status_code
+        """
+        :return: (all results of the list url across pages, 200), (response text, status code) on failure
+        """
+        return list_all(headers, url)
+
+    def getCollection(self, headers, path):
+        """
+        Inventory lookup of a policy API collection, listed once per process
+        :param path: collection path below /policy/api/v1, e.g. /infra/segments
+        :return: (NsxtCollection, 200), (response text, status code) on failure
+        """
+        return self.inventory.collection(headers, "/policy/api/v1" + path)
+
+    def waitForSegmentsRealized(self, headers, address, segment_ids, timeout=600):
+        """
+        Wait until the segments are realized, GET /infra/segments/<id>/state reports success
+        :return: (True, msg) once realized, (False, msg) when one failed or the wait timed out
+        """
+        failed = []
 
-        return list_all_segments_response.json()["results"], 200
+        def _realized():
+            pending = []
+            for segment_id in segment_ids:
+                url = "https://" + address + "/policy/api/v1/infra/segments/" + segment_id + "/state"
+                response = requests.request("GET", url, headers=headers, verify=False)
+                state = response.json().get("state") if response.status_code == 200 else None
+                if state in ["failed", "error"]:
+                    failed.append(segment_id + " " + str(response.json().get("details", state)))
+                    return True
+                if state != "success":
+                    pending.append(segment_id)
+            logger.debug("Segments not realized yet: " + str(pending))
+            return not pending
+
+        realized = wait_until(_realized, timeout=timeout, interval=2, max_interval=15, ignore_errors=True,
+                              description="realization of segments " + ", ".join(segment_ids))
+        if failed:
+            return False, "Segment realization failed " + str(failed)
+        if not realized:
+            return False, "Segments not realized after " + str(int(realized.elapsed)) + "s"
+        return True, "Segments realized after " + str(int(realized.elapsed)) + "s"
 
     def createNsxtSegment(self, segementName, gatewayAddress, dhcpStart, dhcpEnd, dnsServers, network, isDhcp):
         try:
@@ -87,8 +252,7 @@ class NsxtClient:
                     "ERROR_CODE": 500
                 }
                 return  d, 500
-            uri = "https://" + headers_[2] + "/policy/api/v1/infra/segments"
-            output = self.getList(headers_[1], uri)
+            output = self.getCollection(headers_[1], "/infra/segments")
             if output[1] != 200:
                 d = {
                     "responseType": "ERROR",
@@ -97,7 +261,6 @@ class NsxtClient:
                 }
                 return  d, 500
             overlay = str(self.jsonspec['envSpec']['vcenterDetails']["nsxtOverlay"])
-            ntp_servers = str(self.jsonspec['envSpec']['infraComponents']["ntpServers"])
             trz = self.getTransportZone(headers_[2], overlay, headers_[1])
             if trz[0] is None:
                 d = {
@@ -117,58 +280,8 @@ class NsxtClient:
             if not self.checkObjectIsPresentAndReturnPath(output[0], segementName)[0]:
                 logger.info("Creating segment " + segementName)
                 url = "https://" + headers_[2] + "/policy/api/v1/infra/segments/" + segementName
-                if isDhcp:
-                    payload = {
-                        "display_name": segementName,
-                        "subnets": [
-                            {
-                                "gateway_address": gatewayAddress,
-                                "dhcp_ranges": [
-                                    dhcpStart + "-" + dhcpEnd
-                                ],
-                                "dhcp_config": {
-                                    "resource_type": "SegmentDhcpV4Config",
-                                    "lease_time": 86400,
-                                    "dns_servers": self.convertStringToCommaSeperated(dnsServers),
-                                    "options": {
-                                        "others": [
-                                            {
-                                                "code": 42,
-                                                "values": self.convertStringToCommaSeperated(ntp_servers)
-                                            }
-                                        ]
-                                    }
-                                },
-                                "network": network
-                            }
-                        ],
-                        "connectivity_path": tier_path[0],
-                        "transport_zone_path": "/infra/sites/default/enforcement-points/default/transport-zones/" + str(
-                            trz[0]),
-                        "id": segementName
-                    }
-                else:
-                    payload = {
-                        "display_name": segementName,
-                        "subnets": [
-                            {
-                                "gateway_address": gatewayAddress
-                            }
-                        ],
-                        "replication_mode": "MTEP",
-                        "transport_zone_path": "/infra/sites/default/enforcement-points/default/transport-zones/" + str(
-                            trz[0]),
-                        "admin_state": "UP",
-                        "advanced_config": {
-                            "address_pool_paths": [
-                            ],
-                            "multicast": True,
-                            "urpf_mode": "STRICT",
-                            "connectivity": "ON"
-                        },
-                        "connectivity_path": tier_path[0],
-                        "id": segementName
-                    }
+                payload = self.segmentPayload(segementName, gatewayAddress, dhcpStart, dhcpEnd, dnsServers,
+                                              network, isDhcp, tier_path[0], trz[0])
                 headers_[1].update({"Content-Type": "application/json", "Accept": "application/json"})
                 payload_modified = json.dumps(payload, indent=4)
                 dhcp_create = requests.request("PUT", url,
@@ -183,10 +296,18 @@ class NsxtClient:
                     }
                     logger.error(dhcp_create.text)
                     return  d, dhcp_create.status_code
+                self.inventory.record("/policy/api/v1/infra/segments", dhcp_create.json())
                 msg_text = "Created " + segementName
                 logger.info(msg_text)
-                logger.info("Waiting for 1 min for status == ready")
-                time.sleep(60)
+                realized = self.waitForSegmentsRealized(headers_[1], headers_[2], [segementName])
+                if not realized[0]:
+                    logger.error(realized[1])
+                    d = {
+                        "responseType": "ERROR",
+                        "msg": realized[1],
+                        "ERROR_CODE": 500
+                    }
+                    return  d, 500
             else:
                 msg_text = segementName + " is already created"
                 logger.info(msg_text)
@@ -207,12 +328,69 @@ class NsxtClient:
             return  d, 500
 
 
+    def segmentPayload(self, name, gatewayAddress, dhcpStart, dhcpEnd, dnsServers, network, isDhcp, tier_path,
+                       tz_id):
+        """
+        :return: policy Segment body, DHCP enabled when isDhcp else an MTEP overlay segment
+        """
+        ntp_servers = str(self.jsonspec['envSpec']['infraComponents']["ntpServers"])
+        if isDhcp:
+            payload = {
+                "display_name": name,
+                "subnets": [
+                    {
+                        "gateway_address": gatewayAddress,
+                        "dhcp_ranges": [
+                            dhcpStart + "-" + dhcpEnd
+                        ],
+                        "dhcp_config": {
+                            "resource_type": "SegmentDhcpV4Config",
+                            "lease_time": 86400,
+                            "dns_servers": self.convertStringToCommaSeperated(dnsServers),
+                            "options": {
+                                "others": [
+                                    {
+                                        "code": 42,
+                                        "values": self.convertStringToCommaSeperated(ntp_servers)
+                                    }
+                                ]
+                            }
+                        },
+                        "network": network
+                    }
+                ],
+                "connectivity_path": tier_path,
+                "transport_zone_path": "/infra/sites/default/enforcement-points/default/transport-zones/" + str(
+                    tz_id),
+                "id": name
+            }
+        else:
+            payload = {
+                "display_name": name,
+                "subnets": [
+                    {
+                        "gateway_address": gatewayAddress
+                    }
+                ],
+                "replication_mode": "MTEP",
+                "transport_zone_path": "/infra/sites/default/enforcement-points/default/transport-zones/" + str(
+                    tz_id),
+                "admin_state": "UP",
+                "advanced_config": {
+                    "address_pool_paths": [
+                    ],
+                    "multicast": True,
+                    "urpf_mode": "STRICT",
+                    "connectivity": "ON"
+                },
+                "connectivity_path": tier_path,
+                "id": name
+            }
+        return payload
+
     def grabNsxtHeaders(self):
         try:
-            str_enc = str(self.jsonspec['envSpec']['vcenterDetails']["nsxtUserPasswordBase64"])
-            base64_bytes = str_enc.encode('ascii')
-            enc_bytes = base64.b64decode(base64_bytes)
-            password = enc_bytes.decode('ascii').rstrip("\n")
+            password = decode_secret(self.jsonspec['envSpec']['vcenterDetails']["nsxtUserPasswordBase64"])
 
             ecod_bytes = (self.jsonspec['envSpec']['vcenterDetails']["nsxtUser"] + ":" + password).encode(
                 "ascii")
@@ -237,8 +415,7 @@ class NsxtClient:
                     "ERROR_CODE": 500
                 }
                 return  d, 500
-            uri = "https://" + headers_[2] + "/policy/api/v1/infra/dhcp-server-configs"
-            output = self.getList(headers_[1], uri)
+            output = self.getCollection(headers_[1], "/infra/dhcp-server-configs")
             if output[1] != 200:
                 logger.error("Failed to get DHCP info on NSXT " + str(output[0]))
                 d = {
@@ -297,6 +474,7 @@ class NsxtClient:
                         }
                         logger.error(dhcp_create.text)
                         return  d, dhcp_create.status_code
+                    self.inventory.record("/policy/api/v1/infra/dhcp-server-configs", dhcp_create.json())
                     msg_text = "Created DHCP server " + VCF.DHCP_SERVER_NAME
                     logger.info(msg_text)
                 else:
@@ -321,27 +499,20 @@ class NsxtClient:
 
 
     def getPolicy(self, headers, policyName):
-        url = "https://" + headers[2] + "/policy/api/v1/infra/domains/default/gateway-policies"
-        response = requests.request(
-            "GET", url, headers=headers[1], verify=False)
-        if response.status_code != 200:
-            return None, response.text
-        try:
-            for pol in response.json()["results"]:
-                if pol["display_name"] == policyName:
-                    return pol["display_name"], "FOUND"
-            return None, "NOT_FOUND"
-        except Exception:
-            return None, "NOT_FOUND"
+        policies = self.getCollection(headers[1], "/infra/domains/default/gateway-policies")
+        if policies[1] != 200:
+            return None, policies[0]
+        pol = policies[0].find(policyName)
+        if pol is not None:
+            return pol["display_name"], "FOUND"
+        return None, "NOT_FOUND"
 
     def getTier1Details(self, headers_):
-        uri = "https://" + headers_[2] + "/policy/api/v1/infra/tier-1s"
-        response = requests.request(
-            "GET", uri, headers=headers_[1], verify=False)
-        if response.status_code != 200:
-            return None, response.status_code
+        tier1s = self.getCollection(headers_[1], "/infra/tier-1s")
+        if tier1s[1] != 200:
+            return None, tier1s[1]
         teir1name = str(self.jsonspec['envSpec']['vcenterDetails']["nsxtTier1RouterDisplayName"])
-        for tr in response.json()["results"]:
+        for tr in tier1s[0]:
             if str(tr["display_name"]).lower() == teir1name.lower():
                 return tr["path"], "FOUND"
         return None, "NOT_FOUND"
@@ -354,14 +525,12 @@ class NsxtClient:
         return ss[0] + "." + ss[1] + "." + ss[2] + ".0" + "/" + ipNet[1]
 
     def getDomainName(self, headers, domainName):
-        url = "https://" + headers[2] + "/policy/api/v1/infra/domains/"
-        response = requests.request(
-            "GET", url, headers=headers[1], verify=False)
-        if response.status_code != 200:
-            return None, response.text
-        for domain in response.json()["results"]:
-            if str(domain["display_name"]) == domainName:
-                return domain["display_name"], "FOUND"
+        domains = self.getCollection(headers[1], "/infra/domains")
+        if domains[1] != 200:
+            return None, domains[0]
+        domain = domains[0].find(domainName)
+        if domain is not None:
+            return domain["display_name"], "FOUND"
         return None, "NOT_FOUND"
 
 
@@ -396,8 +565,8 @@ class NsxtClient:
                     "ERROR_CODE": 500
                 }
                 return  d, 500
-            uri = "https://" + headers_[2] + "/policy/api/v1/infra/domains/" + domainName[0] + "/groups"
-            output = self.getList(headers_[1], uri)
+            groups_path = "/infra/domains/" + domainName[0] + "/groups"
+            output = self.getCollection(headers_[1], groups_path)
             if output[1] != 200:
                 d = {
                     "responseType": "ERROR",
@@ -406,8 +575,7 @@ class NsxtClient:
                 }
                 return  d, 500
             if segmentName is not None:
-                uri_ = "https://" + headers_[2] + "/policy/api/v1/infra/segments"
-                seg_output = self.getList(headers_[1], uri_)
+                seg_output = self.getCollection(headers_[1], "/infra/segments")
                 if seg_output[1] != 200:
                     d = {
                         "responseType": "ERROR",
@@ -425,13 +593,32 @@ class NsxtClient:
                     return  d, 500
             url = "https://" + headers_[2] + "/policy/api/v1/infra/domains/" + domainName[0] + "/groups/" + groupName
             headers_[1].update({"Content-Type": "application/json", "Accept": "application/json"})
+            if groupName in output[0].by_id:
+                # the cached group may be outdated, the update has to carry its current _revision
+                current = requests.request("GET", url, headers=headers_[1], verify=False)
+                if current.status_code == 200:
+                    self.inventory.record("/policy/api/v1" + groups_path, current.json())
+                elif current.status_code == 404:
+                    self.inventory.invalidate("/policy/api/v1" + groups_path)
+                    output = self.getCollection(headers_[1], groups_path)
+                    if output[1] != 200:
+                        d = {
+                            "responseType": "ERROR",
+                            "msg": "Failed to get list of domain " + str(output[0]),
+                            "ERROR_CODE": 500
+                        }
+                        return  d, 500
+                else:
+                    d = {
+                        "responseType": "ERROR",
+                        "msg": "Failed to get group " + groupName + " " + current.text,
+                        "ERROR_CODE": current.status_code
+                    }
+                    return  d, current.status_code
             isPresent = False
             lis_ip = []
             try:
-                get_group = requests.request("GET", url,
-                                            headers=headers_[1],
-                                            verify=False)
-                results = get_group.json()
+                results = output[0].by_id[groupName]
                 revision_id = results["_revision"]
                 for expression in results["expression"]:
                     if isIp == "true":
@@ -535,6 +722,7 @@ class NsxtClient:
                     return  d, dhcp_create.status_code
                 msg_text = "Created group " + groupName
                 path = dhcp_create.json()["path"]
+                self.inventory.record("/policy/api/v1" + groups_path, dhcp_create.json())
             else:
                 path = obj[1]
                 msg_text = groupName + " group is already created."
@@ -556,17 +744,32 @@ class NsxtClient:
 
 
     def isServiceCreated(self, header, serviceName):
-        url = "https://" + header[2] + "/policy/api/v1/infra/services"
-        response = requests.request(
-            "GET", url, headers=header[1], verify=False)
-        if response.status_code != 200:
-            return None, response.text
-        for service in response.json()["results"]:
-            if service["display_name"] == serviceName:
-                return service["display_name"], "FOUND"
+        services = self.getCollection(header[1], "/infra/services")
+        if services[1] != 200:
+            return None, services[0]
+        service = services[0].find(serviceName)
+        if service is not None:
+            return service["display_name"], "FOUND"
         return None, "NOT_FOUND"
 
 
+    def servicePayload(self, serviceName, port):
+        """
+        :return: Service body of a TCP service on the comma separated ports
+        """
+        return {
+            "service_entries": [
+                {
+                    "display_name": serviceName,
+                    "resource_type": "L4PortSetServiceEntry",
+                    "l4_protocol": "TCP",
+                    "destination_ports": self.convertStringToCommaSeperated(port)
+                }
+            ],
+            "display_name": serviceName,
+            "id": serviceName
+        }
+
     def createVipService(self, serviceName, port):
         headers_ = self.grabNsxtHeaders()
         if headers_[0] is None:
@@ -588,18 +791,7 @@ class NsxtClient:
             else:
                 url = "https://" + headers_[2] + "/policy/api/v1/infra/services/" + serviceName
                 headers_[1].update({"Content-Type": "application/json", "Accept": "application/json"})
-                payload = {
-                    "service_entries": [
-                        {
-                            "display_name": serviceName,
-                            "resource_type": "L4PortSetServiceEntry",
-                            "l4_protocol": "TCP",
-                            "destination_ports": self.convertStringToCommaSeperated(port)
-                        }
-                    ],
-                    "display_name": serviceName,
-                    "id": serviceName
-                }
+                payload = self.servicePayload(serviceName, port)
                 payload_modified = json.dumps(payload, indent=4)
                 response = requests.request(
                     "PUT", url, headers=headers_[1], data=payload_modified, verify=False)
@@ -610,6 +802,7 @@ class NsxtClient:
                         "ERROR_CODE": 500
                     }
                     return  d, 500
+                self.inventory.record("/policy/api/v1/infra/services", response.json())
             message = "Service created successfully"
         else:
             message = "Service is already created " + service[0]
@@ -622,14 +815,63 @@ class NsxtClient:
         return  d, 200
 
     def getListOfFirewallRule(self, headers, policyName):
-        url = "https://" + headers[2] + "/policy/api/v1/infra/domains/default/gateway-policies/" + policyName + "/rules"
-        response = requests.request(
-            "GET", url, headers=headers[1], verify=False)
-        if response.status_code != 200:
-            return None, response.text
-        return response.json()["results"], "FOUND"
+        rules = self.getCollection(headers[1], "/infra/domains/default/gateway-policies/" + policyName + "/rules")
+        if rules[1] != 200:
+            return None, rules[0]
+        return rules[0], "FOUND"
 
 
+    def gatewayPolicyPayload(self, policyName, tier_path):
+        """
+        :return: GatewayPolicy body of a new policy, holding only the allow-all default_rule
+        """
+        return {
+            "resource_type": "GatewayPolicy",
+            "display_name": policyName,
+            "id": policyName,
+            "marked_for_delete": False,
+            "tcp_strict": True,
+            "stateful": True,
+            "locked": False,
+            "category": "LocalGatewayRules",
+            "sequence_number": 10,
+            "children": [
+                {
+                    "resource_type": "ChildRule",
+                    "marked_for_delete": False,
+                    "Rule": {
+                        "display_name": "default_rule",
+                        "id": "default_rule",
+                        "resource_type": "Rule",
+                        "marked_for_delete": False,
+                        "source_groups": [
+                            "ANY"
+                        ],
+                        "sequence_number": 10,
+                        "destination_groups": [
+                            "ANY"
+                        ],
+                        "services": [
+                            "ANY"
+                        ],
+                        "profiles": [
+                            "ANY"
+                        ],
+                        "scope": [
+                            tier_path
+                        ],
+                        "action": "ALLOW",
+                        "direction": "IN_OUT",
+                        "logged": False,
+                        "disabled": False,
+                        "notes": "",
+                        "tag": "",
+                        "ip_protocol": "IPV4_IPV6"
+                    }
+                }
+            ]
+        }
+
     def createFirewallRule(self, policyName, ruleName, rulePayLoad):
         headers_ = self.grabNsxtHeaders()
         if headers_[0] is None:
@@ -670,52 +912,7 @@ class NsxtClient:
                                 {
                                     "resource_type": "ChildGatewayPolicy",
                                     "marked_for_delete": False,
-                                    "GatewayPolicy": {
-                                        "resource_type": "GatewayPolicy",
-                                        "display_name": policyName,
-                                        "id": policyName,
-                                        "marked_for_delete": False,
-                                        "tcp_strict": True,
-                                        "stateful": True,
-                                        "locked": False,
-                                        "category": "LocalGatewayRules",
-                                        "sequence_number": 10,
-                                        "children": [
-                                            {
-                                                "resource_type": "ChildRule",
-                                                "marked_for_delete": False,
-                                                "Rule": {
-                                                    "display_name": "default_rule",
-                                                    "id": "default_rule",
-                                                    "resource_type": "Rule",
-                                                    "marked_for_delete": False,
-                                                    "source_groups": [
-                                                        "ANY"
-                                                    ],
-                                                    "sequence_number": 10,
-                                                    "destination_groups": [
-                                                        "ANY"
-                                                    ],
-                                                    "services": [
-                                                        "ANY"
-                                                    ],
-                                                    "profiles": [
-                                                        "ANY"
-                                                    ],
-                                                    "scope": [
-                                                        tier_path[0]
-                                                    ],
-                                                    "action": "ALLOW",
-                                                    "direction": "IN_OUT",
-                                                    "logged": False,
-                                                    "disabled": False,
-                                                    "notes": "",
-                                                    "tag": "",
-                                                    "ip_protocol": "IPV4_IPV6"
-                                                }
-                                            }
-                                        ]
-                                    }
+                                    "GatewayPolicy": self.gatewayPolicyPayload(policyName, tier_path[0])
                                 }
                             ]
                         }
@@ -732,6 +929,8 @@ class NsxtClient:
                         "ERROR_CODE": 500
                     }
                     return  d, 500
+                self.inventory.invalidate("/policy/api/v1/infra/domains/default/gateway-policies",
+                                          "/policy/api/v1/infra/domains/default/gateway-policies/" + policyName + "/rules")
         else:
             logger.info(policyName + " policy is already created")
         list_fw = self.getListOfFirewallRule(headers_, policyName)
@@ -757,6 +956,8 @@ class NsxtClient:
                     "ERROR_CODE": 500
                 }
                 return  d, 500
+            self.inventory.record("/policy/api/v1/infra/domains/default/gateway-policies/" + policyName + "/rules",
+                                  response.json())
             msg_text = ruleName + " rule created successfully"
         else:
             msg_text = ruleName + " rule is already created"
@@ -785,28 +986,12 @@ class NsxtClient:
 
     def getESXIips(self):
         try:
-            str_enc = str(self.jsonspec['envSpec']['vcenterDetails']["vcenterSsoPasswordBase64"])
-            base64_bytes = str_enc.encode('ascii')
-            enc_bytes = base64.b64decode(base64_bytes)
-            password = enc_bytes.decode('ascii').rstrip("\n")
-
-            ecod_bytes = (self.jsonspec['envSpec']['vcenterDetails'][
-                            "vcenterSsoUser"] + ":" + password).encode(
-                "ascii")
-            ecod_bytes = base64.b64encode(ecod_bytes)
-            address = str(self.jsonspec['envSpec']['vcenterDetails']["vcenterAddress"])
-            ecod_string = ecod_bytes.decode("ascii")
-            uri = "https://" + address + "/api/session"
-            headers = {'Authorization': (
-                    'Basic ' + ecod_string)}
-            response = requests.request(
-                "POST", uri, headers=headers, verify=False)
-            if response.status_code != 201:
-                return None, response.status_code
-            url = "https://" + address + "/api/vcenter/host"
-            header = {'vmware-api-session-id': response.json()}
-            response = requests.request(
-                "GET", url, headers=header, verify=False)
+            session = VcenterRestSession.from_spec(self.jsonspec)
+            if session.session_id is None:
+                return None, "Failed to fetch session ID for vCenter - " + session.host
+            url = "https://" + session.host + "/api/vcenter/host"
+            response = vcenter_request(
+                "GET", url, headers=session.headers(), verify=False)
             if response.status_code != 200:
                 return None, response.text
             ips = ""
@@ -889,6 +1074,8 @@ class NsxtClient:
                     "ERROR_CODE": 500
                 }
                 return  d, 500
+            self.inventory.invalidate(
+                "/policy/api/v1/infra/domains/default/gateway-policies/" + policyName + "/rules")
             d = {
                 "responseType": "SUCCESS",
                 "msg": "Successfully updated default rule",
@@ -903,3 +1090,333 @@ class NsxtClient:
             }
             return  d, 500
 
+
+    def batch(self):
+        """
+        :return: NsxtBatch writing objects of this client's NSX-T manager in one hierarchical PATCH
+        """
+        return NsxtBatch(self)
+
+
+@trace_methods("nsxt")
+class NsxtBatch:
+    """
+    Segments, groups, services and gateway firewall rules of one configure step, written with a
+    single hierarchical PATCH /policy/api/v1/infra instead of a list-then-write round trip per object.
+    read() lists every existing object kind once, the add_* calls only queue what is missing or
+    incomplete and submit() sends the queued objects as one ChildResourceReference tree.
+    """
+
+    DOMAIN = "default"
+
+    def __init__(self, client: NsxtClient):
+        self.client = client
+        self.headers = None
+        self.tier1_path = None
+        self._existing = dict()
+        self._segments = dict()
+        self._services = dict()
+        self._groups = dict()
+        self._rules = dict()
+        self._errors = []
+
+    COLLECTIONS = {
+        "segments": "/infra/segments",
+        "groups": "/infra/domains/" + DOMAIN + "/groups",
+        "services": "/infra/services",
+        "policies": "/infra/domains/" + DOMAIN + "/gateway-policies"
+    }
+
+    def read(self):
+        """
+        Bulk read of the existing segments, groups, services and gateway policies, and the tier1 path
+        :return: (d, status)
+        """
+        headers_ = self.client.grabNsxtHeaders()
+        if headers_[0] is None:
+            d = {
+                "responseType": "ERROR",
+                "msg": "Failed to nsxt info " + str(headers_[1]),
+                "ERROR_CODE": 500
+            }
+            return d, 500
+        headers_[1].update({"Content-Type": "application/json", "Accept": "application/json"})
+        self.headers = headers_
+        for kind, path in self.COLLECTIONS.items():
+            output = self.client.getCollection(headers_[1], path)
+            if output[1] != 200:
+                d = {
+                    "responseType": "ERROR",
+                    "msg": "Failed to get list of " + kind + " " + str(output[0]),
+                    "ERROR_CODE": 500
+                }
+                return d, 500
+            self._existing[kind] = output[0]
+        tier_path = self.client.getTier1Details(headers_)
+        if tier_path[0] is None:
+            d = {
+                "responseType": "ERROR",
+                "msg": "Failed to get Tier1 details " + str(tier_path[1]),
+                "ERROR_CODE": 500
+            }
+            return d, 500
+        self.tier1_path = tier_path[0]
+        d = {
+            "responseType": "SUCCESS",
+            "msg": "Read NSX-T inventory",
+            "ERROR_CODE": 200
+        }
+        return d, 200
+
+    def _existing_object(self, kind, name):
+        collection = self._existing.get(kind)
+        return collection.find(name) if collection is not None else None
+
+    def segment_path(self, name):
+        """
+        :return: path of the segment, existing or queued, None when it is neither
+        """
+        existing = self._existing_object("segments", name)
+        if existing is not None:
+            return existing['path']
+        if name in self._segments:
+            return "/infra/segments/" + name
+        return None
+
+    def group_path(self, name):
+        """
+        :return: path of the group, existing or queued, None when it is neither
+        """
+        existing = self._existing_object("groups", name)
+        if existing is not None:
+            return existing['path']
+        if name in self._groups:
+            return "/infra/domains/" + self.DOMAIN + "/groups/" + self._groups[name]['id']
+        return None
+
+    def add_segment(self, segementName, gatewayAddress, dhcpStart, dhcpEnd, dnsServers, network, isDhcp):
+        """
+        Queue a segment unless it already exists, arguments as for NsxtClient.createNsxtSegment
+        :return: path of the segment
+        """
+        if self._existing_object("segments", segementName) is None:
+            self._segments[segementName] = (gatewayAddress, dhcpStart, dhcpEnd, dnsServers, network, isDhcp)
+        else:
+            logger.info(segementName + " is already created")
+        return self.segment_path(segementName)
+
+    def add_service(self, serviceName, port):
+        """
+        Queue a TCP service unless it already exists
+        :return: path of the service
+        """
+        existing = self._existing_object("services", serviceName)
+        if existing is not None:
+            logger.info("Service is already created " + serviceName)
+            return existing['path']
+        self._services[serviceName] = self.client.servicePayload(serviceName, port)
+        return "/infra/services/" + serviceName
+
+    def add_group(self, groupName, segmentName, isIp, ipaddresses):
+        """
+        Queue a group, arguments as for NsxtClient.createGroup. Members missing from an existing group
+        are added to it, a group already holding every member is left untouched.
+        :return: path of the group
+        """
+        existing = self._existing_object("groups", groupName)
+        group_id = existing['id'] if existing is not None else groupName
+        path = existing['path'] if existing is not None else \
+            "/infra/domains/" + self.DOMAIN + "/groups/" + group_id
+        if isIp == "vc":
+            if existing is None:
+                self._groups[groupName] = {
+                    "display_name": groupName,
+                    "expression": [
+                        {
+                            "value": ipaddresses,
+                            "member_type": "VirtualMachine",
+                            "key": "OSName",
+                            "operator": "EQUALS",
+                            "resource_type": "Condition"
+                        }
+                    ],
+                    "id": group_id
+                }
+            return path
+        if isIp == "true":
+            expression_type, member_key = "IPAddressExpression", "ip_addresses"
+            wanted = self.client.convertStringToCommaSeperated(ipaddresses)
+        else:
+            expression_type, member_key = "PathExpression", "paths"
+            segment_path = self.segment_path(segmentName)
+            if segment_path is None:
+                self._errors.append("Failed to find the segment " + str(segmentName))
+                return path
+            wanted = [segment_path]
+        members = []
+        queued = self._groups.get(groupName)
+        source = queued if queued is not None else existing
+        if source is not None:
+            for expression in source.get('expression', []):
+                members.extend(expression.get(member_key, []))
+        missing = [member for member in wanted if member not in members]
+        if not missing:
+            logger.info(groupName + " group is already created.")
+            return path
+        self._groups[groupName] = {
+            "display_name": groupName,
+            "expression": [
+                {
+                    "resource_type": expression_type,
+                    member_key: members + missing
+                }
+            ],
+            "id": group_id
+        }
+        return path
+
+    def add_rule(self, policyName, ruleName, rulePayLoad):
+        """
+        Queue a gateway firewall rule of the policy, the policy is created with its default rule when missing
+        """
+        rule = dict(rulePayLoad)
+        rule.update({"id": ruleName, "resource_type": "Rule"})
+        self._rules.setdefault(policyName, dict())[ruleName] = rule
+
+    def _policy_id(self, policyName):
+        policy = self._existing_object("policies", policyName)
+        return policy['id'] if policy is not None else policyName
+
+    def _policy_children(self):
+        children = []
+        count = 0
+        for policyName, rules in self._rules.items():
+            policy = self._existing_object("policies", policyName)
+            if policy is None:
+                logger.info("Creating policy " + policyName)
+                body = self.client.gatewayPolicyPayload(policyName, self.tier1_path)
+                body["children"] += [{"resource_type": "ChildRule", "marked_for_delete": False, "Rule": rule}
+                                     for rule in rules.values()]
+                count += len(rules)
+                children.append({
+                    "resource_type": "ChildGatewayPolicy",
+                    "marked_for_delete": False,
+                    "GatewayPolicy": body
+                })
+                continue
+            list_fw = self.client.getListOfFirewallRule(self.headers, policy['id'])
+            if list_fw[0] is None:
+                return None, "Failed to get list of firewalls " + str(list_fw[1])
+            present = {rule['display_name'] for rule in list_fw[0]}
+            new_rules = [rule for name, rule in rules.items() if name not in present]
+            for name in rules:
+                if name in present:
+                    logger.info(name + " rule is already created")
+            if new_rules:
+                count += len(new_rules)
+                children.append({
+                    "resource_type": "ChildResourceReference",
+                    "id": policy['id'],
+                    "target_type": "GatewayPolicy",
+                    "children": [{"resource_type": "ChildRule", "marked_for_delete": False, "Rule": rule}
+                                 for rule in new_rules]
+                })
+        return children, count
+
+    def submit(self):
+        """
+        Write every queued object with one PATCH /policy/api/v1/infra, then forget the queue
+        :return: (d, status)
+        """
+        if self._errors:
+            d = {
+                "responseType": "ERROR",
+                "msg": ", ".join(self._errors),
+                "ERROR_CODE": 500
+            }
+            return d, 500
+        children = []
+        if self._segments:
+            overlay = str(self.client.jsonspec['envSpec']['vcenterDetails']["nsxtOverlay"])
+            trz = self.client.getTransportZone(self.headers[2], overlay, self.headers[1])
+            if trz[0] is None:
+                d = {
+                    "responseType": "ERROR",
+                    "msg": "Failed to get transport zone id " + str(trz[1]),
+                    "ERROR_CODE": 500
+                }
+                return d, 500
+            for name, args in self._segments.items():
+                logger.info("Creating segment " + name)
+                segment = self.client.segmentPayload(name, *args, self.tier1_path, trz[0])
+                segment["resource_type"] = "Segment"
+                children.append({"resource_type": "ChildSegment", "marked_for_delete": False, "Segment": segment})
+        for name, service in self._services.items():
+            logger.info("Creating service " + name)
+            service = dict(service, resource_type="Service")
+            children.append({"resource_type": "ChildService", "marked_for_delete": False, "Service": service})
+        domain_children = []
+        for name, group in self._groups.items():
+            logger.info("Creating group " + name)
+            group = dict(group, resource_type="Group")
+            domain_children.append({"resource_type": "ChildGroup", "marked_for_delete": False, "Group": group})
+        policy_children = self._policy_children()
+        if policy_children[0] is None:
+            d = {
+                "responseType": "ERROR",
+                "msg": policy_children[1],
+                "ERROR_CODE": 500
+            }
+            return d, 500
+        domain_children += policy_children[0]
+        if domain_children:
+            children.append({
+                "resource_type": "ChildResourceReference",
+                "id": self.DOMAIN,
+                "target_type": "Domain",
+                "children": domain_children
+            })
+        if not children:
+            msg_text = "NSX-T objects are already created"
+        else:
+            url = "https://" + self.headers[2] + "/policy/api/v1/infra"
+            payload = {
+                "resource_type": "Infra",
+                "children": children
+            }
+            response = requests.request("PATCH", url, headers=self.headers[1], data=json.dumps(payload, indent=4),
+                                        verify=False)
+            if response.status_code != 200:
+                logger.error(response.text)
+                d = {
+                    "responseType": "ERROR",
+                    "msg": "Failed to update NSX-T objects " + str(response.text),
+                    "ERROR_CODE": 500
+                }
+                return d, 500
+            msg_text = "Created " + str(len(self._segments)) + " segments, " + str(len(self._services)) + \
+                       " services, " + str(len(self._groups)) + " groups and " + \
+                       str(policy_children[1]) + " firewall rules"
+            logger.info(msg_text)
+            self.client.inventory.invalidate(
+                *["/policy/api/v1" + path for path in self.COLLECTIONS.values()],
+                *["/policy/api/v1" + self.COLLECTIONS["policies"] + "/" + self._policy_id(policy) + "/rules"
+                  for policy in self._rules])
+            if self._segments:
+                realized = self.client.waitForSegmentsRealized(self.headers[1], self.headers[2],
+                                                               list(self._segments))
+                if not realized[0]:
+                    logger.error(realized[1])
+                    d = {
+                        "responseType": "ERROR",
+                        "msg": realized[1],
+                        "ERROR_CODE": 500
+                    }
+                    return d, 500
+        self._segments, self._services, self._groups, self._rules = dict(), dict(), dict(), dict()
+        d = {
+            "responseType": "SUCCESS",
+            "msg": msg_text,
+            "ERROR_CODE": 200
+        }
+        return d, 200
@@ -0,0 +1,164 @@
+#  Copyright 2022 VMware, Inc
+#  SPDX-License-Identifier: BSD-2-Clause
+
+import base64
+import copy
+import functools
+import ipaddress
+import json
+import os
+import threading
+from pathlib import Path
+
+from model.vsphereSpec import TkgsMasterSpec, VsphereMasterSpec
+from util.logger_helper import LoggerHelper
+
+logger = LoggerHelper.get_logger(Path(__file__).stem)
+
+# Set on the processes of a workload cluster fan-out, the master spec then describes that one cluster
+WORKLOAD_CLUSTER_ENV = "WORKLOAD_CLUSTER"
+
+
+@functools.lru_cache(maxsize=64)
+def decode_secret(value) -> str:
+    """
+    Plain text of a base64 encoded spec secret, decoded once per process
+    """
+    return base64.b64decode(str(value).encode("ascii")).decode("utf-8").rstrip("\n")
+
+
+@functools.lru_cache(maxsize=256)
+def split_cidr(cidr):
+    """
+    :return: (gateway ip, prefix length) of a gateway cidr such as 192.168.10.1/24
+    """
+    return tuple(str(cidr).split("/"))
+
+
+@functools.lru_cache(maxsize=256)
+def netmask_of(cidr):
+    """
+    :return: dotted netmask of the cidr, None when it is not a valid IPv4 cidr
+    """
+    try:
+        return str(ipaddress.IPv4Network(cidr, False).netmask)
+    except Exception as e:
+        logger.error(e)
+        return None
+
+
+def vcenter_credentials(jsonspec):
+    """
+    :return: (vcenter address, sso user, decoded sso password) of the spec
+    """
+    vcenter_details = jsonspec['envSpec']['vcenterDetails']
+    return vcenter_details['vcenterAddress'], vcenter_details['vcenterSsoUser'], \
+        decode_secret(vcenter_details['vcenterSsoPasswordBase64'])
+
+
+def workload_cluster_names(jsonspec):
+    """
+    :return: names of the workload clusters of the spec, tkgWorkloadClusters when it is set
+    """
+    clusters = jsonspec.get('tkgWorkloadClusters') or [jsonspec['tkgWorkloadComponents']]
+    return [cluster['tkgWorkloadClusterName'] for cluster in clusters]
+
+
+def workload_cluster_spec(jsonspec, name):
+    """
+    Spec of one entry of tkgWorkloadClusters: its fields override tkgWorkloadComponents and
+    its optional tkgWorkloadDataNetwork overrides the fields of that section
+    """
+    clusters = jsonspec.get('tkgWorkloadClusters') or []
+    cluster = next((c for c in clusters if c.get('tkgWorkloadClusterName') == name), None)
+    if cluster is None:
+        if jsonspec['tkgWorkloadComponents']['tkgWorkloadClusterName'] == name:
+            return jsonspec
+        raise ValueError("Workload cluster " + str(name) + " not found in tkgWorkloadClusters")
+    spec = copy.deepcopy(jsonspec)
+    overrides = copy.deepcopy(cluster)
+    spec['tkgWorkloadDataNetwork'].update(overrides.pop('tkgWorkloadDataNetwork', None) or {})
+    spec['tkgWorkloadComponents'].update(overrides)
+    return spec
+
+
+class SpecStore:
+    """
+    Deployment spec files parsed once per process. A file is parsed again only when its
+    mtime or size changed, so a spec rewritten during a run is still picked up. The parsed
+    dict is shared by every caller and must be treated as read only.
+    """
+
+    _stores = dict()
+    _lock = threading.Lock()
+
+    def __init__(self, path, data):
+        self.path = path
+        self.data = data
+        self._spec = None
+        self._memo = dict()
+        self._memo_lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        """
+        :return: SpecStore of the spec file at path
+        """
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        workload_cluster = os.environ.get(WORKLOAD_CLUSTER_ENV)
+        stamp = (stat.st_mtime_ns, stat.st_size, workload_cluster)
+        with cls._lock:
+            entry = cls._stores.get(path)
+            if entry is None or entry[0] != stamp:
+                with open(path) as f:
+                    data = json.load(f)
+                if workload_cluster and 'tkgWorkloadComponents' in data:
+                    data = workload_cluster_spec(data, workload_cluster)
+                entry = (stamp, cls(path, data))
+                cls._stores[path] = entry
+            return entry[1]
+
+    @classmethod
+    def jsonspec(cls, path) -> dict:
+        """
+        Parsed spec dict, drop-in replacement of json.load on the spec file
+        """
+        return cls.load(path).data
+
+    @property
+    def spec(self):
+        """
+        Typed view of the spec, TkgsMasterSpec for the TKGS wcp and namespace specs
+        """
+        if self._spec is None:
+            model = TkgsMasterSpec if "tkgsComponentSpec" in self.data else VsphereMasterSpec
+            self._spec = model.parse_obj(self.data)
+        return self._spec
+
+    def memo(self, key, compute):
+        """
+        Value derived from the spec, computed once until the file changes
+        """
+        with self._memo_lock:
+            if key not in self._memo:
+                self._memo[key] = compute()
+            return self._memo[key]
+
+    def vcenter(self):
+        """
+        :return: dict of vcenter_ip, vcenter_username, vcenter_password, vcenter_datacenter,
+                 vcenter_cluster_name and vcenter_data_store
+        """
+        def _details():
+            vcenter_details = self.data['envSpec']['vcenterDetails']
+            return {
+                'vcenter_ip': vcenter_details['vcenterAddress'],
+                'vcenter_username': vcenter_details['vcenterSsoUser'],
+                'vcenter_password': decode_secret(vcenter_details['vcenterSsoPasswordBase64']),
+                'vcenter_datacenter': vcenter_details.get('vcenterDatacenter'),
+                'vcenter_cluster_name': vcenter_details.get('vcenterCluster'),
+                'vcenter_data_store': vcenter_details.get('vcenterDatastore')
+            }
+
+        return dict(self.memo("vcenter", _details))
@@ -242,3 +242,28 @@ class VsphereMasterSpec(BaseModel):
     tkgWorkloadComponents: Optional[TkgWorkloadComponents]
     harborSpec: Optional[HarborSpec]
     tanzuExtensions: Optional[TanzuExtensions]
+
+
+class TkgsVcenterDetails(BaseModel):
+    vcenterAddress: str
+    vcenterSsoUser: str
+    vcenterSsoPasswordBase64: str
+    vcenterDatacenter: str
+    vcenterCluster: str
+    vcenterDatastore: Optional[str]
+    contentLibraryName: Optional[str]
+    aviOvaName: Optional[str]
+
+
+class TkgsEnvSpec(BaseModel):
+    envType: Optional[str]
+    vcenterDetails: TkgsVcenterDetails
+    marketplaceSpec: Optional[MarketplaceSpec]
+    saasEndpoints: Optional[dict]
+    infraComponents: Optional[InfraComponents]
+
+
+class TkgsMasterSpec(BaseModel):
+    envSpec: TkgsEnvSpec
+    tkgsComponentSpec: Optional[dict]
+    tanzuExtensions: Optional[dict]
@@ -8,17 +8,17 @@ import ruamel.yaml # pip install ruamel.yaml
 from constants.constants import Paths, Avi_Version, Avi_Tkgs_Version, Env
 from util.avi_api_helper import obtain_avi_version, check_controller_is_up
 from util.logger_helper import LoggerHelper, log
-from util.cmd_helper import CmdHelper
 from model.run_config import RunConfig
 from util.tkg_util import TkgUtil
-from util.common_utils import checkenv, getClusterID
+from util.common_utils import getClusterID
 from util.govc_client import GovcClient
 from util.local_cmd_helper import LocalCmdHelper
 from util.common_utils import getClusterStatusOnTanzu
 from util.ShellHelper import runShellCommandAndReturnOutput
-from util.cleanup_util import CleanUpUtil
-from util.common_utils import envCheck
 from workflows.ra_nsxt_workflow import RaNSXTWorkflow
+from util.state_merge import state_read_path, state_write_path
+from util.workflow_context import WorkflowContext
+from model.spec_store import decode_secret
 
 logger = LoggerHelper.get_logger(name='Pre Setup')
 
@@ -30,7 +30,8 @@ class PreSetup:
         self.version = None
         self.jsonpath = None
         self.state_file_path = os.path.join(root_dir, Paths.STATE_PATH)
-        self.tkg_util_obj = TkgUtil(run_config=self.run_config)
+        self.context = WorkflowContext.of(self.run_config)
+        self.tkg_util_obj = self.context.tkg_util()
         self.tkg_version_dict = self.tkg_util_obj.get_desired_state_tkg_version()
         if "tkgs" in self.tkg_version_dict:
             self.jsonpath = os.path.join(self.run_config.root_dir, Paths.TKGS_WCP_MASTER_SPEC_PATH)
@@ -39,9 +40,8 @@ class PreSetup:
         else:
             raise Exception(f"Could not find supported TKG version: {self.tkg_version_dict}")
 
-        with open(self.jsonpath) as f:
-            self.jsonspec = json.load(f)
-        self.env = envCheck(self.run_config)
+        self.jsonspec = self.context.jsonspec(self.jsonpath)
+        self.env = self.context.env()
         if self.env[1] != 200:
             logger.error("Wrong env provided " + self.env[0])
             d = {
@@ -52,7 +52,7 @@ class PreSetup:
             return json.dumps(d), 500
         self.env = self.env[0]
 
-        check_env_output = checkenv(self.jsonspec)
+        check_env_output = self.context.check_vcenter(self.jsonspec)
         if check_env_output is None:
             msg = "Failed to connect to VC. Possible connection to VC is not available or " \
                   "incorrect spec provided."
@@ -64,7 +64,7 @@ class PreSetup:
         self.get_vcenter_details()
         self.get_avi_details()
         self.get_tkg_mgmt_details()
-        self.cleanup_obj = CleanUpUtil()
+        self.cleanup_obj = self.context.cleanup_util()
 
     def get_vcenter_details(self) -> None:
         """
@@ -74,7 +74,7 @@ class PreSetup:
         self.vcenter_dict = {}
         try:
             self.vcenter_dict.update({'vcenter_ip': self.jsonspec['envSpec']['vcenterDetails']['vcenterAddress'],
-                                      'vcenter_password': CmdHelper.decode_base64(
+                                      'vcenter_password': decode_secret(
                                           self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoPasswordBase64']),
                                       'vcenter_username': self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoUser'],
                                       'vcenter_cluster_name': self.jsonspec['envSpec']['vcenterDetails']['vcenterCluster'],
@@ -127,7 +127,7 @@ class PreSetup:
                   msg = "User defined message"
         """
         if self.env == Env.VCF:
-            RaNSXTWorkflow(self.run_config).configure_avi_nsxt_config()
+            self.context.workflow(RaNSXTWorkflow).configure_avi_nsxt_config()
         if TkgUtil.isEnvTkgs_wcp(self.jsonspec):
             avi_required = Avi_Tkgs_Version.VSPHERE_AVI_VERSION
         else:
@@ -315,16 +315,20 @@ class PreSetup:
         return state_dict, msg
 
     def update_state_yml(self, state_dict: dict):
-        config, ind, bsi = ruamel.yaml.util.load_yaml_guess_indent(open(self.state_file_path))
+        config, ind, bsi = ruamel.yaml.util.load_yaml_guess_indent(open(state_read_path(self.state_file_path)))
         for key, val in state_dict.items():
             instances = config[key]
+            if key == "workload_clusters":
+                # One entry per workload cluster, the unnamed entry of a fresh state is taken by the first one
+                instances = next((wl for wl in instances if wl.get("name") == val.get("name")), None) or \
+                    next((wl for wl in instances if not wl.get("name")), None)
+                if instances is None:
+                    logger.debug("No state entry for workload cluster " + str(val.get("name")))
+                    continue
             for item_key, item_val in val.items():
-                if key == "workload_clusters":
-                    instances[0][item_key] = item_val
-                else:
-                    instances[item_key] = item_val
+                instances[item_key] = item_val
 
         yaml = ruamel.yaml.YAML()
         yaml.indent(mapping=ind, sequence=ind, offset=bsi)
-        with open(self.state_file_path, 'w') as fp:
+        with open(state_write_path(self.state_file_path), 'w') as fp:
             yaml.dump(config, fp)
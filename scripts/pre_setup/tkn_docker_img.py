@@ -5,10 +5,8 @@
 
 __author__ = "Abhishek Inani"
 
-import json
 import os
 import shutil
-import requests
 
 from constants.constants import Paths, KubernetesOva, MarketPlaceUrl
 
@@ -19,9 +17,10 @@ from util.tkg_util import TkgUtil
 from util.common_utils import checkenv
 from util.govc_client import GovcClient
 from util.local_cmd_helper import LocalCmdHelper
-from util import cmd_runner
 from util.common_utils import envCheck
-from util.avi_api_helper import getProductSlugId
+from util.artifact_cache import get_artifact_cache, marketplace_sha256
+from util.marketplace_client import MarketplaceClient
+from model.spec_store import SpecStore
 logger = LoggerHelper.get_logger(name='Docker Image Creation')
 
 
@@ -45,8 +44,7 @@ class GenerateTektonDockerImage:
         else:
             raise Exception(f"Could not find supported TKG version: {self.tkg_version_dict}")
 
-        with open(self.jsonpath) as f:
-            self.jsonspec = json.load(f)
+        self.jsonspec = SpecStore.jsonspec(self.jsonpath)
         self.env = envCheck(self.run_config)
         if self.env[1] != 200:
             logger.error("Wrong env provided " + self.env[0])
@@ -90,37 +88,8 @@ class GenerateTektonDockerImage:
         if os.path.exists(self.pkg_dir):
             shutil.rmtree(self.pkg_dir)
         os.makedirs(self.pkg_dir)
-        headers = {
-            "Accept": "application/json",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "refreshToken": self.reftoken
-        }
-        json_object = json.dumps(payload, indent=4)
-        sess = requests.request("POST", MarketPlaceUrl.URL + "/api/v1/user/login", headers=headers,
-                                data=json_object, verify=False)
-        if sess.status_code != 200:
-            return None, "Failed to login and obtain csp-auth-token"
-        else:
-            self.token = sess.json()["access_token"]
-        headers = {
-            "Accept": "application/json",
-            "Content-Type": "application/json",
-            "csp-auth-token": self.token
-        }
-        slug = "true"
-        _solutionName = getProductSlugId(MarketPlaceUrl.TANZU_PRODUCT, headers)
-        if _solutionName[0] is None:
-            return None, "Failed to find product on Marketplace " + str(_solutionName[1])
-        solutionName = _solutionName[0]
-        product = requests.get(
-            MarketPlaceUrl.API_URL + "/products/" + solutionName + "?isSlug=" + slug + "&ownorg=false", headers=headers,
-            verify=False)
-        if product.status_code != 200:
-            return None, "Failed to Obtain Product ID"
-        else:
-            return product
+        self.client = MarketplaceClient.get(self.reftoken)
+        return self.client.product(MarketPlaceUrl.TANZU_PRODUCT)
 
     def extract_meta_info(self, product, grp):
         """
@@ -128,39 +97,20 @@ class GenerateTektonDockerImage:
         :param: product: product of which meta details needed
         :param: grp: Group of which meta details needed
         """
-        meta_dict = {}
-        objectid = None
-        file_name = None
-        app_version = None
-        metafileid = None
-        product_id = product.json()['response']['data']['productid']
-        for metalist in product.json()['response']['data']['metafilesList']:
-            if metalist['appversion'] == self.tkg_version:
-                if grp == "Kubectl Cluster CLI":
-                    if metalist["version"] == self.kube_version[1:] and str(metalist["groupname"]).strip("\t") \
-                            == grp:
-                        objectid = metalist["metafileobjectsList"][0]['fileid']
-                        file_name = metalist["metafileobjectsList"][0]['filename']
-                        app_version = metalist['appversion']
-                        metafileid = metalist['metafileid']
-                        break
-                else:
-                    if str(metalist["groupname"]).strip("\t") == grp:
-                        objectid = metalist["metafileobjectsList"][0]['fileid']
-                        file_name = metalist["metafileobjectsList"][0]['filename']
-                        app_version = metalist['appversion']
-                        metafileid = metalist['metafileid']
-                        break
-        logger.info("ovaName: {ovaName} app_version: {app_version} metafileid: {metafileid}".format(ovaName=file_name,
-                                                                                                    app_version=app_version,
-                                                                                                    metafileid=metafileid))
-        meta_dict.update({"object_id": objectid,
-                          "app_version": app_version,
-                          "metafile_id": metafileid,
-                          "product_id": product_id,
-                          "file_name": file_name})
-        if (objectid or file_name or app_version or metafileid) is None:
+        if grp == "Kubectl Cluster CLI":
+            metalist = product.metafile(self.tkg_version, self.kube_version[1:], grp)
+        else:
+            metalist = product.metafile(self.tkg_version, groupname=grp)
+        if metalist is None:
             return None, "Failed to find the file details in Marketplace"
+        meta_dict = {"object_id": metalist["metafileobjectsList"][0]['fileid'],
+                     "app_version": metalist['appversion'],
+                     "metafile_id": metalist['metafileid'],
+                     "product_id": product.product_id,
+                     "file_name": metalist["metafileobjectsList"][0]['filename'],
+                     "sha256": marketplace_sha256(metalist["metafileobjectsList"][0])}
+        logger.info("ovaName: {ovaName} app_version: {app_version} metafileid: {metafileid}".format(
+            ovaName=meta_dict["file_name"], app_version=meta_dict["app_version"], metafileid=meta_dict["metafile_id"]))
         return meta_dict
 
     def download_files_from_marketplace(self, meta_info):
@@ -169,12 +119,6 @@ class GenerateTektonDockerImage:
         :param: meta_info: Meta information's collected in earleir method
         """
         logger.info("Downloading file - " + meta_info["file_name"])
-        rcmd = cmd_runner.RunCmd()
-        headers = {
-            "Accept": "application/json",
-            "Content-Type": "application/json",
-            "csp-auth-token": self.token
-        }
         payload = {
             "eulaAccepted": "true",
             "appVersion": meta_info["app_version"],
@@ -182,29 +126,16 @@ class GenerateTektonDockerImage:
             "metafileobjectid": meta_info["object_id"]
         }
 
-        json_object = json.dumps(payload, indent=4).replace('\"true\"', 'true')
-        logger.info('--------')
-        logger.info('Marketplaceurl: {url} data: {data}'.format(url=MarketPlaceUrl.URL, data=json_object))
-        presigned_url = requests.request("POST",
-                                         MarketPlaceUrl.URL + "/api/v1/products/" + meta_info["product_id"] + "/download",
-                                         headers=headers, data=json_object, verify=False)
-        logger.info('presigned_url: {}'.format(presigned_url))
-        logger.info('presigned_url text: {}'.format(presigned_url.text))
-        if presigned_url.status_code != 200:
-            return None, "Failed to obtain pre-signed URL"
-        else:
-            download_url = presigned_url.json()["response"]["presignedurl"]
-        curl_inspect_cmd = 'curl -I -X GET {} --output /tmp/resp.txt'.format(download_url)
-        rcmd.run_cmd_only(curl_inspect_cmd)
-        with open('/tmp/resp.txt', 'r') as f:
-            data_read = f.read()
-        if 'HTTP/1.1 200 OK' in data_read:
-            logger.info('Proceed to Download')
-            ova_path = os.path.join(self.pkg_dir, meta_info["file_name"])
-            self.download_file(download_url, ova_path)
-        else:
-            logger.info('Error in presigned url/key: {} '.format(data_read.split('\n')[0]))
-            return None, "Invalid key/url"
+        # docker build does not follow symlinks out of its context, the cache hard links or copies
+        ova_path = os.path.join(self.pkg_dir, meta_info["file_name"])
+        try:
+            get_artifact_cache().fetch(meta_info["metafile_id"], meta_info["file_name"],
+                                       lambda: self.client.presigned_url(meta_info["product_id"], payload),
+                                       sha256=meta_info.get("sha256"), dest=ova_path)
+        except Exception as e:
+            logger.error("Failed to download " + meta_info["file_name"] + ": " + str(e))
+            return None, str(e)
+        return ova_path, "SUCCESS"
 
     def build_docker_image(self):
         """
@@ -216,20 +147,6 @@ class GenerateTektonDockerImage:
         dckr_cmd = ["docker", "build", "-t", f"{self.docker_img_name}:{tag}", "-f", "dockerfile", "."]
         runProcess(dckr_cmd)
 
-    def download_file(self, url, dwl_file):
-        """
-        Method to download pre-requisites files needed to build docker image
-        :param: URL to be downloaded
-        :param: dwl_file: Output file name
-        """
-        with requests.get(url, stream=True) as r:
-            r.raise_for_status()
-            with open(dwl_file, 'wb') as f:
-                for chunk in r.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-        return dwl_file
-
     def clean_downloads(self):
         """
         Method to clean unwanted downloaded tar files
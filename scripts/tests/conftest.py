@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the workflows import their modules relative to scripts/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from util.artifact_cache import ArtifactCache
+
+CHUNK = 1024
+CONTENT = os.urandom(10 * CHUNK + 100)
+
+
+class _RangeHandler(BaseHTTPRequestHandler):
+    ranges = []
+
+    def do_GET(self):
+        match = re.match(r"bytes=(\d+)-(\d+)", self.headers.get("Range", ""))
+        if match is None:
+            body = CONTENT
+            self.send_response(200)
+        else:
+            start, end = int(match.group(1)), int(match.group(2))
+            self.ranges.append((start, end))
+            body = CONTENT[start:end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes %d-%d/%d" % (start, end, len(CONTENT)))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def url():
+    _RangeHandler.ranges = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _RangeHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield "http://127.0.0.1:%d/avi.ova" % server.server_address[1]
+    server.shutdown()
+    server.server_close()
+
+
+def _cache(tmp_path, max_size=1024 * 1024):
+    return ArtifactCache(str(tmp_path / "cache"), max_size=max_size, workers=2, chunk_size=CHUNK)
+
+
+def test_download_resumes_from_the_chunks_already_fetched(tmp_path, url):
+    cache = _cache(tmp_path)
+    sha256 = hashlib.sha256(CONTENT).hexdigest()
+    entry_dir = cache._entry_dir("avi", sha256)
+    os.makedirs(entry_dir)
+    part = os.path.join(entry_dir, "avi.ova.part")
+    with open(part, "wb") as f:
+        f.write(CONTENT[:5 * CHUNK] + b"\0" * (len(CONTENT) - 5 * CHUNK))
+    with open(part + ".done", "w") as f:
+        f.write("".join(str(index) + "\n" for index in range(5)))
+
+    path = cache.fetch("avi", "avi.ova", lambda: url, sha256=sha256)
+
+    with open(path, "rb") as f:
+        assert f.read() == CONTENT
+    fetched = sorted(start // CHUNK for start, end in _RangeHandler.ranges if end > start)
+    assert fetched == list(range(5, 11))
+    assert not os.path.exists(part) and not os.path.exists(part + ".done")
+    assert cache.lookup("avi", "avi.ova", sha256) == path
+
+
+def test_checksum_mismatch_deletes_the_download(tmp_path, url):
+    cache = _cache(tmp_path)
+    sha256 = hashlib.sha256(b"something else").hexdigest()
+
+    with pytest.raises(Exception, match="Checksum mismatch"):
+        cache.fetch("avi", "avi.ova", lambda: url, sha256=sha256)
+
+    entry_dir = cache._entry_dir("avi", sha256)
+    assert sorted(os.listdir(entry_dir)) == [".lock"]
+    assert cache.lookup("avi", "avi.ova", sha256) is None
+
+
+def test_eviction_skips_the_entry_in_use(tmp_path, url):
+    cache = _cache(tmp_path)
+    old = cache.fetch("old", "avi.ova", lambda: url)
+    newer = cache.fetch("newer", "avi.ova", lambda: url)
+    cache.max_size = len(CONTENT) + CHUNK
+
+    with cache._locked(os.path.dirname(old)):
+        cache.evict()
+
+    assert os.path.exists(old)
+    assert not os.path.exists(os.path.dirname(newer))
+    latest = cache.fetch("latest", "avi.ova", lambda: url)
+    assert os.path.exists(latest) and not os.path.exists(os.path.dirname(old))
@@ -0,0 +1,81 @@
+import base64
+import threading
+import urllib.request
+from unittest import mock
+
+import requests
+
+from util import avi_api_helper
+from util.avi_api_helper import AviSession, obtain_session_csrf
+
+
+def _login_response():
+    response = mock.Mock(status_code=200)
+    response.cookies = requests.cookies.cookiejar_from_dict({"csrftoken": "token", "sessionid": "session"})
+    return response
+
+
+def test_cold_login_returns_csrf_without_deadlock():
+    ip = "10.0.0.10"
+    password = base64.b64encode(b"secret").decode("ascii")
+    http = mock.Mock()
+    http.request.return_value = _login_response()
+    result = dict()
+
+    def login():
+        result["csrf2"] = obtain_session_csrf(ip, password)
+
+    with mock.patch.object(avi_api_helper, "_new_http_session", return_value=http), \
+            mock.patch.dict(AviSession._sessions, clear=True):
+        thread = threading.Thread(target=login, daemon=True)
+        thread.start()
+        thread.join(timeout=10)
+        assert not thread.is_alive(), "cold login deadlocked"
+        assert result["csrf2"][0] == "token"
+        assert "sessionid=session" in result["csrf2"][1]
+        assert AviSession.lookup(ip).csrf2 == result["csrf2"]
+    method, url = http.request.call_args[0]
+    assert (method, url) == ("POST", "https://" + ip + "/login")
+
+
+def _session(http, csrf2):
+    with mock.patch.object(avi_api_helper, "_new_http_session", return_value=http):
+        session = AviSession("10.0.0.11", "pass")
+    session.csrf2 = csrf2
+    session._tokens.add(csrf2[0])
+    return session
+
+
+def _sent(http, call):
+    headers = http.request.call_args_list[call][1]["headers"]
+    return headers.get("x-csrftoken"), headers.get("Cookie")
+
+
+def test_credentials_of_the_caller_are_sent_untouched():
+    http = mock.Mock()
+    http.request.return_value = mock.Mock(status_code=401)
+    session = _session(http, ("token", "sessionid=session; "))
+    with mock.patch.object(avi_api_helper, "obtain_second_csrf") as login:
+        response = session.request("PUT", "https://10.0.0.11/api/useraccount",
+                                   headers={"x-csrftoken": "first", "Cookie": "sessionid=first; "})
+    assert response.status_code == 401
+    assert http.request.call_count == 1 and _sent(http, 0) == ("first", "sessionid=first; ")
+    login.assert_not_called()
+
+
+def test_expired_session_token_is_replayed_after_login():
+    http = mock.Mock()
+    http.request.side_effect = [mock.Mock(status_code=401), mock.Mock(status_code=200)]
+    session = _session(http, ("old", "sessionid=old; "))
+    with mock.patch.object(avi_api_helper, "obtain_second_csrf", return_value=("new", "sessionid=new; ")):
+        response = session.request("GET", "https://10.0.0.11/api/cloud",
+                                   headers={"x-csrftoken": "old", "Cookie": "sessionid=old; "})
+    assert response.status_code == 200
+    assert _sent(http, 0) == ("old", "sessionid=old; ")
+    assert _sent(http, 1) == ("new", "sessionid=new; ")
+
+
+def test_http_session_keeps_no_cookies():
+    http = avi_api_helper._new_http_session()
+    cookie = requests.cookies.create_cookie("sessionid", "session", domain="10.0.0.12")
+    assert not http.cookies.get_policy().set_ok(cookie, urllib.request.Request("https://10.0.0.12/login"))
@@ -0,0 +1,56 @@
+import os
+from unittest import mock
+
+import pytest
+
+from util import checkpoint
+from util.checkpoint import Checkpoints, fingerprint
+
+
+def test_changed_fingerprint_invalidates_the_step(tmp_path):
+    root_dir = str(tmp_path)
+    Checkpoints(root_dir, "mgmt").mark("avi-vm", fingerprint("avi", "small"), uuid="vm-1")
+
+    checkpoints = Checkpoints(root_dir, "mgmt")
+    assert checkpoints.done("avi-vm", fingerprint("avi", "small"))
+    assert checkpoints.data("avi-vm") == {"uuid": "vm-1"}
+    assert not checkpoints.done("avi-vm", fingerprint("avi", "large"))
+    assert not Checkpoints(root_dir, "shared").done("avi-vm", fingerprint("avi", "small"))
+
+
+def test_step_whose_result_is_gone_runs_again(tmp_path):
+    root_dir = str(tmp_path)
+    Checkpoints(root_dir, "mgmt").mark("avi-vm", "key")
+
+    checkpoints = Checkpoints(root_dir, "mgmt")
+    assert not checkpoints.done("avi-vm", "key", exists=lambda: False)
+    assert not Checkpoints(root_dir, "mgmt").done("avi-vm", "key")
+
+
+def test_torn_write_keeps_the_previous_journal(tmp_path):
+    root_dir = str(tmp_path)
+    checkpoints = Checkpoints(root_dir, "mgmt")
+    checkpoints.mark("avi-vm", "key")
+
+    def torn_dump(data, f):
+        f.write("scope: mgmt\nsteps:\n  avi-vm: {key: ")
+        raise OSError("No space left on device")
+
+    with mock.patch.object(checkpoint.yaml, "dump", side_effect=torn_dump):
+        with pytest.raises(OSError):
+            checkpoints.mark("se-vm", "key")
+    assert Checkpoints(root_dir, "mgmt").done("avi-vm", "key")
+    assert os.listdir(os.path.dirname(checkpoints.path)) == ["mgmt.yml"]
+
+
+def test_unreadable_journal_is_ignored(tmp_path):
+    root_dir = str(tmp_path)
+    path = checkpoint.checkpoint_path(root_dir, "mgmt")
+    os.makedirs(os.path.dirname(path))
+    with open(path, "w") as f:
+        f.write("scope: mgmt\nsteps:\n  avi-vm: {key: ")
+
+    checkpoints = Checkpoints(root_dir, "mgmt")
+    assert not checkpoints.done("avi-vm", "key")
+    checkpoints.mark("avi-vm", "key")
+    assert Checkpoints(root_dir, "mgmt").done("avi-vm", "key")
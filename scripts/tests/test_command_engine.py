@@ -0,0 +1,59 @@
+import logging
+import sys
+import time
+
+from util import command_engine
+from util.cmd_runner import RunCmd
+
+
+def _python(code):
+    return [sys.executable, "-c", code]
+
+
+def test_exit_code_is_reported():
+    result = command_engine.run(_python("import sys; sys.exit(3)"))
+    assert result.exit_code == 3
+    assert not result and not result.timed_out
+
+
+def test_command_that_can_not_start_has_no_exit_code():
+    result = command_engine.run(["/nonexistent/command"])
+    assert result.exit_code is None
+    assert not result
+
+
+def test_timeout_terminates_the_command():
+    begin = time.monotonic()
+    result = command_engine.run(_python("import time; time.sleep(30)"), timeout=0.5)
+    assert result.timed_out
+    assert result.exit_code is not None and result.exit_code != 0
+    assert time.monotonic() - begin < command_engine.KILL_GRACE
+
+
+def test_output_is_captured_and_stderr_kept_apart():
+    code = "import sys; print('x' * 200000); print('second'); sys.stderr.write('oops\\n')"
+    result = command_engine.run(_python(code), capture=True, merge_stderr=False)
+    assert result.ok
+    assert result.text() == "x" * 200000 + "\nsecond\n"
+    assert "oops" not in result.text() and "oops" in result.tail
+    assert result.stderr_bytes == len("oops\n")
+
+
+def test_output_is_streamed_into_the_log(caplog):
+    with caplog.at_level(logging.DEBUG, logger=command_engine.logger.name):
+        result = command_engine.run(_python("print('first'); print('second')"), level=logging.INFO, prefix="> ")
+    assert result.output is None and list(result.tail) == ["first", "second"]
+    assert [r.getMessage() for r in caplog.records if r.levelno == logging.INFO] == ["> first", "> second"]
+
+
+def test_run_all_keeps_the_order_of_the_commands():
+    results = command_engine.run_all([_python("import time; time.sleep(0.3); print('slow')"),
+                                      _python("print('fast')")], capture=True)
+    assert [result.text() for result in results] == ["slow\n", "fast\n"]
+
+
+def test_run_cmd_only_does_not_log_the_output(caplog):
+    with caplog.at_level(logging.DEBUG):
+        RunCmd().run_cmd_only(sys.executable + " -c \"print('secret output')\"")
+    assert not [r for r in caplog.records if "secret output" in r.getMessage() and "Running cmd" not in
+                r.getMessage() and "Command to execute" not in r.getMessage()]
@@ -0,0 +1,78 @@
+import os
+import sys
+import threading
+
+import yaml
+
+from lib.kube_context import KubeContexts, bound_kubeconfig
+from util import command_engine
+
+
+def _kubeconfig(path, contexts, current):
+    config = {
+        "apiVersion": "v1",
+        "kind": "Config",
+        "clusters": [{"name": name, "cluster": {"server": "https://" + name}} for name in contexts],
+        "users": [{"name": name + "-admin", "user": {"token": name}} for name in contexts],
+        "contexts": [{"name": name, "context": {"cluster": name, "user": name + "-admin"}} for name in contexts],
+        "current-context": current,
+    }
+    with open(path, "w") as f:
+        yaml.dump(config, f)
+
+
+def _kubeconfig_of_command():
+    result = command_engine.run([sys.executable, "-c", "import os; print(os.environ.get('KUBECONFIG'))"],
+                                capture=True)
+    return result.text().strip()
+
+
+def test_bound_thread_runs_against_context_without_switching_others(tmp_path, monkeypatch):
+    default = str(tmp_path / "config")
+    _kubeconfig(default, ["mgmt", "workload"], "mgmt")
+    monkeypatch.setenv("KUBECONFIG", default)
+    contexts = KubeContexts(cache_dir=str(tmp_path / "cache"))
+    seen = dict()
+
+    def other():
+        seen["bound"] = bound_kubeconfig()
+        seen["kubeconfig"] = _kubeconfig_of_command()
+
+    try:
+        assert contexts.use_context("workload")[0] == "workload"
+        kubeconfig, context = bound_kubeconfig()
+        with open(kubeconfig) as f:
+            extracted = yaml.safe_load(f)
+        assert context == "workload" and extracted["current-context"] == "workload"
+        assert [c["name"] for c in extracted["clusters"]] == ["workload"]
+        assert _kubeconfig_of_command() == kubeconfig
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join()
+        assert seen == {"bound": (None, None), "kubeconfig": default}
+        with open(default) as f:
+            assert yaml.safe_load(f)["current-context"] == "mgmt"
+    finally:
+        contexts.release()
+    assert bound_kubeconfig() == (None, None)
+    assert _kubeconfig_of_command() == default
+
+
+def test_exported_contexts_are_added_without_changing_current_context(tmp_path, monkeypatch):
+    default = str(tmp_path / "config")
+    exported = str(tmp_path / "workload.yaml")
+    _kubeconfig(default, ["mgmt"], "mgmt")
+    _kubeconfig(exported, ["workload"], "workload")
+    monkeypatch.setenv("KUBECONFIG", default)
+    contexts = KubeContexts(cache_dir=str(tmp_path / "cache"))
+    monkeypatch.setattr(contexts, "admin_kubeconfig", lambda *args: (exported, "workload"))
+    try:
+        assert contexts.use("workload")[0] == "workload"
+        assert bound_kubeconfig() == (exported, "workload")
+    finally:
+        contexts.release()
+    with open(default) as f:
+        merged = yaml.safe_load(f)
+    assert merged["current-context"] == "mgmt"
+    assert [c["name"] for c in merged["contexts"]] == ["mgmt", "workload"]
+    assert os.path.exists(exported)
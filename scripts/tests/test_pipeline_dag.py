@@ -0,0 +1,43 @@
+import os
+import threading
+import time
+
+from util.pipeline_dag import network_lock
+
+
+def _lease(root_dir, network):
+    return os.path.join(root_dir, "deployment-state", ".locks", network + ".lock")
+
+
+def test_same_network_stages_run_one_after_the_other(tmp_path):
+    root_dir = str(tmp_path)
+    events = []
+
+    def stage(name):
+        with network_lock(root_dir, "tkg-mgmt", poll=0.05):
+            events.append(name + " start")
+            time.sleep(0.2)
+            events.append(name + " end")
+
+    threads = [threading.Thread(target=stage, args=(name,)) for name in ["shared", "workload"]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert events[0].endswith("start") and events[1].endswith("end")
+    assert events[2].endswith("start") and events[3].endswith("end")
+    assert not os.path.exists(_lease(root_dir, "tkg-mgmt"))
+
+
+def test_stale_lease_is_taken_over(tmp_path):
+    root_dir = str(tmp_path)
+    lease = _lease(root_dir, "tkg-mgmt")
+    os.makedirs(os.path.dirname(lease))
+    with open(lease, "w") as f:
+        f.write("dead-pod 1\n")
+    old = time.time() - 3600
+    os.utime(lease, (old, old))
+    with network_lock(root_dir, "tkg-mgmt", stale_after=60, poll=0.05):
+        with open(lease) as f:
+            assert not f.read().startswith("dead-pod")
+    assert not os.path.exists(lease)
@@ -0,0 +1,77 @@
+from unittest import mock
+
+from util.reconcile import APPLIED, BLOCKED, DRIFTED, FAILED, IN_SYNC, MISSING, PENDING, UNKNOWN, Reconciler
+
+
+def _failing_observer():
+    raise Exception("controller unreachable")
+
+
+def _reconciler(clusters, networks):
+    reconciler = Reconciler()
+    reconciler.observe("cluster", lambda: dict(clusters))
+    reconciler.observe("network", networks if callable(networks) else lambda: dict(networks))
+    applies = {name: mock.Mock(return_value=("done", 200)) for name in ["avi", "mgmt", "extensions"]}
+    reconciler.step("avi", applies["avi"])
+    reconciler.want("network", "vip", "avi", {"dhcp": False})
+    reconciler.step("mgmt", applies["mgmt"], after=["avi"])
+    reconciler.want("cluster", "mgmt", "mgmt", {"status": "running"})
+    reconciler.step("extensions", applies["extensions"], after=["mgmt"])
+    return reconciler, applies
+
+
+def test_plan_reports_every_resource():
+    reconciler, _ = _reconciler({"mgmt": {"status": "creating"}}, {"vip": {"dhcp": False, "vlan": 10}})
+    reconciler.want("cluster", "workload", "mgmt")
+    plan = reconciler.plan()
+    assert [status for _, status, _ in plan["avi"]] == [IN_SYNC]
+    assert [(repr(resource), status) for resource, status, _ in plan["mgmt"]] == \
+           [("cluster/mgmt", DRIFTED), ("cluster/workload", MISSING)]
+    assert "status" in plan["mgmt"][0][2]
+    assert plan["extensions"] == []
+
+    reconciler, _ = _reconciler({}, _failing_observer)
+    assert reconciler.plan()["avi"][0][1] == UNKNOWN
+
+
+def test_only_out_of_sync_steps_and_their_resourceless_dependents_are_applied():
+    reconciler, applies = _reconciler({}, {"vip": {"dhcp": False}})
+    d, status = reconciler.run()
+    assert status == 200
+    assert d["steps"] == {"avi": IN_SYNC, "mgmt": APPLIED, "extensions": APPLIED}
+    applies["avi"].assert_not_called()
+    applies["mgmt"].assert_called_once()
+    applies["extensions"].assert_called_once()
+
+
+def test_resourceless_step_is_skipped_when_nothing_before_it_was_applied():
+    reconciler, applies = _reconciler({"mgmt": {"status": "running"}}, {"vip": {"dhcp": False}})
+    d, status = reconciler.run()
+    assert status == 200
+    assert d["steps"] == {"avi": IN_SYNC, "mgmt": IN_SYNC, "extensions": IN_SYNC}
+    assert not any(apply.called for apply in applies.values())
+
+
+def test_unobserved_step_fails_without_applying():
+    reconciler, applies = _reconciler({}, _failing_observer)
+    d, status = reconciler.run()
+    assert status == 500
+    assert d["steps"] == {"avi": FAILED, "mgmt": BLOCKED, "extensions": BLOCKED}
+    assert not any(apply.called for apply in applies.values())
+
+
+def test_failed_apply_blocks_dependents():
+    reconciler, applies = _reconciler({}, {"vip": {"dhcp": True}})
+    applies["avi"].return_value = ("error", 500)
+    d, status = reconciler.run()
+    assert status == 500
+    assert d["steps"] == {"avi": FAILED, "mgmt": BLOCKED, "extensions": BLOCKED}
+    applies["mgmt"].assert_not_called()
+
+
+def test_dry_run_applies_nothing():
+    reconciler, applies = _reconciler({}, {})
+    d, status = reconciler.run(dry_run=True)
+    assert status == 200
+    assert d["steps"] == {"avi": PENDING, "mgmt": PENDING, "extensions": PENDING}
+    assert not any(apply.called for apply in applies.values())
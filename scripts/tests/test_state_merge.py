@@ -0,0 +1,47 @@
+import os
+
+import yaml
+
+from constants.constants import Paths
+from util.state_merge import kubeconfig_fragment_dir, merge_kubeconfig_fragments
+
+
+def _write_yaml(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        yaml.dump(data, f)
+
+
+def _tanzu_config(contexts):
+    return {
+        "apiVersion": "config.tanzu.vmware.com/v1alpha1",
+        "kind": "ClientConfig",
+        "current": "mgmt",
+        "currentContext": {"kubernetes": "mgmt"},
+        "servers": [{"name": "mgmt", "type": "managementcluster"}],
+        "contexts": [{"name": name, "target": "kubernetes"} for name in contexts],
+    }
+
+
+def test_tanzu_config_of_every_fragment_is_kept(tmp_path):
+    root_dir = str(tmp_path)
+    config_suffix = os.path.relpath(Paths.REPO_TANZU_CONFIG_NEW, Paths.KUBECONFIG_REPO)
+    _write_yaml(os.path.join(root_dir, Paths.REPO_TANZU_CONFIG_NEW), _tanzu_config(["mgmt"]))
+    shared = kubeconfig_fragment_dir(root_dir, "shared-services")
+    workload = kubeconfig_fragment_dir(root_dir, "workload")
+    _write_yaml(os.path.join(shared, config_suffix), _tanzu_config(["mgmt", "shared"]))
+    _write_yaml(os.path.join(workload, config_suffix), _tanzu_config(["mgmt", "workload"]))
+    _write_yaml(os.path.join(shared, ".config", "tanzu", "tkg", "clusterconfigs", "shared.yaml"), {"name": "shared"})
+    _write_yaml(os.path.join(workload, ".config", "tanzu", "tkg", "clusterconfigs", "workload.yaml"),
+                {"name": "workload"})
+
+    merge_kubeconfig_fragments(root_dir)
+
+    with open(os.path.join(root_dir, Paths.REPO_TANZU_CONFIG_NEW)) as f:
+        merged = yaml.safe_load(f)
+    assert [context["name"] for context in merged["contexts"]] == ["mgmt", "shared", "workload"]
+    assert [server["name"] for server in merged["servers"]] == ["mgmt"]
+    assert merged["currentContext"] == {"kubernetes": "mgmt"}
+    clusterconfigs = os.path.join(root_dir, Paths.KUBECONFIG_REPO, ".config", "tanzu", "tkg", "clusterconfigs")
+    assert sorted(os.listdir(clusterconfigs)) == ["shared.yaml", "workload.yaml"]
+    assert not os.path.exists(os.path.dirname(shared))
@@ -1,109 +1,75 @@
 #  Copyright 2021 VMware, Inc
 #  SPDX-License-Identifier: BSD-2-Clause
 
+import logging
+import shlex
 import subprocess
 import re
 from subprocess import Popen, PIPE, STDOUT, CalledProcessError
+from util import command_engine
 from util.logger_helper import LoggerHelper, log
+from util.tracing import traced
 from pathlib import Path
 
 logger = LoggerHelper.get_logger(Path(__file__).stem)
 
+
+def _clean(output):
+    return output.rstrip("\n\r").replace("\x1b[0m", "").replace("\x1b[1m", "")
+
+
+def _failed(result):
+    """
+    The helpers below judge a command by its output, a command that could not start or
+    timed out is failed whatever it printed
+    """
+    return result.exit_code is None or result.timed_out
+
+
 def runShellCommandAndReturnOutput(fin):
-    try:
-        logger.debug(f"Command to execute: \n\"{' '.join(fin)}\"")
-        proc = subprocess.Popen(
-            fin,
-            stderr=subprocess.STDOUT,
-            stdout=subprocess.PIPE
-        )
-        output = proc.communicate()[0]
-        formatted_output = output.decode("utf-8").rstrip("\n\r").replace("\x1b[0m", "").replace("\x1b[1m", "")
-        logger.debug(f"Output: \n {'*' * 10}Output Start{'*' * 10}\n{formatted_output}\n{'*' * 10}Output End{'*' * 10}")
-        return_code = 1 if formatted_output.__contains__("error") else 0
-    except subprocess.CalledProcessError as e:
-        return_code = 1
-        formatted_output = e.output
-    return formatted_output.rstrip("\n\r"), return_code
+    result = command_engine.run(fin, capture=True)
+    formatted_output = _clean(result.text())
+    return_code = 1 if formatted_output.__contains__("error") or _failed(result) else 0
+    return formatted_output, return_code
+
 
 def runProcess(cmd):
-    logger.debug(f"Command to execute: \n\"{' '.join(cmd)}\"")
-    popen = subprocess.Popen(cmd, stdout=subprocess.PIPE, universal_newlines=True)
-    for stdout_line in iter(popen.stdout.readline, ""):
-        logger.info(stdout_line)
-    popen.stdout.close()
-    return_code = popen.wait()
-    if return_code:
-        raise subprocess.CalledProcessError(return_code, cmd)
+    result = command_engine.run(cmd, level=logging.INFO)
+    if not result.ok:
+        raise subprocess.CalledProcessError(result.exit_code or 1, cmd)
+
 
 def runShellCommandWithPolling(fin):
-    try:
-        proc = subprocess.Popen(
-            fin
-        )
-        proc.wait()
-        output = proc.poll()
-        if output != 0:
-            raise AssertionError("Failed " + str(output))
-    except subprocess.CalledProcessError as e:
-        returnCode = 1
-        output = e.output
-    return output
+    result = command_engine.run(fin, level=logging.INFO)
+    if not result.ok:
+        raise AssertionError("Failed " + str(result.exit_code))
+    return result.exit_code
 
 
 def runShellCommandAndReturnOutputAsList(fin):
-    try:
-        logger.debug(f"Command to execute: \n\"{' '.join(fin)}\"")
-        proc = subprocess.Popen(
-            fin,
-            stderr=subprocess.STDOUT,
-            stdout=subprocess.PIPE
-        )
-
-        output = proc.communicate()[0]
-        if output.decode("utf-8").lower().__contains__("error"):
-            returnCode = 1
-        else:
-            returnCode = 0
-    except subprocess.CalledProcessError as e:
-        returnCode = 1
-        output = e.output
-    formatted_output = output.decode("utf-8").rstrip("\n\r").replace("\x1b[0m", "").replace("\x1b[1m", "")
-    logger.debug(f"Output Received: \n {'*'*10}Output Start{'*'*10}\n{formatted_output}\n{'*'*10}Output End{'*'*10}")
-    return formatted_output.split("\n"), returnCode
+    return runShellCommandAndReturnOutputAsListWithChangedDir(fin, None)
 
 
 def runShellCommandAndReturnOutputAsListWithChangedDir(fin, ndir):
-    try:
-        proc = subprocess.Popen(
-            fin, cwd=ndir,
-            stderr=subprocess.STDOUT,
-            stdout=subprocess.PIPE
-        )
-        output = proc.communicate()[0]
-        if output.decode("utf-8").lower().__contains__("error"):
-            returnCode = 1
-        else:
-            returnCode = 0
-    except subprocess.CalledProcessError as e:
-        returnCode = 1
-        output = e.output
-    return output.decode("utf-8").rstrip("\n\r").replace("\x1b[0m", "").replace("\x1b[1m", "").split("\n"), returnCode
+    result = command_engine.run(fin, cwd=ndir, capture=True)
+    formatted_output = _clean(result.text())
+    returnCode = 1 if formatted_output.lower().__contains__("error") or _failed(result) else 0
+    return formatted_output.split("\n"), returnCode
+
+
+def _pipe(listMainCommand, listOfPipeCommand, ndir=None):
+    """
+    Run `main | pipe` and return the output of the pipe command, stderr is logged but not returned
+    """
+    cmd = shlex.join(listMainCommand) + " | " + shlex.join(listOfPipeCommand)
+    result = command_engine.run(cmd, cwd=ndir, capture=True, merge_stderr=False)
+    returnCode = 1 if not result.ok or result.text().lower().__contains__("error") else 0
+    return result.text(), returnCode
 
 
 def grabPipeOutputChagedDir(listMainCommand, listOfPipeCommand, ndir):
-    try:
-        ps = subprocess.Popen(listMainCommand, cwd=ndir, stdout=subprocess.PIPE)
-        output = subprocess.check_output(listOfPipeCommand, cwd=ndir, stdin=ps.stdout)
-        ps.wait()
-        if output.decode("utf-8").lower().__contains__("error"):
-            returnCode = 1
-        else:
-            returnCode = 0
-    except subprocess.CalledProcessError as e:
-        returnCode = 1
-        output = e.output
-    string = output.decode("utf-8").rstrip("\n\r").replace("\x1b[0m", "").replace("\x1b[1m", "").split("\n")
+    output, returnCode = _pipe(listMainCommand, listOfPipeCommand, ndir)
+    string = output.rstrip("\n\r").replace("\x1b[0m", "").replace("\x1b[1m", "").split("\n")
     return string, returnCode
 
 
@@ -121,6 +87,7 @@ def verifyPodsAreRunning(podName, listing, regex):
         return False
 
 
+@traced("shell", record_arg=0)
 def grabKubectlCommand(listOfCmd, regex):
     s = "'\"]"
     command = runShellCommandAndReturnOutputAsList(listOfCmd)
@@ -133,6 +100,7 @@ def grabKubectlCommand(listOfCmd, regex):
     return re.search(regex, string).group(1).replace(s, "")
 
 
+@traced("shell", record_arg=0)
 def grabIpAddress(listMainCommand, lisofPipeCommand, regex):
     try:
         command = grabPipeOutput(listMainCommand, lisofPipeCommand)
@@ -146,16 +114,5 @@ def grabIpAddress(listMainCommand, lisofPipeCommand, regex):
 
 
 def grabPipeOutput(listMainCommand, listOfPipeCommand):
-    try:
-        ps = subprocess.Popen(listMainCommand, stdout=subprocess.PIPE)
-        output = subprocess.check_output(listOfPipeCommand, stdin=ps.stdout)
-        ps.wait()
-        if output.decode("utf-8").lower().__contains__("error"):
-            returnCode = 1
-        else:
-            returnCode = 0
-    except subprocess.CalledProcessError as e:
-        returnCode = 1
-        output = e.output
-    string = output.decode("utf-8").rstrip("\n\r")
-    return string, returnCode
+    output, returnCode = _pipe(listMainCommand, listOfPipeCommand)
+    return output.rstrip("\n\r"), returnCode
@@ -0,0 +1,301 @@
+#  Copyright 2022 VMware, Inc
+#  SPDX-License-Identifier: BSD-2-Clause
+
+import fcntl
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from util.logger_helper import LoggerHelper
+from util.tracing import span
+
+logger = LoggerHelper.get_logger(Path(__file__).stem)
+
+# The Tekton workspace PVC is mounted on every task pod, so artifacts cached there survive across tasks and runs
+WORKSPACE_CACHE_DIR = "/workspace/task-shared-data/.artifact-cache"
+LOCAL_CACHE_DIR = "/tmp/arcas-artifact-cache"
+DEFAULT_MAX_SIZE = 60 * 1024 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024 * 1024
+DOWNLOAD_WORKERS = 4
+READ_SIZE = 1024 * 1024
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def default_cache_root():
+    """
+    :return: ARTIFACT_CACHE_DIR, else the workspace PVC when mounted, else a local directory
+    """
+    root = os.environ.get("ARTIFACT_CACHE_DIR")
+    if root:
+        return root
+    return WORKSPACE_CACHE_DIR if os.path.isdir(os.path.dirname(WORKSPACE_CACHE_DIR)) else LOCAL_CACHE_DIR
+
+
+def get_artifact_cache():
+    """
+    Process wide cache. Location and size limit can be overridden with ARTIFACT_CACHE_DIR
+    and ARTIFACT_CACHE_MAX_GB.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            root = default_cache_root()
+            max_gb = os.environ.get("ARTIFACT_CACHE_MAX_GB")
+            max_size = int(float(max_gb) * 1024 * 1024 * 1024) if max_gb else DEFAULT_MAX_SIZE
+            _cache = ArtifactCache(root, max_size)
+        return _cache
+
+
+def marketplace_sha256(file_entry):
+    """
+    :param file_entry: marketplace metafile object or deployment file entry
+    :return: sha256 digest published by marketplace, None when not available
+    """
+    digest = file_entry.get("hashdigest") or file_entry.get("sha256")
+    algo = str(file_entry.get("hashalgo", "sha256")).lower().replace("-", "")
+    if digest and algo in ["sha256", "sha_256"]:
+        return str(digest).lower()
+    return None
+
+
+def _sha256(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(READ_SIZE), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+class ArtifactCache:
+    """
+    Content addressed store for large downloads. Entries are keyed by a caller provided id
+    (marketplace metafileid) plus the expected checksum, downloads resume from where a previous
+    run stopped, and the least recently used entries are evicted above max_size.
+    """
+
+    def __init__(self, root, max_size=DEFAULT_MAX_SIZE, workers=DOWNLOAD_WORKERS, chunk_size=CHUNK_SIZE):
+        self.root = root
+        self.max_size = max_size
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=workers))
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=workers))
+        os.makedirs(self.root, exist_ok=True)
+
+    def _entry_dir(self, key, sha256):
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", str(key))
+        return os.path.join(self.root, name + "-" + (sha256[:16] if sha256 else "nosum"))
+
+    @contextmanager
+    def _locked(self, entry_dir, blocking=True):
+        """
+        flock on the entry so pods sharing the PVC do not download the same artifact twice
+        """
+        os.makedirs(entry_dir, exist_ok=True)
+        with open(os.path.join(entry_dir, ".lock"), "w") as lock:
+            flags = fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(lock, flags)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_meta(self, entry_dir):
+        try:
+            with open(os.path.join(entry_dir, "meta.json")) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, entry_dir, meta):
+        tmp = os.path.join(entry_dir, "meta.json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp, os.path.join(entry_dir, "meta.json"))
+
+    def lookup(self, key, filename, sha256=None):
+        """
+        :return: path of the cached artifact, None when it is not cached
+        """
+        entry_dir = self._entry_dir(key, sha256)
+        meta = self._read_meta(entry_dir)
+        path = os.path.join(entry_dir, filename)
+        if meta is None or meta.get("filename") != filename or not os.path.isfile(path):
+            return None
+        if os.path.getsize(path) != meta.get("size"):
+            return None
+        meta["last_used"] = time.time()
+        self._write_meta(entry_dir, meta)
+        return path
+
+    def fetch(self, key, filename, url_provider, sha256=None, dest=None):
+        """
+        Return the cached artifact, downloading it first when needed.
+        :param key: stable id of the artifact, e.g. marketplace metafileid
+        :param filename: file name of the artifact
+        :param url_provider: callable returning the download url, only called on a cache miss
+        :param sha256: expected digest, verified after download when given
+        :param dest: also make the artifact available at this path
+        :return: path of the artifact, dest when given
+        """
+        entry_dir = self._entry_dir(key, sha256)
+        with self._locked(entry_dir):
+            path = self.lookup(key, filename, sha256)
+            if path is not None:
+                logger.info("Using cached " + filename + " from " + entry_dir)
+            else:
+                with span("download " + filename, "download", key=key):
+                    path = self._download(entry_dir, filename, url_provider(), sha256)
+                self._write_meta(entry_dir, {"key": str(key), "filename": filename, "sha256": sha256,
+                                             "size": os.path.getsize(path), "last_used": time.time()})
+        self.evict(keep=entry_dir)
+        if dest is None:
+            return path
+        self.materialize(path, dest)
+        return dest
+
+    def materialize(self, path, dest):
+        """
+        Hard link the artifact to dest, copying it across filesystems. A symlink would dangle
+        once the entry is evicted.
+        """
+        if os.path.lexists(dest):
+            if not os.path.islink(dest) and os.path.samefile(dest, path):
+                return
+            os.remove(dest)
+        os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+        try:
+            os.link(path, dest)
+        except OSError:
+            shutil.copyfile(path, dest)
+
+    def _probe(self, url):
+        """
+        :return: (total size or None, whether ranges are supported)
+        """
+        with self.session.get(url, headers={"Range": "bytes=0-0"}, stream=True, verify=False) as r:
+            if r.status_code == 206:
+                match = re.search(r"/(\d+)$", r.headers.get("Content-Range", ""))
+                return (int(match.group(1)) if match else None), match is not None
+            if r.status_code == 200:
+                length = r.headers.get("Content-Length")
+                return (int(length) if length else None), False
+            raise Exception("Invalid key/url, download returned " + str(r.status_code))
+
+    def _download(self, entry_dir, filename, url, sha256):
+        part = os.path.join(entry_dir, filename + ".part")
+        done_file = part + ".done"
+        size, ranges = self._probe(url)
+        if ranges and size:
+            self._download_chunks(url, part, done_file, size)
+        else:
+            self._download_stream(url, part)
+        if size and os.path.getsize(part) != size:
+            raise Exception("Download of " + filename + " is incomplete")
+        if sha256:
+            digest = _sha256(part)
+            if digest != sha256:
+                os.remove(part)
+                if os.path.exists(done_file):
+                    os.remove(done_file)
+                raise Exception("Checksum mismatch for " + filename + ", expected " + sha256 + " got " + digest)
+        path = os.path.join(entry_dir, filename)
+        os.replace(part, path)
+        if os.path.exists(done_file):
+            os.remove(done_file)
+        logger.info("Downloaded " + filename + " to " + path)
+        return path
+
+    def _download_stream(self, url, part):
+        with self.session.get(url, stream=True, verify=False) as r:
+            r.raise_for_status()
+            with open(part, "wb") as f:
+                for block in r.iter_content(chunk_size=READ_SIZE):
+                    f.write(block)
+
+    def _download_chunks(self, url, part, done_file, size):
+        """
+        Fetch the artifact as fixed size ranges written in place, completed chunks are
+        recorded in done_file so an interrupted download resumes with the missing ones.
+        """
+        done = set()
+        if os.path.exists(part) and os.path.exists(done_file):
+            with open(done_file) as f:
+                done = {int(line) for line in f if line.strip()}
+        else:
+            with open(part, "wb") as f:
+                f.truncate(size)
+            open(done_file, "w").close()
+        chunks = [i for i in range((size + self.chunk_size - 1) // self.chunk_size) if i not in done]
+        if done:
+            logger.info("Resuming download, %s of %s chunks already present" % (len(done), len(done) + len(chunks)))
+        done_lock = threading.Lock()
+
+        def _fetch(index):
+            start = index * self.chunk_size
+            end = min(start + self.chunk_size, size) - 1
+            with self.session.get(url, headers={"Range": "bytes=%d-%d" % (start, end)}, stream=True,
+                                  verify=False) as r:
+                if r.status_code != 206:
+                    raise Exception("Range request failed with " + str(r.status_code))
+                fd = os.open(part, os.O_WRONLY)
+                try:
+                    offset = start
+                    for block in r.iter_content(chunk_size=READ_SIZE):
+                        os.pwrite(fd, block, offset)
+                        offset += len(block)
+                finally:
+                    os.close(fd)
+            if offset != end + 1:
+                raise Exception("Short read on chunk " + str(index))
+            with done_lock:
+                with open(done_file, "a") as f:
+                    f.write(str(index) + "\n")
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for future in [executor.submit(_fetch, index) for index in chunks]:
+                future.result()
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used entries until the cache fits in max_size. Entries being
+        downloaded or used by another pod are skipped.
+        """
+        entries = []
+        total = 0
+        for name in os.listdir(self.root):
+            entry_dir = os.path.join(self.root, name)
+            if not os.path.isdir(entry_dir):
+                continue
+            size = sum(f.stat().st_size for f in os.scandir(entry_dir) if f.is_file())
+            meta = self._read_meta(entry_dir) or {}
+            entries.append((meta.get("last_used", 0), entry_dir, size))
+            total += size
+        for last_used, entry_dir, size in sorted(entries):
+            if total <= self.max_size:
+                break
+            if entry_dir == keep:
+                continue
+            with self._locked(entry_dir, blocking=False) as locked:
+                if not locked:
+                    continue
+                logger.info("Evicting " + entry_dir + " from artifact cache")
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                total -= size
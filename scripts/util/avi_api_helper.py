@@ -2,13 +2,20 @@
 #  SPDX-License-Identifier: BSD-2-Clause
 
 import json
+import math
 import os
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import DefaultCookiePolicy
 from pathlib import Path
+from urllib.parse import urlparse
 from util import cmd_runner
 import base64
 import requests
 import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from util.ShellHelper import runProcess
 from constants.api_payloads import AlbPayload
 from constants.constants import ControllerLocation, MarketPlaceUrl, AviSize, CertName, Avi_Version, Avi_Tkgs_Version, Versions
@@ -17,13 +24,22 @@ from util.cmd_helper import CmdHelper
 from util.logger_helper import LoggerHelper
 from util.govc_client import GovcClient
 from util.replace_value import replaceValueSysConfig, replaceCertConfig
+from util.avi_registry import AviRegistry
 from util.vcenter_operations import verifyVcenterVersion
 from util.tkg_util import TkgUtil
-from util.vcenter_operations import verifyVcenterVersion
+from util.wait_helper import wait_until
+from util.tracing import span
+from util.artifact_cache import get_artifact_cache, marketplace_sha256
+from util.marketplace_client import MarketplaceClient, search_products
+from model.spec_store import decode_secret
 
 logger = LoggerHelper.get_logger(Path(__file__).stem)
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
+# AviRegistry payloads of the system configuration, edited in memory between the GET and the PUT
+SYSTEM_CONFIG_PAYLOAD = "systemConfig1.json"
+SYSTEM_CERT_PAYLOAD = "systemConfig.json"
+
 
 # Reference: https://github.com/vmware/alb-sdk/blob/eng/python/avi/sdk/README.md
 
@@ -61,16 +77,262 @@ class AviApiSpec:
             csrftoken=csrftoken,
         )
 
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def _new_http_session() -> requests.Session:
+    """
+    requests.Session keeping TCP/TLS connections alive between calls and retrying connection
+    level failures. It keeps no cookies, the AVI credentials of every call are the Cookie header
+    its caller passed, cookies set by earlier responses would replace them.
+    """
+    retries = Retry(total=3, connect=3, read=2, backoff_factor=1,
+                    status_forcelist=[502, 503, 504],
+                    allowed_methods=frozenset(["GET", "HEAD", "OPTIONS", "PUT", "DELETE"]),
+                    raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=32, max_retries=retries)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return session
+
+
+def pooled_http_session() -> requests.Session:
+    """
+    Process wide requests.Session used for the AVI REST calls to controllers without an AviSession
+    :return: shared requests.Session
+    """
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            _http_session = _new_http_session()
+        return _http_session
+
+
+class AviSession:
+    """
+    Keep-alive session to one AVI controller built on top of obtain_second_csrf.
+
+    Sessions are cached per controller address, so every workflow touching the same
+    controller shares one login and one connection pool. Requests carrying a csrf token
+    of the session that are answered with 401 trigger a fresh login and are replayed once
+    with the new csrf token and cookies. Credentials of the caller's own, e.g. the first
+    login before the admin password is set, are sent untouched.
+    """
+    _sessions = dict()
+    _lock = threading.Lock()
+
+    def __init__(self, ip, avienc_pass):
+        self.ip = str(ip)
+        self.avienc_pass = str(avienc_pass)
+        self.csrf2 = None
+        self.http = _new_http_session()
+        self._tokens = set()
+        self._login_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, ip, avienc_pass):
+        """
+        Return the cached session for ip, logging in if it is new or the password changed
+        :param ip: controller ip or fqdn
+        :param avienc_pass: base64 encoded admin password
+        :return: AviSession, csrf2 is None when login failed
+        """
+        with cls._lock:
+            session = cls._sessions.get(str(ip))
+            if session is None or session.avienc_pass != str(avienc_pass):
+                session = AviSession(ip, avienc_pass)
+                cls._sessions[str(ip)] = session
+        if session.csrf2 is None:
+            session.login()
+        return session
+
+    @classmethod
+    def lookup(cls, host):
+        with cls._lock:
+            return cls._sessions.get(str(host))
+
+    def login(self):
+        stale = self.csrf2
+        with self._login_lock:
+            # another thread may have already refreshed the token while we waited
+            if self.csrf2 is None or self.csrf2 is stale:
+                # the plain login, obtain_session_csrf would come back here through AviSession.get
+                self.csrf2 = obtain_second_csrf(self.ip, self.avienc_pass)
+                if self.csrf2 is not None:
+                    self._tokens.add(self.csrf2[0])
+        return self.csrf2
+
+    def headers(self, avi_version):
+        return {
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            "Cookie": self.csrf2[1],
+            "referer": "https://" + self.ip + "/login",
+            "x-avi-version": avi_version,
+            "x-csrftoken": self.csrf2[0]
+        }
+
+    def _send(self, method, url, headers, csrf2=None, **kwargs):
+        headers = dict(headers or {})
+        if csrf2 is not None:
+            headers["Cookie"] = csrf2[1]
+            headers["x-csrftoken"] = csrf2[0]
+        return self.http.request(method, url, headers=headers, **kwargs)
+
+    def request(self, method, url, headers=None, **kwargs):
+        kwargs.setdefault("verify", False)
+        headers = headers or {}
+        csrf2 = self.csrf2
+        if "x-csrftoken" in headers or "Cookie" in headers or urlparse(url).path == "/login":
+            csrf2 = None
+        response = self._send(method, url, headers, csrf2, **kwargs)
+        if response.status_code == 401 and (csrf2 is not None or headers.get("x-csrftoken") in self._tokens):
+            logger.info("AVI session on " + self.ip + " expired, logging in again")
+            if self.login() is not None:
+                response = self._send(method, url, headers, self.csrf2, **kwargs)
+        return response
+
+
+def avi_request(method, url, headers=None, **kwargs):
+    """
+    Drop-in replacement of requests.request for AVI REST calls. Requests go through the
+    pooled keep-alive session, and through the controller's AviSession when one exists
+    so stale csrf headers are refreshed on 401.
+    """
+    kwargs.setdefault("verify", False)
+    parsed = urlparse(url)
+    with span("AVI " + method, "avi", url=parsed.path) as span_args:
+        session = AviSession.lookup(parsed.hostname)
+        if session is not None:
+            response = session.request(method, url, headers=headers, **kwargs)
+        else:
+            response = pooled_http_session().request(method, url, headers=headers, **kwargs)
+        span_args["status"] = response.status_code
+        if method.upper() == "DELETE" and response.status_code in [200, 204] and "/api/" in parsed.path:
+            AviRegistry.forget_uuid(parsed.hostname, parsed.path.rstrip("/").split("/")[-1])
+        return response
+
+
+def obtain_session_csrf(ip, avienc_pass):
+    """
+    Same contract as obtain_second_csrf but reuses the cached AviSession login of the controller
+    :return: (csrftoken, cookies) tuple or None when login failed
+    """
+    return AviSession.get(ip, avienc_pass).csrf2
+
+
+def _get_avi_page(url, headers, params):
+    response = avi_request("GET", url, headers=headers, params=params, verify=False)
+    if response.status_code != 200:
+        raise Exception("Failed to fetch " + url + ": " + response.text)
+    return response.json()
+
+
+def iter_avi_collection(url, headers, name=None, fields=None, page_size=None, workers=1, **filters):
+    """
+    Lazily yield the objects of an AVI collection, page by page
+    :param url: collection url, e.g. https://<ip>/api/network
+    :param headers: AVI request headers carrying the csrf token
+    :param name: server side name= filter
+    :param fields: list of fields to project, server side fields= filter
+    :param page_size: objects per page requested from the controller
+    :param workers: when > 1 the remaining pages are fetched concurrently once count is known
+    :param filters: any other query filter, e.g. **{"cloud_ref.uuid": uuid}
+    """
+    params = dict(filters)
+    if name is not None:
+        params["name"] = name
+    if fields:
+        params["fields"] = ",".join(fields)
+    if page_size:
+        params["page_size"] = page_size
+    page = _get_avi_page(url, headers, params)
+    results = page.get("results", [])
+    for obj in results:
+        yield obj
+    if not page.get("next"):
+        return
+    if workers > 1 and results:
+        size = page_size or len(results)
+        pages = range(2, int(math.ceil(page.get("count", 0) / float(size))) + 1)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_get_avi_page, url, headers, dict(params, page=number, page_size=size))
+                       for number in pages]
+            try:
+                for future in futures:
+                    for obj in future.result().get("results", []):
+                        yield obj
+            finally:
+                # caller stopped early, drop the pages not fetched yet
+                for future in futures:
+                    future.cancel()
+        return
+    while page.get("next"):
+        page = _get_avi_page(page["next"], headers, None)
+        for obj in page.get("results", []):
+            yield obj
+
+
+def find_avi_object(url, headers, name, fields=None, **filters):
+    """
+    Return the first object of the collection named name, or None
+    """
+    for obj in iter_avi_collection(url, headers, name=name, fields=fields, **filters):
+        if obj.get("name") == name:
+            return obj
+    return None
+
+
+def avi_object_uuid(ip, csrf2, avi_version, kind, name):
+    """
+    uuid of an AVI object, from the AviRegistry or looked up on the controller and recorded
+    :param kind: collection name, e.g. cloud
+    :return: uuid, None when there is no such object
+    """
+    uuid = AviRegistry.uuid(ip, kind, name)
+    if uuid is not None and AviRegistry.recorded(ip, kind, name):
+        return uuid
+    headers = {
+        "Accept": "application/json",
+        "Content-Type": "application/json",
+        "Cookie": csrf2[1],
+        "referer": "https://" + ip + "/login",
+        "x-avi-version": avi_version,
+        "x-csrftoken": csrf2[0]
+    }
+    if uuid is not None:
+        # spilled by an earlier run, the object may have been deleted or the controller redeployed since
+        try:
+            response = avi_request("GET", "https://" + ip + "/api/" + kind + "/" + uuid, headers=headers,
+                                   params={"fields": "uuid,name,url"}, verify=False)
+            if response.status_code == 200:
+                AviRegistry.record(ip, kind, response.json())
+                return uuid
+            if response.status_code == 404:
+                logger.info("Cached " + kind + " " + name + " no longer exists, looking it up again")
+                AviRegistry.forget(ip, kind, name)
+        except Exception as e:
+            logger.warning("Failed to check cached " + kind + " " + name + " " + str(e))
+    try:
+        obj = find_avi_object("https://" + ip + "/api/" + kind, headers, name)
+    except Exception as e:
+        logger.error("Failed to look up " + kind + " " + name + " " + str(e))
+        return None
+    if obj is None:
+        return None
+    AviRegistry.record(ip, kind, obj)
+    return obj["uuid"]
+
 def getProductSlugId(productName, headers):
     try:
-        product = requests.get(
-            MarketPlaceUrl.PRODUCT_SEARCH_URL, headers=headers,
-            verify=False)
-        if product.status_code != 200:
-            return None, "Failed to search  product " + productName + " on Marketplace."
-        for pro in product.json()["response"]["dataList"]:
+        for pro in search_products(headers):
             if str(pro["displayname"]) == productName:
                 return str(pro["slug"]), "SUCCESS"
+        return None, "Failed to search  product " + productName + " on Marketplace."
     except Exception as e:
         return None, str(e)
 
@@ -91,88 +353,38 @@ def pushAviToContenLibraryMarketPlace(jsonspec):
     data_store = jsonspec['envSpec']['vcenterDetails']['vcenterDatastore']
     reftoken = jsonspec['envSpec']['marketplaceSpec']['refreshToken']
     avi_version = Avi_Tkgs_Version.VSPHERE_AVI_VERSION if TkgUtil.isEnvTkgs_wcp(jsonspec) else Avi_Version.VSPHERE_AVI_VERSION
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "refreshToken": reftoken
-    }
-    json_object = json.dumps(payload, indent=4)
-    sess = requests.request("POST", MarketPlaceUrl.URL + "/api/v1/user/login", headers=headers,
-                            data=json_object, verify=False)
-    logger.info('Session details: {}'.format(sess.status_code))
-    if sess.status_code != 200:
-        return None, "Failed to login and obtain csp-auth-token"
-    else:
-        token = sess.json()["access_token"]
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-        "csp-auth-token": token
-    }
     if my_file.exists():
         logger.info("Avi ova is already downloaded")
     else:
         logger.info("Downloading avi controller from MarketPlace")
-        slug = "true"
-        _solutionName = getProductSlugId(MarketPlaceUrl.AVI_PRODUCT, headers)
-        logger.info('Solution name from marketplace: {}'.format(_solutionName))
-        if _solutionName[0] is None:
-            return None, "Failed to find product on Marketplace " + str(_solutionName[1])
-        solutionName = _solutionName[0]
-        product = requests.get(MarketPlaceUrl.API_URL + "/products/" +
-                               solutionName + "?isSlug=" + slug + "&ownorg=false", headers=headers,
-                               verify=False)
-        if product.status_code != 200:
-            return None, "Failed to Obtain Product ID"
-        else:
-            ls = []
-            product_id = product.json()['response']['data']['productid']
-            logger.info('Product ID: {}'.format(product_id))
-            for metalist in product.json()['response']['data']['productdeploymentfilesList']:
-                if metalist["appversion"] == avi_version:
-                    objectid = metalist['fileid']
-                    filename = metalist['name']
-                    ls.append(filename)
-                    logger.info('filename: {}'.format(filename))
-                    logger.info("obj id: {objectid} filename: {filename} avi_version: {avi_version}".format(objectid=objectid,
-                                                                                 filename=filename,
-                                                                                 avi_version=avi_version))
-                    logger.info("PRODUCT ID: {product_id}".format(product_id=product_id))
-                    break
+        client = MarketplaceClient.get(reftoken)
+        try:
+            product = client.product(MarketPlaceUrl.AVI_PRODUCT)
+        except Exception as e:
+            return None, str(e)
+        product_id = product.product_id
+        logger.info('Product ID: {}'.format(product_id))
+        deployment_file = product.deployment_file(avi_version)
+        if deployment_file is None:
+            return None, "Failed to find avi " + avi_version + " on Marketplace"
+        objectid = deployment_file['fileid']
+        filename = deployment_file['name']
+        logger.info("obj id: {objectid} filename: {filename} avi_version: {avi_version}".format(objectid=objectid,
+                                                                                                filename=filename,
+                                                                                                avi_version=avi_version))
         payload = {
             "deploymentFileId": objectid,
             "eulaAccepted": "true",
             "productId": product_id
         }
-
-        json_object = json.dumps(payload, indent=4).replace('\"true\"', 'true')
-        logger.info('header: {}'.format(headers))
-        logger.info('data: {}'.format(json_object))
-        presigned_url = requests.request("POST",
-                                         MarketPlaceUrl.URL + "/api/v1/products/" + product_id + "/download",
-                                         headers=headers, data=json_object, verify=False)
-        if presigned_url.status_code != 200:
-            logger.error('Error on request. Code: {}\n Error: {}'.format(presigned_url.status_code,
-                                                                         presigned_url.text))
-            return None, "Failed to obtain pre-signed URL"
-        else:
-            download_url = presigned_url.json()["response"]["presignedurl"]
-
-        curl_inspect_cmd = 'curl -I -X GET {} --output /tmp/resp.txt'.format(download_url)
-        rcmd.run_cmd_only(curl_inspect_cmd)
-        with open('/tmp/resp.txt', 'r') as f:
-            data_read = f.read()
-        if 'HTTP/1.1 200 OK' in data_read:
-            logger.info('Proceed to Download')
-            ova_path = "/tmp/" + ControllerLocation.CONTENT_LIBRARY_OVA_NAME + ".ova"
-            curl_download_cmd = 'curl -X GET {d_url} --output {tmp_path}'.format(d_url=download_url,
-                                                                                 tmp_path=ova_path)
-            rcmd.run_cmd_only(curl_download_cmd)
-        else:
-            logger.info('Error in presigned url/key: {} '.format(data_read.split('\n')[0]))
-            return None, "Invalid key/url"
+        ova_path = "/tmp/" + ControllerLocation.CONTENT_LIBRARY_OVA_NAME + ".ova"
+        try:
+            get_artifact_cache().fetch("deploymentfile-" + str(objectid), filename,
+                                       lambda: client.presigned_url(product_id, payload),
+                                       sha256=marketplace_sha256(deployment_file), dest=ova_path)
+        except Exception as e:
+            logger.error("Failed to download avi ova: " + str(e))
+            return None, str(e)
         logger.info("Avi ova downloaded  at location: {}".format(ova_path))
 
     find_command = "govc library.ls"
@@ -249,7 +461,7 @@ def ra_avi_download(jsonspec):
     vcenter = jsonspec['envSpec']['vcenterDetails']["vcenterAddress"]
     vcenter_user = jsonspec['envSpec']['vcenterDetails']["vcenterSsoUser"]
     vcpass_base64 = jsonspec['envSpec']['vcenterDetails']['vcenterSsoPasswordBase64']
-    vcpass = CmdHelper.decode_base64(vcpass_base64)
+    vcpass = decode_secret(vcpass_base64)
     refresh_token = jsonspec['envSpec']['marketplaceSpec']['refreshToken']
     os.putenv("GOVC_URL", "https://" + vcenter + "/sdk")
     os.putenv("GOVC_USERNAME", vcenter_user)
@@ -283,34 +495,20 @@ def check_controller_is_up(ip):
     headers = {
         "Content-Type": "application/json"
     }
-    payload = {}
-    response_login = None
-    count = 0
-    status = None
-    try:
-        response_login = requests.request("GET", url, headers=headers, data=payload, verify=False)
-        status = response_login.status_code
-    except:
-        pass
-    while (status != 200 or status is None) and count < 150:
-        count = count + 1
+
+    def _controller_up():
         try:
-            response_login = requests.request("GET", url, headers=headers, data=payload, verify=False)
-            if response_login.status_code == 200:
-                break
-        except:
-            pass
-        logger.info("Waited for  " + str(count * 10) + "s, retrying.")
-        time.sleep(10)
-    if response_login is not None:
-        if response_login.status_code != 200:
-            return None
-        else:
-            logger.info("Controller is up and running in   " + str(count * 10) + "s.")
-            return "UP"
-    else:
-        logger.error("Controller is not reachable even after " + str(count * 10) + "s wait")
-        return None
+            return avi_request("GET", url, headers=headers, verify=False).status_code == 200
+        except Exception:
+            return False
+
+    status = wait_until(_controller_up, timeout=1500, interval=5, max_interval=10,
+                        description="AVI controller " + str(ip))
+    if status:
+        logger.info("Controller is up and running in   " + str(int(status.elapsed)) + "s.")
+        return "UP"
+    logger.error("Controller is not reachable even after " + str(int(status.elapsed)) + "s wait")
+    return None
 
 def obtain_first_csrf(ip):
     url = "https://" + str(ip) + "/login"
@@ -323,7 +521,7 @@ def obtain_first_csrf(ip):
         "password": "58NFaGDJm(PJH0G"
     }
     modified_payload = json.dumps(payload, indent=4)
-    response_csrf = requests.request("POST", url, headers=headers, data=modified_payload, verify=False)
+    response_csrf = avi_request("POST", url, headers=headers, data=modified_payload, verify=False)
     if response_csrf.status_code != 200:
         if str(response_csrf.text).__contains__("Invalid credentials"):
             return "SUCCESS"
@@ -350,7 +548,7 @@ def obtain_second_csrf(ip, avienc_pass):
         "password": password_avi
     }
     modified_payload = json.dumps(payload, indent=4)
-    response_csrf = requests.request("POST", url, headers=headers, data=modified_payload, verify=False)
+    response_csrf = avi_request("POST", url, headers=headers, data=modified_payload, verify=False)
     if response_csrf.status_code != 200:
         return None
     cookies_string = ""
@@ -379,15 +577,16 @@ def set_avi_admin_password(ip, first_csrf, avi_version, aviencpass):
                }
     modified_payload = json.dumps(payload, indent=4)
     url = "https://" + ip + "/api/useraccount"
-    response_csrf = requests.request("PUT", url, headers=headers, data=modified_payload, verify=False)
+    response_csrf = avi_request("PUT", url, headers=headers, data=modified_payload, verify=False)
     if response_csrf.status_code != 200:
         return None
     else:
         return "SUCCESS"
 
 def set_dns_ntp_smtp_settings(ip, second_csrf, avi_version):
-    with open('./systemConfig1.json', 'r') as openfile:
-        json_object = json.load(openfile)
+    json_object = AviRegistry.payload(SYSTEM_CONFIG_PAYLOAD)
+    if json_object is None:
+        return None
     url = AlbEndpoint.CRUD_SYSTEM_CONFIG.format(ip=ip)
     headers = {
         "Accept": "application/json",
@@ -398,7 +597,7 @@ def set_dns_ntp_smtp_settings(ip, second_csrf, avi_version):
         "x-csrftoken": second_csrf[0]
     }
     json_object_m = json.dumps(json_object, indent=4)
-    response_csrf = requests.request("PUT", url, headers=headers, data=json_object_m, verify=False)
+    response_csrf = avi_request("PUT", url, headers=headers, data=json_object_m, verify=False)
     if response_csrf.status_code != 200:
         return None
     else:
@@ -415,29 +614,26 @@ def get_system_configuration_and_set_values(ip, second_csrf, avi_version, jsonsp
         "x-csrftoken": second_csrf[0]
     }
     payload = {}
-    response_csrf = requests.request("GET", url, headers=headers, data=payload, verify=False)
+    response_csrf = avi_request("GET", url, headers=headers, data=payload, verify=False)
     logger.info('aviversion: {}'.format(avi_version))
     logger.info('response: {}'.format(response_csrf.text))
     logger.info('response code: {}'.format(response_csrf.status_code))
     if response_csrf.status_code != 200:
         return None
-    os.system("rm -rf ./systemConfig1.json")
-    json_object = json.dumps(response_csrf.json(), indent=4)
     ntp = jsonspec['envSpec']['infraComponents']['ntpServers']
     dns = jsonspec['envSpec']['infraComponents']['dnsServersIp']
     search_domain = jsonspec['envSpec']['infraComponents']['searchDomains']
-    with open("./systemConfig1.json", "w") as outfile:
-        outfile.write(json_object)
-    replaceValueSysConfig("./systemConfig1.json", "default_license_tier", "name", "ENTERPRISE")
-    replaceValueSysConfig("./systemConfig1.json", "email_configuration", "smtp_type", "SMTP_NONE")
-    replaceValueSysConfig("./systemConfig1.json", "dns_configuration", "false",
+    system_config = AviRegistry.set_payload(SYSTEM_CONFIG_PAYLOAD, response_csrf.json())
+    replaceValueSysConfig(system_config, "default_license_tier", "name", "ENTERPRISE")
+    replaceValueSysConfig(system_config, "email_configuration", "smtp_type", "SMTP_NONE")
+    replaceValueSysConfig(system_config, "dns_configuration", "false",
                           dns)
-    replaceValueSysConfig("./systemConfig1.json", "ntp_configuration", "ntp",
+    replaceValueSysConfig(system_config, "ntp_configuration", "ntp",
                           ntp)
-    replaceValueSysConfig("./systemConfig1.json", "dns_configuration", "search_domain",
+    replaceValueSysConfig(system_config, "dns_configuration", "search_domain",
                           search_domain)
     if TkgUtil.isEnvTkgs_ns(jsonspec) or TkgUtil.isEnvTkgs_wcp(jsonspec):
-        replaceValueSysConfig("./systemConfig1.json", "portal_configuration", "allow_basic_authentication",
+        replaceValueSysConfig(system_config, "portal_configuration", "allow_basic_authentication",
                               "true")
     return "SUCCESS"
 
@@ -461,7 +657,7 @@ def disable_welcome_screen(ip, second_csrf, avi_version):
                 },
             }
         }
-    response_csrf = requests.request("PATCH", url, headers=headers, data=json.dumps(body), verify=False)
+    response_csrf = avi_request("PATCH", url, headers=headers, data=json.dumps(body), verify=False)
     if response_csrf.status_code != 200:
         return None
     else:
@@ -485,14 +681,14 @@ def obtain_avi_version(ip, jsonspec):
         "password": password_avi
     }
     modified_payload = json.dumps(payload, indent=4)
-    response_avi = requests.request("POST", url, headers=headers, data=modified_payload, verify=False)
+    response_avi = avi_request("POST", url, headers=headers, data=modified_payload, verify=False)
     if response_avi.status_code != 200:
         default = {
             "username": "admin",
             "password": "58NFaGDJm(PJH0G"
         }
         modified_payload = json.dumps(default, indent=4)
-        response_avi = requests.request("POST", url, headers=headers, data=modified_payload, verify=False)
+        response_avi = avi_request("POST", url, headers=headers, data=modified_payload, verify=False)
         if response_avi.status_code != 200:
             return None, response_avi.text
     return response_avi.json()["version"]["Version"], 200
@@ -509,7 +705,7 @@ def get_backup_configuration(ip, second_csrf, avi_version):
     }
     body = {}
     json_object = json.dumps(body, indent=4)
-    response_csrf = requests.request("GET", url, headers=headers, data=json_object, verify=False)
+    response_csrf = avi_request("GET", url, headers=headers, data=json_object, verify=False)
     if response_csrf.status_code != 200:
         return None, response_csrf.text
     else:
@@ -533,7 +729,7 @@ def setBackupPhrase(ip, seconcsrf, url_backup, aviVersion, avi_backup_phrase):
         "add": {"backup_passphrase": password_avi_backup}
     }
     json_object = json.dumps(body, indent=4)
-    response_csrf = requests.request("PATCH", url, headers=headers, data=json_object, verify=False)
+    response_csrf = avi_request("PATCH", url, headers=headers, data=json_object, verify=False)
     if response_csrf.status_code != 200:
         return None, response_csrf.text
     else:
@@ -550,22 +746,21 @@ def get_avi_cluster_info(ip, csrf2, aviVersion):
     }
     url = AlbEndpoint.AVI_HA.format(ip=ip)
     try:
-        response_csrf = requests.request("GET", url, headers=headers, verify=False)
+        response_csrf = avi_request("GET", url, headers=headers, verify=False)
         if response_csrf.status_code != 200:
             return None, response_csrf.text
         return response_csrf.json(), "SUCCESS"
     except Exception as e:
         return None, str(e)
 
-def form_avi_ha_cluster(ip, jsonspec, aviVersion):
+def _avi_ha_headers(ip, jsonspec, aviVersion):
     if TkgUtil.isEnvTkgs_wcp(jsonspec):
         avienc_pass = str(jsonspec['tkgsComponentSpec']['aviComponents']['aviPasswordBase64'])
     else:
         avienc_pass = str(jsonspec['tkgComponentSpec']['aviComponents']['aviPasswordBase64'])
-    csrf2 = obtain_second_csrf(ip, avienc_pass)
+    csrf2 = obtain_session_csrf(ip, avienc_pass)
     if csrf2 is None:
-        logger.error('Failed to get csrf2 info')
-        return None
+        return None, None
     headers = {
         "Accept": "application/json",
         "Content-Type": "application/json",
@@ -574,6 +769,72 @@ def form_avi_ha_cluster(ip, jsonspec, aviVersion):
         "x-avi-version": aviVersion,
         "x-csrftoken": csrf2[0]
     }
+    return csrf2, headers
+
+
+def _wait_for_active_nodes(ip, headers, active_nodes, timeout):
+    """
+    Wait until active_nodes controllers of the cluster led by ip report CLUSTER_ACTIVE
+    :return: ("SUCCESS", msg) once reached, (None, msg) otherwise
+    """
+    run_time_url = AlbEndpoint.AVI_HA_RUNTIME.format(ip=ip)
+
+    def _nodes_active():
+        response_csrf = avi_request("GET", run_time_url, headers=headers, verify=False)
+        if response_csrf.status_code != 200:
+            raise Exception("Failed to get cluster runtime status " + (str(response_csrf.text)))
+        try:
+            node_statuses = response_csrf.json()["node_states"]
+        except Exception:
+            return False
+        if node_statuses is None:
+            return False
+        for node_status in node_statuses:
+            logger.info("Checking node " + str(node_status["mgmt_ip"]) + " state: " + str(node_status["state"]))
+        logger.info("***********************************************************************************")
+        active = len([node_status for node_status in node_statuses if node_status["state"] == "CLUSTER_ACTIVE"])
+        return active >= active_nodes
+
+    try:
+        all_up = wait_until(_nodes_active, timeout=timeout, interval=5, max_interval=10,
+                            description="AVI cluster " + str(active_nodes) + " nodes active")
+    except Exception as e:
+        return None, str(e)
+    if not all_up:
+        return None, str(active_nodes) + " nodes are not in active state after " + str(int(all_up.elapsed)) + "s"
+    logger.info(str(active_nodes) + " Avi HA cluster nodes are active after " + str(int(all_up.elapsed)) + "s")
+    return "SUCCESS", str(active_nodes) + " nodes are active"
+
+
+def wait_for_avi_ha_cluster(ip, jsonspec, aviVersion, timeout=1800):
+    """
+    Wait for all 3 nodes of the cluster led by ip to be active, used to confirm a cluster formed
+    with quorum=True
+    :param timeout: seconds to wait, 0 checks the runtime state once
+    :return: ("SUCCESS", msg) once all nodes are active, (None, msg) otherwise
+    """
+    csrf2, headers = _avi_ha_headers(ip, jsonspec, aviVersion)
+    if csrf2 is None:
+        logger.error('Failed to get csrf2 info')
+        return None, "Failed to get csrf2 info"
+    try:
+        return _wait_for_active_nodes(ip, headers, 3, timeout)
+    except Exception as e:
+        return None, str(e)
+
+
+def form_avi_ha_cluster(ip, jsonspec, aviVersion, quorum=False):
+    """
+    Form the 3 node controller cluster led by ip, an already formed cluster is only checked for
+    active nodes
+    :param quorum: return as soon as 2 of the 3 nodes are active instead of all of them, the
+                   last node keeps joining in the background, confirm it with wait_for_avi_ha_cluster
+    :return: ("SUCCESS", msg) once formed, (None, msg) otherwise
+    """
+    csrf2, headers = _avi_ha_headers(ip, jsonspec, aviVersion)
+    if csrf2 is None:
+        logger.error('Failed to get csrf2 info')
+        return None, "Failed to get csrf2 info"
 
     try:
         data_center = jsonspec['envSpec']['vcenterDetails']['vcenterDatacenter']
@@ -581,7 +842,7 @@ def form_avi_ha_cluster(ip, jsonspec, aviVersion):
         info, status = get_avi_cluster_info(ip, csrf2, aviVersion)
         if info is None:
             logger.error("Failed to get status of cluster: {}".format(str(status)))
-            return None
+            return None, str(status)
         if TkgUtil.isEnvTkgs_wcp(jsonspec):
             avi_ip = jsonspec['tkgsComponentSpec']['aviComponents']['aviController01Ip']
             avi_ip2 = jsonspec['tkgsComponentSpec']['aviComponents']['aviController02Ip']
@@ -605,68 +866,40 @@ def form_avi_ha_cluster(ip, jsonspec, aviVersion):
             except:
                 pass
         if avi_ip in _list and avi_ip2 in _list and avi_ip3 in _list:
-            logger.info("Avi HA cluster is already configured")
-            return True
-        logger.info("Forming Ha cluster")
-        payload = AlbPayload.AVI_HA_CLUSTER.format(cluster_uuid=info["uuid"], cluster_name="Alb-Cluster",
-                                                   cluster_ip1=avi_ip, vm_uuid_get=_cluster["vm_uuid"],
-                                                   vm_mor_get=_cluster["vm_mor"],
-                                                   vm_hostname_get=_cluster["vm_hostname"], cluster_ip2=avi_ip2,
-                                                   cluster_ip3=avi_ip3, tennat_uuid_get=info["tenant_uuid"],
-                                                   virtual_ip_get=clusterIp)
-        url = AlbEndpoint.AVI_HA.format(ip=ip)
-        response_csrf = requests.request("PUT", url, headers=headers, data=payload, verify=False)
-        if response_csrf.status_code != 200:
-            logger.error('Error on HA formation: {}'.format(str(response_csrf.text)))
-            return None
-        count = 0
-        list_of_nodes = []
-        while count < 180:
-            response_csrf = requests.request("GET", url, headers=headers, verify=False)
-            try:
-                if len(response_csrf.json()["nodes"]) == 3:
-                    for node in response_csrf.json()["nodes"]:
-                        list_of_nodes.append(node["ip"]["addr"])
-                    break
-            except:
-                pass
-            time.sleep(10)
-            logger.info("Waited " + str(count * 10) + "s for getting cluster ips, retrying")
-            count = count + 1
+            logger.info("Avi HA cluster is already configured, checking node states")
+        else:
+            logger.info("Forming Ha cluster")
+            payload = AlbPayload.AVI_HA_CLUSTER.format(cluster_uuid=info["uuid"], cluster_name="Alb-Cluster",
+                                                       cluster_ip1=avi_ip, vm_uuid_get=_cluster["vm_uuid"],
+                                                       vm_mor_get=_cluster["vm_mor"],
+                                                       vm_hostname_get=_cluster["vm_hostname"], cluster_ip2=avi_ip2,
+                                                       cluster_ip3=avi_ip3, tennat_uuid_get=info["tenant_uuid"],
+                                                       virtual_ip_get=clusterIp)
+            url = AlbEndpoint.AVI_HA.format(ip=ip)
+            response_csrf = avi_request("PUT", url, headers=headers, data=payload, verify=False)
+            if response_csrf.status_code != 200:
+                logger.error('Error on HA formation: {}'.format(str(response_csrf.text)))
+                return None, str(response_csrf.text)
 
-        if avi_ip not in list_of_nodes or avi_ip2 not in list_of_nodes or not avi_ip3 in list_of_nodes:
-            logger.error("Failed to form the cluster ips not found in nodes list")
-            return None
+            def _cluster_nodes():
+                try:
+                    nodes = avi_request("GET", url, headers=headers, verify=False).json()["nodes"]
+                    if len(nodes) == 3:
+                        return [node["ip"]["addr"] for node in nodes]
+                except Exception:
+                    pass
+                return None
+
+            list_of_nodes = wait_until(_cluster_nodes, timeout=1800, interval=5, max_interval=10,
+                                       description="AVI cluster node ips").value or []
+
+            if avi_ip not in list_of_nodes or avi_ip2 not in list_of_nodes or not avi_ip3 in list_of_nodes:
+                logger.error("Failed to form the cluster ips not found in nodes list")
+                return None, "Failed to form the cluster ips not found in nodes list"
         logger.info("Getting cluster runtime status")
-        runtime = 0
-        run_time_url = AlbEndpoint.AVI_HA_RUNTIME.format(ip=ip)
-        all_up = False
-        while runtime < 180:
-            try:
-                response_csrf = requests.request("GET", run_time_url, headers=headers, verify=False)
-                if response_csrf.status_code != 200:
-                    return None, "Failed to get cluster runtime status " + (str(response_csrf.text))
-                node_statuses = response_csrf.json()["node_states"]
-                if node_statuses is not None:
-                    logger.info("Checking node " + str(node_statuses[0]["mgmt_ip"]) + " state: " + str(
-                        node_statuses[0]["state"]))
-                    logger.info("Checking node " + str(node_statuses[1]["mgmt_ip"]) + " state: " + str(
-                        node_statuses[1]["state"]))
-                    logger.info("Checking node " + str(node_statuses[2]["mgmt_ip"]) + " state: " + str(
-                        node_statuses[2]["state"]))
-                    logger.info(
-                        "***********************************************************************************")
-                    if node_statuses[0]["state"] == "CLUSTER_ACTIVE" and \
-                            node_statuses[1]["state"] == "CLUSTER_ACTIVE"\
-                            and node_statuses[2]["state"] == "CLUSTER_ACTIVE":
-                        all_up = True
-                        break
-            except:
-                pass
-            runtime = runtime + 1
-            time.sleep(10)
-        if not all_up:
-            return None, "All nodes are not in active atate on wating 30 min"
+        active, status = _wait_for_active_nodes(ip, headers, 2 if quorum else 3, 1800)
+        if active is None:
+            return None, status
         return "SUCCESS", "Successfully formed Ha Cluster"
     except Exception as e:
         return None, str(e)
@@ -683,7 +916,7 @@ def import_ssl_certificate(ip, csrf2, certificate, certificate_key, avi_version)
     }
     certName = CertName.VSPHERE_CERT_NAME
     url = AlbEndpoint.IMPORT_SSL_CERTIFICATE.format(ip=ip)
-    response_csrf = requests.request("POST", url, headers=headers, data=body, verify=False)
+    response_csrf = avi_request("POST", url, headers=headers, data=body, verify=False)
     if response_csrf.status_code != 201:
         return None, response_csrf.text
     else:
@@ -714,7 +947,7 @@ def get_ssl_certificate_status(ip, csrf2, name, aviVersion):
     }
     url = "https://" + ip + "/api/sslkeyandcertificate"
     json_object = json.dumps(body, indent=4)
-    response_csrf = requests.request("GET", url, headers=headers, data=json_object, verify=False)
+    response_csrf = avi_request("GET", url, headers=headers, data=json_object, verify=False)
     if response_csrf.status_code != 200:
         return None, response_csrf.text
     else:
@@ -740,7 +973,7 @@ def create_imported_ssl_certificate(ip, csrf2, dic, cer, key, avi_version):
         "x-csrftoken": csrf2[0]
     }
     url = AlbEndpoint.CRUD_SSL_CERT.format(ip=ip)
-    response_csrf = requests.request("POST", url, headers=headers, data=body, verify=False)
+    response_csrf = avi_request("POST", url, headers=headers, data=body, verify=False)
     if response_csrf.status_code != 201:
         return None, response_csrf.text
     else:
@@ -787,7 +1020,7 @@ def generate_ssl_certificate_vsphere(ip, csrf2, avi_fqdn, avi_version, jsonspec)
         "x-csrftoken": csrf2[0]
     }
     url = AlbEndpoint.CRUD_SSL_CERT.format(ip=ip)
-    response_csrf = requests.request("POST", url, headers=headers, data=body, verify=False)
+    response_csrf = avi_request("POST", url, headers=headers, data=body, verify=False)
     if response_csrf.status_code != 201:
         return None, response_csrf.text
     else:
@@ -804,22 +1037,20 @@ def get_current_cert_config(ip, csrf2, generated_ssl_url, avi_version):
     }
     body = {}
     url = AlbEndpoint.CRUD_SYSTEM_CONFIG.format(ip=ip)
-    response_csrf = requests.request("GET", url, headers=headers, data=body, verify=False)
+    response_csrf = avi_request("GET", url, headers=headers, data=body, verify=False)
     if response_csrf.status_code != 200:
         return None, response_csrf.text
     else:
-        json_object = json.dumps(response_csrf.json(), indent=4)
-        os.system("rm -rf systemConfig.json")
-        with open("./systemConfig.json", "w") as outfile:
-            outfile.write(json_object)
-        replaceCertConfig("systemConfig.json", "portal_configuration", "sslkeyandcertificate_refs",
+        system_config = AviRegistry.set_payload(SYSTEM_CERT_PAYLOAD, response_csrf.json())
+        replaceCertConfig(system_config, "portal_configuration", "sslkeyandcertificate_refs",
                           generated_ssl_url)
         return response_csrf.json()["url"], "SUCCESS"
 
 
 def replaceWithNewCert(ip, csrf2, aviVersion):
-    with open("./systemConfig.json", 'r') as file2:
-        json_object = json.load(file2)
+    json_object = AviRegistry.payload(SYSTEM_CERT_PAYLOAD)
+    if json_object is None:
+        return None, "System configuration was not fetched"
 
     json_object_mo = json.dumps(json_object, indent=4)
     headers = {
@@ -831,7 +1062,7 @@ def replaceWithNewCert(ip, csrf2, aviVersion):
         "x-csrftoken": csrf2[0]
     }
     url = "https://" + ip + "/api/systemconfiguration/?include_name="
-    response_csrf = requests.request("PUT", url, headers=headers, data=json_object_mo, verify=False)
+    response_csrf = avi_request("PUT", url, headers=headers, data=json_object_mo, verify=False)
     if response_csrf.status_code != 200:
         return None, response_csrf.text
     else:
@@ -848,17 +1079,17 @@ def configure_alb_licence(ip, csrf2, license_key, avi_version):
     }
     body = AlbPayload.LICENSE.format(serial_number=license_key)
     url = AlbEndpoint.LICENSE_URL.format(ip=ip)
-    response_csrf = requests.request("GET", url, headers=headers, verify=False)
+    response_csrf = avi_request("GET", url, headers=headers, verify=False)
     if response_csrf.status_code != 200:
         return None, response_csrf.text
     licenses = response_csrf.json()["licenses"]
     for license in licenses:
         if license["license_string"] == license_key:
             return "SUCESS", "Already license is applied"
-    response_csrf = requests.request("PUT", url, headers=headers, data=body, verify=False)
+    response_csrf = avi_request("PUT", url, headers=headers, data=body, verify=False)
     if response_csrf.status_code != 200:
         return None, response_csrf.text
-    response_csrf = requests.request("GET", url, headers=headers, verify=False)
+    response_csrf = avi_request("GET", url, headers=headers, verify=False)
     if response_csrf.status_code != 200:
         return None, response_csrf.text
     licenses = response_csrf.json()["licenses"]
@@ -874,7 +1105,7 @@ def manage_avi_certificates(ip, avi_version, jsonspec, avi_fqdn, cert_name):
         avienc_pass = str(jsonspec['tkgsComponentSpec']['aviComponents']['aviPasswordBase64'])
     else:
         avienc_pass = str(jsonspec['tkgComponentSpec']['aviComponents']['aviPasswordBase64'])
-    csrf2 = obtain_second_csrf(ip, avienc_pass)
+    csrf2 = obtain_session_csrf(ip, avienc_pass)
     if csrf2 is None:
         logger.error("Failed to get csrf from new set password")
         d = {
@@ -1022,14 +1253,18 @@ def manage_avi_certificates(ip, avi_version, jsonspec, avi_fqdn, cert_name):
     return json.dumps(d), 200, True
 
 
-def deployAndConfigureAvi(govc_client: GovcClient, vm_name, controller_ova_location,
-                          deploy_options, performOtherTask, avi_version, jsonspec):
+def deploy_avi_controller_vm(govc_client: GovcClient, vm_name, controller_ova_location, deploy_options, jsonspec):
+    """
+    Deploy the controller VM from the content library item unless it exists, size and power it on
+    :return: ip of the controller VM, None when the deploy failed
+    """
     try:
         data_center = jsonspec['envSpec']['vcenterDetails']['vcenterDatacenter']
         if not govc_client.get_vm_ip(vm_name, datacenter_name=data_center):
-            logger.info("Deploying avi controller..")
-            govc_client.deploy_library_ova(location=controller_ova_location, name=vm_name,
-                                           options=deploy_options)
+            logger.info("Deploying avi controller " + vm_name)
+            with span("deploy " + vm_name, "avi"):
+                govc_client.deploy_library_ova(location=controller_ova_location, name=vm_name,
+                                               options=deploy_options)
             if TkgUtil.isEnvTkgs_wcp(jsonspec):
                 avi_size = jsonspec['tkgsComponentSpec']['aviComponents']['aviSize']
             else:
@@ -1038,7 +1273,7 @@ def deployAndConfigureAvi(govc_client: GovcClient, vm_name, controller_ova_locat
             if size not in ["essentials", "small", "medium", "large"]:
                 logger.error("Wrong avi size provided supported  essentials/small/medium/large " +
                              avi_size)
-                return False
+                return None
             if size == "essentials":
                 cpu = AviSize.ESSENTIALS["cpu"]
                 memory = AviSize.ESSENTIALS["memory"]
@@ -1058,14 +1293,45 @@ def deployAndConfigureAvi(govc_client: GovcClient, vm_name, controller_ova_locat
             runProcess(power_on)
             ip = govc_client.get_vm_ip(vm_name, datacenter_name=data_center, wait_time='30m')
             if ip is None:
-                logger.error("Failed to get ip of avi controller on waiting 30m")
-                return False
-
+                logger.error("Failed to get ip of avi controller " + vm_name + " on waiting 30m")
+                return None
+            # objects recorded against an earlier controller on the same address are gone
+            AviRegistry.forget(ip[0])
+        return govc_client.get_vm_ip(vm_name, datacenter_name=data_center)[0]
     except Exception as e:
-        logger.error("Failed to deploy  the vm from library due to " + str(e))
-        return False
+        logger.error("Failed to deploy  the vm " + vm_name + " from library due to " + str(e))
+        return None
+
 
-    ip = govc_client.get_vm_ip(vm_name, datacenter_name=data_center)[0]
+def bring_up_avi_controllers(govc_client: GovcClient, controllers, controller_ova_location, jsonspec):
+    """
+    Deploy the controller VMs of an HA cluster side by side from one content library item, then
+    wait for the controller service of all of them together
+    :param controllers: dict of controller VM name to its govc library.deploy options
+    :return: dict of controller VM name to its ip, None when a controller failed to come up
+    """
+    with ThreadPoolExecutor(max_workers=max(1, len(controllers))) as executor:
+        ips = dict(zip(controllers, executor.map(
+            lambda vm_name: deploy_avi_controller_vm(govc_client, vm_name, controller_ova_location,
+                                                     controllers[vm_name], jsonspec), controllers)))
+        failed = [vm_name for vm_name, ip in ips.items() if ip is None]
+        if failed:
+            logger.error("Failed to deploy avi controllers " + ", ".join(failed))
+            return None
+        logger.info("Checking controllers " + ", ".join(ips.values()) + " are up")
+        down = [vm_name for vm_name, status in zip(ips, executor.map(check_controller_is_up, ips.values()))
+                if status is None]
+    if down:
+        logger.error("Controller service is not up on " + ", ".join(down))
+        return None
+    return ips
+
+
+def deployAndConfigureAvi(govc_client: GovcClient, vm_name, controller_ova_location,
+                          deploy_options, performOtherTask, avi_version, jsonspec):
+    ip = deploy_avi_controller_vm(govc_client, vm_name, controller_ova_location, deploy_options, jsonspec)
+    if ip is None:
+        return False
     logger.info("Checking controller is up")
     if check_controller_is_up(ip) is None:
         logger.error("Controller service is not up")
@@ -1128,7 +1394,7 @@ def deployAndConfigureAvi(govc_client: GovcClient, vm_name, controller_ova_locat
             avienc_pass = jsonspec['tkgsComponentSpec']['aviComponents']['aviPasswordBase64']
         else:
             avienc_pass = jsonspec['tkgComponentSpec']['aviComponents']['aviPasswordBase64']
-        csrf2 = obtain_second_csrf(ip, avienc_pass)
+        csrf2 = obtain_session_csrf(ip, avienc_pass)
         if csrf2 is None:
             logger.error("Failed to get csrf from new set password")
             d = {
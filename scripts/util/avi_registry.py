@@ -0,0 +1,186 @@
+#  Copyright 2022 VMware, Inc
+#  SPDX-License-Identifier: BSD-2-Clause
+
+import copy
+import fcntl
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+from constants.constants import Paths
+from util.logger_helper import LoggerHelper
+
+logger = LoggerHelper.get_logger(Path(__file__).stem)
+
+CLOUD = "cloud"
+SE_GROUP = "serviceenginegroup"
+IPAM = "ipamdnsproviderprofile"
+NETWORK = "network"
+CERTIFICATE = "sslkeyandcertificate"
+
+AVI_OBJECTS_FILE = "avi-objects.json"
+
+
+class AviRegistry:
+    """
+    In process registry of the AVI objects the workflows created or looked up, per controller,
+    kind and name, and of the request payloads being edited before they are PUT. Payloads
+    are kept per thread, a GET, edit and PUT sequence never sees another thread's payload.
+    Replaces the newCloudInfo.json style scratch files of the working directory. When a
+    workspace is configured the name, uuid and url of every object are spilled to
+    <root_dir>/.tmp/avi-objects.json, so a later task finds them without a lookup.
+    Full objects and payloads are never written, they may hold credentials.
+    """
+
+    _objects = dict()
+    _forgotten = set()
+    _recorded = set()
+    _payloads = threading.local()
+    _spill_path = None
+    _loaded = False
+    _lock = threading.RLock()
+
+    @classmethod
+    def configure(cls, root_dir):
+        with cls._lock:
+            spill_path = os.path.join(root_dir, Paths.TMP_DIR, AVI_OBJECTS_FILE)
+            if spill_path != cls._spill_path:
+                cls._spill_path = spill_path
+                cls._loaded = False
+
+    @classmethod
+    def _read_spill(cls):
+        if not os.path.exists(cls._spill_path):
+            return dict()
+        try:
+            with open(cls._spill_path) as f:
+                return {tuple(key.split("|", 2)): obj for key, obj in json.load(f).items()}
+        except Exception as e:
+            logger.warning("Ignoring unreadable AVI object registry " + cls._spill_path + " " + str(e))
+            return dict()
+
+    @classmethod
+    def _load(cls):
+        if cls._loaded or cls._spill_path is None:
+            return
+        cls._loaded = True
+        for key, obj in cls._read_spill().items():
+            cls._objects.setdefault(key, obj)
+
+    @classmethod
+    def _spill(cls):
+        """
+        Write name, uuid and url of the known objects, keeping what other processes
+        spilled meanwhile unless it was forgotten here. The read, merge and rename run under
+        a file lock, processes sharing the workspace, e.g. the workload fan-out, never drop
+        each other's objects.
+        """
+        if cls._spill_path is None:
+            return
+        os.makedirs(os.path.dirname(cls._spill_path), exist_ok=True)
+        with open(cls._spill_path + ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                spilled = {key: obj for key, obj in cls._read_spill().items() if key not in cls._forgotten}
+                spilled.update({key: {field: obj.get(field) for field in ["name", "uuid", "url"]}
+                                for key, obj in cls._objects.items()})
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(cls._spill_path), prefix=".avi-objects",
+                                                suffix=".tmp")
+                try:
+                    with os.fdopen(fd, "w") as f:
+                        json.dump({"|".join(key): obj for key, obj in spilled.items()}, f, indent=2, sort_keys=True)
+                    os.replace(tmp_path, cls._spill_path)
+                except Exception as e:
+                    logger.warning("Failed to save AVI object registry " + str(e))
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    @classmethod
+    def record(cls, ip, kind, obj):
+        """
+        Remember an object, or every object of a collection response holding results
+        :return: obj
+        """
+        objects = obj.get("results", []) if "results" in obj else [obj]
+        with cls._lock:
+            cls._load()
+            for item in objects:
+                if item.get("name") is not None:
+                    cls._objects[(ip, kind, item["name"])] = item
+                    cls._forgotten.discard((ip, kind, item["name"]))
+                    cls._recorded.add((ip, kind, item["name"]))
+            cls._spill()
+        return obj
+
+    @classmethod
+    def lookup(cls, ip, kind, name):
+        """
+        :return: the object, only name, uuid and url when it was recorded by another process,
+                 None when it is unknown
+        """
+        with cls._lock:
+            cls._load()
+            return cls._objects.get((ip, kind, name))
+
+    @classmethod
+    def uuid(cls, ip, kind, name):
+        obj = cls.lookup(ip, kind, name)
+        return None if obj is None else obj.get("uuid")
+
+    @classmethod
+    def recorded(cls, ip, kind, name):
+        """
+        :return: True when the object was recorded by this process, False when it only comes from
+                 the spill of an earlier run and may have been deleted since
+        """
+        with cls._lock:
+            return (ip, kind, name) in cls._recorded
+
+    @classmethod
+    def forget(cls, ip=None, kind=None, name=None):
+        """
+        Drop the objects of every controller, of one controller, of one kind or one object,
+        e.g. after a delete or a teardown
+        """
+        with cls._lock:
+            cls._load()
+            for key in [key for key in cls._objects if ip in [None, key[0]] and kind in [None, key[1]]
+                        and name in [None, key[2]]]:
+                cls._objects.pop(key)
+                cls._forgotten.add(key)
+                cls._recorded.discard(key)
+            cls._spill()
+
+    @classmethod
+    def forget_uuid(cls, ip, uuid):
+        """
+        Drop the object of a controller with the given uuid, e.g. after a DELETE on its url
+        """
+        with cls._lock:
+            cls._load()
+            names = [key for key, obj in cls._objects.items() if key[0] == ip and obj.get("uuid") == uuid]
+        for key in names:
+            cls.forget(*key)
+
+    @classmethod
+    def set_payload(cls, name, payload):
+        """
+        Keep a payload, e.g. a GET response, to edit it in memory before it is sent back
+        :return: the stored payload, edits to it are seen by payload(name)
+        """
+        payloads = getattr(cls._payloads, "by_name", None)
+        if payloads is None:
+            payloads = cls._payloads.by_name = dict()
+        payloads[name] = copy.deepcopy(payload)
+        return payloads[name]
+
+    @classmethod
+    def payload(cls, name):
+        """
+        :return: the payload stored under name, None when there is none
+        """
+        return getattr(cls._payloads, "by_name", dict()).get(name)
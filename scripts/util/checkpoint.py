@@ -0,0 +1,114 @@
+#  Copyright 2022 VMware, Inc
+#  SPDX-License-Identifier: BSD-2-Clause
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import yaml
+from yaml.loader import SafeLoader
+
+from constants.constants import Paths
+from util.logger_helper import LoggerHelper
+
+logger = LoggerHelper.get_logger(Path(__file__).stem)
+
+CHECKPOINTS_DIR = "checkpoints"
+
+
+def fingerprint(*values):
+    """
+    Short digest of the spec values a step depends on, a changed spec invalidates the checkpoint
+    """
+    return hashlib.sha1(json.dumps(values, sort_keys=True, default=str).encode()).hexdigest()[:12]
+
+
+def checkpoint_path(root_dir, scope):
+    return os.path.join(root_dir, os.path.dirname(Paths.STATE_PATH), CHECKPOINTS_DIR, scope + ".yml")
+
+
+class Checkpoints:
+    """
+    Journal of the sub-steps a workflow completed, kept next to state.yml under
+    deployment-state/checkpoints/<scope>.yml so it is committed with the state. Every task
+    owns its scope, parallel tasks never write the same journal. A step is done only when
+    it was marked with the same key, the fingerprint of the spec values it was run with.
+    """
+
+    def __init__(self, root_dir, scope):
+        self.scope = scope
+        self.path = checkpoint_path(root_dir, scope)
+        self._lock = threading.Lock()
+        self._steps = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return dict()
+        try:
+            with open(self.path) as f:
+                return (yaml.load(f, Loader=SafeLoader) or dict()).get("steps", dict())
+        except Exception as e:
+            logger.warning("Ignoring unreadable checkpoint journal " + self.path + " " + str(e))
+            return dict()
+
+    def _save(self):
+        """
+        Write the journal to a temporary file and rename it over the journal, a task killed
+        mid-write leaves the previous journal intact
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix="." + self.scope, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                yaml.dump({"scope": self.scope, "steps": self._steps}, f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def done(self, step, key=None, exists=None):
+        """
+        :param exists: callable probing that what the step created is still there, e.g. a VM
+                       lookup, the step is forgotten when it returns a falsy value
+        :return: True when the step completed with the same key
+        """
+        entry = self._steps.get(step)
+        if entry is None or entry.get("key") != key:
+            return False
+        if exists is not None and not exists():
+            logger.warning(self.scope + ": " + step + " was completed but what it created is gone, repeating it")
+            self.reset(step)
+            return False
+        logger.info(self.scope + ": " + step + " already completed, skipping")
+        return True
+
+    def data(self, step):
+        """
+        :return: values saved with the step, empty dict when it is not done
+        """
+        return dict(self._steps.get(step, dict()).get("data", dict()))
+
+    def mark(self, step, key=None, **data):
+        with self._lock:
+            self._steps[step] = {"key": key, "at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "data": data}
+            self._save()
+        logger.info(self.scope + ": " + step + " completed")
+
+    def reset(self, *steps):
+        """
+        Forget the given steps, every step of the scope when none is given
+        """
+        with self._lock:
+            if steps:
+                for step in steps:
+                    self._steps.pop(step, None)
+            else:
+                self._steps = dict()
+            self._save()
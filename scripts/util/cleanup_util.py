@@ -9,14 +9,26 @@ import json
 from util.ShellHelper import runShellCommandAndReturnOutput, runProcess, runShellCommandAndReturnOutputAsList, \
     verifyPodsAreRunning
 from util.logger_helper import LoggerHelper, log
+from util.wait_helper import wait_until
+from lib.kube_context import KubeContexts
+from util.vcenter_session import VcenterRestSession, vcenter_request
 from constants.constants import RegexPattern
+from model.spec_store import decode_secret
 
 logger = LoggerHelper.get_logger(name='Pre Setup')
 
 
 class CleanUpUtil:
-    def __int__(self):
-        pass
+    def __init__(self, checkpoints=None):
+        """
+        :param checkpoints: WorkflowContext.checkpoints, the journaled steps of what is deleted are
+                            forgotten so the next run repeats them
+        """
+        self.checkpoints = checkpoints
+
+    def reset_checkpoints(self, scope, *steps):
+        if self.checkpoints is not None:
+            self.checkpoints(scope).reset(*steps)
 
     def is_management_cluster_exists(self, mgmt_cluster: str) -> bool:
         """
@@ -48,24 +60,17 @@ class CleanUpUtil:
             logger.info("Delete Management cluster - " + mgmt_cluster)
             delete_command = ["tanzu", "management-cluster", "delete", "--force", "-y"]
             runProcess(delete_command)
+            KubeContexts.get().forget(mgmt_cluster)
 
-            deleted = False
-            count = 0
-            while count < 360 and not deleted:
-                if self.is_management_cluster_exists(mgmt_cluster):
-                    logger.debug("Management cluster is still not deleted... retrying in 10s")
-                    time.sleep(10)
-                    count = count + 1
-                else:
-                    deleted = True
-                    break
-
+            deleted = wait_until(lambda: not self.is_management_cluster_exists(mgmt_cluster), timeout=3600,
+                                 interval=5, max_interval=30, description="Deletion of " + mgmt_cluster)
             if not deleted:
                 logger.error(
-                    "Management cluster " + mgmt_cluster + " is not deleted even after " + str(count * 5)
+                    "Management cluster " + mgmt_cluster + " is not deleted even after " + str(int(deleted.elapsed))
                     + "s")
                 return False
             else:
+                self.reset_checkpoints("mgmt", "rbac")
                 return True
         except Exception as e:
             logger.error(str(e))
@@ -76,6 +81,7 @@ class CleanUpUtil:
             logger.info("Initiating deletion of cluster - " + cluster)
             delete = ["tanzu", "cluster", "delete", cluster, "-y"]
             delete_status = runShellCommandAndReturnOutputAsList(delete)
+            KubeContexts.get().forget(cluster)
             if delete_status[1] != 0:
                 logger.error("Command to delete - " + cluster + " Failed")
                 logger.debug(delete_status[0])
@@ -90,22 +96,18 @@ class CleanUpUtil:
             if command_status[1] != 0:
                 logger.error("Failed to run command to check status of workload cluster - " + cluster)
                 return False
-            deleting = True
-            count = 0
-            while count < 360 and deleting:
-                if verifyPodsAreRunning(cluster, command_status[0], RegexPattern.deleting) or \
-                        verifyPodsAreRunning(cluster, command_status[0], RegexPattern.running):
-                    logger.info("Waiting for " + cluster + " deletion to complete...")
-                    logger.info("Retrying in 10s...")
-                    time.sleep(10)
-                    count = count + 1
-                    command_status = runShellCommandAndReturnOutputAsList(cluster_running)
-                else:
-                    deleting = False
-            if not deleting:
+
+            def _deleted():
+                command_status = runShellCommandAndReturnOutputAsList(cluster_running)
+                return not (verifyPodsAreRunning(cluster, command_status[0], RegexPattern.deleting) or
+                            verifyPodsAreRunning(cluster, command_status[0], RegexPattern.running))
+
+            deleted = wait_until(_deleted, timeout=3600, interval=5, max_interval=30,
+                                 description="Deletion of " + cluster)
+            if deleted:
                 return True
 
-            logger.error("waited for " + str(count * 5) + "s")
+            logger.error("waited for " + str(int(deleted.elapsed)) + "s")
             return False
         except Exception as e:
             logger.error("Exception occurred while deleting cluster " + str(e))
@@ -120,20 +122,14 @@ class CleanUpUtil:
         """
         vcenter_ip = jsonspec['envSpec']['vcenterDetails']['vcenterAddress']
         vcenter_username = jsonspec(force=True)['envSpec']['vcenterDetails']['vcenterSsoUser']
-        str_enc = str(jsonspec(force=True)['envSpec']['vcenterDetails']["vcenterSsoPasswordBase64"])
-        base64_bytes = str_enc.encode('ascii')
-        enc_bytes = base64.b64decode(base64_bytes)
-        password = enc_bytes.decode('ascii').rstrip("\n")
+        password = decode_secret(jsonspec(force=True)['envSpec']['vcenterDetails']["vcenterSsoPasswordBase64"])
         if not (vcenter_ip or vcenter_username or password):
             return False, "Failed to fetch VC details"
 
-        sess = requests.post("https://" + str(vcenter_ip) + "/rest/com/vmware/cis/session",
-                             auth=(vcenter_username, password), verify=False)
-        if sess.status_code != 200:
+        vc_session = VcenterRestSession.get(vcenter_ip, vcenter_username, password).session_id
+        if vc_session is None:
             logger.error("Connection to vCenter failed")
             return False, "Connection to vCenter failed"
-        else:
-            vc_session = sess.json()['value']
 
         header = {
             "Accept": "application/json",
@@ -141,7 +137,7 @@ class CleanUpUtil:
             "vmware-api-session-id": vc_session
         }
         url = "https://" + vcenter_ip + "/api/vcenter/namespace-management/clusters/" + cluster_id
-        response_csrf = requests.request("GET", url, headers=header, verify=False)
+        response_csrf = vcenter_request("GET", url, headers=header, verify=False)
         if response_csrf.status_code != 200:
             if response_csrf.status_code == 400:
                 if response_csrf.json()["messages"][0][
@@ -2,12 +2,13 @@
 #  SPDX-License-Identifier: BSD-2-Clause
 
 import base64
-import os
+import logging
 import re
 import subprocess
 from datetime import datetime
 from pathlib import Path
 
+from util import command_engine
 from util.logger_helper import LoggerHelper, log_debug
 
 logger = LoggerHelper.get_logger(Path(__file__).stem)
@@ -44,7 +45,8 @@ class CmdHelper:
     @staticmethod
     def execute_cmd(cmd, check=False) -> int:
         logger.debug("Execute command : %s", cmd)
-        error_code = os.system(cmd)
+        result = command_engine.run(cmd, level=logging.INFO)
+        error_code = 1 if result.exit_code is None else result.exit_code
         if error_code != 0 and check:
             logger.error("Error executing cmd : %s", cmd)
             raise Exception("Error executing command")
@@ -55,7 +57,8 @@ class CmdHelper:
     def execute_cmd_and_get_output(cmd) -> str:
         try:
             logger.debug("Execute command : %s", cmd)
-            return subprocess.getoutput(cmd)
+            output = command_engine.run(cmd, capture=True).text()
+            return output[:-1] if output.endswith("\n") else output
         except subprocess.CalledProcessError:
             logger.error("Error executing cmd : %s", cmd)
             return ""
@@ -5,8 +5,9 @@ import traceback
 import logging
 from pathlib import Path
 import shutil
-import subprocess
 import shlex
+from util import command_engine
+from util.ShellHelper import runShellCommandAndReturnOutputAsList
 from util.logger_helper import LoggerHelper
 
 __author__ = 'smuthukumar'
@@ -25,23 +26,21 @@ ToDO:
 
 class RunCmd:
 
-    def run_cmd_only(self, cmd: str, ignore_errors=False, msg=None):
+    def run_cmd_only(self, cmd: str, ignore_errors=False, msg=None, env=None):
         logger.debug(f"Running cmd: {cmd}")
-        try:
-            subprocess.call(shlex.split(cmd), stdout=subprocess.DEVNULL,
-                            stderr=subprocess.DEVNULL)
-        except FileNotFoundError:
-            logger.error(f"Error: {traceback.format_exc()}\n Error executing: {cmd}")
+        result = command_engine.run(shlex.split(cmd), env=env, level=None)
+        if result.exit_code is None:
+            logger.error(f"Error: {result.text()}\n Error executing: {cmd}")
 
-    def run_cmd_output(self, cmd: str):
+    def run_cmd_output(self, cmd: str, env=None):
 
         logger.debug(f"Running cmd: {cmd}")
-        try:
-            cmd_out = subprocess.check_output(cmd, shell=True, encoding='UTF-8')
-            return cmd_out
-        except Exception:
-            logger.error(f"Error: {traceback.format_exc()}")
+        result = command_engine.run(cmd, capture=True, merge_stderr=False, env=env)
+        if not result.ok:
+            tail = "\n".join(result.tail)
+            logger.error(f"Error: {result!r}\n{tail}")
             return None
+        return result.text()
 
     def local_file_copy(self, srcfile, destfile, follow_symlinks=False):
         logger.debug(f"Copying file {srcfile} to {destfile}")
@@ -51,24 +50,4 @@ class RunCmd:
             logger.error(f"Error: {traceback.format_exc ()}")
 
     def runShellCommandAndReturnOutputAsList(self, fin):
-        try:
-            proc = subprocess.Popen(
-                fin,
-                stderr=subprocess.STDOUT,
-                stdout=subprocess.PIPE
-            )
-
-            output = proc.communicate()[0]
-            if output.decode("utf-8").lower().__contains__("error"):
-                returnCode = 1
-            else:
-                returnCode = 0
-        except subprocess.CalledProcessError as e:
-            returnCode = 1
-            output = e.output
-        return output.decode("utf-8").rstrip("\n\r").replace("\x1b[0m", "").replace("\x1b[1m",
-                                                                                    "").split(
-            "\n"), returnCode
-
-
-
+        return runShellCommandAndReturnOutputAsList(fin)
@@ -0,0 +1,253 @@
+#  Copyright 2022 VMware, Inc
+#  SPDX-License-Identifier: BSD-2-Clause
+
+import asyncio
+import codecs
+import collections
+import concurrent.futures
+import logging
+import os
+import shlex
+import signal
+import threading
+import time
+from pathlib import Path
+
+from util.logger_helper import LoggerHelper
+from util.tracing import add_event, redact
+
+logger = LoggerHelper.get_logger(Path(__file__).stem)
+
+# Seconds a command may run when the caller gives no timeout. None, tanzu cluster creates and
+# OVA imports run for as long as they need, CMD_TIMEOUT sets a process wide limit, 0 means none
+DEFAULT_TIMEOUT = None
+# Seconds a command gets to exit after SIGTERM before it is killed
+KILL_GRACE = 10
+# Lines of output kept on a result when the output is only streamed
+TAIL_LINES = 50
+_CHUNK = 65536
+
+_thread_env = threading.local()
+
+
+def default_timeout():
+    value = os.environ.get("CMD_TIMEOUT")
+    if value is None:
+        return DEFAULT_TIMEOUT
+    return float(value) or None
+
+
+def set_thread_env(**values):
+    """
+    Environment variables added to every command the calling thread runs from now on, unless
+    the caller passes its own value. A None value removes the variable again.
+    """
+    current = dict(getattr(_thread_env, "values", dict()))
+    for key, value in values.items():
+        if value is None:
+            current.pop(key, None)
+        else:
+            current[key] = value
+    _thread_env.values = current
+
+
+def _command_env(env):
+    values = getattr(_thread_env, "values", None)
+    if not values:
+        return env
+    merged = dict(os.environ if env is None else env)
+    for key, value in values.items():
+        if env is None or env.get(key) == os.environ.get(key):
+            merged[key] = value
+    return merged
+
+
+class CommandResult:
+    """
+    Outcome of one command. Truthy when it exited with 0.
+    """
+
+    def __init__(self, cmd):
+        self.cmd = cmd
+        self.exit_code = None
+        self.duration = 0.0
+        self.stdout_bytes = 0
+        self.stderr_bytes = 0
+        self.timed_out = False
+        self.cancelled = False
+        self.output = None
+        self.tail = collections.deque(maxlen=TAIL_LINES)
+
+    @property
+    def ok(self):
+        return self.exit_code == 0
+
+    def __bool__(self):
+        return self.ok
+
+    def text(self):
+        """
+        :return: the captured output, the last lines when the command was run without capture
+        """
+        if self.output is not None:
+            return "".join(self.output)
+        return "\n".join(self.tail)
+
+    def __repr__(self):
+        return "CommandResult(cmd={}, exit_code={}, duration={:.1f}s, bytes={}, timed_out={})".format(
+            _display(self.cmd), self.exit_code, self.duration, self.stdout_bytes + self.stderr_bytes, self.timed_out)
+
+
+def _display(cmd):
+    return cmd if isinstance(cmd, str) else shlex.join([str(c) for c in cmd])
+
+
+async def _pump(stream, result, attr, level, prefix, capture):
+    """
+    Read a pipe in chunks and log every complete line as it arrives, long lines never
+    overrun the reader and only the captured output, if any, is kept in memory
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    while True:
+        chunk = await stream.read(_CHUNK)
+        setattr(result, attr, getattr(result, attr) + len(chunk))
+        text = decoder.decode(chunk, final=not chunk)
+        if capture:
+            result.output.append(text)
+        pending += text
+        lines = pending.split("\n")
+        pending = lines.pop()
+        if not chunk and pending:
+            lines.append(pending)
+            pending = ""
+        for line in lines:
+            line = line.rstrip("\r")
+            result.tail.append(line)
+            if level is not None and logger.isEnabledFor(level):
+                logger.log(level, prefix + line)
+        if not chunk:
+            return
+
+
+def _signal(process, sig):
+    try:
+        os.killpg(process.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+async def _stop(process):
+    _signal(process, signal.SIGTERM)
+    try:
+        await asyncio.wait_for(process.wait(), KILL_GRACE)
+    except asyncio.TimeoutError:
+        _signal(process, signal.SIGKILL)
+        await process.wait()
+
+
+async def run_async(cmd, timeout=-1, cwd=None, env=None, capture=False, merge_stderr=True, stdin=None,
+                    level=logging.DEBUG, prefix=""):
+    """
+    Run a command, streaming its output into the logger line by line
+    :param cmd: argument list, or a string run by the shell (pipes, redirections)
+    :param timeout: seconds before the command and its children are terminated, -1 for the
+                    default timeout, None for no timeout
+    :param capture: keep the whole output on result.output, only the last lines are kept otherwise
+    :param merge_stderr: read stderr interleaved with stdout, as the shell helpers always did. When
+                         False stderr is logged but not captured
+    :param stdin: bytes written to the command input
+    :param level: log level of the output lines, None to not log them
+    :param prefix: text put in front of every logged line
+    :return: CommandResult, exit_code is None when the command could not be started
+    """
+    if timeout == -1:
+        timeout = default_timeout()
+    env = _command_env(env)
+    result = CommandResult(cmd)
+    result.output = [] if capture else None
+    stderr = asyncio.subprocess.STDOUT if merge_stderr else asyncio.subprocess.PIPE
+    stdin_pipe = asyncio.subprocess.PIPE if stdin is not None else asyncio.subprocess.DEVNULL
+    start = time.time()
+    begin = time.monotonic()
+    logger.debug("Command to execute: " + _display(cmd))
+    try:
+        if isinstance(cmd, str):
+            process = await asyncio.create_subprocess_shell(cmd, stdin=stdin_pipe, stdout=asyncio.subprocess.PIPE,
+                                                            stderr=stderr, cwd=cwd, env=env, start_new_session=True)
+        else:
+            process = await asyncio.create_subprocess_exec(*[str(c) for c in cmd], stdin=stdin_pipe,
+                                                           stdout=asyncio.subprocess.PIPE, stderr=stderr, cwd=cwd,
+                                                           env=env, start_new_session=True)
+    except OSError as e:
+        logger.error("Failed to start " + _display(cmd) + " " + str(e))
+        result.tail.append(str(e))
+        result.duration = time.monotonic() - begin
+        return result
+    pumps = [_pump(process.stdout, result, "stdout_bytes", level, prefix, capture)]
+    if not merge_stderr:
+        pumps.append(_pump(process.stderr, result, "stderr_bytes", level, prefix, False))
+    if stdin is not None:
+        process.stdin.write(stdin)
+        await process.stdin.drain()
+        process.stdin.close()
+    try:
+        await asyncio.wait_for(asyncio.gather(*pumps, process.wait()), timeout)
+    except asyncio.TimeoutError:
+        result.timed_out = True
+        logger.error("Timed out after " + str(timeout) + "s, terminating " + _display(cmd))
+        await _stop(process)
+    except asyncio.CancelledError:
+        result.cancelled = True
+        logger.warning("Cancelled, terminating " + _display(cmd))
+        await _stop(process)
+        raise
+    finally:
+        result.duration = time.monotonic() - begin
+        result.exit_code = process.returncode
+        add_event(redact(_display(cmd))[:60], "shell", start, result.duration,
+                  {"arg": redact(_display(cmd)), "exit_code": result.exit_code, "bytes": result.stdout_bytes + result.stderr_bytes,
+                   "timed_out": result.timed_out})
+    return result
+
+
+async def _gather(cmds, limit, kwargs):
+    semaphore = asyncio.Semaphore(limit or len(cmds) or 1)
+
+    async def _one(cmd):
+        async with semaphore:
+            return await run_async(cmd, **kwargs)
+
+    return await asyncio.gather(*[_one(cmd) for cmd in cmds])
+
+
+def _run_loop(coroutine):
+    """
+    Run a coroutine to completion from synchronous code, in a helper thread when the caller
+    already runs an event loop
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coroutine)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coroutine).result()
+
+
+def run(cmd, **kwargs):
+    """
+    Synchronous run_async
+    :return: CommandResult
+    """
+    kwargs["env"] = _command_env(kwargs.get("env"))
+    return _run_loop(run_async(cmd, **kwargs))
+
+
+def run_all(cmds, limit=None, **kwargs):
+    """
+    Run independent commands concurrently
+    :param limit: most commands running at once, all of them when None
+    :return: list of CommandResult in the order of cmds
+    """
+    kwargs["env"] = _command_env(kwargs.get("env"))
+    return _run_loop(_gather(list(cmds), limit, kwargs))
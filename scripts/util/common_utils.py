@@ -3,7 +3,6 @@
 
 import os, sys
 import re
-import ipaddress
 import traceback
 import json
 from util import cmd_runner
@@ -20,13 +19,14 @@ from util.extensions_helper import check_fluent_bit_http_endpoint_enabled, \
     check_fluent_bit_kafka_endpoint_endpoint_enabled
 from util.logger_helper import LoggerHelper
 import requests
-from util.avi_api_helper import getProductSlugId, obtain_second_csrf
+from util.avi_api_helper import obtain_session_csrf, avi_request, find_avi_object, avi_object_uuid
+from util.avi_registry import AviRegistry, CLOUD
+from util.se_fleet import SeFleetTracker
 from util.replace_value import replaceValueSysConfig, replaceValue
 from util.file_helper import FileHelper
 from util.ShellHelper import runShellCommandAndReturnOutput, runShellCommandAndReturnOutputAsList, \
-    runProcess, grabKubectlCommand, verifyPodsAreRunning, grabPipeOutput, \
+    runProcess, verifyPodsAreRunning, grabPipeOutput, \
     runShellCommandAndReturnOutputAsListWithChangedDir, grabPipeOutputChagedDir
-from util.cmd_helper import CmdHelper
 from util.cmd_runner import RunCmd
 import time
 from jinja2 import Template
@@ -35,12 +35,18 @@ from yaml import SafeLoader
 from ruamel import yaml as ryaml
 from datetime import datetime
 from util.vcenter_operations import createResourcePool, create_folder
+from util.vcenter_session import VcenterRestSession, vcenter_request
 from util.tkg_util import TkgUtil
+from util.wait_helper import wait_until
+from util.artifact_cache import get_artifact_cache, marketplace_sha256
+from util.marketplace_client import MarketplaceClient
+from lib.kubectl_watch import wait_for_pods_running, wait_for_package_reconciled
+from lib.kube_context import KubeContexts
 import subprocess
 import pathlib
 import tarfile
 from pyVim import connect
-from util.tkg_util import TkgUtil
+from model.spec_store import decode_secret, netmask_of, split_cidr
 
 logger = LoggerHelper.get_logger('common_utils')
 logging.getLogger("paramiko").setLevel(logging.WARNING)
@@ -48,7 +54,7 @@ logging.getLogger("paramiko").setLevel(logging.WARNING)
 
 def checkenv(jsonspec):
     vcpass_base64 = jsonspec['envSpec']['vcenterDetails']['vcenterSsoPasswordBase64']
-    password = CmdHelper.decode_base64(vcpass_base64)
+    password = decode_secret(vcpass_base64)
     vcenter_username = jsonspec['envSpec']['vcenterDetails']['vcenterSsoUser']
     vcenter_ip = jsonspec['envSpec']['vcenterDetails']['vcenterAddress']
     os.putenv("GOVC_URL", "https://" + vcenter_ip + "/sdk")
@@ -115,66 +121,32 @@ def createSubscribedLibrary(vcenter_ip, vcenter_username, password, jsonspec):
 
 def download_upgrade_binaries(binary, refreshToken):
     # TODO: redudant download method. replace to single one with filename and targetted binary
-    rcmd = cmd_runner.RunCmd()
     filename = binary
     solutionName = KubernetesOva.MARKETPLACE_KUBERNETES_SOLUTION_NAME
     logger.debug(("Solution Name: {}".format(solutionName)))
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "refreshToken": refreshToken
-    }
-    json_object = json.dumps(payload, indent=4)
-    sess = requests.request("POST", MarketPlaceUrl.URL + "/api/v1/user/login", headers=headers,
-                            data=json_object, verify=False)
-    if sess.status_code != 200:
-        return None, "Failed to login and obtain csp-auth-token"
-    else:
-        token = sess.json()["access_token"]
+    client = MarketplaceClient.get(refreshToken)
+    try:
+        product = client.product(MarketPlaceUrl.TANZU_PRODUCT)
+    except Exception as e:
+        return None, str(e)
 
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-        "csp-auth-token": token
-    }
+    metafile = None
+    for metalist in product.metafiles(UpgradeVersions.TARGET_VERSION, partial=True):
+        binary_targetted = metalist["metafileobjectsList"][0]['filename']
+        logger.info("Binary: {}".format(binary_targetted))
+        logger.info("appversion: {}".format(metalist['appversion']))
+        if binary in binary_targetted:
+            logger.info("Found the binary....")
+            metafile = metalist
 
-    objectid = None
-    slug = "true"
-    _solutionName = getProductSlugId(MarketPlaceUrl.TANZU_PRODUCT, headers)
-    if _solutionName[0] is None:
-        return None, "Failed to find product on Marketplace " + str(_solutionName[1])
-    solutionName = _solutionName[0]
-    product = requests.get(
-        MarketPlaceUrl.API_URL + "/products/" + solutionName + "?isSlug=" + slug + "&ownorg=false",
-        headers=headers,
-        verify=False)
-
-    if product.status_code != 200:
-        return None, "Failed to Obtain Product ID"
-    else:
-        product_id = product.json()['response']['data']['productid']
-        for metalist in product.json()['response']['data']['metafilesList']:
-            binary_targetted = metalist["metafileobjectsList"][0]['filename']
-            app_version = metalist['appversion']
-
-            if app_version in UpgradeVersions.TARGET_VERSION:
-                logger.info("Binary: {}".format(binary_targetted))
-                logger.info("appversion: {}".format(app_version))
-
-                if binary in binary_targetted:
-                    logger.info("Found the binary....")
-                    objectid = metalist["metafileobjectsList"][0]['fileid']
-                    binaryName = metalist["metafileobjectsList"][0]['filename']
-                    metafileid = metalist['metafileid']
-                    logger.info("Binary Downloading...: {}".format(binaryName))
-                    logger.info("appversion Downloading..: {}".format(app_version))
-
-    if (objectid or binaryName or app_version or metafileid) is None:
+    if metafile is None:
         return None, "Failed to find the file details in Marketplace"
-
-    logger.info("Downloading binary " + binaryName)
+    objectid = metafile["metafileobjectsList"][0]['fileid']
+    binaryName = metafile["metafileobjectsList"][0]['filename']
+    app_version = metafile['appversion']
+    metafileid = metafile['metafileid']
+    logger.info("Binary Downloading...: {}".format(binaryName))
+    logger.info("appversion Downloading..: {}".format(app_version))
 
     payload = {
         "eulaAccepted": "true",
@@ -182,38 +154,18 @@ def download_upgrade_binaries(binary, refreshToken):
         "metafileid": metafileid,
         "metafileobjectid": objectid
     }
-
-    json_object = json.dumps(payload, indent=4).replace('\"true\"', 'true')
-    presigned_url = requests.request("POST",
-                                     MarketPlaceUrl.URL + "/api/v1/products/" + product_id + "/download",
-                                     headers=headers, data=json_object, verify=False)
-    if presigned_url.status_code != 200:
-        return None, "Failed to obtain pre-signed URL"
-    else:
-        download_url = presigned_url.json()["response"]["presignedurl"]
-
-    curl_inspect_cmd = 'curl -I -X GET {} --output /tmp/resp.txt'.format(download_url)
-    rcmd.run_cmd_only(curl_inspect_cmd)
-    with open('/tmp/resp.txt', 'r') as f:
-        data_read = f.read()
-    if 'HTTP/1.1 200 OK' in data_read:
-        logger.info('Proceed to Download')
-        binary_path = "/tmp/" + filename
-        curl_download_cmd = 'curl -X GET {d_url} --output {tmp_path}'.format(d_url=download_url,
-                                                                             tmp_path=binary_path)
-        rcmd.run_cmd_only(curl_download_cmd)
-    else:
-        logger.info('Error in presigned url/key: {} '.format(data_read.split('\n')[0]))
-        return None, "Invalid key/url"
+    try:
+        get_artifact_cache().fetch(metafileid, binaryName, lambda: client.presigned_url(product.product_id, payload),
+                                   sha256=marketplace_sha256(metafile["metafileobjectsList"][0]),
+                                   dest="/tmp/" + filename)
+    except Exception as e:
+        logger.error("Failed to download " + binaryName + ": " + str(e))
+        return None, str(e)
 
     return filename, "Kubernetes OVA download successful"
 
 
 def getOvaMarketPlace(filename, refreshToken, version, baseOS, upgrade):
-    rcmd = cmd_runner.RunCmd()
-    ovaName = None
-    app_version = None
-    metafileid = None
     # get base tanzu version for right ova to be downloaded
     tanzu_targetted_version = KubernetesOva.TARGET_VERSION
     filename = filename + ".ova"
@@ -224,72 +176,30 @@ def getOvaMarketPlace(filename, refreshToken, version, baseOS, upgrade):
     else:
         ova_groupname = KubernetesOva.MARKETPLACE_UBUTNU_GROUPNAME
 
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json"
-    }
-    payload = {
-        "refreshToken": refreshToken
-    }
-    json_object = json.dumps(payload, indent=4)
-    sess = requests.request("POST", MarketPlaceUrl.URL + "/api/v1/user/login", headers=headers,
-                            data=json_object, verify=False)
-    if sess.status_code != 200:
-        return None, "Failed to login and obtain csp-auth-token"
-    else:
-        token = sess.json()["access_token"]
-
-    headers = {
-        "Accept": "application/json",
-        "Content-Type": "application/json",
-        "csp-auth-token": token
-    }
+    client = MarketplaceClient.get(refreshToken)
+    try:
+        product = client.product(MarketPlaceUrl.TANZU_PRODUCT)
+    except Exception as e:
+        return None, str(e)
 
-    objectid = None
-    slug = "true"
-    _solutionName = getProductSlugId(MarketPlaceUrl.TANZU_PRODUCT, headers)
-    if _solutionName[0] is None:
-        return None, "Failed to find product on Marketplace " + str(_solutionName[1])
-    solutionName = _solutionName[0]
-    product = requests.get(
-        MarketPlaceUrl.API_URL + "/products/" + solutionName + "?isSlug=" + slug + "&ownorg=false", headers=headers,
-        verify=False)
-    if product.status_code != 200:
-        return None, "Failed to Obtain Product ID"
+    if upgrade:
+        # todo: Change targetted version to get from desired state
+        # version:  tkg: 1.5.3
+        metafile = product.metafile(UpgradeVersions.TARGET_VERSION, version[1:], ova_groupname, partial=True)
     else:
-        product_id = product.json()['response']['data']['productid']
-
-        for metalist in product.json()['response']['data']['metafilesList']:
-            ovaname = metalist["metafileobjectsList"][0]['filename']
-            if upgrade:
-                # todo: Change targetted version to get from desired state
-                # version:  tkg: 1.5.3
-                if metalist['appversion'] in UpgradeVersions.TARGET_VERSION:
-                    if metalist["version"] == version[1:] and str(metalist["groupname"]).strip(
-                            "\t") == ova_groupname:
-                        objectid = metalist["metafileobjectsList"][0]['fileid']
-                        ovaName = metalist["metafileobjectsList"][0]['filename']
-                        app_version = metalist['appversion']
-                        metafileid = metalist['metafileid']
-                        break
-
-            else:
-                # tanzu_targetted_version since we have grouped ova's under marketplace
-                # under versions
-                if metalist['appversion'] == tanzu_targetted_version:
-                    if metalist["version"] == version[1:] and str(metalist["groupname"]).strip("\t") \
-                            == ova_groupname:
-                        objectid = metalist["metafileobjectsList"][0]['fileid']
-                        ovaName = metalist["metafileobjectsList"][0]['filename']
-                        app_version = metalist['appversion']
-                        metafileid = metalist['metafileid']
-                        break
+        # tanzu_targetted_version since we have grouped ova's under marketplace
+        # under versions
+        metafile = product.metafile(tanzu_targetted_version, version[1:], ova_groupname)
+    if metafile is None:
+        return None, "Failed to find the file details in Marketplace"
+    objectid = metafile["metafileobjectsList"][0]['fileid']
+    ovaName = metafile["metafileobjectsList"][0]['filename']
+    app_version = metafile['appversion']
+    metafileid = metafile['metafileid']
     logger.info("---------------------")
     logger.info("ovaName: {ovaName} app_version: {app_version} metafileid: {metafileid}".format(ovaName=ovaName,
                                                                                                 app_version=app_version,
                                                                                                 metafileid=metafileid))
-    if (objectid or ovaName or app_version or metafileid) is None:
-        return None, "Failed to find the file details in Marketplace"
 
     logger.info("Downloading kubernetes ova - " + ovaName)
 
@@ -299,33 +209,13 @@ def getOvaMarketPlace(filename, refreshToken, version, baseOS, upgrade):
         "metafileid": metafileid,
         "metafileobjectid": objectid
     }
-
-    json_object = json.dumps(payload, indent=4).replace('\"true\"', 'true')
-    logger.info('--------')
-    logger.info('Marketplaceurl: {url} data: {data}'.format(url=MarketPlaceUrl.URL, data=json_object))
-    presigned_url = requests.request("POST",
-                                     MarketPlaceUrl.URL + "/api/v1/products/" + product_id + "/download",
-                                     headers=headers, data=json_object, verify=False)
-    logger.info('presigned_url: {}'.format(presigned_url))
-    logger.info('presigned_url text: {}'.format(presigned_url.text))
-    if presigned_url.status_code != 200:
-        return None, "Failed to obtain pre-signed URL"
-    else:
-        download_url = presigned_url.json()["response"]["presignedurl"]
-
-    curl_inspect_cmd = 'curl -I -X GET {} --output /tmp/resp.txt'.format(download_url)
-    rcmd.run_cmd_only(curl_inspect_cmd)
-    with open('/tmp/resp.txt', 'r') as f:
-        data_read = f.read()
-    if 'HTTP/1.1 200 OK' in data_read:
-        logger.info('Proceed to Download')
-        ova_path = "/tmp/" + ovaName
-        curl_download_cmd = 'curl -X GET {d_url} --output {tmp_path}'.format(d_url=download_url,
-                                                                             tmp_path=ova_path)
-        rcmd.run_cmd_only(curl_download_cmd)
-    else:
-        logger.info('Error in presigned url/key: {} '.format(data_read.split('\n')[0]))
-        return None, "Invalid key/url"
+    try:
+        get_artifact_cache().fetch(metafileid, ovaName, lambda: client.presigned_url(product.product_id, payload),
+                                   sha256=marketplace_sha256(metafile["metafileobjectsList"][0]),
+                                   dest="/tmp/" + ovaName)
+    except Exception as e:
+        logger.error("Failed to download " + ovaName + ": " + str(e))
+        return None, str(e)
 
     return ovaName, "Kubernetes OVA download successful"
 
@@ -349,7 +239,7 @@ def downloadAndPushToVCMarketPlace(file, datacenter, datastore, networkName, clu
         vcenter_ip = jsonspec['envSpec']['vcenterDetails']['vcenterAddress']
         vcenter_username = jsonspec['envSpec']['vcenterDetails']['vcenterSsoUser']
         enc_password = jsonspec['envSpec']['vcenterDetails']['vcenterSsoPasswordBase64']
-        password = CmdHelper.decode_base64(enc_password)
+        password = decode_secret(enc_password)
         os.putenv("GOVC_URL", "https://" + vcenter_ip + "/sdk")
         os.putenv("GOVC_USERNAME", vcenter_username)
         os.putenv("GOVC_PASSWORD", password)
@@ -368,6 +258,22 @@ def downloadAndPushToVCMarketPlace(file, datacenter, datastore, networkName, clu
         return "SUCCESS", "ALREADY DOWNLOADED"
 
 
+def isKubernetesOvaTemplatePresent(jsonspec, version, baseOS):
+    """
+    :return: True when the kubernetes template downloadAndPushKubernetesOvaMarketPlace pushes for
+             version and baseOS is in the datacenter VM folder
+    """
+    if baseOS == "photon":
+        template = KubernetesOva.MARKETPLACE_PHOTON_KUBERNETES_FILE_NAME + "-" + version
+    elif baseOS == "ubuntu":
+        template = KubernetesOva.MARKETPLACE_UBUNTU_KUBERNETES_FILE_NAME + "-" + version
+    else:
+        return False
+    vCenter_datacenter = jsonspec['envSpec']['vcenterDetails']['vcenterDatacenter']
+    output = runShellCommandAndReturnOutputAsList(["govc", "ls", "/" + vCenter_datacenter + "/vm"])
+    return output[1] == 0 and str(output[0]).__contains__(template)
+
+
 def downloadAndPushKubernetesOvaMarketPlace(jsonspec, version, baseOS, upgrade=False):
     try:
         rcmd = cmd_runner.RunCmd()
@@ -529,21 +435,19 @@ def getCloudStatus(ip, csrf2, aviVersion, cloudName):
     }
     body = {}
     url = "https://" + ip + "/api/cloud"
-    response_csrf = requests.request("GET", url, headers=headers, data=body, verify=False)
+    response_csrf = avi_request("GET", url, headers=headers, data=body, verify=False)
     if response_csrf.status_code != 200:
         return None, response_csrf.text
     else:
         for re in response_csrf.json()["results"]:
             if re['name'] == cloudName:
-                os.system("rm -rf newCloudInfo.json")
-                with open("./newCloudInfo.json", "w") as outfile:
-                    json.dump(response_csrf.json(), outfile)
+                AviRegistry.record(ip, CLOUD, response_csrf.json())
                 return re["url"], "SUCCESS"
     return "NOT_FOUND", "SUCCESS"
 
 
 def seperateNetmaskAndIp(cidr):
-    return str(cidr).split("/")
+    return list(split_cidr(cidr))
 
 
 def getSECloudStatus(ip, csrf2, aviVersion, seGroupName):
@@ -558,7 +462,7 @@ def getSECloudStatus(ip, csrf2, aviVersion, seGroupName):
     body = {}
     json_object = json.dumps(body, indent=4)
     url = "https://" + ip + "/api/serviceenginegroup"
-    response_csrf = requests.request("GET", url, headers=headers, data=json_object, verify=False)
+    response_csrf = avi_request("GET", url, headers=headers, data=json_object, verify=False)
     if response_csrf.status_code != 200:
         return None, response_csrf.text
     else:
@@ -580,7 +484,7 @@ def getVrfAndNextRoutId(ip, csrf2, cloudUuid, typen, routIp, aviVersion):
     body = {}
     routId = 0
     url = "https://" + ip + "/api/vrfcontext/?name.in=" + typen + "&cloud_ref.uuid=" + cloudUuid
-    response_csrf = requests.request("GET", url, headers=headers, data=body, verify=False)
+    response_csrf = avi_request("GET", url, headers=headers, data=body, verify=False)
     if response_csrf.status_code != 200:
         return None, response_csrf.text
     else:
@@ -639,7 +543,7 @@ def addStaticRoute(ip, csrf2, vrfUrl, routeIp, routId, aviVersion):
     }
     url = vrfUrl
     json_object = json.dumps(body, indent=4)
-    response_csrf = requests.request("PATCH", url, headers=headers, data=json_object, verify=False)
+    response_csrf = avi_request("PATCH", url, headers=headers, data=json_object, verify=False)
     if response_csrf.status_code != 200:
         return None, response_csrf.text
     else:
@@ -1415,49 +1319,26 @@ def getManagementCluster():
 
 
 def switchToManagementContext(clusterName):
-    commands_shared = ["tanzu", "management-cluster", "kubeconfig", "get", clusterName, "--admin"]
-    kubeContextCommand_shared = grabKubectlCommand(commands_shared, RegexPattern.SWITCH_CONTEXT_KUBECTL)
-    if kubeContextCommand_shared is None:
-        logger.error("Failed get admin cluster context of cluster " + clusterName)
+    context = KubeContexts.get().use(clusterName, management=True)
+    if context[0] is None:
         d = {
             "responseType": "ERROR",
-            "msg": "Failed get admin cluster context of cluster " + clusterName,
+            "msg": context[1],
             "ERROR_CODE": 500
         }
         return json.dumps(d), 500
-    lisOfSwitchContextCommand_shared = str(kubeContextCommand_shared).split(" ")
-    status = runShellCommandAndReturnOutputAsList(lisOfSwitchContextCommand_shared)
-    if status[1] != 0:
-        logger.error("Failed to switch to" + clusterName + "cluster context " + str(status[0]))
-        d = {
-            "responseType": "ERROR",
-            "msg": "Failed to switch to " + clusterName + " cluster context " + str(status[0]),
-            "ERROR_CODE": 500
-        }
-        return json.dumps(d), 500
-
-    logger.info("Switched to " + clusterName + " context")
     d = {
         "responseType": "ERROR",
-        "msg": "Switched to " + clusterName + " context",
+        "msg": context[1],
         "ERROR_CODE": 200
     }
     return json.dumps(d), 200
 
 
 def waitForGrepProcessWithoutChangeDir(list1, list2, podName, status):
-    time.sleep(30)
-    count_cert = 0
-    running = False
     try:
-        while count_cert < 60:
-            cert_state = grabPipeOutput(list1, list2)
-            if verifyPodsAreRunning(podName, cert_state[0], status):
-                running = True
-                break
-            time.sleep(30)
-            count_cert = count_cert + 1
-            logger.info("Waited for  " + str(count_cert * 30) + "s, retrying.")
+        running = wait_until(lambda: verifyPodsAreRunning(podName, grabPipeOutput(list1, list2)[0], status),
+                             timeout=1830, interval=5, max_interval=30, description=podName + " " + status)
     except Exception as e:
         logger.error(" Failed to verify pod running ")
         d = {
@@ -1465,21 +1346,21 @@ def waitForGrepProcessWithoutChangeDir(list1, list2, podName, status):
             "msg": "Failed to verify pod running",
             "ERROR_CODE": 500
         }
-        return json.dumps(d), 500, count_cert
+        return json.dumps(d), 500
     if not running:
-        logger.error(podName + " is not running on waiting " + str(count_cert * 30) + "s")
+        logger.error(podName + " is not running on waiting " + str(int(running.elapsed)) + "s")
         d = {
             "responseType": "ERROR",
-            "msg": podName + " is not running on waiting " + str(count_cert * 30) + "s",
+            "msg": podName + " is not running on waiting " + str(int(running.elapsed)) + "s",
             "ERROR_CODE": 500
         }
-        return json.dumps(d), 500, count_cert
+        return json.dumps(d), 500
     d = {
         "responseType": "ERROR",
         "msg": "Successfully running " + podName + " ",
         "ERROR_CODE": 200
     }
-    return json.dumps(d), 200, count_cert
+    return json.dumps(d), 200
 
 
 def createContourDataValues(clusterName):
@@ -1563,8 +1444,7 @@ def installExtentionFor14(service_name, cluster, jsonspec):
                 if states[1] != 0:
                     logger.error(
                         AppName.CERT_MANAGER + " installation command failed. Checking for reconciliation status..")
-            certManagerStatus = waitForGrepProcessWithoutChangeDir(main_command, sub_command, AppName.CERT_MANAGER,
-                                                                   RegexPattern.RECONCILE_SUCCEEDED)
+            certManagerStatus = waitForPackageReconciled(AppName.CERT_MANAGER)
             if certManagerStatus[1] == 500:
                 d = {
                     "responseType": "ERROR",
@@ -1614,68 +1494,67 @@ def installExtentionFor14(service_name, cluster, jsonspec):
                     "ERROR_CODE": 500
                 }
                 return json.dumps(d), 500
-        if Upgrade_Extensions.UPGRADE_EXTN:
+            if Upgrade_Extensions.UPGRADE_EXTN:
 
-            cmdOutput = checkExtentionDeployed(AppName.CONTOUR)
-            if cmdOutput[1] != 0:
+                cmdOutput = checkExtentionDeployed(AppName.CONTOUR)
+                if cmdOutput[1] != 0:
+                    d = {
+                        "responseType": "WARNING",
+                        "msg": AppName.CONTOUR + " is not deployed, but is enabled in deployment json file...hence skipping upgrade",
+                        "ERROR_CODE": 299
+                    }
+                    # returning 200 status code, because we have to check if other extensions have to be upgraded
+                    return json.dumps(d), 299
+
+                logger.info("Updating contour - " + state)
+                update_command = ["tanzu", "package", "installed", "update", AppName.CONTOUR, "--package-name",
+                                  "contour.tanzu.vmware.com", "--version", state, "--values-file",
+                                  Paths.LOCAL_VSPHERE_ALB_CONTOUR_CONFIG, "--namespace",
+                                  "package-tanzu-system-contour"]
+                states = runShellCommandAndReturnOutputAsList(update_command)
+                if states[1] != 0:
+                    for r in states[0]:
+                        logger.error(r)
+                    logger.info(
+                        AppName.CONTOUR + " update command failed. Checking for reconciliation status...")
+            else:
+                logger.info("Installing contour - " + state)
+                install_command = ["tanzu", "package", "install", AppName.CONTOUR, "--package-name",
+                                   "contour.tanzu.vmware.com", "--version", state, "--values-file",
+                                   Paths.LOCAL_VSPHERE_ALB_CONTOUR_CONFIG, "--namespace",
+                                   "package-tanzu-system-contour",
+                                   "--create-namespace"]
+                states = runShellCommandAndReturnOutputAsList(install_command)
+                if states[1] != 0:
+                    for r in states[0]:
+                        logger.error(r)
+                    logger.info(
+                        AppName.CONTOUR + " install command failed. Checking for reconciliation status...")
+            contourStatus = waitForPackageReconciled(AppName.CONTOUR)
+            if contourStatus[1] == 500:
                 d = {
-                    "responseType": "WARNING",
-                    "msg": AppName.CONTOUR + " is not deployed, but is enabled in deployment json file...hence skipping upgrade",
-                    "ERROR_CODE": 299
+                    "responseType": "ERROR",
+                    "msg": "Failed to bring contour " + str(contourStatus[0]),
+                    "ERROR_CODE": 500
                 }
-                # returning 200 status code, because we have to check if other extensions have to be upgraded
-                return json.dumps(d), 299
-
-            logger.info("Updating contour - " + state)
-            update_command = ["tanzu", "package", "installed", "update", AppName.CONTOUR, "--package-name",
-                              "contour.tanzu.vmware.com", "--version", state, "--values-file",
-                              Paths.LOCAL_VSPHERE_ALB_CONTOUR_CONFIG, "--namespace",
-                              "package-tanzu-system-contour"]
-            states = runShellCommandAndReturnOutputAsList(update_command)
-            if states[1] != 0:
-                for r in states[0]:
-                    logger.error(r)
-                logger.info(
-                    AppName.CONTOUR + " update command failed. Checking for reconciliation status...")
+                return json.dumps(d), 500
+            if service != "all":
+                logger.info("Contour deployed and is up and running")
+                d = {
+                    "responseType": "SUCCESS",
+                    "msg": "Contour deployed and is up and running",
+                    "ERROR_CODE": 200
+                }
+                return json.dumps(d), 200
         else:
-            logger.info("Installing contour - " + state)
-            install_command = ["tanzu", "package", "install", AppName.CONTOUR, "--package-name",
-                               "contour.tanzu.vmware.com", "--version", state, "--values-file",
-                               Paths.LOCAL_VSPHERE_ALB_CONTOUR_CONFIG, "--namespace",
-                               "package-tanzu-system-contour",
-                               "--create-namespace"]
-            states = runShellCommandAndReturnOutputAsList(install_command)
-            if states[1] != 0:
-                for r in states[0]:
-                    logger.error(r)
-                logger.info(
-                    AppName.CONTOUR + " install command failed. Checking for reconciliation status...")
-        contourStatus = waitForGrepProcessWithoutChangeDir(main_command, sub_command, AppName.CONTOUR,
-                                                           RegexPattern.RECONCILE_SUCCEEDED)
-        if contourStatus[1] == 500:
-            d = {
-                "responseType": "ERROR",
-                "msg": "Failed to bring contour " + str(contourStatus[0]),
-                "ERROR_CODE": 500
-            }
-            return json.dumps(d), 500
-        if service != "all":
-            logger.info("Contour deployed and is up and running")
-            d = {
-                "responseType": "SUCCESS",
-                "msg": "Contour deployed and is up and running",
-                "ERROR_CODE": 200
-            }
-            return json.dumps(d), 200
-    else:
-        logger.info("Contour is already up and running")
-        d = {
-            "responseType": "SUCCESS",
-            "msg": "Contour is already up and running",
-            "ERROR_CODE": 200
-        }
-        return json.dumps(d), 200
-
+            logger.info("Contour is already up and running")
+            if service != "all":
+                d = {
+                    "responseType": "SUCCESS",
+                    "msg": "Contour is already up and running",
+                    "ERROR_CODE": 200
+                }
+                return json.dumps(d), 200
 
     d = {
         "responseType": "SUCCESS",
@@ -1688,21 +1567,19 @@ def installExtentionFor14(service_name, cluster, jsonspec):
 def getClusterID(vCenter, vCenter_user, VC_PASSWORD, cluster, jsonspec):
     url = "https://" + vCenter + "/"
     try:
-        sess = requests.post(url + "rest/com/vmware/cis/session", auth=(vCenter_user, VC_PASSWORD), verify=False)
-        if sess.status_code != 200:
+        session_id = VcenterRestSession.get(vCenter, vCenter_user, VC_PASSWORD).session_id
+        if session_id is None:
             d = {
                 "reponseType": "ERROR",
                 "msg": "Failed to fetch session ID for vCenter - " + vCenter,
                 "ERROR_CODE": 500
             }
             return json.dumps(d), 500
-        else:
-            session_id = sess.json()['value']
 
         vcenter_datacenter = jsonspec['envSpec']['vcenterDetails']['vcenterDatacenter']
 
-        datcenter_resp = requests.get(url + "api/vcenter/datacenter?names=" + vcenter_datacenter, verify=False,
-                                      headers={"vmware-api-session-id": session_id})
+        datcenter_resp = vcenter_request("GET", url + "api/vcenter/datacenter?names=" + vcenter_datacenter, verify=False,
+                                         headers={"vmware-api-session-id": session_id})
         if datcenter_resp.status_code != 200:
             logger.error(datcenter_resp.json())
             d = {
@@ -1714,7 +1591,7 @@ def getClusterID(vCenter, vCenter_user, VC_PASSWORD, cluster, jsonspec):
 
         datacenter_id = datcenter_resp.json()[0]['datacenter']
 
-        clusterID_resp = requests.get(url + "api/vcenter/cluster?names=" + cluster, verify=False, headers={
+        clusterID_resp = vcenter_request("GET", url + "api/vcenter/cluster?names=" + cluster, verify=False, headers={
             "vmware-api-session-id": session_id
         })
         if clusterID_resp.status_code != 200:
@@ -1740,23 +1617,21 @@ def getClusterID(vCenter, vCenter_user, VC_PASSWORD, cluster, jsonspec):
 def getStoragePolicies(vCenter, vCenter_user, VC_PASSWORD):
     url = "https://" + vCenter + "/"
     try:
-        sess = requests.post(url + "rest/com/vmware/cis/session", auth=(vCenter_user, VC_PASSWORD), verify=False)
-        if sess.status_code != 200:
+        vc_session = VcenterRestSession.get(vCenter, vCenter_user, VC_PASSWORD).session_id
+        if vc_session is None:
             d = {
                 "responseType": "ERROR",
                 "msg": "Failed to fetch session ID for vCenter - " + vCenter,
                 "ERROR_CODE": 500
             }
             return json.dumps(d), 500
-        else:
-            vc_session = sess.json()['value']
 
         header = {
             "Accept": "application/json",
             "Content-Type": "application/json",
             "vmware-api-session-id": vc_session
         }
-        storage_policies = requests.request("GET", url + "api/vcenter/storage/policies", headers=header, verify=False)
+        storage_policies = vcenter_request("GET", url + "api/vcenter/storage/policies", headers=header, verify=False)
         if storage_policies.status_code != 200:
             d = {
                 "responseType": "ERROR",
@@ -1800,11 +1675,7 @@ def convertStringToCommaSeperated(strA):
 
 
 def cidr_to_netmask(cidr):
-    try:
-        return str(ipaddress.IPv4Network(cidr, False).netmask)
-    except Exception as e:
-        logger.error(e)
-        return None
+    return netmask_of(cidr)
 
 
 def getCountOfIpAdress(gatewayCidr, start, end):
@@ -1845,7 +1716,7 @@ def getAviCertificate(ip, csrf2, certName, aviVersion):
     }
     body = {}
     url = "https://" + ip + "/api/sslkeyandcertificate"
-    response_csrf = requests.request("GET", url, headers=headers, data=body, verify=False)
+    response_csrf = avi_request("GET", url, headers=headers, data=body, verify=False)
     if response_csrf.status_code != 200:
         logger.error("Failed to get certificate " + response_csrf.text)
         return None, response_csrf.text
@@ -1856,32 +1727,18 @@ def getAviCertificate(ip, csrf2, certName, aviVersion):
     return "NOT_FOUND", "FAILED"
 
 
-def switchToContext(clusterName):
-    commands_shared = ["tanzu", "cluster", "kubeconfig", "get", clusterName, "--admin"]
-    kubeContextCommand_shared = grabKubectlCommand(commands_shared, RegexPattern.SWITCH_CONTEXT_KUBECTL)
-    if kubeContextCommand_shared is None:
-        logger.error("Failed get admin cluster context of cluster " + clusterName)
+def switchToContext(clusterName, env=None):
+    context = KubeContexts.get().use(clusterName)
+    if context[0] is None:
         d = {
             "responseType": "ERROR",
-            "msg": "Failed get admin cluster context of cluster " + clusterName,
+            "msg": context[1],
             "ERROR_CODE": 500
         }
         return json.dumps(d), 500
-    lisOfSwitchContextCommand_shared = str(kubeContextCommand_shared).split(" ")
-    status = runShellCommandAndReturnOutputAsList(lisOfSwitchContextCommand_shared)
-    if status[1] != 0:
-        logger.error("Failed to switch to" + clusterName + "cluster context " + str(status[0]))
-        d = {
-            "responseType": "ERROR",
-            "msg": "Failed to switch to " + clusterName + " cluster context " + str(status[0]),
-            "ERROR_CODE": 500
-        }
-        return json.dumps(d), 500
-
-    logger.info("Switched to " + clusterName + " context")
     d = {
         "responseType": "ERROR",
-        "msg": "Switched to " + clusterName + " context",
+        "msg": context[1],
         "ERROR_CODE": 200
     }
     return json.dumps(d), 200
@@ -2140,26 +1997,6 @@ def getNetworkPathTMC(networkName, vcenter_ip, vcenter_username, password):
     return None
 
 
-def checkTmcRegister(cluster, ifManagement):
-    try:
-        if ifManagement:
-            list = ["tmc", "managementcluster", "list"]
-        else:
-            list = ["tmc", "cluster", "list"]
-        o = runShellCommandAndReturnOutput(list)
-        if o[0].__contains__(cluster):
-            logger.info("here ")
-            state = checkClusterStateOnTmc(cluster, ifManagement)
-            if state[0] == "SUCCESS":
-                return True
-            else:
-                return False
-        else:
-            return False
-    except:
-        return False
-
-
 def checkSharedServiceProxyEnabled(env, jsonspec):
     if env == Env.VMC:
         shared_proxy = "false"
@@ -2280,41 +2117,47 @@ def generateTSMJsonFile(management_cluster, provisioner_name, cluster_name, exac
         json.dump(tsmJson, f)
 
 
-def waitForProcessWithStatus(list1, podName, status):
-    count_cert = 0
-    running = False
-    while count_cert < 60:
-        cert_state = runShellCommandAndReturnOutputAsList(list1)
-        time.sleep(30)
-        if verifyPodsAreRunning(podName, cert_state[0], status):
-            running = True
-            break
-        count_cert = count_cert + 1
-        logger.info("Waited for  " + str(count_cert * 30) + "s, retrying.")
+def waitForPodsRunning(namespace, podName):
+    running = wait_for_pods_running(podName, namespace=namespace, timeout=1800)
     if not running:
-        logger.error(podName + " is not running on waiting " + str(count_cert * 30) + "s")
+        logger.error(podName + " is not running on waiting " + str(int(running.elapsed)) + "s")
         d = {
             "responseType": "ERROR",
-            "msg": podName + " is not running on waiting " + str(count_cert * 30) + "s",
+            "msg": podName + " is not running on waiting " + str(int(running.elapsed)) + "s",
             "ERROR_CODE": 500
         }
-        return json.dumps(d), 500, count_cert
+        return json.dumps(d), 500
     logger.info("Successfully running " + podName)
     d = {
         "responseType": "SUCCESS",
         "msg": "Successfully running" + podName,
         "ERROR_CODE": 200
     }
-    return json.dumps(d), 200, count_cert
+    return json.dumps(d), 200
+
+
+def waitForPackageReconciled(packageName):
+    reconciled = wait_for_package_reconciled(packageName, timeout=1830)
+    if not reconciled:
+        logger.error(packageName + " is not reconciled on waiting " + str(int(reconciled.elapsed)) + "s")
+        d = {
+            "responseType": "ERROR",
+            "msg": packageName + " is not reconciled on waiting " + str(int(reconciled.elapsed)) + "s",
+            "ERROR_CODE": 500
+        }
+        return json.dumps(d), 500
+    d = {
+        "responseType": "SUCCESS",
+        "msg": "Successfully reconciled " + packageName + " ",
+        "ERROR_CODE": 200
+    }
+    return json.dumps(d), 200
 
 
 def integrateSas(cluster_name, jsonspec, sasType):
     vcenter_ip = jsonspec['envSpec']['vcenterDetails']['vcenterAddress']
     vcenter_username = jsonspec['envSpec']['vcenterDetails']['vcenterSsoUser']
-    str_enc = str(jsonspec['envSpec']['vcenterDetails']["vcenterSsoPasswordBase64"])
-    base64_bytes = str_enc.encode('ascii')
-    enc_bytes = base64.b64decode(base64_bytes)
-    password = enc_bytes.decode('ascii').rstrip("\n")
+    password = decode_secret(jsonspec['envSpec']['vcenterDetails']["vcenterSsoPasswordBase64"])
     cluster = jsonspec["envSpec"]["vcenterDetails"]["vcenterCluster"]
     command = ["tmc", "managementcluster", "list"]
     output = runShellCommandAndReturnOutputAsList(command)
@@ -2362,15 +2205,15 @@ def integrateSas(cluster_name, jsonspec, sasType):
         command_create = ["tmc", "cluster", "integration", "create", "-f", fileName]
         state = runShellCommandAndReturnOutput(command_create)
         if sasType == SAS.TO:
-            command_kube = ["kubectl", "get", "pods", "-n", "tanzu-observability-saas"]
+            namespace = "tanzu-observability-saas"
             pods = ["wavefront"]
         elif sasType == SAS.TSM:
-            command_kube = ["kubectl", "get", "pods", "-n", "vmware-system-tsm"]
+            namespace = "vmware-system-tsm"
             pods = ["allspark", "installer-job", "k8s-cluster-manager", "tsm-agent-operator"]
         for pod in pods:
-            st = waitForProcessWithStatus(command_kube, pod, RegexPattern.RUNNING)
+            st = waitForPodsRunning(namespace, pod)
             if st[1] != 200:
-                return st[0].json, st[1]
+                return st[0], st[1]
         count = 0
         registered = False
         while count < 180:
@@ -2460,27 +2303,15 @@ def getVipNetworkIpNetMask(ip, csrf2, name, aviVersion):
         "x-avi-version": aviVersion,
         "x-csrftoken": csrf2[0]
     }
-    body = {}
     url = "https://" + ip + "/api/network"
     try:
-        response_csrf = requests.request("GET", url, headers=headers, data=body, verify=False)
-        if response_csrf.status_code != 200:
-            return None, response_csrf.text
-        else:
-            for re in response_csrf.json()["results"]:
-                if re['name'] == name:
-                    for sub in re["configured_subnets"]:
-                        return str(sub["prefix"]["ip_addr"]["addr"]) + "/" + str(sub["prefix"]["mask"]), "SUCCESS"
-            else:
-                next_url = None if not response_csrf.json()["next"] else response_csrf.json()["next"]
-                while len(next_url) > 0:
-                    response_csrf = requests.request("GET", next_url, headers=headers, data=body, verify=False)
-                    for re in response_csrf.json()["results"]:
-                        if re['name'] == name:
-                            for sub in re["configured_subnets"]:
-                                return str(sub["prefix"]["ip_addr"]["addr"]) + "/" + str(
-                                    sub["prefix"]["mask"]), "SUCCESS"
-                    next_url = None if not response_csrf.json()["next"] else response_csrf.json()["next"]
+        network = find_avi_object(url, headers, name, fields=["name", "configured_subnets"])
+    except Exception as e:
+        return None, str(e)
+    try:
+        if network is not None:
+            for sub in network["configured_subnets"]:
+                return str(sub["prefix"]["ip_addr"]["addr"]) + "/" + str(sub["prefix"]["mask"]), "SUCCESS"
         return "NOT_FOUND", "FAILED"
     except KeyError:
         return "NOT_FOUND", "FAILED"
@@ -2555,6 +2386,7 @@ def isClusterRunning(vcenter_ip, vcenter_username, password, cluster, workload_n
             return json.dumps(d), 500
 
         logger.info("logging into cluster - " + endpoint_ip)
+        KubeContexts.get().release()
         os.putenv("KUBECTL_VSPHERE_PASSWORD", password)
         connect_command = ["kubectl", "vsphere", "login", "--server=" + endpoint_ip,
                            "--vsphere-username=" + vcenter_username,
@@ -2638,20 +2470,14 @@ def isClusterRunning(vcenter_ip, vcenter_username, password, cluster, workload_n
 def isWcpEnabled(cluster_id, jsonspec):
     vcenter_ip = jsonspec['envSpec']['vcenterDetails']['vcenterAddress']
     vcenter_username = jsonspec['envSpec']['vcenterDetails']['vcenterSsoUser']
-    str_enc = str(jsonspec['envSpec']['vcenterDetails']["vcenterSsoPasswordBase64"])
-    base64_bytes = str_enc.encode('ascii')
-    enc_bytes = base64.b64decode(base64_bytes)
-    password = enc_bytes.decode('ascii').rstrip("\n")
+    password = decode_secret(jsonspec['envSpec']['vcenterDetails']["vcenterSsoPasswordBase64"])
     if not (vcenter_ip or vcenter_username or password):
         return False, "Failed to fetch VC details"
 
-    sess = requests.post("https://" + str(vcenter_ip) + "/rest/com/vmware/cis/session",
-                         auth=(vcenter_username, password), verify=False)
-    if sess.status_code != 200:
+    vc_session = VcenterRestSession.get(vcenter_ip, vcenter_username, password).session_id
+    if vc_session is None:
         logger.error("Connection to vCenter failed")
         return False, "Connection to vCenter failed"
-    else:
-        vc_session = sess.json()['value']
 
     header = {
         "Accept": "application/json",
@@ -2659,7 +2485,7 @@ def isWcpEnabled(cluster_id, jsonspec):
         "vmware-api-session-id": vc_session
     }
     url = "https://" + vcenter_ip + "/api/vcenter/namespace-management/clusters/" + cluster_id
-    response_csrf = requests.request("GET", url, headers=header, verify=False)
+    response_csrf = vcenter_request("GET", url, headers=header, verify=False)
     if response_csrf.status_code != 200:
         if response_csrf.status_code == 400:
             if response_csrf.json()["messages"][0][
@@ -2690,6 +2516,7 @@ def connect_to_workload(vCenter, vcenter_username, password, cluster, workload_n
         else:
             return None, "Failed to obtain cluster endpoint IP on given cluster - " + workload_name
         logger.info("logging into cluster - " + endpoint_ip)
+        KubeContexts.get().release()
         os.putenv("KUBECTL_VSPHERE_PASSWORD", password)
         connect_command = ["kubectl", "vsphere", "login", "--vsphere-username", vcenter_username, "--server",
                            endpoint_ip,
@@ -2864,28 +2691,16 @@ def installCertManagerAndContour(cluster_name, repo_address, service_name, jsons
             }
             return json.dumps(d), 500
     else:
+        name_space = None
         if TkgUtil.isEnvTkgs_ns(jsonspec):
             name_space = jsonspec['tkgsComponentSpec']["tkgsVsphereNamespaceSpec"][
                 'tkgsVsphereWorkloadClusterSpec']['tkgsVsphereNamespaceName']
-            commands_shared = ["tanzu", "cluster", "kubeconfig", "get", cluster_name, "--admin", "-n", name_space]
-        else:
-            commands_shared = ["tanzu", "cluster", "kubeconfig", "get", cluster_name, "--admin"]
-        kubeContextCommand_shared = grabKubectlCommand(commands_shared, RegexPattern.SWITCH_CONTEXT_KUBECTL)
-        if kubeContextCommand_shared is None:
-            logger.error("Failed to get switch to " + cluster_name + " cluster context command")
-            d = {
-                "responseType": "ERROR",
-                "msg": "Failed to get switch to " + cluster_name + " context command",
-                "ERROR_CODE": 500
-            }
-            return json.dumps(d), 500
-        lisOfSwitchContextCommand_shared = str(kubeContextCommand_shared).split(" ")
-        status = runShellCommandAndReturnOutputAsList(lisOfSwitchContextCommand_shared)
-        if status[1] != 0:
-            logger.error("Failed to get switch to shared cluster context " + str(status[0]))
+        context = KubeContexts.get().use(cluster_name, namespace=name_space)
+        if context[0] is None:
+            logger.error("Failed to get switch to " + cluster_name + " context " + context[1])
             d = {
                 "responseType": "ERROR",
-                "msg": "Failed to get switch to " + cluster_name + " context " + str(status[0]),
+                "msg": "Failed to get switch to " + cluster_name + " context " + context[1],
                 "ERROR_CODE": 500
             }
             return json.dumps(d), 500
@@ -3212,7 +3027,7 @@ def checkFluentBitInstalled():
 
 
 def checkNameSpaceRunningStatus(url, header, name_space, cluster_id):
-    response_csrf = requests.request("GET", url, headers=header, verify=False)
+    response_csrf = vcenter_request("GET", url, headers=header, verify=False)
     if response_csrf.status_code != 200:
         return None, "Failed to get namespace list " + str(response_csrf.text)
     found = False
@@ -3302,6 +3117,7 @@ def supervisorTMC(vcenter_user, VC_PASSWORD, cluster_ip):
             logger.info("Server config delete failed")
             return "Server config delete failed", 500
     logger.info("Logging in to cluster " + cluster_ip)
+    KubeContexts.get().release()
     os.putenv("KUBECTL_VSPHERE_PASSWORD", VC_PASSWORD)
     connect_command = ["kubectl", "vsphere", "login", "--server=" + cluster_ip, "--vsphere-username=" + vcenter_user,
                        "--insecure-skip-tls-verify"]
@@ -3366,6 +3182,7 @@ def getClusterVersionsFullList(vCenter, vcenter_username, password, cluster, jso
             return json.dumps(d), 500
 
         logger.info("logging into cluster - " + endpoint_ip)
+        KubeContexts.get().release()
         os.putenv("KUBECTL_VSPHERE_PASSWORD", password)
         connect_command = ["kubectl", "vsphere", "login", "--server=" + endpoint_ip,
                            "--vsphere-username=" + vcenter_username,
@@ -3431,22 +3248,13 @@ def checkClusterVersionCompatibility(vc_ip, vc_user, vc_password, cluster_name,
 
 def checkAndWaitForAllTheServiceEngineIsUp(ip, clodName, jsonspec, aviVersion):
     avienc_pass = str(jsonspec['tkgsComponentSpec']['aviComponents']['aviPasswordBase64'])
-    csrf2 = obtain_second_csrf(ip, avienc_pass)
+    csrf2 = obtain_session_csrf(ip, avienc_pass)
     if csrf2 is None:
         logger.error("Failed to get csrf from new set password")
         return None, "Failed to get csrf from new set password"
-    with open("./newCloudInfo.json", 'r') as file2:
-        new_cloud_json = json.load(file2)
-    uuid = None
-    try:
-        uuid = new_cloud_json["uuid"]
-    except:
-        for re in new_cloud_json["results"]:
-            if re["name"] == clodName:
-                uuid = re["uuid"]
+    uuid = avi_object_uuid(ip, csrf2, aviVersion, CLOUD, clodName)
     if uuid is None:
         return None, "Failed", "ERROR"
-    url = "https://" + ip + "/api/serviceengine-inventory/?cloud_ref.uuid=" + str(uuid)
     headers = {
         "Accept": "application/json",
         "Content-Type": "application/json",
@@ -3455,34 +3263,14 @@ def checkAndWaitForAllTheServiceEngineIsUp(ip, clodName, jsonspec, aviVersion):
         "x-avi-version": aviVersion,
         "x-csrftoken": csrf2[0]
     }
-    payload = {}
-    count = 0
-    seCount = 0
-    response_csrf = None
     logger.info("Checking all service are up or not.")
-    while count < 60:
-        try:
-            logger.info("Waited for " + str(count * 10) + "s retrying")
-            response_csrf = requests.request("GET", url, headers=headers, data=payload, verify=False)
-            length = len(response_csrf.json()["results"])
-            if response_csrf.status_code == 200:
-                for se in response_csrf.json()["results"]:
-                    if str(se["runtime"]["se_connected"]).strip().lower() == "true":
-                        seCount = seCount + 1
-                        if seCount == length:
-                            break
-            if seCount == length:
-                break
-        except:
-            pass
-        count = count + 1
-        time.sleep(10)
-    if response_csrf is None:
-        logger.info("Waited for " + str(count * 10) + "s but service engine is not up")
+    tracker = SeFleetTracker(ip, headers, uuid)
+    result = tracker.wait(timeout=600)
+    logger.info("Service engine time to connect: " + str(tracker.time_to_ready()))
+    if not result and not tracker.engines:
+        logger.info("Waited for " + str(int(result.elapsed)) + "s but service engine is not up")
         return None, "Failed", "ERROR"
-    if response_csrf.status_code != 200:
-        return None, response_csrf.text
-    elif count >= 59:
+    elif not result:
         return None, "NOT_FOUND", "TIME_OUT"
     else:
         logger.info("All service are up and running")
@@ -3492,16 +3280,14 @@ def checkAndWaitForAllTheServiceEngineIsUp(ip, clodName, jsonspec, aviVersion):
 def registerTMCTKGs(vCenter, vCenter_user, VC_PASSWORD, jsonspec):
     url = "https://" + vCenter + "/"
     try:
-        sess = requests.post(url + "rest/com/vmware/cis/session", auth=(vCenter_user, VC_PASSWORD), verify=False)
-        if sess.status_code != 200:
+        session_id = VcenterRestSession.get(vCenter, vCenter_user, VC_PASSWORD).session_id
+        if session_id is None:
             d = {
                 "responseType": "ERROR",
                 "msg": "Failed to fetch session ID for vCenter - " + vCenter,
                 "ERROR_CODE": 500
             }
             return json.dumps(d), 500
-        else:
-            session_id = sess.json()['value']
 
         header = {
             "Accept": "application/json",
@@ -3512,8 +3298,8 @@ def registerTMCTKGs(vCenter, vCenter_user, VC_PASSWORD, jsonspec):
         id = getClusterID(vCenter, vCenter_user, VC_PASSWORD, cluster_name, jsonspec)
         if id[1] != 200:
             return None, id[0]
-        clusterip_resp = requests.get(url + "api/vcenter/namespace-management/clusters/" + str(id[0]), verify=False,
-                                      headers=header)
+        clusterip_resp = vcenter_request("GET", url + "api/vcenter/namespace-management/clusters/" + str(id[0]), verify=False,
+                                         headers=header)
         if clusterip_resp.status_code != 200:
             d = {
                 "responseType": "ERROR",
@@ -3564,7 +3350,6 @@ def registerTMCTKGs(vCenter, vCenter_user, VC_PASSWORD, jsonspec):
                 return "Failed to apply k8s-register-manifest.yaml file", 500
 
             logger.info("Waiting for TMC registration to complete... ")
-            time.sleep(300)
             wait_status = waitForTMCRegistration(supervisor_cluster)
             if wait_status[1] != 200:
                 logger.error(wait_status[0])
@@ -3582,41 +3367,25 @@ def registerTMCTKGs(vCenter, vCenter_user, VC_PASSWORD, jsonspec):
 
 
 def waitForTMCRegistration(super_cls):
-    registered = False
-    count = 0
-    register_status_command = ["tmc", "managementcluster", "get", super_cls]
-    register_status = runShellCommandAndReturnOutput(register_status_command)
-    if register_status[1] != 0:
-        return "Failed to obtain register status for TMC", 500
-    else:
-        yaml_ouptput = yaml.load(register_status[0], Loader=SafeLoader)
-        if yaml_ouptput["status"]["health"] == "HEALTHY" and \
-                yaml_ouptput["status"]["conditions"]["READY"]["status"].lower() == "true":
-            registered = True
-
-    while not registered and count < 30:
+    def _registered():
         register_status_command = ["tmc", "managementcluster", "get", super_cls]
         register_status = runShellCommandAndReturnOutput(register_status_command)
         if register_status[1] != 0:
-            return "Failed to obtain register status for TMC", 500
-        else:
-            yaml_ouptput = yaml.load(register_status[0], Loader=SafeLoader)
-            if yaml_ouptput["status"]["health"] == "HEALTHY" and \
-                    yaml_ouptput["status"]["conditions"]["READY"]["status"].lower() == "true":
-                registered = True
-                break
-            else:
-                logger.info("Waited for  " + str(count * 30) + "s, retrying.")
-                count = count + 1
-                time.sleep(30)
+            # the management cluster shows up in TMC only once the agents have started
+            return False
+        yaml_ouptput = yaml.load(register_status[0], Loader=SafeLoader)
+        return yaml_ouptput["status"]["health"] == "HEALTHY" and \
+            yaml_ouptput["status"]["conditions"]["READY"]["status"].lower() == "true"
+
+    registered = wait_until(_registered, timeout=1200, interval=10, max_interval=30,
+                            description="TMC registration of " + super_cls)
     if not registered:
-        logger.error("TMC registration still did not complete " + str(count * 30))
+        logger.error("TMC registration still did not complete " + str(int(registered.elapsed)))
         d = {
             "responseType": "ERROR",
-            "msg": "TMC registration still did not complete " + str(count * 30),
+            "msg": "TMC registration still did not complete " + str(int(registered.elapsed)),
             "ERROR_CODE": 500
         }
         return json.dumps(d), 500
     else:
         return "TMC Registration successful", 200
-
@@ -0,0 +1,165 @@
+#  Copyright 2022 VMware, Inc
+#  SPDX-License-Identifier: BSD-2-Clause
+
+import json
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import ExitStack
+from pathlib import Path
+
+from constants.constants import AppName
+from lib.kube_context import KubeContexts, bound_kubeconfig
+from lib.kubectl_watch import PACKAGE_INSTALLS, shared_watch, watch_target
+from util.logger_helper import LoggerHelper
+from util.pipeline_dag import stage_levels
+from util.tracing import span
+
+logger = LoggerHelper.get_logger(Path(__file__).stem)
+
+# Extensions and the extensions that must be reconciled before they are installed. Contour needs
+# the cert-manager CRDs, harbor, grafana and prometheus publish through a contour ingress.
+EXTENSION_DEPENDENCIES = {
+    AppName.CERT_MANAGER: [],
+    AppName.CONTOUR: [AppName.CERT_MANAGER],
+    AppName.HARBOR: [AppName.CONTOUR],
+    AppName.GRAFANA: [AppName.CONTOUR],
+    AppName.PROMETHUS: [AppName.CONTOUR],
+    AppName.FLUENT_BIT: [],
+}
+
+# Status codes of the install functions that let the extensions depending on them go ahead,
+# 299 is an upgrade skipped because the extension was never deployed
+DONE_CODES = [200, 299]
+
+
+class ExtensionScheduler:
+    """
+    Installs the extensions of one cluster, every extension as soon as the extensions it depends
+    on are reconciled, side by side with the others. The install functions keep waiting for their
+    PackageInstall to reconcile, all those waits are answered by one shared kubectl watch on the
+    admin context of the cluster, resolved before any install runs.
+    Serial schedulers run one install at a time against the cluster the calling thread was
+    switched to, for install functions that switch clusters themselves, e.g. looping over
+    several clusters.
+    """
+
+    def __init__(self, cluster_name, kubeconfig=None, context=None, namespace=None, serial=False):
+        self.cluster_name = cluster_name
+        self.kubeconfig = kubeconfig
+        self.context = context
+        self.namespace = namespace
+        self.serial = serial
+        self.installs = dict()
+        self.after = dict()
+        self.results = dict()
+        self._caller = (None, None)
+        self._lock = threading.Lock()
+
+    def add(self, name, install, after=None):
+        """
+        :param name: extension, a key of EXTENSION_DEPENDENCIES or any other name
+        :param install: callable installing the extension and waiting for it, returning (msg, status code)
+        :param after: extensions to wait for, the scheduled ones of EXTENSION_DEPENDENCIES[name] by default
+        """
+        self.installs[name] = install
+        if after is not None:
+            self.after[name] = list(after)
+        return self
+
+    def _dependencies(self):
+        return {name: {"after": [dep for dep in self.after.get(name, EXTENSION_DEPENDENCIES.get(name, []))
+                                 if dep in self.installs]}
+                for name in self.installs}
+
+    def _install(self, name):
+        logger.info("Installing " + name + " on " + self.cluster_name)
+        with span("extension " + name, "extension", cluster=self.cluster_name) as span_args, \
+                ExitStack() as stack:
+            if not self.serial:
+                stack.enter_context(watch_target(self.kubeconfig, self.context))
+            kubeconfig, context = self._caller if self.serial else (self.kubeconfig, self.context)
+            try:
+                if kubeconfig is not None:
+                    KubeContexts.get().bind(kubeconfig, context)
+                result = self.installs[name]()
+            except Exception as e:
+                logger.error("Exception occurred while installing " + name + " " + str(e))
+                result = "Exception occurred while installing " + name + " " + str(e), 500
+            finally:
+                KubeContexts.get().release()
+            span_args["status"] = result[1]
+        return result
+
+    def _resolve_context(self):
+        """
+        :return: None, or the error msg when the admin kubeconfig of the cluster could not be exported
+        """
+        if self.serial or self.kubeconfig is not None or self.context is not None:
+            return None
+        kubeconfig, context = KubeContexts.get().admin_kubeconfig(self.cluster_name, namespace=self.namespace)
+        if kubeconfig is None:
+            return context
+        self.kubeconfig, self.context = kubeconfig, context
+        return None
+
+    def run(self):
+        """
+        :return: (json msg, 200) when every extension installed, (json msg, 500) naming the failed
+                 extensions and the ones skipped because of them otherwise
+        """
+        stages = self._dependencies()
+        stage_levels(stages)
+        self._caller = bound_kubeconfig()
+        error = self._resolve_context()
+        if error is not None:
+            d = {
+                "responseType": "ERROR",
+                "msg": "Failed to deploy extensions on " + self.cluster_name + " " + str(error),
+                "ERROR_CODE": 500
+            }
+            return json.dumps(d), 500
+        pending = dict(stages)
+        failed = []
+        skipped = []
+        with ExitStack() as stack:
+            if not self.serial:
+                stack.enter_context(shared_watch(PACKAGE_INSTALLS, kubeconfig=self.kubeconfig, context=self.context))
+            executor = stack.enter_context(ThreadPoolExecutor(max_workers=1 if self.serial else max(1, len(stages))))
+            running = dict()
+            while pending or running:
+                for name in [name for name, stage in pending.items()
+                             if all(self.results.get(dep, (None, None))[1] in DONE_CODES for dep in stage["after"])]:
+                    pending.pop(name)
+                    running[executor.submit(self._install, name)] = name
+                for name in [name for name, stage in pending.items()
+                             if any(dep in failed or dep in skipped for dep in stage["after"])]:
+                    logger.error("Skipping " + name + ", an extension it depends on failed")
+                    pending.pop(name)
+                    skipped.append(name)
+                if not running:
+                    continue
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    with self._lock:
+                        self.results[name] = future.result()
+                    if self.results[name][1] in DONE_CODES:
+                        logger.info(name + " installed on " + self.cluster_name)
+                    else:
+                        logger.error("Failed to install " + name + " " + str(self.results[name][0]))
+                        failed.append(name)
+        if failed:
+            d = {
+                "responseType": "ERROR",
+                "msg": "Failed to deploy extensions " + ", ".join(failed) +
+                       (", skipped " + ", ".join(skipped) if skipped else "") + " " +
+                       " ".join(str(self.results[name][0]) for name in failed),
+                "ERROR_CODE": 500
+            }
+            return json.dumps(d), 500
+        d = {
+            "responseType": "SUCCESS",
+            "msg": "Extensions " + ", ".join(self.results) + " deployed on " + self.cluster_name,
+            "ERROR_CODE": 200
+        }
+        return json.dumps(d), 200
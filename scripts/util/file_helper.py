@@ -20,6 +20,7 @@ from pydantic.main import BaseModel
 from yaml.loader import SafeLoader
 
 from util.logger_helper import LoggerHelper, log
+from util.state_merge import state_read_path, state_write_path
 
 logger = LoggerHelper.get_logger(Path(__file__).stem)
 
@@ -28,7 +29,7 @@ class FileHelper:
     @staticmethod
     def load_state(spec_path: str) -> State:
         # Open the file and load the file
-        with open(spec_path) as f:
+        with open(state_read_path(spec_path)) as f:
             data = yaml.load(f, Loader=SafeLoader)
         return State.parse_obj(data)
 
@@ -87,7 +88,7 @@ class FileHelper:
     @staticmethod
     def dump_state(state: State, file_path: str):
         # Open the file and load the file
-        with open(file_path, "w") as f:
+        with open(state_write_path(file_path), "w") as f:
             yaml.dump(yaml.load(state.json(), Loader=SafeLoader), f)
 
     @staticmethod
@@ -6,6 +6,8 @@ import json
 from constants.constants import GovcCommands, VmPowerState
 from util import cmd_runner
 from util.cmd_helper import CmdHelper
+from model.spec_store import decode_secret
+from util.vsphere_inventory import VsphereInventory
 
 class GovcClient:
     def __init__(self, jsonspec, cmd_helper: cmd_runner):
@@ -14,10 +16,11 @@ class GovcClient:
         self.vcenter_ip = jsonspec['envSpec']['vcenterDetails']['vcenterAddress']
         self.vcenter_username = jsonspec['envSpec']['vcenterDetails']['vcenterSsoUser']
         vcpass_base64 = jsonspec['envSpec']['vcenterDetails']['vcenterSsoPasswordBase64']
-        password = CmdHelper.decode_base64(vcpass_base64)
+        password = decode_secret(vcpass_base64)
         self.vcenter_password = password
         self.skip_verification = True
         self.set_env_vars()
+        self.inventory = VsphereInventory.get(self.vcenter_ip, self.vcenter_username, self.vcenter_password)
 
     def set_env_vars(self):
 
@@ -27,35 +30,40 @@ class GovcClient:
         os.environ["GOVC_INSECURE"] = json.dumps(self.skip_verification)
         # current_app.logger.info(f"ENV variables: {os.environ}")
 
+    def _find(self, kind, name, options, cmd):
+        """
+        Answer a govc find from the inventory snapshot, run govc only when the snapshot can not
+        """
+        found = self.inventory.find(kind, name, options=options)
+        if found is not None:
+            return found or None
+        exit_code, output = self.cmd_runner.run_cmd_output(cmd)
+        return output if output is None or output.strip() == '' else output.strip().split('\n')
+
     def find_datacenter_by_name(self, datacenter_name, options=''):
         cmd = GovcCommands.FIND_DATACENTER_BY_NAME.format(dc_name=datacenter_name, options=options)
-        exit_code, output = self.cmd_runner.run_cmd_output(cmd)
-        return output.strip() if output and output.strip() != '' else None
+        found = self._find("d", datacenter_name, options, cmd)
+        return '\n'.join(found) if found else None
 
     def find_clusters_by_name(self, cluster_name, options=''):
         cmd = GovcCommands.FIND_CLUSTERS_BY_NAME.format(clu_name=cluster_name, options=options)
-        exit_code, output = self.cmd_runner.run_cmd_output(cmd)
-        return output if output is None or output.strip() == '' else output.strip().split('\n')
+        return self._find("c", cluster_name, options, cmd)
 
     def find_resource_pools_by_name(self, pool_name, options=''):
-        cmd = GovcCommands.FIND_RESOURCE_POOLS_BY_NAME.format(clu_name=pool_name, options=options)
-        exit_code, output = self.cmd_runner.run_cmd_output(cmd)
-        return output if output is None or output.strip() == '' else output.strip().split('\n')
+        cmd = GovcCommands.FIND_RESOURCE_POOLS_BY_NAME.format(rp_name=pool_name, options=options)
+        return self._find("p", pool_name, options, cmd)
 
     def find_folders_by_name(self, folder_name, options=''):
         cmd = GovcCommands.FIND_FOLDERS_BY_NAME.format(folder_name=folder_name, options=options)
-        exit_code, output = self.cmd_runner.run_cmd_output(cmd)
-        return output if output is None or output.strip() == '' else output.strip().split('\n')
+        return self._find("f", folder_name, options, cmd)
 
     def find_vms_by_name(self, vm_name, options=''):
         cmd = GovcCommands.FIND_VMS_BY_NAME.format(vm_name=vm_name, options=options)
-        exit_code, output = self.cmd_runner.run_cmd_output(cmd)
-        return output if output is None or output.strip() == '' else output.strip().split('\n')
+        return self._find("m", vm_name, options, cmd)
 
     def find_networks_by_name(self, network_name, options=''):
         cmd = GovcCommands.FIND_NETWORKS_BY_NAME.format(network_name=network_name, options=options)
-        exit_code, output = self.cmd_runner.run_cmd_output(cmd)
-        return output if output is None or output.strip() == '' else output.strip().split('\n')
+        return self._find("n", network_name, options, cmd)
 
     def create_resource_pool(self, pool, options=''):
         """
@@ -65,6 +73,7 @@ class GovcClient:
         if not existing_pools or pool not in existing_pools:
             cmd = GovcCommands.CREATE_RESOURCE_POOL.format(pool=pool, options=options)
             self.cmd_runner.run_cmd(cmd)
+            self.inventory.invalidate()
         return pool
 
     def create_folder(self, folder, options=''):
@@ -75,6 +84,7 @@ class GovcClient:
         if not existing_folders or folder not in existing_folders:
             cmd = GovcCommands.CREATE_FOLDER.format(folder=folder, options=options)
             self.cmd_runner.run_cmd(cmd)
+            self.inventory.invalidate()
         return folder
 
     def check_network_exists(self, network_name, options=''):
@@ -84,10 +94,14 @@ class GovcClient:
     def deploy_library_ova(self, location, name, options=''):
         cmd = GovcCommands.DEPLOY_LIBRARY_OVA.format(location=location, name=name, options=options)
         self.cmd_runner.run_cmd(cmd)
+        self.inventory.invalidate()
 
     def get_vm_ip(self, vm_name, datacenter_name, wait_time='5m'):
         if not self.find_vms_by_name(vm_name):
             return None
+        ip = self.inventory.vm_ip(vm_name, datacenter_name)
+        if ip is not None:
+            return [ip]
         options = ''
         if wait_time:
             options += f'-wait {wait_time}'
@@ -96,6 +110,8 @@ class GovcClient:
         return output if output is None or output.strip() == '' else output.strip().split('\n')
 
     def get_vm_power_state(self, vm_name):
+        if self.inventory.vm(vm_name):
+            return self.inventory.power_state(vm_name)
         power_state_filter = "-runtime.powerState {state}"
         for v in VmPowerState.__members__.values():
             if self.find_vms_by_name(vm_name, options=power_state_filter.format(state=v.value)):
@@ -13,6 +13,9 @@ from model.spec import MasterSpec
 from util.cmd_helper import CmdHelper as Cli
 from util.file_helper import FileHelper
 from util.logger_helper import LoggerHelper
+from util.avi_registry import AviRegistry
+from lib.kube_context import KubeContexts
+from util.vsphere_inventory import VsphereInventory
 
 logger = LoggerHelper.get_logger(Path(__file__).stem)
 
@@ -36,17 +39,18 @@ def template_avi_se_govc_config(spec):
 
 
 def export_govc_env_vars(run_config: RunConfig):
+    # os.environ, not os.putenv, so the inventory lookups see the same vCenter as govc
     if run_config.deployment_platform == DeploymentPlatform.VMC:
-        os.putenv("GOVC_URL", run_config.vmc.vc_mgmt_ip)
-        os.putenv("GOVC_USERNAME", run_config.vmc.vc_cloud_user)
-        os.putenv("GOVC_PASSWORD", run_config.vmc.vc_cloud_password)
+        os.environ["GOVC_URL"] = run_config.vmc.vc_mgmt_ip
+        os.environ["GOVC_USERNAME"] = run_config.vmc.vc_cloud_user
+        os.environ["GOVC_PASSWORD"] = run_config.vmc.vc_cloud_password
     elif run_config.deployment_platform == DeploymentPlatform.VSPHERE:
-        os.putenv("GOVC_URL", run_config.spec.vsphere.server)
-        os.putenv("GOVC_USERNAME", run_config.spec.vsphere.username)
-        os.putenv("GOVC_PASSWORD", Cli.decode_password(run_config.spec.vsphere.password))
+        os.environ["GOVC_URL"] = run_config.spec.vsphere.server
+        os.environ["GOVC_USERNAME"] = run_config.spec.vsphere.username
+        os.environ["GOVC_PASSWORD"] = Cli.decode_password(run_config.spec.vsphere.password)
     elif run_config.deployment_platform == DeploymentPlatform.VCF:
         pass
-    os.putenv("GOVC_INSECURE", str("true"))
+    os.environ["GOVC_INSECURE"] = str("true")
 
 
 def deploy_avi_controller_ova(run_config: RunConfig):
@@ -104,7 +108,18 @@ def load_node_template(run_config: RunConfig):
         Cli.execute_cmd(deploy_ova_cmd)
 
 
+def _inventory_find(folder, vm_name, options=''):
+    """
+    :return: VM paths from the inventory snapshot, None when govc has to be run
+    """
+    inventory = VsphereInventory.from_govc_env()
+    return None if inventory is None else inventory.find("m", vm_name, root=folder, options=options)
+
+
 def find_vms(folder, vm_name):
+    found = _inventory_find(folder, vm_name)
+    if found is not None:
+        return found or False
     find_vm_cmd = f'govc find {folder or "."} -type m -name "{vm_name}"'
     vms = Cli.execute_cmd_and_get_output(find_vm_cmd).strip()
     if len(vms) == 0:
@@ -112,7 +127,11 @@ def find_vms(folder, vm_name):
     return vms.split("\n")
 
 
-def teardown_env(spec: MasterSpec):
+def teardown_env(spec: MasterSpec, checkpoints=None):
+    """
+    Delete the ALB and cluster VMs and forget the AVI objects and kubeconfigs recorded for them
+    :param checkpoints: WorkflowContext.checkpoints, the avi and mgmt journals are reset once the VMs are deleted
+    """
     export_govc_env_vars(spec)
     logger.info("Deleting ALB")
     delete_vm(find_vms(spec.avi.deployment.folder, spec.avi.vmName))
@@ -122,6 +141,11 @@ def teardown_env(spec: MasterSpec):
     delete_vm(find_vms(spec.tkg.sharedService.deployment.folder, f"{spec.tkg.sharedService.cluster.name}*"))
     for wl in spec.tkg.workloadClusters:
         delete_vm(find_vms(wl.deployment.folder, f"{wl.cluster.name}*"))
+    AviRegistry.forget()
+    KubeContexts.get().forget()
+    if checkpoints is not None:
+        for scope in ["avi", "mgmt"]:
+            checkpoints(scope).reset()
 
 
 def delete_vm(vm_paths):
@@ -133,10 +157,14 @@ def delete_vm(vm_paths):
         delete_cmd = f"govc vm.destroy {vm_path}"
         Cli.execute_cmd_and_get_output(power_off_cmd)
         Cli.execute_cmd_and_get_output(delete_cmd)
+    VsphereInventory.invalidate_all()
 
 
 def find_vm_by_name(name, is_template=False):
     logger.info(f"Check if VM exists by name: [{name}]")
+    found = _inventory_find(None, name, options=f"-config.template {is_template}")
+    if found is not None:
+        return found or None
     cmd = f"govc find . -type m -config.template {is_template} -name {name}"
     output = Cli.execute_cmd_and_get_output(cmd)
     if len(output) == 0:
@@ -154,6 +182,7 @@ def import_ova(options, dc, ds, folder, res_pool, ova_file, name, template=False
     logger.info(f"Importing OVA by name: {name}")
     cmd = f"govc import.ova -options {options} -dc {dc} -ds {ds} -folder {folder} -pool {res_pool} {ova_file}"
     Cli.execute_cmd_and_get_output(cmd)
+    VsphereInventory.invalidate_all()
     if not find_vm_by_name(name, is_template=template):
         msg = f"Failed to import OVA. No VM found by name: {name}"
         logger.error(msg)
@@ -191,6 +220,10 @@ def update_vm_cpu_memory(name, cpus, memory):
 
 def get_vm_power_state(name):
     logger.info(f"Getting power state for VM: [{name}]")
+    inventory = VsphereInventory.from_govc_env()
+    state = None if inventory is None else inventory.power_state(name)
+    if state is not None:
+        return state
     cmd = f'govc vm.info {name} | grep "Power state"'
     res = Cli.execute_cmd_and_get_output(cmd)
     return VmPowerState.ON if res and "poweredOn" in res else VmPowerState.OFF
@@ -1,8 +1,10 @@
 #  Copyright 2021 VMware, Inc
 #  SPDX-License-Identifier: BSD-2-Clause
 
+import logging
 import subprocess
 
+from util import command_engine
 from util.base_cmd_helper import BaseCmdHelper
 
 
@@ -10,13 +12,17 @@ class LocalCmdHelper(BaseCmdHelper):
     def run_cmd(self, cmd: str, ignore_errors=False) -> int:
 
         command = cmd.split()
-        op = subprocess.run(command, check=not ignore_errors)
+        op = command_engine.run(command, level=logging.INFO)
+        if not op.ok and not ignore_errors:
+            raise subprocess.CalledProcessError(op.exit_code or 1, command)
 
-        return op.returncode
+        return op.exit_code
 
     def run_cmd_output(self, cmd: str, ignore_errors=False) -> tuple:
 
         command = cmd.split()
-        op = subprocess.run(command, check=not ignore_errors, capture_output=True)
+        op = command_engine.run(command, capture=True, merge_stderr=False)
+        if not op.ok and not ignore_errors:
+            raise subprocess.CalledProcessError(op.exit_code or 1, command, output=op.text())
 
-        return op.returncode, op.stdout.decode()
+        return op.exit_code, op.text()
@@ -0,0 +1,209 @@
+#  Copyright 2022 VMware, Inc
+#  SPDX-License-Identifier: BSD-2-Clause
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import requests
+
+from constants.constants import MarketPlaceUrl
+from util.artifact_cache import default_cache_root
+from util.logger_helper import LoggerHelper
+
+logger = LoggerHelper.get_logger(Path(__file__).stem)
+
+# Product listings change with marketplace releases only, an hour keeps a whole pipeline run on one fetch
+LISTING_TTL = 3600
+# Refresh the csp-auth-token this many seconds before it expires
+TOKEN_MARGIN = 60
+DEFAULT_TOKEN_LIFETIME = 1800
+
+
+def _cache_dir():
+    return os.environ.get("MARKETPLACE_CACHE_DIR") or default_cache_root() + "-marketplace"
+
+
+def cached_json(name, fetch, ttl=LISTING_TTL):
+    """
+    Return the json document cached on disk under name when younger than ttl,
+    otherwise call fetch and store its result.
+    """
+    path = os.path.join(_cache_dir(), name + ".json")
+    try:
+        if time.time() - os.path.getmtime(path) < ttl:
+            with open(path) as f:
+                return json.load(f)
+    except (OSError, ValueError):
+        pass
+    data = fetch()
+    try:
+        os.makedirs(_cache_dir(), exist_ok=True)
+        tmp = path + "." + str(os.getpid())
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning("Failed to cache marketplace listing " + name + ": " + str(e))
+    return data
+
+
+def search_products(headers):
+    """
+    :return: list of products published by VMware on marketplace, cached for LISTING_TTL
+    """
+    def _fetch():
+        product = requests.get(MarketPlaceUrl.PRODUCT_SEARCH_URL, headers=headers, verify=False)
+        if product.status_code != 200:
+            raise Exception("Failed to search products on Marketplace.")
+        return product.json()["response"]["dataList"]
+
+    return cached_json("products", _fetch)
+
+
+class MarketplaceClient:
+    """
+    Marketplace metadata access shared by all the download paths. The csp-auth-token is kept
+    until it expires and product listings are cached on disk, with their metafiles indexed by
+    (appversion, version, groupname).
+    """
+
+    _clients = dict()
+    _lock = threading.Lock()
+
+    def __init__(self, refresh_token):
+        self.refresh_token = refresh_token
+        self.token = None
+        self.expires_at = 0
+        self.products = dict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, refresh_token):
+        with cls._lock:
+            client = cls._clients.get(refresh_token)
+            if client is None:
+                client = cls(refresh_token)
+                cls._clients[refresh_token] = client
+            return client
+
+    def login(self):
+        headers = {
+            "Accept": "application/json",
+            "Content-Type": "application/json"
+        }
+        payload = {
+            "refreshToken": self.refresh_token
+        }
+        sess = requests.request("POST", MarketPlaceUrl.URL + "/api/v1/user/login", headers=headers,
+                                data=json.dumps(payload, indent=4), verify=False)
+        if sess.status_code != 200:
+            raise Exception("Failed to login and obtain csp-auth-token")
+        self.token = sess.json()["access_token"]
+        self.expires_at = time.time() + int(sess.json().get("expires_in", DEFAULT_TOKEN_LIFETIME))
+        return self.token
+
+    def headers(self):
+        with self._lock:
+            if self.token is None or time.time() > self.expires_at - TOKEN_MARGIN:
+                self.login()
+            return {
+                "Accept": "application/json",
+                "Content-Type": "application/json",
+                "csp-auth-token": self.token
+            }
+
+    def product_slug(self, product_name):
+        for pro in search_products(self.headers()):
+            if str(pro["displayname"]) == product_name:
+                return str(pro["slug"])
+        raise Exception("Failed to find product " + product_name + " on Marketplace")
+
+    def product(self, product_name):
+        """
+        :return: MarketplaceProduct for the product display name
+        """
+        with self._lock:
+            if product_name in self.products:
+                return self.products[product_name]
+        slug = self.product_slug(product_name)
+        headers = self.headers()
+
+        def _fetch():
+            product = requests.get(MarketPlaceUrl.API_URL + "/products/" + slug + "?isSlug=true&ownorg=false",
+                                   headers=headers, verify=False)
+            if product.status_code != 200:
+                raise Exception("Failed to Obtain Product ID")
+            return product.json()['response']['data']
+
+        name = "product-" + hashlib.sha256(slug.encode()).hexdigest()[:16]
+        product = MarketplaceProduct(cached_json(name, _fetch))
+        with self._lock:
+            self.products[product_name] = product
+        return product
+
+    def presigned_url(self, product_id, payload):
+        """
+        :param payload: download request, metafile or deployment file ids
+        :return: pre-signed download url
+        """
+        json_object = json.dumps(payload, indent=4).replace('\"true\"', 'true')
+        presigned_url = requests.request("POST", MarketPlaceUrl.URL + "/api/v1/products/" + product_id + "/download",
+                                         headers=self.headers(), data=json_object, verify=False)
+        if presigned_url.status_code != 200:
+            logger.error('Error on request. Code: {}\n Error: {}'.format(presigned_url.status_code,
+                                                                         presigned_url.text))
+            raise Exception("Failed to obtain pre-signed URL")
+        return presigned_url.json()["response"]["presignedurl"]
+
+
+class MarketplaceProduct:
+    """
+    Product listing with its metafiles indexed by (appversion, version, groupname),
+    None in a key position matches any value.
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.product_id = data['productid']
+        self.index = dict()
+        self.appversions = []
+        for metalist in data.get('metafilesList', []):
+            appversion = metalist.get('appversion')
+            version = metalist.get('version')
+            groupname = str(metalist.get('groupname')).strip("\t")
+            if appversion not in self.appversions:
+                self.appversions.append(appversion)
+            for key in [(appversion, version, groupname), (appversion, version, None),
+                        (appversion, None, groupname), (appversion, None, None)]:
+                self.index.setdefault(key, []).append(metalist)
+
+    def metafiles(self, appversion, version=None, groupname=None, partial=False):
+        """
+        :param partial: also match metafiles whose appversion is contained in appversion, e.g.
+                        "1.5" for "1.5.4", the upgrade downloads match their target version this way
+        :return: matching metafiles
+        """
+        if not partial:
+            return self.index.get((appversion, version, groupname), [])
+        found = []
+        for candidate in self.appversions:
+            if candidate and candidate in appversion:
+                found.extend(self.index.get((candidate, version, groupname), []))
+        return found
+
+    def metafile(self, appversion, version=None, groupname=None, partial=False):
+        """
+        :return: first metafile matching, None when there is none
+        """
+        found = self.metafiles(appversion, version, groupname, partial)
+        return found[0] if found else None
+
+    def deployment_file(self, appversion):
+        for deployment_file in self.data.get('productdeploymentfilesList', []):
+            if deployment_file["appversion"] == appversion:
+                return deployment_file
+        return None
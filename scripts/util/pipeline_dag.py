@@ -0,0 +1,137 @@
+#  Copyright 2022 VMware, Inc
+#  SPDX-License-Identifier: BSD-2-Clause
+
+import os
+import re
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from util.logger_helper import LoggerHelper
+
+logger = LoggerHelper.get_logger(Path(__file__).stem)
+
+# A network lock not renewed for this long was left by a task pod that died
+LOCK_STALE_SECONDS = 600
+LOCK_POLL_SECONDS = 10
+
+# Day 0 stages, the cli command each one runs and the stages it needs first.
+# Shared services and workload clusters only need the management cluster, so they run side by side
+# and merge-state folds their state fragments back before the extensions are installed.
+DAY0_STAGES = {
+    "avi": {"command": "avi deploy", "after": []},
+    "mgmt": {"command": "mgmt deploy", "after": ["avi"]},
+    "shared-services": {"command": "shared-services deploy-cluster", "after": ["mgmt"], "parallel": True},
+    "workload": {"command": "workload-clusters deploy", "after": ["mgmt"], "parallel": True},
+    "merge-state": {"command": "state merge", "after": ["shared-services", "workload"]},
+    "extensions": {"command": "extns deploy", "after": ["merge-state"]},
+}
+
+
+def stage_levels(stages=None):
+    """
+    Group stages so every stage only depends on stages of earlier groups
+    :return: list of lists of stage names, stages of one group can run in parallel
+    """
+    stages = stages or DAY0_STAGES
+    done = set()
+    levels = []
+    while len(done) < len(stages):
+        level = sorted(name for name, stage in stages.items()
+                       if name not in done and all(dep in done for dep in stage["after"]))
+        if not level:
+            raise Exception("Dependency cycle between stages " + str(sorted(set(stages) - done)))
+        levels.append(level)
+        done.update(level)
+    return levels
+
+
+def cluster_network(jsonspec, stage):
+    """
+    :return: port group the cluster of the stage is deployed on, None when the spec does not say
+    """
+    try:
+        if stage == "shared-services":
+            shared_spec = jsonspec['tkgComponentSpec'].get('tkgSharedserviceSpec', {})
+            return shared_spec.get('tkgSharedserviceNetworkName') or \
+                jsonspec['tkgComponentSpec']['tkgMgmtComponents']['tkgMgmtNetworkName']
+        if stage == "workload":
+            return jsonspec['tkgWorkloadComponents']['tkgWorkloadNetworkName']
+    except (KeyError, TypeError, AttributeError):
+        pass
+    return None
+
+
+def _lease_stale(lease_path, stale_after):
+    try:
+        return time.time() - os.path.getmtime(lease_path) > stale_after
+    except FileNotFoundError:
+        return False
+
+
+def _take_over(lease_path):
+    """
+    Remove a lease its holder stopped renewing. It is renamed away first, so of several waiters
+    seeing the same stale lease only one removes it.
+    """
+    stale_path = lease_path + "." + socket.gethostname() + "-" + str(os.getpid()) + ".stale"
+    try:
+        os.rename(lease_path, stale_path)
+    except FileNotFoundError:
+        return
+    logger.warning("Took over stale lock " + lease_path)
+    os.remove(stale_path)
+
+
+@contextmanager
+def network_lock(root_dir, network, stale_after=LOCK_STALE_SECONDS, poll=LOCK_POLL_SECONDS):
+    """
+    Serialize parallel stages deploying on the same network, stages on different networks
+    do not wait for each other. The task pods run on different nodes and flock is not shared
+    between NFS clients, so the lock is a lease file on the shared workspace created with
+    O_CREAT|O_EXCL. The holder renews it while it runs, a lease not renewed for stale_after
+    seconds was left by a pod that died and is taken over.
+    """
+    if not network:
+        yield
+        return
+    lock_dir = os.path.join(root_dir, "deployment-state", ".locks")
+    os.makedirs(lock_dir, exist_ok=True)
+    lease_path = os.path.join(lock_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", network) + ".lock")
+    waiting = False
+    while True:
+        try:
+            fd = os.open(lease_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if _lease_stale(lease_path, stale_after):
+                _take_over(lease_path)
+                continue
+            if not waiting:
+                logger.info("Another stage is deploying on " + network + ", waiting for it to finish")
+                waiting = True
+            time.sleep(poll)
+    with os.fdopen(fd, "w") as lease:
+        lease.write(socket.gethostname() + " " + str(os.getpid()) + "\n")
+    stop = threading.Event()
+
+    def _renew():
+        while not stop.wait(max(1, stale_after / 4)):
+            try:
+                os.utime(lease_path)
+            except OSError as e:
+                logger.warning("Failed to renew lock " + lease_path + " " + str(e))
+
+    renewer = threading.Thread(target=_renew, daemon=True)
+    renewer.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        renewer.join()
+        try:
+            os.remove(lease_path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,189 @@
+#  Copyright 2022 VMware, Inc
+#  SPDX-License-Identifier: BSD-2-Clause
+
+import json
+import traceback
+from pathlib import Path
+
+from util.logger_helper import LoggerHelper
+from util.pipeline_dag import stage_levels
+from util.tracing import span
+
+logger = LoggerHelper.get_logger(Path(__file__).stem)
+
+IN_SYNC = "IN_SYNC"
+MISSING = "MISSING"
+DRIFTED = "DRIFTED"
+UNKNOWN = "UNKNOWN"
+
+APPLIED = "APPLIED"
+FAILED = "FAILED"
+BLOCKED = "BLOCKED"
+PENDING = "PENDING"
+
+
+def matches(desired, actual):
+    """
+    True when every field of desired is present in actual with the same value. Lists match when
+    each desired element matches some element of actual, extra actual fields are ignored.
+    """
+    if isinstance(desired, dict):
+        return isinstance(actual, dict) and all(key in actual and matches(value, actual[key])
+                                                for key, value in desired.items())
+    if isinstance(desired, (list, tuple)):
+        return isinstance(actual, (list, tuple)) and all(any(matches(d, a) for a in actual) for d in desired)
+    return str(desired) == str(actual)
+
+
+def result_status(result):
+    """
+    Status code of a workflow method result: (msg, code) tuples, True, or None/False on failure
+    """
+    if isinstance(result, (tuple, list)) and len(result) > 1 and isinstance(result[1], int):
+        return result[1]
+    if result is True:
+        return 200
+    return 500
+
+
+class Resource:
+    """
+    One node of the desired state: an object of a kind, identified by name, that the step
+    creating it must make exist with at least the desired fields
+    """
+
+    def __init__(self, kind, name, step, desired=None):
+        self.kind = kind
+        self.name = name
+        self.step = step
+        self.desired = desired or {}
+
+    def __repr__(self):
+        return self.kind + "/" + str(self.name)
+
+
+class Reconciler:
+    """
+    Desired state graph of resources grouped in steps. Actual state is read in bulk, one observer
+    call per resource kind, and only the steps owning a missing or drifted resource are applied,
+    in dependency order. A step fails fast for its dependents, which are reported as blocked.
+    A step owning a resource that could not be observed is not applied and fails. A step owning
+    no resources has nothing to compare, it is applied only when a step it comes after was.
+    """
+
+    def __init__(self):
+        self.steps = dict()
+        self._observers = dict()
+        self._actual = dict()
+
+    def observe(self, kind, fetch):
+        """
+        :param fetch: callable returning a dict of name -> object with every existing object of the kind
+        """
+        self._observers[kind] = fetch
+
+    def step(self, name, apply, after=None):
+        """
+        :param apply: callable creating the resources of the step, returns (msg, status code)
+        :param after: names of the steps that must be in sync or applied first, a step without
+                      resources is applied only when one of them was
+        """
+        self.steps[name] = {"apply": apply, "after": list(after or []), "resources": []}
+
+    def want(self, kind, name, step, desired=None):
+        resource = Resource(kind, name, step, desired)
+        self.steps[step]["resources"].append(resource)
+        return resource
+
+    def actual(self, kind, refresh=False):
+        """
+        :return: dict name -> object of the kind, None when it could not be observed
+        """
+        if refresh or kind not in self._actual:
+            with span("observe " + kind, "reconcile"):
+                try:
+                    self._actual[kind] = self._observers[kind]()
+                except Exception as e:
+                    logger.warning("Failed to observe " + kind + " " + str(e))
+                    logger.debug(traceback.format_exc())
+                    self._actual[kind] = None
+        return self._actual[kind]
+
+    def diff(self, resource):
+        """
+        :return: (status, reason) of the resource against the observed state
+        """
+        actual = self.actual(resource.kind)
+        if actual is None:
+            return UNKNOWN, "could not observe " + resource.kind
+        obj = actual.get(resource.name)
+        if obj is None:
+            return MISSING, "not found"
+        if not matches(resource.desired, obj):
+            drifted = [key for key, value in resource.desired.items() if not matches(value, obj.get(key))]
+            return DRIFTED, "differs in " + ", ".join(drifted)
+        return IN_SYNC, ""
+
+    def plan(self):
+        """
+        :return: dict step -> list of (resource, status, reason)
+        """
+        return {name: [(resource,) + self.diff(resource) for resource in step["resources"]]
+                for name, step in self.steps.items()}
+
+    def run(self, dry_run=False):
+        """
+        Apply the out of sync steps in dependency order
+        :return: (d, status), d["steps"] holds the outcome of every step
+        """
+        plan = self.plan()
+        outcome = dict()
+        for level in stage_levels(self.steps):
+            for name in level:
+                step = self.steps[name]
+                pending = [(resource, status, reason) for resource, status, reason in plan[name]
+                           if status != IN_SYNC]
+                blocked_by = [dep for dep in step["after"] if outcome[dep] in [FAILED, BLOCKED]]
+                if blocked_by:
+                    outcome[name] = BLOCKED
+                    logger.warning("Skipping " + name + ", it needs " + ", ".join(blocked_by))
+                    continue
+                unknown = [resource for resource, status, reason in pending if status == UNKNOWN]
+                if unknown:
+                    outcome[name] = FAILED
+                    logger.error("Not applying " + name + ", could not observe " +
+                                 ", ".join(repr(resource) for resource in unknown))
+                    continue
+                if not plan[name] and not any(outcome[dep] in [APPLIED, PENDING] for dep in step["after"]):
+                    outcome[name] = IN_SYNC
+                    logger.info(name + " owns no resources and none of the steps it needs was applied, nothing to do")
+                    continue
+                if plan[name] and not pending:
+                    outcome[name] = IN_SYNC
+                    logger.info(name + " is in sync, nothing to do")
+                    continue
+                for resource, status, reason in pending:
+                    logger.info(name + ": " + repr(resource) + " is " + status + (" (" + reason + ")" if reason else ""))
+                if dry_run:
+                    outcome[name] = PENDING
+                    continue
+                logger.info("Applying " + name)
+                with span("apply " + name, "reconcile"):
+                    try:
+                        status_code = result_status(step["apply"]())
+                    except Exception as e:
+                        logger.error("Failed to apply " + name + " " + str(e))
+                        logger.debug(traceback.format_exc())
+                        status_code = 500
+                outcome[name] = APPLIED if status_code == 200 else FAILED
+                for resource in step["resources"]:
+                    self._actual.pop(resource.kind, None)
+        failed = [name for name, result in outcome.items() if result in [FAILED, BLOCKED]]
+        d = {
+            "responseType": "ERROR" if failed else "SUCCESS",
+            "msg": "Failed to reconcile " + ", ".join(failed) if failed else "Stack is reconciled",
+            "steps": outcome,
+            "ERROR_CODE": 500 if failed else 200
+        }
+        logger.info(json.dumps(outcome))
+        return d, d["ERROR_CODE"]
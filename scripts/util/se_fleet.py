@@ -0,0 +1,127 @@
+#  Copyright 2022 VMware, Inc
+#  SPDX-License-Identifier: BSD-2-Clause
+
+import time
+from pathlib import Path
+
+from util.avi_api_helper import avi_request, iter_avi_collection
+from util.logger_helper import LoggerHelper
+from util.tracing import add_event
+from util.wait_helper import wait_until
+
+logger = LoggerHelper.get_logger(Path(__file__).stem)
+
+SE_INVENTORY_PATH = "/api/serviceengine-inventory/"
+# Parts of the inventory objects read by the tracker, faults and alert summaries are not fetched
+SE_INVENTORY_FIELDS = ["uuid", "config", "runtime", "health_score"]
+SE_PAGE_SIZE = 200
+
+
+class ServiceEngineState:
+    """
+    Last seen state of one service engine
+    """
+
+    def __init__(self, uuid, name, seen_at):
+        self.uuid = uuid
+        self.name = name
+        self.connected = False
+        self.oper_state = None
+        self.health_score = None
+        self.seen_at = seen_at
+        self.ready_at = None
+
+    @property
+    def ready(self):
+        return self.ready_at is not None
+
+
+class SeFleetTracker:
+    """
+    Connected and health state of the service engines of one cloud, by SE uuid. The first poll
+    lists every engine, later polls only fetch the engines not connected yet, plus a one object
+    page telling whether engines were added meanwhile. Records when every engine became ready.
+    """
+
+    def __init__(self, ip, headers, cloud_uuid):
+        self.ip = ip
+        self.headers = headers
+        self.cloud_uuid = cloud_uuid
+        self.url = "https://" + ip + SE_INVENTORY_PATH
+        self.engines = dict()
+        self.started = time.monotonic()
+        self._started_wall = time.time()
+        self.polls = 0
+
+    def _list(self, **filters):
+        return list(iter_avi_collection(self.url, self.headers, fields=SE_INVENTORY_FIELDS, page_size=SE_PAGE_SIZE,
+                                        **dict(filters, **{"cloud_ref.uuid": self.cloud_uuid})))
+
+    def _count(self):
+        response = avi_request("GET", self.url, headers=self.headers, verify=False,
+                               params={"cloud_ref.uuid": self.cloud_uuid, "fields": "uuid", "page_size": 1})
+        if response.status_code != 200:
+            raise Exception("Failed to count service engines " + response.text)
+        return response.json().get("count", len(response.json().get("results", [])))
+
+    def _update(self, obj, now):
+        config = obj.get("config", {})
+        uuid = obj.get("uuid") or config.get("uuid")
+        if uuid is None:
+            return
+        engine = self.engines.get(uuid)
+        if engine is None:
+            engine = self.engines[uuid] = ServiceEngineState(uuid, config.get("name", uuid), now)
+        runtime = obj.get("runtime", {})
+        engine.connected = str(runtime.get("se_connected")).strip().lower() == "true"
+        engine.oper_state = runtime.get("oper_status", {}).get("state")
+        engine.health_score = obj.get("health_score", {}).get("health_score")
+        if engine.connected and engine.ready_at is None:
+            engine.ready_at = now
+            logger.info("Service engine " + engine.name + " connected after " +
+                        str(int(engine.ready_at - self.started)) + "s")
+            add_event("SE " + engine.name, "avi", self._started_wall + (engine.seen_at - self.started),
+                      engine.ready_at - engine.seen_at, {"uuid": uuid, "oper_state": engine.oper_state})
+
+    def pending(self):
+        return [uuid for uuid, engine in self.engines.items() if not engine.ready]
+
+    def poll(self):
+        """
+        Refresh the state of the engines not ready yet
+        :return: True when every known engine is connected
+        """
+        self.polls += 1
+        now = time.monotonic()
+        pending = self.pending()
+        if not self.engines or self._count() != len(self.engines):
+            objects = self._list()
+        elif pending:
+            try:
+                objects = self._list(**{"uuid.in": ",".join(pending)})
+            except Exception as e:
+                logger.debug("Filtered service engine query failed, listing all engines " + str(e))
+                objects = self._list()
+        else:
+            objects = []
+        for obj in objects:
+            self._update(obj, now)
+        pending = self.pending()
+        logger.info(str(len(self.engines) - len(pending)) + " of " + str(len(self.engines)) +
+                    " service engines connected")
+        return not pending
+
+    def wait(self, timeout=600):
+        """
+        :return: WaitResult, truthy when every engine connected before timeout
+        """
+        return wait_until(self.poll, timeout, interval=5, max_interval=15,
+                          description="service engines of cloud " + str(self.cloud_uuid), ignore_errors=True)
+
+    def time_to_ready(self):
+        """
+        :return: dict of SE name to the seconds it took to connect since tracking started, None when
+                 it is not connected
+        """
+        return {engine.name: None if engine.ready_at is None else round(engine.ready_at - self.started, 1)
+                for engine in self.engines.values()}
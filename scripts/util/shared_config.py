@@ -18,8 +18,10 @@ from util.cmd_runner import RunCmd
 from util.file_helper import FileHelper
 from util.cmd_helper import CmdHelper
 from util.tkg_util import TkgUtil
+from util.extension_scheduler import ExtensionScheduler
 
 from constants.constants import Tkg_version, Extentions
+from model.spec_store import decode_secret
 
 logger = LoggerHelper.get_logger('common_utils')
 logging.getLogger("paramiko").setLevel(logging.WARNING)
@@ -75,7 +77,7 @@ def _update_harbor_data_values(remote_file, jsonspec, runconfig):
     rcmd.local_file_copy(remote_file, local_file)
     harbor_host = jsonspec['harborSpec']['harborFqdn']
     harbor_pass_enc = jsonspec['harborSpec']['harborPasswordBase64']
-    sp_pass = CmdHelper.decode_base64(harbor_pass_enc)
+    sp_pass = decode_secret(harbor_pass_enc)
     harbor_pass = ''.join(sp_pass)
 
     logger.info(f"Updating admin password in local copy of harbor-data-values.yaml")
@@ -126,10 +128,7 @@ def deployExtentions(jsonspec, runconfig):
 
     aviVersion = Avi_Tkgs_Version.VSPHERE_AVI_VERSION if TkgUtil.isEnvTkgs_wcp(jsonspec) else Avi_Version.VSPHERE_AVI_VERSION
     shared_cluster_name = jsonspec['tkgComponentSpec']['tkgMgmtComponents']['tkgSharedserviceClusterName']
-    str_enc = str(jsonspec['harborSpec']['harborPasswordBase64'])
-    base64_bytes = str_enc.encode('ascii')
-    enc_bytes = base64.b64decode(base64_bytes)
-    password = enc_bytes.decode('ascii').rstrip("\n")
+    password = decode_secret(jsonspec['harborSpec']['harborPasswordBase64'])
     harborPassword = password
     host = jsonspec['harborSpec']['harborFqdn']
     harborCertPath = jsonspec['harborSpec']['harborCertPath']
@@ -144,28 +143,18 @@ def deployExtentions(jsonspec, runconfig):
         repo_address = repo_address + "/"
     repo_address = repo_address.replace("https://", "").replace("http://", "")
     logger.info('Setting up Cert and Contour...')
-    cert_ext_status = installCertManagerAndContour(jsonspec, shared_cluster_name, repo_address)
-    if cert_ext_status[1] != 200:
-        logger.error(cert_ext_status[0].json['msg'])
-        d = {
-            "responseType": "ERROR",
-            "msg": cert_ext_status[0].json['msg'],
-            "ERROR_CODE": 500
-        }
-        return json.dumps(d), 500
-
-    service = "all"
+    scheduler = ExtensionScheduler(shared_cluster_name)
+    scheduler.add(AppName.CERT_MANAGER, lambda: installCertManagerAndContour(shared_cluster_name, repo_address,
+                                                                             "certmanager", jsonspec))
+    scheduler.add(AppName.CONTOUR, lambda: installCertManagerAndContour(shared_cluster_name, repo_address,
+                                                                        "ingress", jsonspec))
     if isHarborEnabled:
         logger.info('Setting up Harbor...')
-        harbor_status = _install_harbor_package(jsonspec, shared_cluster_name, runconfig)
-        if harbor_status[1] != 200:
-            logger.error("Error setting up Harbor registry...")
-            d = {
-                "responseType": "ERROR",
-                "msg": cert_ext_status[0].json['msg'],
-                "ERROR_CODE": 500
-            }
-            return json.dumps(d), 500
+        scheduler.add(AppName.HARBOR, lambda: _install_harbor_package(jsonspec, shared_cluster_name, runconfig))
+    status = scheduler.run()
+    if status[1] != 200:
+        logger.error("Error setting up extensions " + json.loads(status[0])['msg'])
+        return status
     logger.info("Configured all extentions successfully")
     d = {
         "responseType": "SUCCESS",
@@ -0,0 +1,202 @@
+#  Copyright 2022 VMware, Inc
+#  SPDX-License-Identifier: BSD-2-Clause
+
+import copy
+import glob
+import os
+import shutil
+import subprocess
+from pathlib import Path
+
+import yaml
+from yaml.loader import SafeLoader
+
+from constants.constants import Paths
+from model.status import State
+from util.logger_helper import LoggerHelper
+
+logger = LoggerHelper.get_logger(Path(__file__).stem)
+
+# Set on Tekton tasks that run in parallel, state updates of the task then go to a private fragment
+STATE_FRAGMENT_ENV = "STATE_FRAGMENT"
+FRAGMENTS_DIR = "fragments"
+
+
+def _fragment_name():
+    return os.environ.get(STATE_FRAGMENT_ENV)
+
+
+def _is_state_file(path):
+    return os.path.normpath(path).endswith(os.path.normpath(Paths.STATE_PATH))
+
+
+def fragment_path(state_file_path, name):
+    return os.path.join(os.path.dirname(state_file_path), FRAGMENTS_DIR, name + ".yml")
+
+
+def state_read_path(state_file_path):
+    """
+    State file to read, the task fragment once the task has written one
+    """
+    name = _fragment_name()
+    if name and _is_state_file(state_file_path):
+        path = fragment_path(state_file_path, name)
+        if os.path.exists(path):
+            return path
+    return state_file_path
+
+
+def state_write_path(state_file_path):
+    """
+    State file to write, the task fragment when STATE_FRAGMENT is set so parallel tasks
+    never overwrite each other's updates of state.yml
+    """
+    name = _fragment_name()
+    if name and _is_state_file(state_file_path):
+        path = fragment_path(state_file_path, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+    return state_file_path
+
+
+def _named(items):
+    return isinstance(items, list) and all(isinstance(item, dict) and "name" in item for item in items)
+
+
+def _merge(base, ours, theirs, path, conflicts, by_name=False):
+    """
+    Three way merge of theirs into ours, both derived from base
+    :param by_name: merge lists of objects with a name key by name instead of by position, the
+                    items added by both sides are kept
+    """
+    if isinstance(base, dict) and isinstance(ours, dict) and isinstance(theirs, dict):
+        for key in theirs:
+            if key in ours:
+                ours[key] = _merge(base.get(key), ours[key], theirs[key], path + [str(key)], conflicts, by_name)
+            else:
+                ours[key] = copy.deepcopy(theirs[key])
+        return ours
+    if by_name and _named(ours) and _named(theirs) and (base is None or _named(base)):
+        base_items = {item["name"]: item for item in base or []}
+        merged = {item["name"]: item for item in ours}
+        for item in theirs:
+            name = item["name"]
+            if name in merged:
+                merged[name] = _merge(base_items.get(name, dict()), merged[name], item, path + [name], conflicts,
+                                      by_name)
+            else:
+                merged[name] = copy.deepcopy(item)
+        return list(merged.values())
+    if isinstance(base, list) and isinstance(ours, list) and isinstance(theirs, list) \
+            and len(base) == len(ours) == len(theirs):
+        return [_merge(b, o, t, path + [str(i)], conflicts) for i, (b, o, t) in enumerate(zip(base, ours, theirs))]
+    if theirs == base:
+        return ours
+    if ours != base and ours != theirs:
+        conflicts.append(".".join(path))
+    return copy.deepcopy(theirs)
+
+
+def merge_state_fragments(root_dir):
+    """
+    Fold the fragments written by parallel tasks back into state.yml. Every fragment started
+    from the current state.yml, so only the values a task changed are applied. Fragments are
+    removed once merged.
+    :return: list of state paths changed by more than one task, the fragment last in name order wins
+    """
+    state_file_path = os.path.join(root_dir, Paths.STATE_PATH)
+    with open(state_file_path) as f:
+        base = yaml.load(f, Loader=SafeLoader)
+    merged = copy.deepcopy(base)
+    conflicts = []
+    fragments = sorted(glob.glob(os.path.join(os.path.dirname(state_file_path), FRAGMENTS_DIR, "*.yml")))
+    for fragment in fragments:
+        logger.info("Merging state fragment " + fragment)
+        with open(fragment) as f:
+            merged = _merge(base, merged, yaml.load(f, Loader=SafeLoader), [], conflicts)
+    state = State.parse_obj(merged)
+    with open(state_file_path, "w") as f:
+        yaml.dump(yaml.load(state.json(), Loader=SafeLoader), f)
+    for fragment in fragments:
+        os.remove(fragment)
+    for conflict in conflicts:
+        logger.warning("State " + conflict + " was updated by several tasks")
+    return conflicts
+
+
+def kubeconfig_fragment_dir(root_dir, name):
+    return os.path.join(root_dir, Paths.KUBECONFIG_REPO, FRAGMENTS_DIR, name)
+
+
+def merge_kubeconfig_fragments(root_dir):
+    """
+    Merge the kubeconfigs saved by parallel tasks under kubeconfig-repo/fragments/<task> into
+    kubeconfig-repo, so the contexts of every cluster created in parallel are kept.
+    """
+    fragments_root = os.path.join(root_dir, Paths.KUBECONFIG_REPO, FRAGMENTS_DIR)
+    if not os.path.isdir(fragments_root):
+        return
+    for rel_path in [Paths.REPO_KUBE_CONFIG, Paths.REPO_KUBE_TKG_CONFIG]:
+        target = os.path.join(root_dir, rel_path)
+        suffix = os.path.relpath(rel_path, Paths.KUBECONFIG_REPO)
+        configs = [target] if os.path.exists(target) else []
+        configs += sorted(glob.glob(os.path.join(fragments_root, "*", suffix)))
+        if len(configs) < 2:
+            if configs and configs[0] != target:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(configs[0], target)
+            continue
+        env = dict(os.environ, KUBECONFIG=":".join(configs))
+        merged = subprocess.run(["kubectl", "config", "view", "--flatten"], env=env, check=True,
+                                capture_output=True).stdout.decode()
+        with open(target, "w") as f:
+            f.write(merged)
+        logger.info("Merged " + str(len(configs)) + " kubeconfigs into " + target)
+    _merge_tanzu_config_fragments(root_dir, fragments_root)
+    shutil.rmtree(fragments_root)
+
+
+def _merge_tanzu_config_fragments(root_dir, fragments_root):
+    """
+    Fold the ~/.config copies of the tasks into kubeconfig-repo/.config. tanzu/config.yaml is
+    merged like state.yml with its servers and contexts kept by name, any other file is taken
+    from the task that wrote it last.
+    """
+    target_root = os.path.join(root_dir, Paths.KUBECONFIG_REPO, ".config")
+    config_suffix = os.path.relpath(Paths.REPO_TANZU_CONFIG_NEW, os.path.join(Paths.KUBECONFIG_REPO, ".config"))
+    newest = dict()
+    for fragment in sorted(glob.glob(os.path.join(fragments_root, "*", ".config"))):
+        for dir_path, _, file_names in os.walk(fragment):
+            for file_name in file_names:
+                path = os.path.join(dir_path, file_name)
+                rel_path = os.path.relpath(path, fragment)
+                if rel_path == config_suffix:
+                    continue
+                if rel_path not in newest or os.path.getmtime(path) >= os.path.getmtime(newest[rel_path]):
+                    newest[rel_path] = path
+    for rel_path, path in newest.items():
+        target = os.path.join(target_root, rel_path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copy2(path, target)
+
+    fragments = sorted(glob.glob(os.path.join(fragments_root, "*", ".config", config_suffix)))
+    if not fragments:
+        return
+    target = os.path.join(target_root, config_suffix)
+    base = None
+    if os.path.exists(target):
+        with open(target) as f:
+            base = yaml.load(f, Loader=SafeLoader)
+    merged = copy.deepcopy(base)
+    conflicts = []
+    for fragment in fragments:
+        with open(fragment) as f:
+            theirs = yaml.load(f, Loader=SafeLoader)
+        merged = copy.deepcopy(theirs) if merged is None else _merge(base or dict(), merged, theirs, [], conflicts,
+                                                                     by_name=True)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target, "w") as f:
+        yaml.dump(merged, f)
+    for conflict in conflicts:
+        logger.warning("Tanzu config " + conflict + " was updated by several tasks")
+    logger.info("Merged " + str(len(fragments)) + " tanzu configs into " + target)
@@ -3,6 +3,7 @@
 #  Copyright 2021 VMware, Inc
 #  SPDX-License-Identifier: BSD-2-Clause
 
+import io
 import os
 import os.path
 import ssl
@@ -10,47 +11,41 @@ import sys
 import tarfile
 import time
 import argparse
-from threading import Timer
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Timer
 from six.moves.urllib.request import Request, urlopen
 from pyVmomi import vim, vmodl
-from pyVim import connect
-from pyVim.connect import Disconnect
-import atexit
 from util.logger_helper import LoggerHelper, log
-from util.cmd_helper import CmdHelper
 from pathlib import Path
+import requests
 import urllib3
+from requests.adapters import HTTPAdapter
 from constants.constants import SegmentsName
-from pyVim import connect
-
-from util.cmd_helper import CmdHelper
+from util.vcenter_session import VcenterSession, find_by_name, retrieve_names
+from util.tracing import traced
+from model.spec_store import decode_secret
 logger = LoggerHelper.get_logger(Path(__file__).stem)
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 sys.path.append("../")
 
+# Disks of an OVA uploaded at the same time
+UPLOAD_WORKERS = 4
+# Read-ahead buffer of a remote OVA stream
+READ_AHEAD = 8 * 1024 * 1024
+# Forward seeks up to this size are served by reading on, larger ones open a new range request
+SKIP_LIMIT = 4 * 1024 * 1024
+
+_web_session = requests.Session()
+_web_session.mount("http://", HTTPAdapter(pool_maxsize=UPLOAD_WORKERS * 2))
+_web_session.mount("https://", HTTPAdapter(pool_maxsize=UPLOAD_WORKERS * 2))
+
 def get_obj(content, vimtype, name):
     """
     Return an object by name, if name is None the
     first found object is returned
     """
-    obj = None
-    container = content.viewManager.CreateContainerView(
-        content.rootFolder, vimtype, True)
-    for c in container.view:
-        try:
-            c.name
-        except:
-            pass
-        if name:
-            if c.name.strip() == name.strip():
-                obj = c
-                break
-        else:
-            obj = c
-            break
-
-    return obj
+    return find_by_name(content, vimtype, name)
 
 
 def get_obj_particular_folder(content, vimtype, folder, datacenter, si, name):
@@ -58,39 +53,23 @@ def get_obj_particular_folder(content, vimtype, folder, datacenter, si, name):
     Return an object by name, if name is None the
     first found object is returned
     """
-    obj = None
-    container = content.viewManager.CreateContainerView(
-        get_folder(si, datacenter, folder), vimtype, True)
-    for c in container.view:
-        try:
-            c.name
-        except:
-            pass
-        if name:
-            if str(c.name.strip()).__contains__(name.strip()):
-                obj = c
-                break
-        else:
-            obj = c
-            break
-
-    return obj
+    for obj, props in retrieve_names(content, vimtype, get_folder(si, datacenter, folder)):
+        if not name or str(props.get("name", "")).strip().__contains__(name.strip()):
+            return obj
+    return None
 
 
+@traced("vcenter")
 def checkVmPresent(vcenterhost, username, password, vm_name):
     si = getSi(vcenterhost, username, password)
     return get_obj(si.RetrieveContent(), [vim.VirtualMachine], vm_name)
 
 
+@traced("vcenter")
 def deploySeOva(vcenterhost, username, password, vm_name, folder, datacenter_name, resource_pool, datastore_name,
                 ova_path, host):
-    si = None
-    try:
-        print(f"Trying to connect to VCENTER SERVER . . .{vcenterhost}")
-        si = connect.SmartConnectNoSSL(host=vcenterhost, user=username, pwd=password)
-    except IOError as e:
-        atexit.register(Disconnect, si)
-        raise AssertionError("Failed to connect to vcenter.")
+    print(f"Trying to connect to VCENTER SERVER . . .{vcenterhost}")
+    si = getSi(vcenterhost, username, password)
 
     print(f"Connected to VCENTER SERVER ! {vcenterhost}")
     vm = get_obj(si.RetrieveContent(), [vim.VirtualMachine], vm_name)
@@ -174,15 +153,10 @@ def deploySeOva(vcenterhost, username, password, vm_name, folder, datacenter_nam
 
 
 def getSi(vcenterhost, username, password):
-    si = None
-    try:
-        si = connect.SmartConnectNoSSL(host=vcenterhost, user=username, pwd=password)
-    except IOError as e:
-        atexit.register(Disconnect, si)
-        raise AssertionError("Failed to connect to vcenter.")
-    return si
+    return VcenterSession.get(vcenterhost, username, password)
 
 
+@traced("vcenter")
 def destroy_vm(SI, foder, Datacenter, vm_name):
     try:
         content = SI.RetrieveContent()
@@ -473,21 +447,64 @@ class OvfHandler(object):
                                   self.tarfile.getnames()))[0]
         return self.tarfile.extractfile(ovffilename)
 
+    def get_disk_member(self, file_item):
+        """
+        Does translation for disk key to the tar member describing the disk,
+        None when the ova has no such regular file.
+        """
+        try:
+            member = self.tarfile.getmember(file_item.path)
+        except KeyError:
+            return None
+        return member if member.isfile() else None
+
+    def open_disk(self, file_item):
+        """
+        Opens a reader over a single disk on a handle of its own, so disks
+        can be read concurrently.
+        """
+        member = self.get_disk_member(file_item)
+        if member is None:
+            return None
+        return DiskReader(self.handle.reopen(), member.offset_data, member.size, self.add_progress)
+
     def get_device_url(self, file_item, lease):
         for device_url in lease.info.deviceUrl:
             if device_url.importKey == file_item.deviceId:
                 return device_url
         raise Exception("Failed to find deviceUrl for file %s" % file_item.path)
 
+    def add_progress(self, amount):
+        with self.progress_lock:
+            self.transferred += amount
+
+    def progress(self):
+        """
+        Progress aggregated over all the disks being uploaded.
+        """
+        if not self.total:
+            return 0
+        with self.progress_lock:
+            return min(100, int(100.0 * self.transferred / self.total))
+
+    @traced("ova")
     def upload_disks(self, lease, host):
         """
-        Uploads all the disks, with a progress keep-alive.
+        Uploads all the disks concurrently, with a progress keep-alive.
         """
         self.lease = lease
+        self.progress_lock = Lock()
+        self.transferred = 0
+        members = [self.get_disk_member(fileItem) for fileItem in self.spec.fileItem]
+        self.total = sum(member.size for member in members if member is not None)
         try:
             self.start_timer()
-            for fileItem in self.spec.fileItem:
-                self.upload_disk(fileItem, lease, host)
+            workers = max(1, min(UPLOAD_WORKERS, len(self.spec.fileItem)))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(self.upload_disk, fileItem, lease, host)
+                           for fileItem in self.spec.fileItem]
+                for future in futures:
+                    future.result()
             lease.Complete()
             print("Finished deploy successfully.")
             return 0
@@ -500,23 +517,27 @@ class OvfHandler(object):
             lease.Abort(vmodl.fault.SystemError(reason=str(ex)))
         return 1
 
+    @traced("ova")
     def upload_disk(self, file_item, lease, host):
         """
-        Upload an individual disk. Passes the file handle of the
+        Upload an individual disk. Passes a reader over the
         disk directly to the urlopen request.
         """
-        ovffile = self.get_disk(file_item)
+        ovffile = self.open_disk(file_item)
         if ovffile is None:
             return
         device_url = self.get_device_url(file_item, lease)
         url = device_url.url.replace('*', host)
-        headers = {'Content-length': get_tarfile_size(ovffile)}
+        headers = {'Content-length': ovffile.size}
         if hasattr(ssl, '_create_unverified_context'):
-            ssl_context = ssl.create_unverified_context()
+            ssl_context = ssl._create_unverified_context()
         else:
             ssl_context = None
-        req = Request(url, ovffile, headers)
-        urlopen(req, context=ssl_context)
+        try:
+            req = Request(url, ovffile, headers)
+            urlopen(req, context=ssl_context)
+        finally:
+            ovffile.close()
 
     def start_timer(self):
         """
@@ -529,7 +550,7 @@ class OvfHandler(object):
         Update the progress and reschedule the timer if not complete.
         """
         try:
-            prog = self.handle.progress()
+            prog = self.progress()
             self.lease.Progress(prog)
             if self.lease.state not in [vim.HttpNfcLease.State.done,
                                         vim.HttpNfcLease.State.error]:
@@ -539,6 +560,34 @@ class OvfHandler(object):
             pass
 
 
+class DiskReader(object):
+    """
+    Reads one member of the OVA out of its own handle and reports the bytes read.
+    """
+
+    def __init__(self, handle, offset, size, on_read):
+        self.handle = handle
+        self.size = size
+        self.remaining = size
+        self.on_read = on_read
+        self.handle.seek(offset)
+
+    def read(self, amount=-1):
+        if self.remaining <= 0:
+            return b""
+        if amount is None or amount < 0 or amount > self.remaining:
+            amount = self.remaining
+        result = self.handle.read(amount)
+        if not result:
+            raise IOError("Unexpected end of OVA, %d bytes missing" % self.remaining)
+        self.remaining -= len(result)
+        self.on_read(len(result))
+        return result
+
+    def close(self):
+        self.handle.close()
+
+
 class FileHandle(object):
     def __init__(self, filename):
         self.filename = filename
@@ -550,6 +599,12 @@ class FileHandle(object):
     def __del__(self):
         self.fh.close()
 
+    def reopen(self):
+        return FileHandle(self.filename)
+
+    def close(self):
+        self.fh.close()
+
     def tell(self):
         return self.fh.tell()
 
@@ -577,28 +632,61 @@ class FileHandle(object):
 
 
 class WebHandle(object):
+    """
+    Seekable reader over a remote OVA. Keeps one streaming response on a pooled
+    connection behind a large read-ahead buffer and only issues a new range
+    request when seeking backwards or far ahead.
+    """
+
     def __init__(self, url):
         self.url = url
-        r = urlopen(url)
-        if r.code != 200:
+        r = _web_session.get(url, stream=True, verify=False)
+        if r.status_code != 200:
+            r.close()
             raise FileNotFoundError(url)
-        self.headers = self._headers_to_dict(r)
+        self.headers = {n.lower(): v.strip() for n, v in r.headers.items()}
         if 'accept-ranges' not in self.headers:
+            r.close()
             raise Exception("Site does not accept ranges")
         self.st_size = int(self.headers['content-length'])
         self.offset = 0
-
-    def _headers_to_dict(self, r):
-        result = {}
-        if hasattr(r, 'getheaders'):
-            for n, v in r.getheaders():
-                result[n.lower()] = v.strip()
-        else:
-            for line in r.info().headers:
-                if line.find(':') != -1:
-                    n, v = line.split(': ', 1)
-                    result[n.lower()] = v.strip()
-        return result
+        self._open(r, 0)
+
+    def _open(self, response, position):
+        self._response = response
+        self._stream = io.BufferedReader(response.raw, buffer_size=READ_AHEAD)
+        self._position = position
+
+    def _close_stream(self):
+        if self._response is not None:
+            self._response.close()
+        self._response = None
+        self._stream = None
+
+    def _range_request(self, start):
+        self._close_stream()
+        r = _web_session.get(self.url, headers={'Range': 'bytes=%d-' % start}, stream=True, verify=False)
+        if r.status_code != 206:
+            r.close()
+            raise Exception("Range request on %s failed with %s" % (self.url, r.status_code))
+        self._open(r, start)
+
+    def reopen(self):
+        """
+        Another handle on the same url, with a connection of its own.
+        """
+        handle = WebHandle.__new__(WebHandle)
+        handle.url = self.url
+        handle.headers = self.headers
+        handle.st_size = self.st_size
+        handle.offset = 0
+        handle._response = None
+        handle._stream = None
+        handle._position = None
+        return handle
+
+    def close(self):
+        self._close_stream()
 
     def tell(self):
         return self.offset
@@ -616,14 +704,16 @@ class WebHandle(object):
         return True
 
     def read(self, amount):
-        start = self.offset
-        end = self.offset + amount - 1
-        req = Request(self.url,
-                      headers={'Range': 'bytes=%d-%d' % (start, end)})
-        r = urlopen(req)
-        self.offset += amount
-        result = r.read(amount)
-        r.close()
+        if self.offset >= self.st_size:
+            return b""
+        skip = self.offset - self._position if self._stream is not None else -1
+        if skip < 0 or skip > SKIP_LIMIT:
+            self._range_request(self.offset)
+        elif skip:
+            self._stream.read(skip)
+        result = self._stream.read(amount)
+        self.offset += len(result)
+        self._position = self.offset
         return result
 
     # A slightly more accurate percentage
@@ -631,10 +721,10 @@ class WebHandle(object):
         return int(100.0 * self.offset / self.st_size)
 
 
+@traced("vcenter")
 def createResourcePool(vcenterHostName, vcenterUser, vcenterPassword, clusterName, name, parentResourcePool):
-    si = None
     try:
-        si = connect.SmartConnectNoSSL(host=vcenterHostName, user=vcenterUser, pwd=vcenterPassword)
+        si = getSi(vcenterHostName, vcenterUser, vcenterPassword)
         content = si.RetrieveContent()
         cluster = get_obj(content, [vim.ClusterComputeResource], clusterName)
 
@@ -668,16 +758,13 @@ def createResourcePool(vcenterHostName, vcenterUser, vcenterPassword, clusterNam
         else:
             return None
     except Exception as e:
-        atexit.register(Disconnect, si)
         raise AssertionError("Operation failed " + str(e))
-    finally:
-        atexit.register(Disconnect, si)
 
 
+@traced("vcenter")
 def create_folder(vcenterHostName, vceneterUser, vcenterPassword, datacenter_name, folder_name):
-    si = None
     try:
-        si = connect.SmartConnectNoSSL(host=vcenterHostName, user=vceneterUser, pwd=vcenterPassword)
+        si = getSi(vcenterHostName, vceneterUser, vcenterPassword)
         content = si.RetrieveContent()
         datacenter = get_dc(si, datacenter_name)
         destfolder = get_obj(content, [vim.Folder], folder_name)
@@ -687,10 +774,7 @@ def create_folder(vcenterHostName, vceneterUser, vcenterPassword, datacenter_nam
         else:
             return None
     except Exception as e:
-        atexit.register(Disconnect, si)
         raise AssertionError("Operation failed " + str(e))
-    finally:
-        atexit.register(Disconnect, si)
 
 
 def getNetwork(datacenter, name):
@@ -720,9 +804,10 @@ def getNetwork(datacenter, name):
             raise Exception('Encountered errors while fetching networks %s' % datacenter.name)
 
 
+@traced("vcenter")
 def getDvPortGroupId(vcenterIp, vcenterUser, vcenterPassword, networkName, vc_data_center):
     try:
-        si = connect.SmartConnectNoSSL(host=vcenterIp, user=vcenterUser, pwd=vcenterPassword)
+        si = getSi(vcenterIp, vcenterUser, vcenterPassword)
         try:
             datacenter = get_dc(si, vc_data_center)
         except Exception as e:
@@ -738,12 +823,13 @@ def getDvPortGroupId(vcenterIp, vcenterUser, vcenterPassword, networkName, vc_da
         logger.error(str(e))
         return None
 
+@traced("vcenter")
 def verifyVcenterVersion(version, jsonspec):
     vcpass_base64 = jsonspec['envSpec']['vcenterDetails']['vcenterSsoPasswordBase64']
-    vcenter_password = CmdHelper.decode_base64(vcpass_base64)
+    vcenter_password = decode_secret(vcpass_base64)
     vcenter_username = jsonspec['envSpec']['vcenterDetails']['vcenterSsoUser']
     vcenter_ip = jsonspec['envSpec']['vcenterDetails']['vcenterAddress']
-    si = connect.SmartConnectNoSSL(host=vcenter_ip, user=vcenter_username, pwd=vcenter_password)
+    si = getSi(vcenter_ip, vcenter_username, vcenter_password)
     content = si.RetrieveContent()
     vcVersion = content.about.version
     if vcVersion.startswith(version):
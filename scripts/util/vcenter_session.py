@@ -0,0 +1,301 @@
+#  Copyright 2022 VMware, Inc
+#  SPDX-License-Identifier: BSD-2-Clause
+
+import atexit
+import base64
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+import requests
+from pyVim import connect
+from pyVim.connect import Disconnect
+from pyVmomi import vim, vmodl
+from requests.adapters import HTTPAdapter
+
+from util.logger_helper import LoggerHelper
+from util.tracing import span
+
+logger = LoggerHelper.get_logger(Path(__file__).stem)
+
+
+class VcenterSession:
+    """
+    One authenticated pyVmomi ServiceInstance per vCenter and user for the whole process.
+    The session is checked before being handed out and re-established when vCenter expired it.
+    """
+
+    _sessions = dict()
+    _lock = threading.Lock()
+
+    def __init__(self, host, username, password):
+        self.host = host
+        self.username = username
+        self.password = password
+        self.si = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, host, username, password):
+        """
+        :return: ServiceInstance connected to host, reused across calls
+        """
+        key = (host, username)
+        with cls._lock:
+            session = cls._sessions.get(key)
+            if session is None or session.password != password:
+                session = cls(host, username, password)
+                cls._sessions[key] = session
+        return session.service_instance()
+
+    @classmethod
+    def disconnect_all(cls):
+        with cls._lock:
+            sessions = list(cls._sessions.values())
+            cls._sessions.clear()
+        for session in sessions:
+            session.disconnect()
+
+    def _alive(self):
+        try:
+            return self.si.content.sessionManager.currentSession is not None
+        except Exception:
+            return False
+
+    def service_instance(self):
+        with self._lock:
+            if self.si is not None and self._alive():
+                return self.si
+            if self.si is not None:
+                logger.info("vCenter session for " + self.host + " expired, logging in again")
+            try:
+                self.si = connect.SmartConnectNoSSL(host=self.host, user=self.username, pwd=self.password)
+            except IOError:
+                self.si = None
+                raise AssertionError("Failed to connect to vcenter.")
+            return self.si
+
+    def disconnect(self):
+        with self._lock:
+            if self.si is not None:
+                try:
+                    Disconnect(self.si)
+                except Exception:
+                    pass
+                self.si = None
+
+
+atexit.register(VcenterSession.disconnect_all)
+
+REST_SESSION_PATH = "/rest/com/vmware/cis/session"
+SESSION_HEADER = "vmware-api-session-id"
+# vCenter answers 429/503 when too many sessions are created at once
+LOGIN_ATTEMPTS = 4
+
+_rest_http = None
+_rest_http_lock = threading.Lock()
+
+
+def pooled_rest_session() -> requests.Session:
+    """
+    Process wide requests.Session for vCenter REST calls, keeps connections to vCenter alive
+    """
+    global _rest_http
+    with _rest_http_lock:
+        if _rest_http is None:
+            session = requests.Session()
+            session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+            session.verify = False
+            _rest_http = session
+        return _rest_http
+
+
+class VcenterRestSession:
+    """
+    One vmware-api-session-id per vCenter for the whole process, shared by every REST call
+    instead of creating a new session per call. Requests answered with 401 log in again and
+    are replayed once, sessions are deleted at exit.
+    """
+
+    _sessions = dict()
+    _lock = threading.Lock()
+
+    def __init__(self, host, username, password):
+        self.host = str(host)
+        self.username = username
+        self.password = password
+        self.session_id = None
+        self._login_lock = threading.Lock()
+
+    @classmethod
+    def get(cls, host, username, password):
+        """
+        Return the cached session for host, logging in if it is new or the credentials changed
+        :return: VcenterRestSession, session_id is None when login failed
+        """
+        with cls._lock:
+            session = cls._sessions.get(str(host).lower())
+            if session is None or session.username != username or session.password != password:
+                session = cls(host, username, password)
+                cls._sessions[str(host).lower()] = session
+        if session.session_id is None:
+            session.login()
+        return session
+
+    @classmethod
+    def from_spec(cls, jsonspec):
+        """
+        Session for the vCenter of the deployment spec
+        """
+        vcenter_details = jsonspec['envSpec']['vcenterDetails']
+        password = base64.b64decode(str(vcenter_details["vcenterSsoPasswordBase64"]).encode('ascii')) \
+            .decode('ascii').rstrip("\n")
+        return cls.get(vcenter_details['vcenterAddress'], vcenter_details['vcenterSsoUser'], password)
+
+    @classmethod
+    def lookup(cls, host):
+        with cls._lock:
+            return cls._sessions.get(str(host).lower())
+
+    @classmethod
+    def logout_all(cls):
+        with cls._lock:
+            sessions = list(cls._sessions.values())
+            cls._sessions.clear()
+        for session in sessions:
+            session.logout()
+
+    def _create(self):
+        url = "https://" + self.host + REST_SESSION_PATH
+        for attempt in range(LOGIN_ATTEMPTS):
+            with span("vCenter login", "vcenter", host=self.host) as span_args:
+                response = pooled_rest_session().post(url, auth=(self.username, self.password), verify=False)
+                span_args["status"] = response.status_code
+            if response.status_code == 200:
+                return response.json()['value']
+            if response.status_code not in [429, 503]:
+                break
+            time.sleep(2 ** attempt)
+        logger.error("Failed to fetch session ID for vCenter - " + self.host + ": " + str(response.status_code))
+        return None
+
+    def login(self):
+        stale = self.session_id
+        with self._login_lock:
+            # another thread may have already logged in again while we waited
+            if self.session_id is None or self.session_id == stale:
+                self.session_id = self._create()
+        return self.session_id
+
+    def headers(self):
+        return {
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            SESSION_HEADER: self.session_id
+        }
+
+    def _send(self, method, url, headers, **kwargs):
+        headers = dict(headers or {})
+        headers[SESSION_HEADER] = self.session_id
+        return pooled_rest_session().request(method, url, headers=headers, **kwargs)
+
+    def request(self, method, url, headers=None, **kwargs):
+        kwargs.setdefault("verify", False)
+        response = self._send(method, url, headers, **kwargs)
+        if response.status_code == 401:
+            logger.info("vCenter REST session on " + self.host + " expired, logging in again")
+            if self.login() is not None:
+                response = self._send(method, url, headers, **kwargs)
+        return response
+
+    def logout(self):
+        with self._login_lock:
+            if self.session_id is None:
+                return
+            try:
+                pooled_rest_session().delete("https://" + self.host + REST_SESSION_PATH,
+                                             headers={SESSION_HEADER: self.session_id}, verify=False, timeout=10)
+            except Exception:
+                pass
+            self.session_id = None
+
+
+atexit.register(VcenterRestSession.logout_all)
+
+
+def vcenter_request(method, url, headers=None, **kwargs):
+    """
+    Drop-in replacement of requests.request for vCenter REST calls. Requests carrying a
+    vmware-api-session-id go through the vCenter's VcenterRestSession so an expired id is
+    refreshed on 401, all requests share the pooled connections.
+    """
+    kwargs.setdefault("verify", False)
+    parsed = urlparse(url)
+    with span("vCenter " + method, "vcenter", url=parsed.path) as span_args:
+        session = VcenterRestSession.lookup(parsed.hostname)
+        if session is not None and SESSION_HEADER in (headers or {}):
+            response = session.request(method, url, headers=headers, **kwargs)
+        else:
+            response = pooled_rest_session().request(method, url, headers=headers, **kwargs)
+        span_args["status"] = response.status_code
+        return response
+
+
+def retrieve_names(content, vimtype, root=None, properties=None):
+    """
+    Fetch name and parent of every object of the given types below root in a single
+    PropertyCollector call, instead of one round-trip per object.
+    :param content: ServiceContent
+    :param vimtype: list of managed object types
+    :param root: container to search, rootFolder by default
+    :param properties: properties to retrieve, name and parent by default
+    :return: list of (managed object, dict of property values)
+    """
+    properties = properties or ["name", "parent"]
+    view = content.viewManager.CreateContainerView(root or content.rootFolder, vimtype, True)
+    try:
+        traversal = vmodl.query.PropertyCollector.TraversalSpec(name="traverseView", path="view", skip=False,
+                                                                type=vim.view.ContainerView)
+        object_spec = vmodl.query.PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[traversal])
+        property_specs = [vmodl.query.PropertyCollector.PropertySpec(type=t, pathSet=properties, all=False)
+                          for t in vimtype]
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(objectSet=[object_spec], propSet=property_specs)
+        collector = content.propertyCollector
+        options = vmodl.query.PropertyCollector.RetrieveOptions()
+        result = collector.RetrievePropertiesEx([filter_spec], options)
+        objects = []
+        while result is not None:
+            for obj in result.objects:
+                objects.append((obj.obj, {prop.name: prop.val for prop in obj.propSet}))
+            if not result.token:
+                break
+            result = collector.ContinueRetrievePropertiesEx(result.token)
+        return objects
+    finally:
+        view.Destroy()
+
+
+def index_by_name(content, vimtype, root=None):
+    """
+    :return: dict of stripped object name to the list of (managed object, parent)
+    """
+    index = dict()
+    for obj, props in retrieve_names(content, vimtype, root):
+        index.setdefault(str(props.get("name", "")).strip(), []).append((obj, props.get("parent")))
+    return index
+
+
+def find_by_name(content, vimtype, name, root=None):
+    """
+    Return the first object of the given types named name, or the first object found
+    when name is None
+    """
+    objects = retrieve_names(content, vimtype, root)
+    if not name:
+        return objects[0][0] if objects else None
+    name = name.strip()
+    for obj, props in objects:
+        if str(props.get("name", "")).strip() == name:
+            return obj
+    return None
@@ -0,0 +1,241 @@
+#  Copyright 2022 VMware, Inc
+#  SPDX-License-Identifier: BSD-2-Clause
+
+import fnmatch
+import os
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+from urllib.parse import urlparse
+
+from pyVmomi import vim
+
+from constants.constants import VmPowerState
+from util.logger_helper import LoggerHelper
+from util.tracing import span
+from util.vcenter_session import VcenterSession, retrieve_names
+
+logger = LoggerHelper.get_logger(Path(__file__).stem)
+
+# Seconds a snapshot answers lookups before it is loaded again, objects created by other tools
+# (tanzu, govc import) show up at most this late
+INVENTORY_TTL = 60
+
+# govc find -type letters and the managed object types they select
+FIND_TYPES = {
+    "d": vim.Datacenter,
+    "c": vim.ClusterComputeResource,
+    "p": vim.ResourcePool,
+    "f": vim.Folder,
+    "m": vim.VirtualMachine,
+    "n": vim.Network,
+}
+# govc find filters answered from the snapshot, other options are left to govc
+FIND_FILTERS = ["runtime.powerState", "config.template"]
+
+_CONTAINER_TYPES = [vim.Datacenter, vim.Folder, vim.ComputeResource, vim.ResourcePool, vim.Network]
+_VM_PROPERTIES = ["name", "parent", "runtime.powerState", "config.template"]
+_POWER_STATES = {VmPowerState.ON.value: "poweredOn", VmPowerState.OFF.value: "poweredOff"}
+
+InventoryObject = namedtuple("InventoryObject", ["obj", "name", "path", "props"])
+
+
+def parse_find_options(options):
+    """
+    :param options: extra govc find arguments, such as "-runtime.powerState on"
+    :return: dict of property to expected value, None when an option is not supported
+    """
+    tokens = str(options or "").split()
+    if len(tokens) % 2 != 0:
+        return None
+    filters = dict()
+    for flag, value in zip(tokens[::2], tokens[1::2]):
+        if flag[1:] not in FIND_FILTERS:
+            return None
+        filters[flag[1:]] = _POWER_STATES.get(value, value) if flag[1:] == "runtime.powerState" else value
+    return filters
+
+
+def _matches(props, filters):
+    return all(str(props.get(key)).lower() == str(value).lower() for key, value in filters.items())
+
+
+class VsphereInventory:
+    """
+    Name indexed snapshot of the vCenter inventory, loaded in two PropertyCollector calls over
+    the shared VcenterSession, answering the govc find style lookups without a govc process and
+    login per lookup. Paths are the inventory paths govc prints, e.g. /dc/host/cluster.
+    Lookups return None when the snapshot can not answer them, the callers then run govc.
+    """
+
+    _inventories = dict()
+    _lock = threading.Lock()
+
+    def __init__(self, host, username, password):
+        self.host = host
+        self.username = username
+        self.password = password
+        self._by_name = None
+        self._loaded_at = 0
+        self._failed_at = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, host, username, password):
+        """
+        :return: inventory of the vCenter, shared across calls
+        """
+        key = (host, username)
+        with cls._lock:
+            inventory = cls._inventories.get(key)
+            if inventory is None or inventory.password != password:
+                inventory = cls(host, username, password)
+                cls._inventories[key] = inventory
+            return inventory
+
+    @classmethod
+    def from_govc_env(cls):
+        """
+        Inventory of the vCenter govc is configured for through GOVC_URL, GOVC_USERNAME and
+        GOVC_PASSWORD
+        :return: VsphereInventory, None when the variables are not set
+        """
+        url = os.environ.get("GOVC_URL")
+        username = os.environ.get("GOVC_USERNAME")
+        password = os.environ.get("GOVC_PASSWORD")
+        if not url or not username or not password:
+            return None
+        host = urlparse(url if "://" in url else "https://" + url).hostname
+        return cls.get(host, username, password)
+
+    @classmethod
+    def invalidate_all(cls):
+        with cls._lock:
+            inventories = list(cls._inventories.values())
+        for inventory in inventories:
+            inventory.invalidate()
+
+    def invalidate(self):
+        """
+        Drop the snapshot, e.g. after creating or deleting objects
+        """
+        with self._lock:
+            self._by_name = None
+
+    def _load(self):
+        with span("vCenter inventory", "vcenter", host=self.host):
+            content = VcenterSession.get(self.host, self.username, self.password).RetrieveContent()
+            objects = retrieve_names(content, _CONTAINER_TYPES) + \
+                retrieve_names(content, [vim.VirtualMachine], properties=_VM_PROPERTIES)
+        nodes = {obj._moId: (obj, props) for obj, props in objects}
+        paths = dict()
+
+        def path_of(moid):
+            if moid not in paths:
+                obj, props = nodes[moid]
+                parent = props.get("parent")
+                parent_path = path_of(parent._moId) if parent is not None and parent._moId in nodes else ""
+                paths[moid] = parent_path + "/" + str(props.get("name", ""))
+            return paths[moid]
+
+        by_name = dict()
+        for moid, (obj, props) in nodes.items():
+            name = str(props.get("name", "")).strip()
+            by_name.setdefault(name, []).append(InventoryObject(obj, name, path_of(moid), props))
+        logger.debug("Loaded " + str(len(nodes)) + " inventory objects of vCenter " + self.host)
+        return by_name
+
+    def _snapshot(self):
+        """
+        :return: dict of object name to the list of InventoryObject, None when vCenter can not
+                 be reached
+        """
+        with self._lock:
+            now = time.monotonic()
+            if self._failed_at is not None and now - self._failed_at < INVENTORY_TTL:
+                return None
+            if self._by_name is None or now - self._loaded_at > INVENTORY_TTL:
+                try:
+                    self._by_name = self._load()
+                    self._loaded_at = now
+                    self._failed_at = None
+                except Exception as e:
+                    logger.warning("Failed to load inventory of vCenter " + self.host + ", using govc " + str(e))
+                    self._by_name = None
+                    self._failed_at = now
+                    return None
+            return self._by_name
+
+    def objects(self, kind, pattern, root=None, filters=None):
+        """
+        :param kind: govc find -type letter
+        :param pattern: govc find -name pattern, shell style wildcards allowed
+        :param root: inventory path to search below, the whole inventory for None or "."
+        :param filters: dict of property to expected value
+        :return: list of InventoryObject, None when the snapshot is not available
+        """
+        by_name = self._snapshot()
+        if by_name is None:
+            return None
+        pattern = str(pattern).strip()
+        if any(c in pattern for c in "*?["):
+            candidates = [o for name, objs in by_name.items() if fnmatch.fnmatchcase(name, pattern) for o in objs]
+        else:
+            candidates = by_name.get(pattern, [])
+        prefix = None if root in [None, "", ".", "/"] else "/" + str(root).strip("/") + "/"
+        return sorted([o for o in candidates if isinstance(o.obj, FIND_TYPES[kind])
+                       and (prefix is None or o.path.startswith(prefix))
+                       and _matches(o.props, filters or dict())], key=lambda o: o.path)
+
+    def find(self, kind, pattern, root=None, options=''):
+        """
+        govc find <root> -type <kind> -name <pattern> <options>
+        :return: list of inventory paths, None when the lookup has to be left to govc
+        """
+        filters = parse_find_options(options)
+        if filters is None or (root not in [None, "", ".", "/"] and "/" not in str(root)):
+            # relative folder names are resolved against the govc datacenter
+            return None
+        found = self.objects(kind, pattern, root, filters)
+        return None if found is None else [o.path for o in found]
+
+    def vm(self, name, datacenter=None):
+        """
+        :param name: VM name or inventory path
+        :return: the first VirtualMachine named name, False when there is none, None when the
+                 snapshot is not available
+        """
+        if str(name).startswith("/"):
+            found = self.objects("m", str(name).rstrip("/").split("/")[-1])
+            found = found if found is None else [o for o in found if o.path == str(name).rstrip("/")]
+        else:
+            found = self.objects("m", name, root=datacenter)
+        if found is None:
+            return None
+        return found[0].obj if found else False
+
+    def power_state(self, name):
+        """
+        Current power state, read from the VM itself and not from the snapshot
+        :return: VmPowerState, None when the snapshot is not available
+        """
+        vm = self.vm(name)
+        if vm is None:
+            return None
+        if vm and vm.runtime.powerState == vim.VirtualMachinePowerState.poweredOn:
+            return VmPowerState.ON
+        return VmPowerState.OFF
+
+    def vm_ip(self, name, datacenter=None):
+        """
+        :return: current guest IP of the VM, None when it has none yet or the snapshot is not available
+        """
+        vm = self.vm(name, datacenter)
+        if not vm:
+            return None
+        try:
+            return vm.guest.ipAddress or None
+        except Exception as e:
+            logger.warning("Failed to read guest IP of " + str(name) + " " + str(e))
+            return None
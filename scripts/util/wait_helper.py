@@ -0,0 +1,124 @@
+#  Copyright 2022 VMware, Inc
+#  SPDX-License-Identifier: BSD-2-Clause
+
+import random
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from util.logger_helper import LoggerHelper
+from util.tracing import add_event
+
+logger = LoggerHelper.get_logger(Path(__file__).stem)
+
+_metrics = []
+_metrics_lock = threading.Lock()
+_phase = threading.local()
+
+
+class WaitResult:
+    """
+    Outcome of a wait_until call. Truthy when the predicate succeeded before the deadline.
+    """
+
+    def __init__(self, description, value, elapsed, attempts):
+        self.description = description
+        self.value = value
+        self.elapsed = elapsed
+        self.attempts = attempts
+
+    def __bool__(self):
+        return bool(self.value)
+
+    def __repr__(self):
+        return "WaitResult(description={}, success={}, elapsed={:.1f}s, attempts={})".format(
+            self.description, bool(self), self.elapsed, self.attempts)
+
+
+@contextmanager
+def phase_deadline(name, timeout):
+    """
+    Bound every wait_until issued inside the block by a shared deadline, so a phase made of
+    several waits can not exceed timeout seconds in total. Nested phases keep the tightest deadline.
+    :param name: phase name used in logs
+    :param timeout: seconds allowed for the whole phase
+    """
+    outer = getattr(_phase, "deadline", None)
+    deadline = time.monotonic() + timeout
+    if outer is not None:
+        deadline = min(deadline, outer[1])
+    _phase.deadline = (name, deadline)
+    try:
+        yield
+    finally:
+        _phase.deadline = outer
+
+
+def wait_until(predicate, timeout, interval=2, backoff=1.5, max_interval=30, jitter=0.2,
+               description=None, ignore_errors=False):
+    """
+    Poll predicate until it returns a truthy value or timeout expires, sleeping with jittered
+    exponential backoff between polls. Returns as soon as the predicate succeeds.
+    :param predicate: callable without arguments, its truthy return value ends the wait
+    :param timeout: maximum seconds to wait, capped by the enclosing phase_deadline
+    :param interval: first sleep between polls in seconds
+    :param backoff: multiplier applied to the sleep after each poll
+    :param max_interval: upper bound for the sleep between polls
+    :param jitter: random +/- fraction applied to every sleep
+    :param description: text used in logs and metrics
+    :param ignore_errors: treat exceptions raised by predicate as a failed poll instead of raising
+    :return: WaitResult
+    """
+    description = description or getattr(predicate, "__name__", "condition")
+    start = time.monotonic()
+    deadline = start + timeout
+    phase = getattr(_phase, "deadline", None)
+    if phase is not None and phase[1] < deadline:
+        deadline = phase[1]
+    delay = interval
+    attempts = 0
+    value = None
+    while True:
+        attempts += 1
+        try:
+            value = predicate()
+        except Exception as e:
+            if not ignore_errors:
+                raise
+            logger.debug("Poll %s for %s failed: %s", attempts, description, str(e))
+            value = None
+        if value:
+            break
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        sleep_for = delay * random.uniform(1 - jitter, 1 + jitter)
+        time.sleep(max(0, min(sleep_for, remaining)))
+        delay = min(delay * backoff, max_interval)
+    result = WaitResult(description, value, time.monotonic() - start, attempts)
+    record_wait(result)
+    return result
+
+
+def record_wait(result):
+    """
+    Log a finished wait and keep it in the process metrics
+    :param result: WaitResult
+    """
+    with _metrics_lock:
+        _metrics.append(result)
+    add_event(result.description, "wait", time.time() - result.elapsed, result.elapsed,
+              {"success": bool(result), "attempts": result.attempts})
+    if result:
+        logger.info("%s ready after %.1fs (%s polls)", result.description, result.elapsed, result.attempts)
+    else:
+        logger.warning("%s not ready after %.1fs (%s polls)", result.description, result.elapsed, result.attempts)
+
+
+def get_wait_metrics():
+    """
+    :return: list of WaitResult for every wait_until issued by this process
+    """
+    with _metrics_lock:
+        return list(_metrics)
@@ -0,0 +1,100 @@
+#  Copyright 2022 VMware, Inc
+#  SPDX-License-Identifier: BSD-2-Clause
+
+import threading
+from pathlib import Path
+
+from model.run_config import RunConfig
+from model.spec_store import SpecStore
+from util.avi_registry import AviRegistry
+from util.logger_helper import LoggerHelper
+
+logger = LoggerHelper.get_logger(Path(__file__).stem)
+
+
+class WorkflowContext:
+    """
+    Env checks and clients shared by every workflow of one run config.
+    Nothing is built before it is first asked for, and nothing is built twice, so nested
+    workflows (e.g. the workload workflow driving the management one) reuse what the
+    outer workflow already loaded and checked.
+    """
+
+    _contexts = dict()
+    _lock = threading.Lock()
+
+    def __init__(self, run_config: RunConfig):
+        self.run_config = run_config
+        self._lock = threading.RLock()
+        self._checked_vcenters = dict()
+        self._objects = dict()
+        AviRegistry.configure(run_config.root_dir)
+
+    @classmethod
+    def of(cls, run_config: RunConfig):
+        """
+        :return: context of run_config, created on first call
+        """
+        with cls._lock:
+            context = cls._contexts.get(id(run_config))
+            if context is None or context.run_config is not run_config:
+                context = cls(run_config)
+                cls._contexts[id(run_config)] = context
+            return context
+
+    def _once(self, key, build):
+        with self._lock:
+            if key not in self._objects:
+                self._objects[key] = build()
+            return self._objects[key]
+
+    def jsonspec(self, jsonpath):
+        """
+        Parsed spec file, shared through SpecStore
+        """
+        return SpecStore.jsonspec(jsonpath)
+
+    def env(self):
+        """
+        :return: envCheck result, (env, 200) when the desired state env is supported
+        """
+        from util.common_utils import envCheck
+        return self._once("env", lambda: envCheck(self.run_config))
+
+    def check_vcenter(self, jsonspec):
+        """
+        checkenv once per vCenter of the spec, failures are not remembered so they are retried
+        :return: govc output, None when vCenter can not be reached
+        """
+        from util.common_utils import checkenv
+        vcenter_details = jsonspec['envSpec']['vcenterDetails']
+        key = (vcenter_details['vcenterAddress'], vcenter_details['vcenterSsoUser'])
+        with self._lock:
+            if self._checked_vcenters.get(key) is None:
+                self._checked_vcenters[key] = checkenv(jsonspec)
+            return self._checked_vcenters[key]
+
+    def tkg_util(self):
+        from util.tkg_util import TkgUtil
+        return self._once("tkg_util", lambda: TkgUtil(run_config=self.run_config))
+
+    def nsxt_client(self):
+        from lib.nsxt_client import NsxtClient
+        return self._once("nsxt_client", lambda: NsxtClient(self.run_config))
+
+    def cleanup_util(self):
+        from util.cleanup_util import CleanUpUtil
+        return self._once("cleanup_util", lambda: CleanUpUtil(checkpoints=self.checkpoints))
+
+    def checkpoints(self, scope):
+        """
+        Checkpoint journal of a workflow scope, such as avi or mgmt
+        """
+        from util.checkpoint import Checkpoints
+        return self._once(("checkpoints", scope), lambda: Checkpoints(self.run_config.root_dir, scope))
+
+    def workflow(self, workflow_class):
+        """
+        Shared instance of a workflow class for this run config
+        """
+        return self._once(workflow_class, lambda: workflow_class(self.run_config))
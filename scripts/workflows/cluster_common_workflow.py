@@ -7,6 +7,7 @@ from pathlib import Path
 
 from constants.constants import Constants, KubectlCommands, Paths, TKGCommands
 from lib.kubectl_client import KubectlClient
+from lib.kubectl_watch import wait_for_package_reconciled
 from lib.tkg_cli_client import TkgCliClient
 from lib.tmc_cli_client import TmcCliClient
 from model.spec import MasterSpec
@@ -17,6 +18,7 @@ from util.git_helper import Git
 from util.logger_helper import LoggerHelper, log, log_debug
 from util.cmd_runner import RunCmd
 from util.tanzu_utils import TanzuUtils
+from util.tracing import trace_methods
 
 logger = LoggerHelper.get_logger(Path(__file__).stem)
 
@@ -25,6 +27,7 @@ TIMEOUT = int(Constants.RECONCILE_WAIT_TIMEOUT)
 RETRY_COUNT = TIMEOUT // DELAY
 
 
+@trace_methods()
 class ClusterCommonWorkflow:
     def __init__(self):
         self.runcmd = RunCmd()
@@ -109,6 +112,19 @@ class ClusterCommonWorkflow:
         else:
             raise ValueError(f"Waiting for {name} to reconcile. Current state: {package_status}")
 
+    def wait_for_package_reconciled(self, name, namespace):
+        """
+        Wait on the PackageInstall watch, shared with the other packages being installed when an
+        ExtensionScheduler runs, instead of polling the tanzu cli
+        """
+        reconciled = wait_for_package_reconciled(name, namespace=namespace, timeout=TIMEOUT, stop_on_failure=True)
+        if reconciled.value == "FAILED":
+            raise Exception(f"Failed to reconcile package: {name}")
+        if not reconciled:
+            raise ValueError(f"Waiting for {name} to reconcile, not reconciled after {int(reconciled.elapsed)}s")
+        logger.info(f"Package {name} reconciled successfully.")
+        return True
+
     @log_debug
     def create_namespace_for_extension(self, namespace, sa_name, config_file, extension_name, work_dir):
         if not self.kubectl_client.check_namespace_exists(namespace=namespace):
@@ -244,7 +260,7 @@ class ClusterCommonWorkflow:
                                                     options=options)
 
                 logger.info(f"Check if package {name} reconciled")
-                self.check_package_reconciled(name=name, namespace=namespace)
+                self.wait_for_package_reconciled(name=name, namespace=namespace)
 
                 logger.info(f'Check status of {name} service')
                 self.check_app_reconciled(app_name=name, namespace=namespace)
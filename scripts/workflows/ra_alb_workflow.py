@@ -8,13 +8,15 @@ from pathlib import Path
 import time
 from retry import retry
 import json
+from functools import partial
 
 from constants.constants import Paths, AlbPrefix, AlbCloudType, ComponentPrefix, AlbLicenseTier, VmPowerState, \
     AlbVrfContext, ControllerLocation, CertName, ResourcePoolAndFolderName, Avi_Version, Avi_Tkgs_Version, Env
 from model.run_config import RunConfig
 from model.status import HealthEnum, Info, State
 from util.avi_api_helper import AviApiSpec, ra_avi_download, isAviHaEnabled, \
-    deployAndConfigureAvi, form_avi_ha_cluster, manage_avi_certificates
+    bring_up_avi_controllers, deployAndConfigureAvi, form_avi_ha_cluster, manage_avi_certificates, \
+    wait_for_avi_ha_cluster
 from util.cmd_helper import CmdHelper, timer
 from util.file_helper import FileHelper
 from util.logger_helper import LoggerHelper, log
@@ -26,16 +28,22 @@ from util.common_utils import checkenv, createResourceFolderAndWait, envCheck
 from util.vcenter_operations import create_folder, createResourcePool
 from util.tkg_util import TkgUtil
 from workflows.ra_nsxt_workflow import RaNSXTWorkflow
+from util.tracing import trace_methods
+from util.workflow_context import WorkflowContext
+from util.checkpoint import fingerprint
+from model.spec_store import decode_secret
 
 logger = LoggerHelper.get_logger(name='alb_workflow')
 
 
+@trace_methods()
 class RALBWorkflow:
     def __init__(self, run_config: RunConfig) -> None:
         self.run_config = run_config
         self.version = None
         self.jsonpath = None
-        self.tkg_util_obj = TkgUtil(run_config=self.run_config)
+        self.context = WorkflowContext.of(self.run_config)
+        self.tkg_util_obj = self.context.tkg_util()
         self.tkg_version_dict = self.tkg_util_obj.get_desired_state_tkg_version()
         if "tkgs" in self.tkg_version_dict:
             self.jsonpath = os.path.join(self.run_config.root_dir, Paths.TKGS_WCP_MASTER_SPEC_PATH)
@@ -44,10 +52,9 @@ class RALBWorkflow:
         else:
             raise Exception(f"Could not find supported TKG version: {self.tkg_version_dict}")
 
-        with open(self.jsonpath) as f:
-            self.jsonspec = json.load(f)
+        self.jsonspec = self.context.jsonspec(self.jsonpath)
 
-        check_env_output = checkenv(self.jsonspec)
+        check_env_output = self.context.check_vcenter(self.jsonspec)
         if check_env_output is None:
             msg = "Failed to connect to VC. Possible connection to VC is not available or " \
                   "incorrect spec provided."
@@ -55,7 +62,7 @@ class RALBWorkflow:
         self.isEnvTkgs_wcp = TkgUtil.isEnvTkgs_wcp(self.jsonspec)
         self.isEnvTkgs_ns = TkgUtil.isEnvTkgs_ns(self.jsonspec)
         self.get_vcenter_details()
-        self.env = envCheck(self.run_config)
+        self.env = self.context.env()
         if self.env[1] != 200:
             logger.error("Wrong env provided " + self.env[0])
             d = {
@@ -74,7 +81,7 @@ class RALBWorkflow:
         self.vcenter_dict = {}
         try:
             self.vcenter_dict.update({'vcenter_ip': self.jsonspec['envSpec']['vcenterDetails']['vcenterAddress'],
-                                      'vcenter_password': CmdHelper.decode_base64(
+                                      'vcenter_password': decode_secret(
                                           self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoPasswordBase64']),
                                       'vcenter_username': self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoUser'],
                                       'vcenter_cluster_name': self.jsonspec['envSpec']['vcenterDetails']['vcenterCluster'],
@@ -88,7 +95,7 @@ class RALBWorkflow:
     @log("Setting up AVI Certificate")
     def aviCertManagement_vsphere(self):
         vcpass_base64 = self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoPasswordBase64']
-        password = CmdHelper.decode_base64(vcpass_base64)
+        password = decode_secret(vcpass_base64)
         vcenter_username = self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoUser']
         vcenter_ip = self.jsonspec['envSpec']['vcenterDetails']['vcenterAddress']
         if self.isEnvTkgs_wcp:
@@ -279,7 +286,7 @@ class RALBWorkflow:
             #rp_pool = dcname + "/host/" + clustername + "/Resources/" + parent_resourcepool
             foldername = "TEKTON"
             vcpass_base64 = self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoPasswordBase64']
-            password = CmdHelper.decode_base64(vcpass_base64)
+            password = decode_secret(vcpass_base64)
             vcenter_username = self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoUser']
             vcenter_ip = self.jsonspec['envSpec']['vcenterDetails']['vcenterAddress']
             create_folder(vcenter_ip, vcenter_username, password, dcname, foldername)
@@ -292,18 +299,34 @@ class RALBWorkflow:
             raise ValueError('Failed to deploy and configure avi.')
         avi_version = Avi_Tkgs_Version.VSPHERE_AVI_VERSION if TkgUtil.isEnvTkgs_wcp(self.jsonspec) else Avi_Version.VSPHERE_AVI_VERSION
         govc_client = GovcClient(self.jsonspec, LocalCmdHelper())
-        dep = deployAndConfigureAvi(govc_client=govc_client, vm_name=controller_name,
-                                    controller_ova_location=controller_location,
-                                    deploy_options=options,
-                                    performOtherTask=True,
-                                    avi_version=avi_version,
-                                    jsonspec=self.jsonspec)
-        if not dep:
-            logger.error(
-                "Failed to deploy and configure avi " + str(dep))
-
-            raise ValueError('Failed to deploy and configure avi.')
+        checkpoints = self.context.checkpoints("avi")
         if isAviHaEnabled(ha_field):
+            pending = {name: deploy_options for step, name, deploy_options in
+                       [("controller-01", controller_name, options), ("controller-02", controller_name2, options2),
+                        ("controller-03", controller_name3, options3)]
+                       if not checkpoints.done(step, fingerprint(name, avi_version),
+                                               exists=partial(govc_client.find_vms_by_name, name))}
+            if pending:
+                logger.info("Bringing up avi controllers " + ", ".join(pending))
+                if bring_up_avi_controllers(govc_client, pending, controller_location, self.jsonspec) is None:
+                    raise ValueError('Failed to deploy and configure avi.')
+        if not checkpoints.done("controller-01", fingerprint(controller_name, avi_version),
+                                exists=partial(govc_client.find_vms_by_name, controller_name)):
+            dep = deployAndConfigureAvi(govc_client=govc_client, vm_name=controller_name,
+                                        controller_ova_location=controller_location,
+                                        deploy_options=options,
+                                        performOtherTask=True,
+                                        avi_version=avi_version,
+                                        jsonspec=self.jsonspec)
+            if not dep:
+                logger.error(
+                    "Failed to deploy and configure avi " + str(dep))
+
+                raise ValueError('Failed to deploy and configure avi.')
+            checkpoints.mark("controller-01", fingerprint(controller_name, avi_version))
+        if isAviHaEnabled(ha_field) and \
+                not checkpoints.done("controller-02", fingerprint(controller_name2, avi_version),
+                                     exists=partial(govc_client.find_vms_by_name, controller_name2)):
             logger.info("Deploying 2nd avi controller")
             dep2 = deployAndConfigureAvi(govc_client=govc_client, vm_name=controller_name2,
                                          controller_ova_location=controller_location,
@@ -321,6 +344,10 @@ class RALBWorkflow:
                     "ERROR_CODE": 500
                 }
                 raise ValueError('Failed to deploy and configure avi.')
+            checkpoints.mark("controller-02", fingerprint(controller_name2, avi_version))
+        if isAviHaEnabled(ha_field) and \
+                not checkpoints.done("controller-03", fingerprint(controller_name3, avi_version),
+                                     exists=partial(govc_client.find_vms_by_name, controller_name3)):
             logger.info("Deploying 3rd avi controller")
             dep3 = deployAndConfigureAvi(govc_client=govc_client, vm_name=controller_name3,
                                          controller_ova_location=controller_location,
@@ -331,18 +358,32 @@ class RALBWorkflow:
             if not dep3:
                 logger.error("Failed to deploy and configure avi 2nd controller")
                 raise ValueError('Failed to deploy and configure avi.')
-            res, status = form_avi_ha_cluster(ip, self.jsonspec, avi_version)
+            checkpoints.mark("controller-03", fingerprint(controller_name3, avi_version))
+        ha_pending = False
+        if isAviHaEnabled(ha_field):
+            ha_key = fingerprint(controller_name, controller_name2, controller_name3, avi_version)
+            all_active = partial(wait_for_avi_ha_cluster, ip, self.jsonspec, avi_version, timeout=0)
+            if not checkpoints.done("ha-cluster", ha_key, exists=lambda: all_active()[0] is not None):
+                res, status = form_avi_ha_cluster(ip, self.jsonspec, avi_version, quorum=True)
+                if res is None:
+                    logger.error("Failed to form avi ha cluster " + str(status))
+                    raise ValueError('Failed to deploy and configure avi.')
+                ha_pending = True
+        avi_cert = self.aviCertManagement_vsphere()
+        if ha_pending:
+            # formed with quorum only, the last node joins while the certificate is set up
+            res, status = wait_for_avi_ha_cluster(ip, self.jsonspec, avi_version)
             if res is None:
-                logger.error("Failed to form avi ha cluster ")
+                logger.error("Avi ha cluster did not become fully active " + str(status))
                 raise ValueError('Failed to deploy and configure avi.')
-        avi_cert = self.aviCertManagement_vsphere()
+            checkpoints.mark("ha-cluster", ha_key)
         return True
 
     @log("Setting up VCF preconfig")
     def avi_vcf_pre_config(self):
         if self.env == Env.VCF:
             try:
-                configureNsxt = RaNSXTWorkflow(self.run_config).configure_avi_nsxt_config()
+                configureNsxt = self.context.workflow(RaNSXTWorkflow).configure_avi_nsxt_config()
                 return configureNsxt[0], configureNsxt[1]
             except Exception as e:
                 logger.error("Failed to configure vcf " + str(e))
@@ -3,6 +3,7 @@
 #  Copyright 2021 VMware, Inc
 #  SPDX-License-Identifier: BSD-2-Clause
 
+import functools
 import os
 from pathlib import Path
 import time
@@ -16,21 +17,26 @@ from util.extensions_helper import checkTanzuExtensionEnabled, check_fluent_bit_
     check_fluent_bit_kafka_endpoint_endpoint_enabled, check_fluent_bit_syslog_endpoint_enabled, \
     check_fluent_bit_elastic_search_endpoint_enabled, check_fluent_bit_http_endpoint_enabled, checkPromethusEnabled
     
-from constants.constants import Tkg_Extention_names, Paths 
+from constants.constants import Tkg_Extention_names, Paths, AppName
 from util.common_utils import checkenv
 from util.tkg_util import TkgUtil
 from util.cmd_runner import RunCmd
+from util.tracing import trace_methods
+from util.workflow_context import WorkflowContext
+from util.extension_scheduler import ExtensionScheduler
 
 logger = LoggerHelper.get_logger(name='ra_deploy_ext_workflow.py')
 
 
+@trace_methods()
 class RaDeployExtWorkflow:
 
     def __init__(self, run_config: RunConfig) -> None:
         self.run_config = run_config
         self.version = None
         self.jsonpath = None
-        self.tkg_util_obj = TkgUtil(run_config=self.run_config)
+        self.context = WorkflowContext.of(self.run_config)
+        self.tkg_util_obj = self.context.tkg_util()
         self.tkg_version_dict = self.tkg_util_obj.get_desired_state_tkg_version()
         self.desired_state_tkg_version = None
         if "tkgs" in self.tkg_version_dict:
@@ -41,10 +47,9 @@ class RaDeployExtWorkflow:
             self.desired_state_tkg_version = self.tkg_version_dict["tkgm"]
         else:
             raise Exception(f"Could not find supported TKG version: {self.tkg_version_dict}")
-        with open(self.jsonpath) as f:
-            self.jsonspec = json.load(f)
+        self.jsonspec = self.context.jsonspec(self.jsonpath)
 
-        check_env_output = checkenv(self.jsonspec)
+        check_env_output = self.context.check_vcenter(self.jsonspec)
         if check_env_output is None:
             msg = "Failed to connect to VC. Possible connection to VC is not available or " \
                   "incorrect spec provided."
@@ -121,23 +126,7 @@ class RaDeployExtWorkflow:
                     }
                     return json.dumps(d), 500
 
-                if Tkg_version.TKG_VERSION == "1.5":
-                    for extn in logginglistOfExtention:
-                        status = self.extension_obj.deploy(extn)
-                        if status[1] == 200:
-                            logger.info("Successfully deployed " + str(logginglistOfExtention))
-                        elif status[1] == 299:
-                            logger.info(extn + " is not deployed, but is enabled in deployment json file...hence skipping upgrade")
-                        else:
-                            logger.info("Failed to deploy extension " + str(status[0]))
-                            d = {
-                                "responseType": "ERROR",
-                                "msg": "Failed to deploy extension " + str(status[0]),
-                                "ERROR_CODE": 500
-                            }
-                            return json.dumps(d), 500
-                    
-                else:
+                if Tkg_version.TKG_VERSION != "1.5":
                     logger.info("Unsupported TKG version")
                     d = {
                         "responseType": "ERROR",
@@ -145,46 +134,29 @@ class RaDeployExtWorkflow:
                         "ERROR_CODE": 500
                     }
                     return json.dumps(d), 500
-               
-                monitoringListOfExtention = []
+
+                # the installers switch the current-context across the listed clusters, one at a time
+                scheduler = ExtensionScheduler(str(self.jsonspec['tanzuExtensions']['tkgClustersName']).strip(),
+                                               serial=True)
+                for extn in logginglistOfExtention:
+                    scheduler.add(AppName.FLUENT_BIT, functools.partial(self.extension_obj.deploy, extn))
                 if checkPromethusEnabled(self.jsonspec):
-                    monitoringListOfExtention.append(Tkg_Extention_names.PROMETHEUS)
-                    monitoringListOfExtention.append(Tkg_Extention_names.GRAFANA)
-                if len(monitoringListOfExtention) == 0:
-                    logger.info("No monitoring extension to deploy")
+                    # the prometheus deployment installs cert-manager and contour, grafana relies on them
+                    scheduler.add(AppName.PROMETHUS,
+                                  functools.partial(self.extension_obj.deploy, Tkg_Extention_names.PROMETHEUS))
+                    scheduler.add(AppName.GRAFANA,
+                                  functools.partial(self.extension_obj.deploy, Tkg_Extention_names.GRAFANA),
+                                  after=[AppName.PROMETHUS])
+                if not scheduler.installs:
+                    logger.info("No extension to deploy")
                     d = {
                         "responseType": "SUCCESS",
                         "msg": "No extension to deploy ",
                         "ERROR_CODE": 200
                     }
                     return json.dumps(d), 200
-                if Tkg_version.TKG_VERSION == "1.5":
-                    for extn in monitoringListOfExtention:
-                        status = self.extension_obj.deploy(extn)
+                return scheduler.run()
 
-                        if status[1] == 200:
-                            logger.info("Successfully deployed " + str(monitoringListOfExtention))
-                        elif status[1] == 299:
-                            logger.info(extn + " is not deployed, but is enabled in deployment json file...hence skipping upgrade")
-                        else:
-                            logger.info("Failed to deploy extension "+str(status[0]))
-                            d = {
-                                "responseType": "ERROR",
-                                "msg": "Failed to deploy extension "+str(status[0]),
-                                "ERROR_CODE": 500
-                            }
-                            return json.dumps(d), 500
-                    
-                else:
-                    logger.info("Unsupported TKG version")
-                    d = {
-                        "responseType": "ERROR",
-                        "msg": "Unsupported TKG version",
-                        "ERROR_CODE": 500
-                    }
-                    return json.dumps(d), 500
-                    
-                
         except Exception as e:
             logger.error("Failed to deploy the extensions " + str(e))
             d = {
@@ -24,7 +24,9 @@ from util.file_helper import FileHelper
 from util.git_helper import Git
 from util.govc_helper import get_alb_ip_address
 from util.logger_helper import LoggerHelper, log
-from util.avi_api_helper import isAviHaEnabled, obtain_second_csrf, obtain_avi_version
+from util.avi_api_helper import isAviHaEnabled, obtain_session_csrf, obtain_avi_version, avi_request, \
+    iter_avi_collection, find_avi_object, avi_object_uuid
+from util.avi_registry import AviRegistry, CLOUD, IPAM
 from util.ssh_helper import SshHelper
 from util.ssl_helper import get_base64_cert
 from util.tanzu_utils import TanzuUtils
@@ -32,31 +34,38 @@ from workflows.cluster_common_workflow import ClusterCommonWorkflow
 import subprocess
 import shutil
 import traceback
-from util.common_utils import downloadAndPushKubernetesOvaMarketPlace, \
+from util.common_utils import downloadAndPushKubernetesOvaMarketPlace, isKubernetesOvaTemplatePresent, \
     getCloudStatus, seperateNetmaskAndIp, getSECloudStatus, getSeNewBody, getVrfAndNextRoutId, \
-    addStaticRoute, getVipNetworkIpNetMask, getClusterStatusOnTanzu, runSsh, checkenv, \
-    switchToManagementContext, getClusterID, getPolicyID, envCheck, \
+    addStaticRoute, getVipNetworkIpNetMask, getClusterStatusOnTanzu, runSsh, \
+    switchToManagementContext, getClusterID, getPolicyID, \
     convertStringToCommaSeperated, cidr_to_netmask, getCountOfIpAdress, getLibraryId, getAviCertificate, \
     checkTmcEnabled, createSubscribedLibrary, checkAndWaitForAllTheServiceEngineIsUp, configureKubectl, registerTMCTKGs
 from util.replace_value import generateVsphereConfiguredSubnets, replaceValueSysConfig, \
     generateVsphereConfiguredSubnetsForSe
 from util.vcenter_operations import createResourcePool, create_folder, getDvPortGroupId, checkforIpAddress, getSi
+from util.vcenter_session import VcenterRestSession, vcenter_request
+from util.workflow_context import WorkflowContext
+from util.checkpoint import fingerprint
 from util.ShellHelper import runProcess, runShellCommandAndReturnOutputAsList, verifyPodsAreRunning
 from util.oidc_helper import checkEnableIdentityManagement, checkPinnipedInstalled, checkPinnipedServiceStatus, \
     checkPinnipedDexServiceStatus, createRbacUsers
 from util.tkg_util import TkgUtil
-from util.cleanup_util import CleanUpUtil
+from util.wait_helper import wait_until
+from util.tracing import trace_methods
+from model.spec_store import decode_secret
 
 
 # logger = LoggerHelper.get_logger(Path(__file__).stem)
 logger = LoggerHelper.get_logger(name='ra_mgmt_cluster_workflow')
 
 
+@trace_methods()
 class RaMgmtClusterWorkflow:
     def __init__(self, run_config: RunConfig):
         self.run_config = run_config
         logger.info ("Current deployment state: %s", self.run_config.state)
-        self.tkg_util_obj = TkgUtil(run_config=self.run_config)
+        self.context = WorkflowContext.of(self.run_config)
+        self.tkg_util_obj = self.context.tkg_util()
         self.tkg_version_dict = self.tkg_util_obj.get_desired_state_tkg_version()
         if "tkgs" in self.tkg_version_dict:
             self.jsonpath = os.path.join(self.run_config.root_dir, Paths.TKGS_WCP_MASTER_SPEC_PATH)
@@ -65,11 +74,8 @@ class RaMgmtClusterWorkflow:
         else:
             raise Exception(f"Could not find supported TKG version: {self.tkg_version_dict}")
 
-        self.cleanup_obj = CleanUpUtil()
-
-        with open(self.jsonpath) as f:
-            self.jsonspec = json.load(f)
-        self.env = envCheck(self.run_config)
+        self.jsonspec = self.context.jsonspec(self.jsonpath)
+        self.env = self.context.env()
         if self.env[1] != 200:
             logger.error("Wrong env provided " + self.env[0])
             d = {
@@ -79,7 +85,7 @@ class RaMgmtClusterWorkflow:
             }
             return json.dumps(d), 500
         self.env = self.env[0]
-        check_env_output = checkenv(self.jsonspec)
+        check_env_output = self.context.check_vcenter(self.jsonspec)
         if check_env_output is None:
             msg = "Failed to connect to VC. Possible connection to VC is not available or " \
                   "incorrect spec provided."
@@ -88,6 +94,10 @@ class RaMgmtClusterWorkflow:
         self.isEnvTkgs_ns = TkgUtil.isEnvTkgs_ns(self.jsonspec)
         self.get_vcenter_details()
 
+    @property
+    def cleanup_obj(self):
+        return self.context.cleanup_util()
+
     def get_vcenter_details(self):
         """
         Method to get vCenter Details from JSON file
@@ -96,7 +106,7 @@ class RaMgmtClusterWorkflow:
         self.vcenter_dict = {}
         try:
             self.vcenter_dict.update({'vcenter_ip': self.jsonspec['envSpec']['vcenterDetails']['vcenterAddress'],
-                                      'vcenter_password': CmdHelper.decode_base64(
+                                      'vcenter_password': decode_secret(
                                           self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoPasswordBase64']),
                                       'vcenter_username': self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoUser'],
                                       'vcenter_cluster_name': self.jsonspec['envSpec']['vcenterDetails']['vcenterCluster'],
@@ -271,7 +281,7 @@ class RaMgmtClusterWorkflow:
         vsSpec = VsphereMasterSpec.parse_obj(json_dict)
         aviVersion = Avi_Tkgs_Version.VSPHERE_AVI_VERSION if TkgUtil.isEnvTkgs_wcp(self.jsonspec) else Avi_Version.VSPHERE_AVI_VERSION
         vcpass_base64 = self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoPasswordBase64']
-        password = CmdHelper.decode_base64(vcpass_base64)
+        password = decode_secret(vcpass_base64)
         vcenter_username = self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoUser']
         vcenter_ip = self.jsonspec['envSpec']['vcenterDetails']['vcenterAddress']
         cluster_name = self.jsonspec['envSpec']['vcenterDetails']['vcenterCluster']
@@ -327,7 +337,7 @@ class RaMgmtClusterWorkflow:
             avienc_pass = str(self.jsonspec['tkgsComponentSpec']['aviComponents']['aviPasswordBase64'])
         else:
             avienc_pass = str(self.jsonspec['tkgComponentSpec']['aviComponents']['aviPasswordBase64'])
-        csrf2 = obtain_second_csrf(ip, avienc_pass)
+        csrf2 = obtain_session_csrf(ip, avienc_pass)
         if csrf2 is None:
             logger.error("Failed to get csrf from new set password")
             d = {
@@ -441,18 +451,22 @@ class RaMgmtClusterWorkflow:
                 view_users = \
                 self.jsonspec['tkgComponentSpec']['tkgMgmtComponents']['tkgMgmtRbacUserRoleSpec'][
                     'viewUsers']
-                rbac_user_status = createRbacUsers(management_cluster, isMgmt=True, env=self.env, edit_users=edit_users,
-                                                cluster_admin_users=cluster_admin_users, admin_users=admin_users,
-                                                view_users=view_users)
-                if rbac_user_status[1] != 200:
-                    logger.error(rbac_user_status[0].json['msg'])
-                    d = {
-                        "responseType": "ERROR",
-                        "msg": rbac_user_status[0].json['msg'],
-                        "ERROR_CODE": 500
-                    }
-                    return json.dumps(d), 500
-                logger.info("Successfully created RBAC for all the provided users")
+                checkpoints = self.context.checkpoints("mgmt")
+                rbac_key = fingerprint(management_cluster, cluster_admin_users, admin_users, edit_users, view_users)
+                if not checkpoints.done("rbac", rbac_key):
+                    rbac_user_status = createRbacUsers(management_cluster, isMgmt=True, env=self.env, edit_users=edit_users,
+                                                    cluster_admin_users=cluster_admin_users, admin_users=admin_users,
+                                                    view_users=view_users)
+                    if rbac_user_status[1] != 200:
+                        logger.error(rbac_user_status[0].json['msg'])
+                        d = {
+                            "responseType": "ERROR",
+                            "msg": rbac_user_status[0].json['msg'],
+                            "ERROR_CODE": 500
+                        }
+                        return json.dumps(d), 500
+                    checkpoints.mark("rbac", rbac_key)
+                    logger.info("Successfully created RBAC for all the provided users")
 
             else:
                 logger.info("Identity Management is not enabled")
@@ -476,7 +490,7 @@ class RaMgmtClusterWorkflow:
         }
         url = "https://" + ip + "/api/cloud"
         body = {}
-        response_csrf = requests.request("GET", url, headers=headers, data=body, verify=False)
+        response_csrf = avi_request("GET", url, headers=headers, data=body, verify=False)
         if response_csrf.status_code != 200:
             return None, response_csrf.text
         uuid = None
@@ -487,32 +501,30 @@ class RaMgmtClusterWorkflow:
         if uuid is None:
             return None, "Failed", "Error"
         status_url = "https://" + ip + "/api/cloud/" + uuid + "/status"
-        count = 0
-        response_csrf = None
-        while count < 60:
-            response_csrf = requests.request("GET", status_url, headers=headers, data=body,
-                                             verify=False)
+        state = dict()
+
+        def _placement_ready():
+            response_csrf = avi_request("GET", status_url, headers=headers, data=body, verify=False)
             if response_csrf.status_code != 200:
-                return None, "Failed", "Error"
-            try:
-                logger.info(name + " cloud state " + response_csrf.json()["state"])
-                if response_csrf.json()["state"] == "CLOUD_STATE_PLACEMENT_READY":
-                    break
-            except:
-                pass
-            count = count + 1
-            time.sleep(10)
-            logger.info("Waited for " + str(count * 10) + "s retrying")
-        if response_csrf is None:
-            logger.info("Waited for " + str(count * 10) + "s default cloud status")
+                raise Exception(response_csrf.text)
+            state["value"] = response_csrf.json().get("state")
+            logger.info(name + " cloud state " + str(state["value"]))
+            return state["value"] == "CLOUD_STATE_PLACEMENT_READY"
+
+        try:
+            wait_until(_placement_ready, timeout=600, interval=5, max_interval=10,
+                       description=name + " cloud placement")
+        except Exception:
+            return None, "Failed", "Error"
+        if "value" not in state:
             return None, "Failed", "ERROR"
 
-        return "SUCCESS", "READY", response_csrf.json()["state"]
+        return "SUCCESS", "READY", state["value"]
 
     @log("Creating mgmt cloud")
     def createNewCloud(self, ip, csrf2, aviVersion):
         vcpass_base64 = self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoPasswordBase64']
-        password = CmdHelper.decode_base64(vcpass_base64)
+        password = decode_secret(vcpass_base64)
         vcenter_username = self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoUser']
         vcenter_ip = self.jsonspec['envSpec']['vcenterDetails']['vcenterAddress']
         data_center = self.jsonspec['envSpec']['vcenterDetails']['vcenterDatacenter']
@@ -550,28 +562,18 @@ class RaMgmtClusterWorkflow:
         }
         json_object = json.dumps(body, indent=4)
         url = "https://" + ip + "/api/cloud"
-        response_csrf = requests.request("POST", url, headers=headers, data=json_object,
-                                         verify=False)
+        response_csrf = avi_request("POST", url, headers=headers, data=json_object,
+                                    verify=False)
         if response_csrf.status_code != 201:
             return None, response_csrf.text
         else:
-            os.system("rm -rf newCloudInfo.json")
-            with open("./newCloudInfo.json", "w") as outfile:
-                json.dump(response_csrf.json(), outfile)
+            AviRegistry.record(ip, CLOUD, response_csrf.json())
             return response_csrf.json()["url"], "SUCCESS"
 
     @log("Fetching Network url")
     def getNetworkUrl(self, ip, csrf2, name, aviVersion, cloudName=None):
         cloudName = Cloud.CLOUD_NAME_VSPHERE if cloudName is None else cloudName
-        with open("./newCloudInfo.json", 'r') as file2:
-            new_cloud_json = json.load(file2)
-        uuid = None
-        try:
-            uuid = new_cloud_json["uuid"]
-        except:
-            for re in new_cloud_json["results"]:
-                if re["name"] == cloudName:
-                    uuid = re["uuid"]
+        uuid = avi_object_uuid(ip, csrf2, aviVersion, CLOUD, cloudName)
         if uuid is None:
             return None, "Failed", "ERROR"
         url = "https://" + ip + "/api/network-inventory/?cloud_ref.uuid=" + uuid
@@ -583,42 +585,20 @@ class RaMgmtClusterWorkflow:
             "x-avi-version": aviVersion,
             "x-csrftoken": csrf2[0]
         }
-        payload = {}
-        count = 0
-        response_csrf = None
         try:
-            while count < 60:
-                response_csrf = requests.request("GET", url, headers=headers, data=payload,
-                                                 verify=False)
-                if response_csrf.status_code == 200:
-                    if response_csrf.json()["count"] > 1:
-                        break
-                count = count + 1
-                time.sleep(10)
-                logger.info("Waited for " + str(count * 10) + "s retrying")
-            if response_csrf is None:
-                logger.info(
-                    "Waited for " + str(count * 10) + "s but service engine is not up")
-                return None, "Failed", "ERROR"
-            if response_csrf.status_code != 200:
-                return None, response_csrf.text
-            elif count >= 59:
+            # only the inventory count is needed to know discovery is done
+            def _discovered():
+                response_csrf = avi_request("GET", url, headers=headers, params={"page_size": 1},
+                                            verify=False)
+                return response_csrf.status_code == 200 and response_csrf.json()["count"] > 1
+
+            if not wait_until(_discovered, timeout=600, interval=5, max_interval=10,
+                              description="AVI network discovery", ignore_errors=True):
                 return None, "NOT_FOUND", "TIME_OUT"
-            else:
-                for se in response_csrf.json()["results"]:
-                    if se["config"]["name"] == name:
-                        return se["config"]["url"], se["config"]["uuid"], "FOUND", "SUCCESS"
-                else:
-                    next_url = None if not response_csrf.json()["next"] else response_csrf.json()[
-                        "next"]
-                    while len(next_url) > 0:
-                        response_csrf = requests.request("GET", next_url, headers=headers,
-                                                         data=payload, verify=False)
-                        for se in response_csrf.json()["results"]:
-                            if se["config"]["name"] == name:
-                                return se["config"]["url"], se["config"]["uuid"], "FOUND", "SUCCESS"
-                        next_url = None if not response_csrf.json()["next"] else \
-                            response_csrf.json()["next"]
+            network = find_avi_object("https://" + ip + "/api/network", headers, name,
+                                      fields=["name", "url", "uuid"], **{"cloud_ref.uuid": uuid})
+            if network is not None:
+                return network["url"], network["uuid"], "FOUND", "SUCCESS"
             return None, "NOT_FOUND", "Failed"
         except KeyError:
             return None, "NOT_FOUND", "Failed"
@@ -636,7 +616,7 @@ class RaMgmtClusterWorkflow:
             "x-csrftoken": csrf2[0]
         }
         payload = {}
-        response_csrf = requests.request("GET", url, headers=headers, data=payload, verify=False)
+        response_csrf = avi_request("GET", url, headers=headers, data=payload, verify=False)
         details = {}
         if response_csrf.status_code != 200:
             details["error"] = response_csrf.text
@@ -650,21 +630,21 @@ class RaMgmtClusterWorkflow:
         except Exception as e:
             logger.info("Ip pools are not configured.")
 
-        os.system("rm -rf managementNetworkDetails.json")
-        with open("./managementNetworkDetails.json", "w") as outfile:
-            json.dump(response_csrf.json(), outfile)
+        network_details = AviRegistry.set_payload("managementNetworkDetails.json", response_csrf.json())
         if isSeRequired:
-            generateVsphereConfiguredSubnetsForSe("managementNetworkDetails.json", startIp, endIp, prefixIp,
+            generateVsphereConfiguredSubnetsForSe(network_details, startIp, endIp, prefixIp,
                                                   int(netmask))
         else:
-            generateVsphereConfiguredSubnets("managementNetworkDetails.json", startIp, endIp, prefixIp,
+            generateVsphereConfiguredSubnets(network_details, startIp, endIp, prefixIp,
                                              int(netmask))
         return "SUCCESS", 200, details
 
     @log("Updating Network with IP Pools")
     def updateNetworkWithIpPools(self, ip, csrf2, managementNetworkUrl, fileName, aviVersion):
-        with open(fileName, 'r') as openfile:
-            json_object = json.load(openfile)
+        """
+        :param fileName: name of the AviRegistry payload prepared by getNetworkDetails or getNetworkDetailsVip
+        """
+        json_object = AviRegistry.payload(fileName)
         json_object_m = json.dumps(json_object, indent=4)
         url = managementNetworkUrl
         headers = {
@@ -676,16 +656,16 @@ class RaMgmtClusterWorkflow:
             "x-csrftoken": csrf2[0]
         }
         details = {}
-        response_csrf = requests.request("PUT", url, headers=headers, data=json_object_m,
-                                         verify=False)
+        response_csrf = avi_request("PUT", url, headers=headers, data=json_object_m,
+                                    verify=False)
         if response_csrf.status_code != 200:
             count = 0
             if response_csrf.text.__contains__(
                     "Cannot edit network properties till network sync from Service Engines is complete"):
                 while count < 10:
                     time.sleep(60)
-                    response_csrf = requests.request("PUT", url, headers=headers,
-                                                     data=json_object_m, verify=False)
+                    response_csrf = avi_request("PUT", url, headers=headers,
+                                                data=json_object_m, verify=False)
                     if response_csrf.status_code == 200:
                         break
                     logger.info("waited for " + str(count * 60) + "s sync to complete")
@@ -711,25 +691,21 @@ class RaMgmtClusterWorkflow:
         }
         payload = {}
         url = newCloudUrl
-        response_csrf = requests.request("GET", url, headers=headers, data=payload, verify=False)
+        response_csrf = avi_request("GET", url, headers=headers, data=payload, verify=False)
         if response_csrf.status_code != 200:
             return None, response_csrf.text
         else:
-            json_object = json.dumps(response_csrf.json(), indent=4)
-            os.system("rm -rf detailsOfNewCloud.json")
-            with open("./detailsOfNewCloud.json", "w") as outfile:
-                outfile.write(json_object)
-            replaceValueSysConfig("detailsOfNewCloud.json", "vcenter_configuration",
+            new_cloud = AviRegistry.set_payload("detailsOfNewCloud.json", response_csrf.json())
+            replaceValueSysConfig(new_cloud, "vcenter_configuration",
                                   "management_network", vim_ref)
             ip_val = dict(ip_addr=dict(addr=captured_ip, type="V4"), mask=captured_mask)
-            replaceValueSysConfig("detailsOfNewCloud.json", "vcenter_configuration",
+            replaceValueSysConfig(new_cloud, "vcenter_configuration",
                                   "management_ip_subnet", ip_val)
             return response_csrf.json(), "SUCCESS"
 
     @log("Updating new cloud details...")
     def updateNewCloud(self, ip, csrf2, newCloudUrl, aviVersion):
-        with open("./detailsOfNewCloud.json", 'r') as file2:
-            new_cloud_json = json.load(file2)
+        new_cloud_json = AviRegistry.payload("detailsOfNewCloud.json")
         json_object = json.dumps(new_cloud_json, indent=4)
         headers = {
             "Accept": "application/json",
@@ -739,8 +715,8 @@ class RaMgmtClusterWorkflow:
             "x-avi-version": aviVersion,
             "x-csrftoken": csrf2[0]
         }
-        response_csrf = requests.request("PUT", newCloudUrl, headers=headers, data=json_object,
-                                         verify=False)
+        response_csrf = avi_request("PUT", newCloudUrl, headers=headers, data=json_object,
+                                    verify=False)
         if response_csrf.status_code != 200:
             return None, response_csrf.text
         else:
@@ -759,7 +735,7 @@ class RaMgmtClusterWorkflow:
             "x-csrftoken": csrf2[0]
         }
         payload = {}
-        response_csrf = requests.request("GET", url, headers=headers, data=payload, verify=False)
+        response_csrf = avi_request("GET", url, headers=headers, data=payload, verify=False)
         details = {}
         if response_csrf.status_code != 200:
             details["error"] = response_csrf.text
@@ -773,10 +749,8 @@ class RaMgmtClusterWorkflow:
         except Exception as e:
             logger.info("Ip pools are not configured.")
 
-        os.system("rm -rf vipNetworkDetails.json")
-        with open("./vipNetworkDetails.json", "w") as outfile:
-            json.dump(response_csrf.json(), outfile)
-        generateVsphereConfiguredSubnets("vipNetworkDetails.json", startIp, endIp, prefixIp,
+        vip_details = AviRegistry.set_payload("vipNetworkDetails.json", response_csrf.json())
+        generateVsphereConfiguredSubnets(vip_details, startIp, endIp, prefixIp,
                                          int(netmask))
         return "SUCCESS", 200, details
 
@@ -842,18 +816,15 @@ class RaMgmtClusterWorkflow:
             "x-avi-version": aviVersion,
             "x-csrftoken": csrf2[0]
         }
-        body = {}
         url = "https://" + ip + "/api/ipamdnsproviderprofile"
-        response_csrf = requests.request("GET", url, headers=headers, data=body, verify=False)
-        if response_csrf.status_code != 200:
-            return None, response_csrf.text
-        else:
-            json_object = json.dumps(response_csrf.json(), indent=4)
-            with open("./ipam_details.json", "w") as outfile:
-                outfile.write(json_object)
-            for re in response_csrf.json()["results"]:
-                if re['name'] == name:
-                    return re["url"], "SUCCESS"
+        try:
+            ipams = list(iter_avi_collection(url, headers, name=name))
+        except Exception as e:
+            return None, str(e)
+        AviRegistry.record(ip, IPAM, dict(count=len(ipams), results=ipams))
+        for re in ipams:
+            if re['name'] == name:
+                return re["url"], "SUCCESS"
         return "NOT_FOUND", "SUCCESS"
 
     @log("Creating IPAM...")
@@ -922,8 +893,8 @@ class RaMgmtClusterWorkflow:
             }
         json_object = json.dumps(body, indent=4)
         url = "https://" + ip + "/api/ipamdnsproviderprofile"
-        response_csrf = requests.request("POST", url, headers=headers, data=json_object,
-                                         verify=False)
+        response_csrf = avi_request("POST", url, headers=headers, data=json_object,
+                                    verify=False)
         if response_csrf.status_code != 201:
             return None, response_csrf.text
         else:
@@ -941,25 +912,17 @@ class RaMgmtClusterWorkflow:
         }
         payload = {}
         url = newCloudUrl
-        response_csrf = requests.request("GET", url, headers=headers, data=payload, verify=False)
+        response_csrf = avi_request("GET", url, headers=headers, data=payload, verify=False)
         if response_csrf.status_code != 200:
             return None, response_csrf.text
         else:
-            json_object = json.dumps(response_csrf.json(), indent=4)
-            os.system("rm -rf detailsOfNewCloudIpam.json")
-            with open("./detailsOfNewCloudIpam.json", "w") as outfile:
-                outfile.write(json_object)
-            with open("detailsOfNewCloudIpam.json") as f:
-                data = json.load(f)
+            data = AviRegistry.set_payload("detailsOfNewCloudIpam.json", response_csrf.json())
             data["ipam_provider_ref"] = ipamUrl
-            with open("detailsOfNewCloudIpam.json", 'w') as f:
-                json.dump(data, f)
             return response_csrf.json(), "SUCCESS"
 
     @log("Updating IPAM...")
     def updateIpam(self, ip, csrf2, newCloudUrl, aviVersion):
-        with open("./detailsOfNewCloudIpam.json", 'r') as file2:
-            new_cloud_json = json.load(file2)
+        new_cloud_json = AviRegistry.payload("detailsOfNewCloudIpam.json")
         json_object = json.dumps(new_cloud_json, indent=4)
         headers = {
             "Accept": "application/json",
@@ -969,8 +932,8 @@ class RaMgmtClusterWorkflow:
             "x-avi-version": aviVersion,
             "x-csrftoken": csrf2[0]
         }
-        response_csrf = requests.request("PUT", newCloudUrl, headers=headers, data=json_object,
-                                         verify=False)
+        response_csrf = avi_request("PUT", newCloudUrl, headers=headers, data=json_object,
+                                    verify=False)
         if response_csrf.status_code != 200:
             return None, response_csrf.text
         else:
@@ -987,16 +950,13 @@ class RaMgmtClusterWorkflow:
             "x-csrftoken": csrf2[0]
         }
         url = "https://" + ip + "/api/vimgrclusterruntime"
-        payload = {}
-        response_csrf = requests.request("GET", url, headers=headers, data=payload, verify=False)
-        if response_csrf.status_code != 200:
-            return None, response_csrf.text
-        else:
-            for cluster in response_csrf.json()["results"]:
-                if cluster["name"] == cluster_name:
-                    return cluster["url"], "SUCCESS"
-
-            return "NOT_FOUND", "FAILED"
+        try:
+            cluster = find_avi_object(url, headers, cluster_name, fields=["name", "url"])
+        except Exception as e:
+            return None, str(e)
+        if cluster is not None:
+            return cluster["url"], "SUCCESS"
+        return "NOT_FOUND", "FAILED"
 
     @log("Creating Service Engine for cloud")
     def createSECloud(self, ip, csrf2, newCloudUrl, seGroupName, clusterUrl, dataStore, aviVersion):
@@ -1195,8 +1155,8 @@ class RaMgmtClusterWorkflow:
         }
         json_object = getSeNewBody(newCloudUrl, seGroupName, clusterUrl, dataStore)
         url = "https://" + ip + "/api/serviceenginegroup"
-        response_csrf = requests.request("POST", url, headers=headers, data=json_object,
-                                         verify=False)
+        response_csrf = avi_request("POST", url, headers=headers, data=json_object,
+                                    verify=False)
         if response_csrf.status_code != 201:
             return None, response_csrf.text
         else:
@@ -1214,13 +1174,11 @@ class RaMgmtClusterWorkflow:
             "x-csrftoken": csrf2[0]
         }
         payload = {}
-        response_csrf = requests.request("GET", url, headers=headers, data=payload, verify=False)
+        response_csrf = avi_request("GET", url, headers=headers, data=payload, verify=False)
         if response_csrf.status_code != 200:
             return None, "Failed"
-        os.system("rm -rf managementNetworkDetailsDhcp.json")
-        with open("./managementNetworkDetailsDhcp.json", "w") as outfile:
-            json.dump(response_csrf.json(), outfile)
-        replaceValueSysConfig("managementNetworkDetailsDhcp.json", "dhcp_enabled", "name", "true")
+        network_details = AviRegistry.set_payload("managementNetworkDetailsDhcp.json", response_csrf.json())
+        replaceValueSysConfig(network_details, "dhcp_enabled", "name", "true")
         return "SUCCESS", 200
 
     @log("Enabling DHCP for Shared network")
@@ -1235,13 +1193,11 @@ class RaMgmtClusterWorkflow:
             "x-csrftoken": csrf2[0]
         }
         payload = {}
-        response_csrf = requests.request("GET", url, headers=headers, data=payload, verify=False)
+        response_csrf = avi_request("GET", url, headers=headers, data=payload, verify=False)
         if response_csrf.status_code != 200:
             return None, "Failed"
-        os.system("rm -rf sharedNetworkDetailsDhcp.json")
-        with open("./sharedNetworkDetailsDhcp.json", "w") as outfile:
-            json.dump(response_csrf.json(), outfile)
-        replaceValueSysConfig("sharedNetworkDetailsDhcp.json", "dhcp_enabled", "name", "true")
+        network_details = AviRegistry.set_payload("sharedNetworkDetailsDhcp.json", response_csrf.json())
+        replaceValueSysConfig(network_details, "dhcp_enabled", "name", "true")
         return "SUCCESS", 200
 
 
@@ -1265,8 +1221,7 @@ class RaMgmtClusterWorkflow:
                 "ERROR_CODE": 500
             }
             return json.dumps(d), 500
-        with open('./managementNetworkDetailsDhcp.json', 'r') as openfile:
-            json_object = json.load(openfile)
+        json_object = AviRegistry.payload("managementNetworkDetailsDhcp.json")
         json_object_m = json.dumps(json_object, indent=4)
         headers = {
             "Accept": "application/json",
@@ -1276,8 +1231,8 @@ class RaMgmtClusterWorkflow:
             "x-avi-version": aviVersion,
             "x-csrftoken": csrf2[0]
         }
-        response_csrf = requests.request("PUT", getNetwork[0], headers=headers, data=json_object_m,
-                                         verify=False)
+        response_csrf = avi_request("PUT", getNetwork[0], headers=headers, data=json_object_m,
+                                    verify=False)
         if response_csrf.status_code != 200:
             return None, response_csrf.text
         return "SUCCESS", 200
@@ -1302,8 +1257,7 @@ class RaMgmtClusterWorkflow:
                 "ERROR_CODE": 500
             }
             return json.dumps(d), 500
-        with open('./sharedNetworkDetailsDhcp.json', 'r') as openfile:
-            json_object = json.load(openfile)
+        json_object = AviRegistry.payload("sharedNetworkDetailsDhcp.json")
         json_object_m = json.dumps(json_object, indent=4)
         headers = {
             "Accept": "application/json",
@@ -1313,7 +1267,7 @@ class RaMgmtClusterWorkflow:
             "x-avi-version": aviVersion,
             "x-csrftoken": csrf2[0]
         }
-        response_csrf = requests.request("PUT", getNetwork[0], headers=headers, data=json_object_m, verify=False)
+        response_csrf = avi_request("PUT", getNetwork[0], headers=headers, data=json_object_m, verify=False)
         if response_csrf.status_code != 200:
             return None, response_csrf.text
         return "SUCCESS", 200
@@ -1330,7 +1284,7 @@ class RaMgmtClusterWorkflow:
         }
         body = {}
         url = AlbEndpoint.AVI_SERVICE_ENGINE.format(ip=ip, se_name=se_name, avi_cloud_uuid=avi_cloud_uuid)
-        response_csrf = requests.request("GET", url, headers=headers, data=body, verify=False)
+        response_csrf = avi_request("GET", url, headers=headers, data=body, verify=False)
         if response_csrf.status_code != 200:
             return None, response_csrf.text
         else:
@@ -1342,7 +1296,7 @@ class RaMgmtClusterWorkflow:
             type = VrfType.GLOBAL
             cloud_ref_ = cloud_ref[cloud_ref.rindex("/") + 1:]
             se_group_url = AlbEndpoint.AVI_SE_GROUP.format(ip=ip, cloud_ref=cloud_ref_, service_engine_uuid=se_uuid)
-            response = requests.request("GET", se_group_url, headers=headers, data=body, verify=False)
+            response = avi_request("GET", se_group_url, headers=headers, data=body, verify=False)
             if response.status_code != 200:
                 return None, response.text
             createVs = False
@@ -1357,7 +1311,7 @@ class RaMgmtClusterWorkflow:
             if createVs:
                 logger.info("Creating  virtual service")
                 vrf_get_url = "https://" + ip + "/api/vrfcontext/?name.in=" + type + "&cloud_ref.uuid=" + avi_cloud_uuid
-                response_csrf = requests.request("GET", vrf_get_url, headers=headers, data=body, verify=False)
+                response_csrf = avi_request("GET", vrf_get_url, headers=headers, data=body, verify=False)
                 if response_csrf.status_code != 200:
                     return None, response_csrf.text
                 vrf_url = ""
@@ -1385,7 +1339,7 @@ class RaMgmtClusterWorkflow:
                 else:
                     return None, "Vip Ip pools are not configured."
                 virtual_service_vip_url = AlbEndpoint.AVI_VIRTUAL_SERVICE_VIP.format(ip=ip)
-                response = requests.request("GET", virtual_service_vip_url, headers=headers, data=body, verify=False)
+                response = avi_request("GET", virtual_service_vip_url, headers=headers, data=body, verify=False)
                 if response.status_code != 200:
                     return None, response.text
                 isVipCreated = False
@@ -1403,14 +1357,14 @@ class RaMgmtClusterWorkflow:
                                                                 virtual_service_name_vip=ServiceName.SIVT_SERVICE_VIP,
                                                                 vrf_context_ref=vrf_url
                                                                 , network_ref=vip_network_url, addr=ip_pre, mask=mask)
-                    response = requests.request("POST", virtual_service_vip_url, headers=headers, data=body, verify=False)
+                    response = avi_request("POST", virtual_service_vip_url, headers=headers, data=body, verify=False)
                     if response.status_code != 201:
                         return None, response.text
                     vip_url = response.json()["url"]
                 if not vip_url:
                     return None, "virtual service vip url not found"
                 virtual_service_url = AlbEndpoint.AVI_VIRTUAL_SERVICE.format(ip=ip)
-                response = requests.request("GET", virtual_service_url, headers=headers, data=body, verify=False)
+                response = avi_request("GET", virtual_service_url, headers=headers, data=body, verify=False)
                 if response.status_code != 200:
                     return None, response.text
                 isVsCreated = False
@@ -1425,7 +1379,7 @@ class RaMgmtClusterWorkflow:
                     body = AlbPayload.VIRTUAL_SERVICE.format(cloud_ref=cloud_ref,
                                                             se_group_ref=service_engine_group_url
                                                             , vsvip_ref=vip_url)
-                    response = requests.request("POST", virtual_service_url, headers=headers, data=body, verify=False)
+                    response = avi_request("POST", virtual_service_url, headers=headers, data=body, verify=False)
                     if response.status_code != 201:
                         return None, response.text
                 body = {}
@@ -1436,7 +1390,7 @@ class RaMgmtClusterWorkflow:
                     if se_count == 2:
                         for i in range(1):
                             while counter_se < 60:
-                                response = requests.request("GET", se_group_url, headers=headers, data=body, verify=False)
+                                response = avi_request("GET", se_group_url, headers=headers, data=body, verify=False)
                                 if response.status_code != 200:
                                     return None, response.text
                                 config = response.json()["results"][0]
@@ -1453,14 +1407,14 @@ class RaMgmtClusterWorkflow:
                             if not initialized:
                                 return None, "Service engines not initialized  in 30m"
                             logger.info("Checking status of service engine " + str(seurl))
-                            response = requests.request("GET", seurl, headers=headers, data=body, verify=False)
+                            response = avi_request("GET", seurl, headers=headers, data=body, verify=False)
                             if response.status_code != 200:
                                 return None, response.text
                             isConnected = False
                             try:
                                 status = response.json()["se_connected"]
                                 while not status and counter < 60:
-                                    response = requests.request("GET", seurl, headers=headers, data=body, verify=False)
+                                    response = avi_request("GET", seurl, headers=headers, data=body, verify=False)
                                     if response.status_code != 200:
                                         return None, response.text
                                     status = response.json()["se_connected"]
@@ -1484,7 +1438,7 @@ class RaMgmtClusterWorkflow:
                         for i in range(2, 3):
                             seurl = config["serviceengines"][i]
                             logger.info("Checking status of service engine " + str(seurl))
-                            response = requests.request("GET", seurl, headers=headers, data=body, verify=False)
+                            response = avi_request("GET", seurl, headers=headers, data=body, verify=False)
                             if response.status_code != 200:
                                 return None, response.text
                             logger.info(response.json())
@@ -1492,7 +1446,7 @@ class RaMgmtClusterWorkflow:
                             try:
                                 status = response.json()["se_connected"]
                                 while not status and counter < 60:
-                                    response = requests.request("GET", seurl, headers=headers, data=body, verify=False)
+                                    response = avi_request("GET", seurl, headers=headers, data=body, verify=False)
                                     if response.status_code != 200:
                                         return None, response.text
                                     if status:
@@ -1511,7 +1465,7 @@ class RaMgmtClusterWorkflow:
                     return None, str(e)
                 try:
                     logger.info("Deleting Virtual service")
-                    response = requests.request("GET", virtual_service_vip_url, headers=headers, data=body, verify=False)
+                    response = avi_request("GET", virtual_service_vip_url, headers=headers, data=body, verify=False)
                     if response.status_code != 200:
                         return None, response.text
                     vip_url = ""
@@ -1524,7 +1478,7 @@ class RaMgmtClusterWorkflow:
                         logger.info("No virtual service vip created")
                     vs_url = ""
                     virtual_service_url = AlbEndpoint.AVI_VIRTUAL_SERVICE.format(ip=ip)
-                    response = requests.request("GET", virtual_service_url, headers=headers, data=body, verify=False)
+                    response = avi_request("GET", virtual_service_url, headers=headers, data=body, verify=False)
                     try:
                         for r in response.json()["results"]:
                             if r["name"] == ServiceName.SIVT_SERVICE:
@@ -1532,8 +1486,8 @@ class RaMgmtClusterWorkflow:
                                 break
                     except:
                         logger.info("No virtual service created")
-                    requests.request("DELETE", vs_url, headers=headers, data=body, verify=False)
-                    requests.request("DELETE", vip_url, headers=headers, data=body, verify=False)
+                    avi_request("DELETE", vs_url, headers=headers, data=body, verify=False)
+                    avi_request("DELETE", vip_url, headers=headers, data=body, verify=False)
                 except Exception as e:
                     pass
                 return "SUCCESS", "Required Service engines sucessfully  created"
@@ -1545,7 +1499,7 @@ class RaMgmtClusterWorkflow:
     def configCloud(self):
         aviVersion = Avi_Tkgs_Version.VSPHERE_AVI_VERSION if TkgUtil.isEnvTkgs_wcp(self.jsonspec) else Avi_Version.VSPHERE_AVI_VERSION
         vcpass_base64 = self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoPasswordBase64']
-        password = CmdHelper.decode_base64(vcpass_base64)
+        password = decode_secret(vcpass_base64)
         vcenter_username = self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoUser']
         vcenter_ip = self.jsonspec['envSpec']['vcenterDetails']['vcenterAddress']
         cluster_name = self.jsonspec['envSpec']['vcenterDetails']['vcenterCluster']
@@ -1553,20 +1507,26 @@ class RaMgmtClusterWorkflow:
         data_store = self.jsonspec['envSpec']['vcenterDetails']['vcenterDatastore']
         refToken = self.jsonspec['envSpec']['marketplaceSpec']['refreshToken']
         req = True
+        checkpoints = self.context.checkpoints("mgmt")
         if refToken and (self.env == Env.VSPHERE or self.env == Env.VCF):
             if not (self.isEnvTkgs_wcp or self.isEnvTkgs_ns):
                 kubernetes_ova_os = self.jsonspec["tkgComponentSpec"]["tkgMgmtComponents"]["tkgMgmtBaseOs"]
                 kubernetes_ova_version = KubernetesOva.KUBERNETES_OVA_LATEST_VERSION
-                logger.info("Kubernetes OVA configs for management cluster")
-                down_status = downloadAndPushKubernetesOvaMarketPlace(self.jsonspec, kubernetes_ova_version, kubernetes_ova_os)
-                if down_status[0] is None:
-                    logger.error(down_status[1])
-                    d = {
-                        "responseType": "ERROR",
-                        "msg": down_status[1],
-                        "ERROR_CODE": 500
-                    }
-                    return json.dumps(d), 500
+                ova_key = fingerprint(kubernetes_ova_os, kubernetes_ova_version)
+                if not checkpoints.done("kubernetes-ova", ova_key,
+                                        exists=lambda: isKubernetesOvaTemplatePresent(self.jsonspec, kubernetes_ova_version,
+                                                                                      kubernetes_ova_os)):
+                    logger.info("Kubernetes OVA configs for management cluster")
+                    down_status = downloadAndPushKubernetesOvaMarketPlace(self.jsonspec, kubernetes_ova_version, kubernetes_ova_os)
+                    if down_status[0] is None:
+                        logger.error(down_status[1])
+                        d = {
+                            "responseType": "ERROR",
+                            "msg": down_status[1],
+                            "ERROR_CODE": 500
+                        }
+                        return json.dumps(d), 500
+                    checkpoints.mark("kubernetes-ova", ova_key)
         else:
             logger.info("MarketPlace refresh token is not provided, "
                         "skipping the download of kubernetes ova")
@@ -1601,7 +1561,7 @@ class RaMgmtClusterWorkflow:
             avienc_pass = str(self.jsonspec['tkgsComponentSpec']['aviComponents']['aviPasswordBase64'])
         else:
             avienc_pass = str(self.jsonspec['tkgComponentSpec']['aviComponents']['aviPasswordBase64'])
-        csrf2 = obtain_second_csrf(ip, avienc_pass)
+        csrf2 = obtain_session_csrf(ip, avienc_pass)
         if csrf2 is None:
             logger.error("Failed to get csrf from new set password")
             d = {
@@ -1678,7 +1638,13 @@ class RaMgmtClusterWorkflow:
             else:
                 cloud_url = get_cloud[0]
                 isGen = True
-            if isGen:
+            # Every object the cloud configuration creates depends on these spec sections
+            cloud_key = fingerprint(self.jsonspec['tkgComponentSpec']['aviMgmtNetwork'],
+                                    self.jsonspec['tkgComponentSpec']['tkgClusterVipNetwork'],
+                                    self.jsonspec['tkgComponentSpec']['tkgMgmtComponents']['tkgMgmtNetworkName'],
+                                    self.jsonspec['tkgMgmtDataNetwork'],
+                                    self.jsonspec['envSpec']['vcenterDetails']['vcenterCluster'])
+            if isGen and (get_cloud[0] == "NOT_FOUND" or not checkpoints.done("avi-cloud", cloud_key)):
                 for i in tqdm(range(60), desc="Waiting…", ascii=False, ncols=75):
                     time.sleep(1)
                 mgmt_pg = self.jsonspec['tkgComponentSpec']['aviMgmtNetwork']['aviMgmtNetworkName']
@@ -1938,15 +1904,7 @@ class RaMgmtClusterWorkflow:
                             }
                         return json.dumps(d), 500
 
-                with open("./newCloudInfo.json", 'r') as file2:
-                    new_cloud_json = json.load(file2)
-                uuid = None
-                try:
-                    uuid = new_cloud_json["uuid"]
-                except:
-                    for re in new_cloud_json["results"]:
-                        if re["name"] == Cloud.CLOUD_NAME_VSPHERE:
-                            uuid = re["uuid"]
+                uuid = avi_object_uuid(ip, csrf2, aviVersion, CLOUD, Cloud.CLOUD_NAME_VSPHERE)
                 if uuid is None:
                     return None, "NOT_FOUND"
                 ipNetMask = seperateNetmaskAndIp(
@@ -2005,6 +1963,7 @@ class RaMgmtClusterWorkflow:
                         "ERROR_CODE": 500
                         }
                     return json.dumps(d), 500
+                checkpoints.mark("avi-cloud", cloud_key)
 
             logger.info("Configured management cluster cloud successfully")
             d = {
@@ -2030,19 +1989,15 @@ class RaMgmtClusterWorkflow:
                 "x-avi-version": aviVersion,
                 "x-csrftoken": csrf2[0]
             }
-            with open("./newCloudInfo.json", 'r') as file2:
-                new_cloud_json = json.load(file2)
+            default_cloud = AviRegistry.lookup(ip, CLOUD, Cloud.DEFAULT_CLOUD_NAME_VSPHERE) or dict()
             try:
-                for result in new_cloud_json['results']:
-                    if result['name'] == Cloud.DEFAULT_CLOUD_NAME_VSPHERE:
-                        vcenter_config = result["vcenter_configuration"]["vcenter_url"]
-                        break
+                vcenter_config = default_cloud["vcenter_configuration"]["vcenter_url"]
                 logger.info(
                     " vcenter details are already updated to cloud " + Cloud.DEFAULT_CLOUD_NAME_VSPHERE)
             except:
                 logger.info("Updating vcenter details to cloud " + Cloud.DEFAULT_CLOUD_NAME_VSPHERE)
                 vcpass_base64 = self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoPasswordBase64']
-                vcenter_password = CmdHelper.decode_base64(vcpass_base64)
+                vcenter_password = decode_secret(vcpass_base64)
                 vcenter_username = self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoUser']
                 vcenter_ip = self.jsonspec['envSpec']['vcenterDetails']['vcenterAddress']
                 vcenter_datacenter = self.jsonspec['envSpec']['vcenterDetails']['vcenterDatacenter']
@@ -2062,13 +2017,11 @@ class RaMgmtClusterWorkflow:
                 url = cloud_url
                 logger.info("Waiting for 1 min status == ready")
                 time.sleep(60)
-                response_csrf = requests.request("PUT", url, headers=headers, data=json_object, verify=False)
+                response_csrf = avi_request("PUT", url, headers=headers, data=json_object, verify=False)
                 if response_csrf.status_code != 200:
                     return None, response_csrf.text
                 else:
-                    os.system("rm -rf newCloudInfo.json")
-                    with open("./newCloudInfo.json", "w") as outfile:
-                        json.dump(response_csrf.json(), outfile)
+                    AviRegistry.record(ip, CLOUD, response_csrf.json())
             mgmt_pg = self.jsonspec['tkgsComponentSpec']['aviMgmtNetwork']['aviMgmtNetworkName']
             get_management = self.getNetworkUrl(ip, csrf2, mgmt_pg, aviVersion,
                                                 cloudName=Cloud.DEFAULT_CLOUD_NAME_VSPHERE)
@@ -2104,15 +2057,7 @@ class RaMgmtClusterWorkflow:
             if updateNewCloudStatus[0] is None:
                 logger.error("Failed to update cloud " + str(updateNewCloudStatus[1]))
                 return None, str(updateNewCloudStatus[1])
-            with open("./newCloudInfo.json", 'r') as file2:
-                new_cloud_json = json.load(file2)
-            uuid = None
-            try:
-                uuid = new_cloud_json["uuid"]
-            except:
-                for re in new_cloud_json["results"]:
-                    if re["name"] == Cloud.DEFAULT_CLOUD_NAME_VSPHERE:
-                        uuid = re["uuid"]
+            uuid = avi_object_uuid(ip, csrf2, aviVersion, CLOUD, Cloud.DEFAULT_CLOUD_NAME_VSPHERE)
             if uuid is None:
                 logger.error(Cloud.DEFAULT_CLOUD_NAME_VSPHERE + " cloud not found")
                 return None, "NOT_FOUND"
@@ -2227,7 +2172,7 @@ class RaMgmtClusterWorkflow:
             }
         }
         json_object = json.dumps(body, indent=4)
-        response_csrf = requests.request("PUT", seUrl, headers=headers, data=json_object, verify=False)
+        response_csrf = avi_request("PUT", seUrl, headers=headers, data=json_object, verify=False)
         if response_csrf.status_code != 200:
             return None, response_csrf.text
         else:
@@ -2239,9 +2184,8 @@ class RaMgmtClusterWorkflow:
             vc_user = self.vcenter_dict["vcenter_username"]
             vc_password = self.vcenter_dict["vcenter_password"]
             vc_data_center = self.vcenter_dict["vcenter_datacenter"]
-            sess = requests.post("https://" + vCenter + "/rest/com/vmware/cis/session", auth=(vc_user, vc_password),
-                                 verify=False)
-            if sess.status_code != 200:
+            vc_session = VcenterRestSession.get(vCenter, vc_user, vc_password).session_id
+            if vc_session is None:
                 d = {
                     "responseType": "ERROR",
                     "msg": "Failed to fetch session ID for vCenter - " + vCenter,
@@ -2249,8 +2193,6 @@ class RaMgmtClusterWorkflow:
                 }
                 logger.error(f"Error occurred: [ {d} ]")
                 return False
-            else:
-                vc_session = sess.json()['value']
 
             header = {
                 "Accept": "application/json",
@@ -2262,7 +2204,7 @@ class RaMgmtClusterWorkflow:
             if id[1] != 200:
                 return None, id[0]
             url = "https://" + vCenter + "/api/vcenter/namespace-management/clusters/" + str(id[0])
-            response_csrf = requests.request("GET", url, headers=header, verify=False)
+            response_csrf = vcenter_request("GET", url, headers=header, verify=False)
             endpoint_ip = None
             isRuning = False
             if response_csrf.status_code != 200:
@@ -2425,13 +2367,13 @@ class RaMgmtClusterWorkflow:
                 url1 = "https://" + vCenter + "/api/vcenter/namespace-management/clusters/" + str(
                     id[0]) + "?action=enable"
                 json_object = json.dumps(body, indent=4)
-                response_csrf = requests.request("POST", url1, headers=header, data=json_object, verify=False)
+                response_csrf = vcenter_request("POST", url1, headers=header, data=json_object, verify=False)
                 if response_csrf.status_code != 204:
                     return None, response_csrf.text
                 count = 0
                 found = False
                 while count < 135:
-                    response_csrf = requests.request("GET", url, headers=header, verify=False)
+                    response_csrf = vcenter_request("GET", url, headers=header, verify=False)
                     try:
                         if response_csrf.json()["config_status"] == "RUNNING":
                             endpoint_ip = response_csrf.json()["api_server_cluster_endpoint"]
@@ -2499,7 +2441,7 @@ class RaMgmtClusterWorkflow:
             }
             return json.dumps(d), 500
         avienc_pass = str(self.jsonspec['tkgsComponentSpec']['aviComponents']['aviPasswordBase64'])
-        csrf2 = obtain_second_csrf(ip, avienc_pass)
+        csrf2 = obtain_session_csrf(ip, avienc_pass)
         if csrf2 is None:
             logger.error("Failed to get csrf from new set password")
             d = {
@@ -2550,16 +2492,14 @@ class RaMgmtClusterWorkflow:
 
         logger.info("Setting up kubectl vsphere plugin...")
         url_ = "https://" + vcenter_ip + "/"
-        sess = requests.post(url_ + "rest/com/vmware/cis/session", auth=(vcenter_username, password), verify=False)
-        if sess.status_code != 200:
+        session_id = VcenterRestSession.get(vcenter_ip, vcenter_username, password).session_id
+        if session_id is None:
             d = {
                 "responseType": "ERROR",
                 "msg": "Failed to fetch session ID for vCenter - " + vcenter_ip,
                 "ERROR_CODE": 500
             }
             return json.dumps(d), 500
-        else:
-            session_id = sess.json()['value']
 
         header = {
             "Accept": "application/json",
@@ -2570,8 +2510,8 @@ class RaMgmtClusterWorkflow:
         id = getClusterID(vcenter_ip, vcenter_username, password, cluster_name, self.jsonspec)
         if id[1] != 200:
             return None, id[0]
-        clusterip_resp = requests.get(url_ + "api/vcenter/namespace-management/clusters/" + str(id[0]), verify=False,
-                                      headers=header)
+        clusterip_resp = vcenter_request("GET", url_ + "api/vcenter/namespace-management/clusters/" + str(id[0]), verify=False,
+                                         headers=header)
         if clusterip_resp.status_code != 200:
             d = {
                 "responseType": "ERROR",
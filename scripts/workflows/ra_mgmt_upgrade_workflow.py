@@ -13,9 +13,12 @@ from util.common_utils import downloadAndPushKubernetesOvaMarketPlace, download_
     checkenv, untar_binary, locate_binary_tmp
 from util.cmd_runner import RunCmd
 import pathlib
+from util.tracing import trace_methods
+from model.spec_store import SpecStore
 
 logger = LoggerHelper.get_logger(name='ra_mgmt_upgrade_workflow')
 
+@trace_methods()
 class RaMgmtUpgradeWorkflow:
     def __init__(self, run_config: RunConfig):
         self.run_config = run_config
@@ -24,8 +27,7 @@ class RaMgmtUpgradeWorkflow:
         self.tanzu_client = TkgCliClient()
         self.rcmd = RunCmd()
 
-        with open(jsonpath) as f:
-            self.jsonspec = json.load(f)
+        self.jsonspec = SpecStore.jsonspec(jsonpath)
 
         check_env_output = checkenv(self.jsonspec)
         if check_env_output is None:
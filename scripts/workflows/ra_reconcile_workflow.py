@@ -0,0 +1,207 @@
+#  Copyright 2022 VMware, Inc
+#  SPDX-License-Identifier: BSD-2-Clause
+
+import json
+import os
+
+from constants.constants import Paths, Cloud, Env, AppName
+from lib.kubectl_watch import PACKAGE_INSTALLS, reconcile_succeeded
+from lib.tkg_cli_client import TkgCliClient
+from model.run_config import RunConfig
+from util.avi_api_helper import isAviHaEnabled, obtain_session_csrf, obtain_avi_version, iter_avi_collection
+from util.cmd_runner import RunCmd
+from util.extensions_helper import checkTanzuExtensionEnabled, checkPromethusEnabled
+from util.logger_helper import LoggerHelper
+from util.reconcile import Reconciler, IN_SYNC
+from util.tkg_util import TkgUtil
+from util.tracing import trace_methods
+from util.workflow_context import WorkflowContext
+
+logger = LoggerHelper.get_logger(name='reconcile_workflow')
+
+
+@trace_methods()
+class RaReconcileWorkflow:
+    """
+    Day 0 stack of a TKGm deployment as a desired state graph: AVI controller, NSX-T objects for
+    VCF, AVI cloud, SE groups, IPAM and networks, the management, shared services and workload
+    clusters and the monitoring packages. Actual state is read in bulk and only the day 0 steps
+    owning a missing or drifted object run again, so a retry resumes after the last good step.
+    """
+
+    def __init__(self, run_config: RunConfig):
+        self.run_config = run_config
+        self.context = WorkflowContext.of(run_config)
+        self.jsonpath = os.path.join(self.run_config.root_dir, Paths.MASTER_SPEC_PATH)
+        self.jsonspec = self.context.jsonspec(self.jsonpath)
+        env = self.context.env()
+        self.env = env[0] if env[1] == 200 else None
+        self.rcmd = RunCmd()
+        self._reconciler = None
+
+    def _avi_headers(self):
+        avi_components = self.jsonspec['tkgComponentSpec']['aviComponents']
+        if isAviHaEnabled(avi_components['enableAviHa']):
+            ip = avi_components['aviClusterFqdn']
+        else:
+            ip = avi_components['aviController01Fqdn']
+        csrf2 = obtain_session_csrf(ip, str(avi_components['aviPasswordBase64']))
+        if csrf2 is None:
+            raise Exception("Failed to login to AVI controller " + str(ip))
+        avi_version = obtain_avi_version(ip, self.jsonspec)
+        if avi_version[0] is None:
+            raise Exception("Failed to obtain avi version " + str(avi_version[1]))
+        headers = {
+            "Accept": "application/json",
+            "Content-Type": "application/json",
+            "Cookie": csrf2[1],
+            "referer": "https://" + ip + "/login",
+            "x-avi-version": avi_version[0],
+            "x-csrftoken": csrf2[0]
+        }
+        return ip, headers, avi_version[0]
+
+    def _avi_controller(self):
+        ip, headers, avi_version = self._avi_headers()
+        return {ip: {"version": avi_version}}
+
+    def _avi_objects(self, collection):
+        def _fetch():
+            ip, headers, _ = self._avi_headers()
+            return {obj['name']: obj for obj in iter_avi_collection("https://" + ip + "/api/" + collection, headers)}
+        return _fetch
+
+    def _nsxt_objects(self, path):
+        def _fetch():
+            nsxt_client = self.context.nsxt_client()
+            headers_ = nsxt_client.grabNsxtHeaders()
+            if headers_[0] is None:
+                raise Exception("Failed to nsxt info " + str(headers_[1]))
+            collection = nsxt_client.getCollection(headers_[1], path)
+            if collection[1] != 200:
+                raise Exception(str(collection[0]))
+            return collection[0].by_name
+        return _fetch
+
+    def _clusters(self):
+        return {cluster['name']: cluster for cluster in TkgCliClient().get_all_clusters()}
+
+    def _packages(self, cluster):
+        def _fetch():
+            output = self.rcmd.run_cmd_output(
+                "kubectl get " + PACKAGE_INSTALLS + " -A -o json --context " + cluster + "-admin@" + cluster)
+            return {obj['metadata']['name']: {"reconciled": reconcile_succeeded(obj)}
+                    for obj in json.loads(output).get("items", [])}
+        return _fetch
+
+    def _workflow_step(self, module, class_name, method):
+        def _apply():
+            workflow_module = __import__(module, fromlist=[class_name])
+            return getattr(self.context.workflow(getattr(workflow_module, class_name)), method)()
+        return _apply
+
+    def build(self):
+        """
+        :return: Reconciler holding the desired state of the spec, observations are shared by plan and reconcile
+        """
+        if self._reconciler is not None:
+            return self._reconciler
+        if TkgUtil.isEnvTkgs_wcp(self.jsonspec) or TkgUtil.isEnvTkgs_ns(self.jsonspec):
+            raise Exception("Reconcile supports TKGm deployments only")
+        reconciler = Reconciler()
+        tkg_components = self.jsonspec['tkgComponentSpec']
+        mgmt_components = tkg_components['tkgMgmtComponents']
+        avi_components = tkg_components['aviComponents']
+        avi_ip = avi_components['aviClusterFqdn'] if isAviHaEnabled(avi_components['enableAviHa']) \
+            else avi_components['aviController01Fqdn']
+
+        reconciler.observe("avi-controller", self._avi_controller)
+        reconciler.observe("avi-cloud", self._avi_objects("cloud"))
+        reconciler.observe("avi-se-group", self._avi_objects("serviceenginegroup"))
+        reconciler.observe("avi-ipam", self._avi_objects("ipamdnsproviderprofile"))
+        reconciler.observe("avi-network", self._avi_objects("network"))
+        reconciler.observe("cluster", self._clusters)
+
+        reconciler.step("avi", self._workflow_step("workflows.ra_alb_workflow", "RALBWorkflow",
+                                                   "avi_controller_setup"))
+        reconciler.want("avi-controller", avi_ip, "avi")
+        mgmt_after = ["avi"]
+        if self.env == Env.VCF:
+            reconciler.observe("nsxt-segment", self._nsxt_objects("/infra/segments"))
+            reconciler.observe("nsxt-group", self._nsxt_objects("/infra/domains/default/groups"))
+            reconciler.step("nsxt", self._workflow_step("workflows.ra_nsxt_workflow", "RaNSXTWorkflow",
+                                                        "configure_avi_nsxt_config"))
+            for segment in [tkg_components['tkgSharedserviceSpec']['tkgSharedserviceNetworkName'],
+                            tkg_components['tkgClusterVipNetwork']['tkgClusterVipNetworkName'],
+                            self.jsonspec['tkgMgmtDataNetwork']['tkgMgmtDataNetworkName'],
+                            tkg_components['aviMgmtNetwork']['aviMgmtNetworkName']]:
+                reconciler.want("nsxt-segment", segment, "nsxt")
+            mgmt_after.append("nsxt")
+
+        reconciler.step("mgmt", self._workflow_step("workflows.ra_mgmt_cluster_workflow", "RaMgmtClusterWorkflow",
+                                                    "create_mgmt_cluster"), after=mgmt_after)
+        reconciler.want("avi-cloud", Cloud.CLOUD_NAME_VSPHERE, "mgmt")
+        reconciler.want("avi-se-group", Cloud.SE_GROUP_NAME_VSPHERE, "mgmt")
+        reconciler.want("avi-ipam", Cloud.IPAM_NAME_VSPHERE, "mgmt")
+        reconciler.want("avi-network", tkg_components['aviMgmtNetwork']['aviMgmtNetworkName'], "mgmt",
+                        {"configured_subnets": [{"static_ip_ranges": [{"type": "STATIC_IPS_FOR_VIP_AND_SE"}]}]})
+        reconciler.want("cluster", mgmt_components['tkgMgmtClusterName'], "mgmt", {"status": "running"})
+
+        if self.env == Env.VCF:
+            shared_cluster = tkg_components['tkgSharedserviceSpec']['tkgSharedserviceClusterName']
+        else:
+            shared_cluster = mgmt_components['tkgSharedserviceClusterName']
+        reconciler.step("shared-services", self._workflow_step("workflows.ra_shared_cluster_workflow",
+                                                               "RaSharedClusterWorkflow", "deploy"), after=["mgmt"])
+        reconciler.want("cluster", shared_cluster, "shared-services", {"status": "running"})
+
+        workload_cluster = self.jsonspec['tkgWorkloadComponents']['tkgWorkloadClusterName']
+        reconciler.step("workload", self._workflow_step("workflows.ra_workload_cluster_workflow",
+                                                        "RaWorkloadClusterWorkflow", "deploy"), after=["mgmt"])
+        reconciler.want("avi-se-group", Cloud.SE_WORKLOAD_GROUP_NAME_VSPHERE, "workload")
+        reconciler.want("avi-network", self.jsonspec['tkgWorkloadDataNetwork']['tkgWorkloadDataNetworkName'],
+                        "workload")
+        reconciler.want("cluster", workload_cluster, "workload", {"status": "running"})
+
+        reconciler.step("extensions", self._workflow_step("workflows.ra_deploy_ext_workflow", "RaDeployExtWorkflow",
+                                                          "deploy_tkg_extensions"),
+                        after=["shared-services", "workload"])
+        # without prometheus the step owns no resources, it runs only after a cluster step was applied
+        if checkTanzuExtensionEnabled(self.jsonspec) and checkPromethusEnabled(self.jsonspec):
+            for cluster in str(self.jsonspec['tanzuExtensions']['tkgClustersName']).split(","):
+                cluster = cluster.strip()
+                reconciler.observe("package@" + cluster, self._packages(cluster))
+                for package in [AppName.PROMETHUS, AppName.GRAFANA]:
+                    reconciler.want("package@" + cluster, package, "extensions", {"reconciled": True})
+        self._reconciler = reconciler
+        return reconciler
+
+    def plan(self):
+        """
+        :return: list of (step, resource, status, reason) of the resources that are not in sync
+        """
+        try:
+            plan = self.build().plan()
+        except Exception as e:
+            logger.error("Failed to build desired state " + str(e))
+            return []
+        return [(step, resource, status, reason) for step, resources in plan.items()
+                for resource, status, reason in resources if status != IN_SYNC]
+
+    def reconcile(self, dry_run=False):
+        """
+        Run the day 0 steps owning missing or drifted objects
+        :return: (json msg, status code)
+        """
+        try:
+            reconciler = self.build()
+        except Exception as e:
+            logger.error("Failed to build desired state " + str(e))
+            d = {
+                "responseType": "ERROR",
+                "msg": "Failed to build desired state " + str(e),
+                "ERROR_CODE": 500
+            }
+            return json.dumps(d), 500
+        d, status = reconciler.run(dry_run=dry_run)
+        return json.dumps(d), status
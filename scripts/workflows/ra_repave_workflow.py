@@ -9,6 +9,7 @@ import json
 import time
 from constants.constants import Paths, RegexPattern, KubectlCommands
 from lib.tkg_cli_client import TkgCliClient
+from lib.kube_context import KubeContexts
 from lib.kubectl_client import KubectlClient
 from model.run_config import RunConfig, RepaveConfig
 from util.logger_helper import LoggerHelper
@@ -19,9 +20,12 @@ from util.ShellHelper import runShellCommandAndReturnOutputAsList, verifyPodsAre
     grabKubectlCommand, grabPipeOutput
 import ruamel.yaml
 from ruamel.yaml.comments import CommentedMap
+from util.tracing import trace_methods
+from model.spec_store import SpecStore
 
 logger = LoggerHelper.get_logger(name='repave_workflow')
 
+@trace_methods()
 class RepaveWorkflow:
     def __init__(self, run_config: RunConfig, repave_config: RepaveConfig):
         self.repave_config = repave_config
@@ -35,8 +39,7 @@ class RepaveWorkflow:
         self.cpu_change = ''
         self.memory_change = ''
 
-        with open(jsonpath) as f:
-            self.jsonspec = json.load(f)
+        self.jsonspec = SpecStore.jsonspec(jsonpath)
         try:
             check_env_output = checkenv(self.jsonspec)
             print("check_env_output: {}".format(check_env_output))
@@ -197,17 +200,10 @@ class RepaveWorkflow:
 
         try:
             # switch to mgmt context
-            commands = ["tanzu", "management-cluster", "kubeconfig", "get", self.management_cluster,
-                        "--admin"]
-            kube_context_cmd = grabKubectlCommand(commands, RegexPattern.SWITCH_CONTEXT_KUBECTL)
-            if kube_context_cmd is None:
-                logger.error("Failed to get switch to management cluster context command")                
-                return None
-            list_switch_cmd = str(kube_context_cmd).split(" ")
-            status = runShellCommandAndReturnOutputAsList(list_switch_cmd)
-            if status[1] != 0:
+            context = KubeContexts.get().use(self.management_cluster, management=True)
+            if context[0] is None:
                 logger.error(
-                    "Failed to get switch to management cluster context " + str(status[0]))
+                    "Failed to get switch to management cluster context " + context[1])
                 return None
 
             # get the template of the cluster to separate yml file
@@ -10,8 +10,11 @@ from util.logger_helper import LoggerHelper
 import traceback
 from util.common_utils import checkenv
 from util.cmd_runner import RunCmd
+from util.tracing import trace_methods
+from model.spec_store import SpecStore
 logger = LoggerHelper.get_logger(name='scale_workflow')
 
+@trace_methods()
 class ScaleWorkflow:
     def __init__(self, run_config: RunConfig, scale_config: ScaleConfig):
         self.scale_config = scale_config
@@ -21,8 +24,7 @@ class ScaleWorkflow:
         self.rcmd = RunCmd()
         self.fetched_cluster_dict = {}
 
-        with open(jsonpath) as f:
-            self.jsonspec = json.load(f)
+        self.jsonspec = SpecStore.jsonspec(jsonpath)
         try:
             check_env_output = checkenv(self.jsonspec)
             print("check_env_output: {}".format(check_env_output))
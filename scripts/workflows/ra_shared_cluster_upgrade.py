@@ -14,9 +14,12 @@ from util.common_utils import downloadAndPushKubernetesOvaMarketPlace, checkenv,
 from util.cmd_runner import RunCmd
 from util.ShellHelper import grabKubectlCommand, runShellCommandAndReturnOutputAsList, \
     grabPipeOutput
+from util.tracing import trace_methods
+from model.spec_store import SpecStore
 
 logger = LoggerHelper.get_logger(name='ra_shared_upgrade_workflow')
 
+@trace_methods()
 class RaSharedUpgradeWorkflow:
     def __init__(self, run_config: RunConfig):
         self.run_config = run_config
@@ -25,8 +28,7 @@ class RaSharedUpgradeWorkflow:
         self.tanzu_client = TkgCliClient()
         self.rcmd = RunCmd()
 
-        with open(jsonpath) as f:
-            self.jsonspec = json.load(f)
+        self.jsonspec = SpecStore.jsonspec(jsonpath)
 
         check_env_output = checkenv(self.jsonspec)
         if check_env_output is None:
@@ -14,6 +14,7 @@ from constants.constants import TKG_EXTENSIONS_ROOT, ControllerLocation, Kubectl
     AppName, Avi_Tkgs_Version, Avi_Version, Cloud, Env, Tkg_version, SegmentsName
 
 from jinja2 import Template
+from lib.kube_context import KubeContexts
 from lib.kubectl_client import KubectlClient
 from lib.tkg_cli_client import TkgCliClient
 from model.run_config import RunConfig
@@ -31,7 +32,7 @@ from util.cmd_runner import RunCmd
 from util.oidc_helper import createRbacUsers
 from util.common_utils import downloadAndPushKubernetesOvaMarketPlace, runSsh, getNetworkFolder, \
     deployCluster, registerWithTmcOnSharedAndWorkload, registerTanzuObservability, checkenv, getVipNetworkIpNetMask, \
-    obtain_second_csrf, createClusterFolder, createResourceFolderAndWait, checkTmcEnabled, getKubeVersionFullName, \
+    obtain_session_csrf, createClusterFolder, createResourceFolderAndWait, checkTmcEnabled, getKubeVersionFullName, \
     getNetworkPathTMC, checkSharedServiceProxyEnabled, checkTmcRegister, createProxyCredentialsTMC, enable_data_protection,\
     checkEnableIdentityManagement, checkPinnipedInstalled, checkDataProtectionEnabled
 from util.vcenter_operations import createResourcePool, create_folder
@@ -42,17 +43,22 @@ from util.shared_config import deployExtentions
 from lib.nsxt_client import NsxtClient
 from util.tkg_util import TkgUtil
 from util.cleanup_util import CleanUpUtil
+from util.tracing import trace_methods
+from util.workflow_context import WorkflowContext
+from model.spec_store import decode_secret
 
 
 
 logger = LoggerHelper.get_logger(Path(__file__).stem)
 
 
+@trace_methods()
 class RaSharedClusterWorkflow:
     def __init__(self, run_config: RunConfig):
 
         self.run_config = run_config
-        self.tkg_util_obj = TkgUtil(run_config=self.run_config)
+        self.context = WorkflowContext.of(self.run_config)
+        self.tkg_util_obj = self.context.tkg_util()
         self.tkg_version_dict = self.tkg_util_obj.get_desired_state_tkg_version()
         self.desired_state_tkg_version = None
         self.env = "vsphere"         #keeping code for env check, so hardcoding env as vsphere
@@ -76,12 +82,10 @@ class RaSharedClusterWorkflow:
         # Following values must be set in upgrade scenarios
         self.prev_extensions_root = None
         self.prev_extensions_dir = None
-        jsonpath = os.path.join(self.run_config.root_dir, Paths.MASTER_SPEC_PATH)
-        with open(jsonpath) as f:
-            self.jsonspec = json.load(f)
+        self.jsonspec = self.context.jsonspec(os.path.join(self.run_config.root_dir, Paths.MASTER_SPEC_PATH))
         self.rcmd = RunCmd()
 
-        self.env = envCheck(self.run_config)
+        self.env = self.context.env()
         if self.env[1] != 200:
             logger.error("Wrong env provided " + self.env[0])
             d = {
@@ -91,17 +95,15 @@ class RaSharedClusterWorkflow:
             }
             return json.dumps(d), 500
         self.env = self.env[0]
-        self.nsxObj = NsxtClient(self.run_config)
 
         self.isEnvTkgs_ns = TkgUtil.isEnvTkgs_ns(self.jsonspec)
         self.isEnvTkgs_wcp = TkgUtil.isEnvTkgs_wcp(self.jsonspec)
 
-        check_env_output = checkenv(self.jsonspec)
+        check_env_output = self.context.check_vcenter(self.jsonspec)
         if check_env_output is None:
             msg = "Failed to connect to VC. Possible connection to VC is not available or " \
                   "incorrect spec provided."
             raise Exception(msg)
-        self.cleanup_obj = CleanUpUtil()
         if self.env == Env.VCF:
             self.shrd_clstr = self.jsonspec['tkgComponentSpec']['tkgSharedserviceSpec'][
                 'tkgSharedserviceClusterName']
@@ -109,6 +111,14 @@ class RaSharedClusterWorkflow:
             self.shrd_clstr = self.jsonspec['tkgComponentSpec']['tkgMgmtComponents'][
                 'tkgSharedserviceClusterName']
 
+    @property
+    def nsxObj(self):
+        return self.context.nsxt_client()
+
+    @property
+    def cleanup_obj(self):
+        return self.context.cleanup_util()
+
     def _template_deploy_yaml(self):
         deploy_yaml = FileHelper.read_resource(Paths.VSPHERE_SHARED_SERVICES_SPEC_J2)
         t = Template(deploy_yaml)
@@ -132,23 +142,12 @@ class RaSharedClusterWorkflow:
     def akoDeploymentConfigSharedCluster(self,shared_cluster_name, aviVersion):
         management_cluster = self.jsonspec['tkgComponentSpec']['tkgMgmtComponents'][
             'tkgMgmtClusterName']
-        commands = ["tanzu", "management-cluster", "kubeconfig", "get", management_cluster, "--admin"]
-        kubeContextCommand = grabKubectlCommand(commands, RegexPattern.SWITCH_CONTEXT_KUBECTL)
-        if kubeContextCommand is None:
-            logger.error("Failed to get switch to management cluster context command")
+        context = KubeContexts.get().use(management_cluster, management=True)
+        if context[0] is None:
+            logger.error("Failed to get switch to management cluster context " + context[1])
             d = {
                 "responseType": "ERROR",
-                "msg": "Failed to get switch to management cluster context command",
-                "ERROR_CODE": 500
-            }
-            return json.dumps(d), 500
-        lisOfSwitchContextCommand = str(kubeContextCommand).split(" ")
-        status = runShellCommandAndReturnOutputAsList(lisOfSwitchContextCommand)
-        if status[1] != 0:
-            logger.error("Failed to get switch to management cluster context " + str(status[0]))
-            d = {
-                "responseType": "ERROR",
-                "msg": "Failed to get switch to management cluster context " + str(status[0]),
+                "msg": "Failed to get switch to management cluster context " + context[1],
                 "ERROR_CODE": 500
             }
             return json.dumps(d), 500
@@ -224,7 +223,7 @@ class RaSharedClusterWorkflow:
             avienc_pass = str(self.jsonspec['tkgsComponentSpec']['aviComponents']['aviPasswordBase64'])
         else:
             avienc_pass = str(self.jsonspec['tkgComponentSpec']['aviComponents']['aviPasswordBase64'])
-        csrf2 = obtain_second_csrf(avi_fqdn, avienc_pass)
+        csrf2 = obtain_session_csrf(avi_fqdn, avienc_pass)
         if csrf2 is None:
             logger.error("Failed to get csrf from new set password")
             d = {
@@ -368,7 +367,7 @@ class RaSharedClusterWorkflow:
             vsSpec = VsphereMasterSpec.parse_obj(json_dict)
             aviVersion = Avi_Tkgs_Version.VSPHERE_AVI_VERSION if TkgUtil.isEnvTkgs_wcp(self.jsonspec) else Avi_Version.VSPHERE_AVI_VERSION
             vcpass_base64 = self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoPasswordBase64']
-            password = CmdHelper.decode_base64(vcpass_base64)
+            password = decode_secret(vcpass_base64)
             vcenter_username = self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoUser']
             vcenter_ip = self.jsonspec['envSpec']['vcenterDetails']['vcenterAddress']
             cluster_name = self.jsonspec['envSpec']['vcenterDetails']['vcenterCluster']
@@ -627,23 +626,12 @@ class RaSharedClusterWorkflow:
 
                 if not clusterGroup:
                     clusterGroup = "default"
-                commands = ["tanzu", "management-cluster", "kubeconfig", "get", management_cluster, "--admin"]
-                kubeContextCommand = grabKubectlCommand(commands, RegexPattern.SWITCH_CONTEXT_KUBECTL)
-                if kubeContextCommand is None:
-                    logger.error("Failed to get switch to management cluster context command")
-                    d = {
-                        "responseType": "ERROR",
-                        "msg": "Failed to get switch to management cluster context command",
-                        "ERROR_CODE": 500
-                    }
-                    return json.dumps(d), 500
-                lisOfSwitchContextCommand = str(kubeContextCommand).split(" ")
-                status = runShellCommandAndReturnOutputAsList(lisOfSwitchContextCommand)
-                if status[1] != 0:
-                    logger.error("Failed to get switch to management cluster context " + str(status[0]))
+                context = KubeContexts.get().use(management_cluster, management=True)
+                if context[0] is None:
+                    logger.error("Failed to get switch to management cluster context " + context[1])
                     d = {
                         "responseType": "ERROR",
-                        "msg": "Failed to get switch to management cluster context " + str(status[0]),
+                        "msg": "Failed to get switch to management cluster context " + context[1],
                         "ERROR_CODE": 500
                     }
                     return json.dumps(d), 500
@@ -843,23 +831,12 @@ class RaSharedClusterWorkflow:
                             "ERROR_CODE": 500
                         }
                         return json.dumps(d), 500
-                    commands = ["tanzu", "management-cluster", "kubeconfig", "get", management_cluster, "--admin"]
-                    kubeContextCommand = grabKubectlCommand(commands, RegexPattern.SWITCH_CONTEXT_KUBECTL)
-                    if kubeContextCommand is None:
-                        logger.error("Failed to get switch to management cluster context command")
+                    context = KubeContexts.get().use(management_cluster, management=True)
+                    if context[0] is None:
+                        logger.error("Failed to get switch to management cluster context " + context[1])
                         d = {
                             "responseType": "ERROR",
-                            "msg": "Failed to get switch to management cluster context command",
-                            "ERROR_CODE": 500
-                        }
-                        return json.dumps(d), 500
-                    lisOfSwitchContextCommand = str(kubeContextCommand).split(" ")
-                    status = runShellCommandAndReturnOutputAsList(lisOfSwitchContextCommand)
-                    if status[1] != 0:
-                        logger.error("Failed to get switch to management cluster context " + str(status[0]))
-                        d = {
-                            "responseType": "ERROR",
-                            "msg": "Failed to get switch to management cluster context " + str(status[0]),
+                            "msg": "Failed to get switch to management cluster context " + context[1],
                             "ERROR_CODE": 500
                         }
                         return json.dumps(d), 500
@@ -888,23 +865,12 @@ class RaSharedClusterWorkflow:
                             return json.dumps(d), 500
                     else:
                         logger.info(status[0])
-                    commands_shared = ["tanzu", "cluster", "kubeconfig", "get", shared_cluster_name, "--admin"]
-                    kubeContextCommand_shared = grabKubectlCommand(commands_shared, RegexPattern.SWITCH_CONTEXT_KUBECTL)
-                    if kubeContextCommand_shared is None:
-                        logger.error("Failed to get switch to shared cluster context command")
-                        d = {
-                            "responseType": "ERROR",
-                            "msg": "Failed to get switch to shared cluster context command",
-                            "ERROR_CODE": 500
-                        }
-                        return json.dumps(d), 500
-                    lisOfSwitchContextCommand_shared = str(kubeContextCommand_shared).split(" ")
-                    status = runShellCommandAndReturnOutputAsList(lisOfSwitchContextCommand_shared)
-                    if status[1] != 0:
-                        logger.error("Failed to get switch to shared cluster context " + str(status[0]))
+                    context = KubeContexts.get().use(shared_cluster_name)
+                    if context[0] is None:
+                        logger.error("Failed to get switch to shared cluster context " + context[1])
                         d = {
                             "responseType": "ERROR",
-                            "msg": "Failed to get switch to shared cluster context " + str(status[0]),
+                            "msg": "Failed to get switch to shared cluster context " + context[1],
                             "ERROR_CODE": 500
                         }
                         return json.dumps(d), 500
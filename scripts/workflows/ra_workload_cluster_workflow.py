@@ -10,49 +10,69 @@ import time
 from constants.constants import TKG_EXTENSIONS_ROOT, Constants, Paths, Task, ControllerLocation, \
     Cloud, VrfType, RegexPattern, AkoType, AppName, Versions, ResourcePoolAndFolderName, PLAN, \
     Sizing, ClusterType, Repo, Avi_Version, Avi_Tkgs_Version, Env
+from lib.kube_context import KubeContexts
 from lib.kubectl_client import KubectlClient
 from lib.tkg_cli_client import TkgCliClient
 from model.run_config import RunConfig
-from util.common_utils import envCheck
 from workflows.ra_nsxt_workflow import RaNSXTWorkflow
 from util.cmd_helper import CmdHelper
 from util.file_helper import FileHelper
 from util.git_helper import Git
 from util.logger_helper import LoggerHelper, log, log_debug
 from util.cmd_runner import RunCmd
-from lib.nsxt_client import NsxtClient
 from workflows.cluster_common_workflow import ClusterCommonWorkflow
 from util.common_utils import downloadAndPushKubernetesOvaMarketPlace, getCloudStatus, \
     getVrfAndNextRoutId, addStaticRoute, getVipNetworkIpNetMask, getSECloudStatus, \
     createResourceFolderAndWait, getNetworkFolder, deployCluster, verifyPodsAreRunning,\
     registerWithTmcOnSharedAndWorkload, registerTanzuObservability, registerTSM,\
-    installCertManagerAndContour, runSsh, checkenv, checkNameSpaceRunningStatus, getClusterID, getPolicyID, \
+    installCertManagerAndContour, runSsh, checkNameSpaceRunningStatus, getClusterID, getPolicyID, \
     getLibraryId, getBodyResourceSpec, cidr_to_netmask, getCountOfIpAdress, seperateNetmaskAndIp, configureKubectl, \
     createClusterFolder, supervisorTMC, checkTmcEnabled, get_alias_name, convertStringToCommaSeperated, \
     checkClusterVersionCompatibility, checkToEnabled, checkTSMEnabled, checkDataProtectionEnabled, \
     enable_data_protection, checkEnableIdentityManagement, checkPinnipedInstalled
 from util.oidc_helper import createRbacUsers
 from util.ShellHelper import runShellCommandAndReturnOutput
-from util.avi_api_helper import isAviHaEnabled, obtain_second_csrf
+from util.avi_api_helper import isAviHaEnabled, obtain_session_csrf, avi_request, avi_object_uuid
+from util.avi_registry import AviRegistry, CLOUD, IPAM
 from workflows.ra_mgmt_cluster_workflow import RaMgmtClusterWorkflow
 from util.ShellHelper import grabKubectlCommand, runShellCommandAndReturnOutputAsList, \
     grabPipeOutput
 from util.vcenter_operations import getDvPortGroupId
+from util.vcenter_session import VcenterRestSession, vcenter_request
+from util.workflow_context import WorkflowContext
 import ruamel
 from ruamel import yaml as ryaml
 import yaml
 import requests
 from model.vsphereSpec import VsphereMasterSpec
 from util.tkg_util import TkgUtil
-from util.cleanup_util import CleanUpUtil
+from util.wait_helper import wait_until
+from util.tracing import trace_methods
+from util.pipeline_dag import network_lock
+from model.spec_store import decode_secret
 
 logger = LoggerHelper.get_logger(Path(__file__).stem)
 
+WORKLOAD_PRECONFIG_LOCK = "workload-avi-preconfig"
 
+
+def workload_ako_name(workload_cluster_name):
+    return "tkgvsphere-ako-" + workload_cluster_name
+
+
+def workload_ako_selector(workload_cluster_name):
+    """
+    Value of the AkoType.KEY label selecting the cluster in its AKODeploymentConfig
+    """
+    return AkoType.type_ako_set + "-" + workload_cluster_name
+
+
+@trace_methods()
 class RaWorkloadClusterWorkflow:
     def __init__(self, run_config: RunConfig):
         self.run_config = run_config
-        self.tkg_util_obj = TkgUtil(run_config=self.run_config)
+        self.context = WorkflowContext.of(self.run_config)
+        self.tkg_util_obj = self.context.tkg_util()
         self.tkg_version_dict = self.tkg_util_obj.get_desired_state_tkg_version()
         self.desired_state_tkg_version = None
         if "tkgs" in self.tkg_version_dict:
@@ -76,12 +96,10 @@ class RaWorkloadClusterWorkflow:
         self.prev_version = None
         self.prev_extensions_root = None
         self.prev_extensions_dir = None
-        with open(self.jsonpath) as f:
-            self.jsonspec = json.load(f)
+        self.jsonspec = self.context.jsonspec(self.jsonpath)
         self.rcmd = RunCmd()
-        self.clusterops = RaMgmtClusterWorkflow(self.run_config)
 
-        self.env = envCheck(self.run_config)
+        self.env = self.context.env()
         if self.env[1] != 200:
             logger.error("Wrong env provided " + self.env[0])
             d = {
@@ -91,12 +109,11 @@ class RaWorkloadClusterWorkflow:
             }
             return json.dumps(d), 500
         self.env = self.env[0]
-        self.nsxObj = NsxtClient(self.run_config)
 
         self.isEnvTkgs_ns = TkgUtil.isEnvTkgs_ns(self.jsonspec)
         self.isEnvTkgs_wcp = TkgUtil.isEnvTkgs_wcp(self.jsonspec)
 
-        check_env_output = checkenv(self.jsonspec)
+        check_env_output = self.context.check_vcenter(self.jsonspec)
         if check_env_output is None:
             msg = "Failed to connect to VC. Possible connection to VC is not available or " \
                   "incorrect spec provided."
@@ -104,9 +121,20 @@ class RaWorkloadClusterWorkflow:
         self.isEnvTkgs_wcp = TkgUtil.isEnvTkgs_wcp(self.jsonspec)
         self.isEnvTkgs_ns = TkgUtil.isEnvTkgs_ns(self.jsonspec)
         self.get_vcenter_details()
-        self.cleanup_obj = CleanUpUtil()
         self.wrkld_cluster_name = self.jsonspec['tkgWorkloadComponents']['tkgWorkloadClusterName']
 
+    @property
+    def clusterops(self):
+        return self.context.workflow(RaMgmtClusterWorkflow)
+
+    @property
+    def nsxObj(self):
+        return self.context.nsxt_client()
+
+    @property
+    def cleanup_obj(self):
+        return self.context.cleanup_util()
+
     def get_vcenter_details(self):
         """
         Method to get vCenter Details from JSON file
@@ -115,7 +143,7 @@ class RaWorkloadClusterWorkflow:
         self.vcenter_dict = {}
         try:
             self.vcenter_dict.update({'vcenter_ip': self.jsonspec['envSpec']['vcenterDetails']['vcenterAddress'],
-                                      'vcenter_password': CmdHelper.decode_base64(
+                                      'vcenter_password': decode_secret(
                                           self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoPasswordBase64']),
                                       'vcenter_username': self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoUser'],
                                       'vcenter_cluster_name': self.jsonspec['envSpec']['vcenterDetails'][
@@ -128,8 +156,12 @@ class RaWorkloadClusterWorkflow:
             pass
 
 
-    def createAkoFile(self, ip, wipCidr, tkgMgmtDataPg):
-
+    def createAkoFile(self, ip, wipCidr, tkgMgmtDataPg, workload_cluster_name):
+        """
+        Write the AKODeploymentConfig of one workload cluster, named and selecting the cluster by
+        its name so clusters deployed side by side with their own data network do not share one
+        :return: path of the yaml file
+        """
         repository = 'projects.registry.vmware.com/tkg/ako'
 
         data = dict(
@@ -138,7 +170,7 @@ class RaWorkloadClusterWorkflow:
             metadata=dict(
                 finalizers=['ako-operator.networking.tkg.tanzu.vmware.com'],
                 generation=2,
-                name='tkgvsphere-ako-workload-set01'
+                name=workload_ako_name(workload_cluster_name)
             ),
             spec=dict(
                 adminCredentialRef=dict(
@@ -151,7 +183,7 @@ class RaWorkloadClusterWorkflow:
                 cloudName=Cloud.CLOUD_NAME_VSPHERE,
                 clusterSelector=dict(
                     matchLabels=dict(
-                        type=AkoType.type_ako_set
+                        type=workload_ako_selector(workload_cluster_name)
                     )
                 ),
                 controller=ip,
@@ -164,14 +196,15 @@ class RaWorkloadClusterWorkflow:
                 serviceEngineGroup=Cloud.SE_WORKLOAD_GROUP_NAME_VSPHERE
             )
         )
-        with open('./ako_vsphere_workloadset1.yaml', 'w') as outfile:
+        yaml_file_path = os.path.join(Paths.CLUSTER_PATH, workload_cluster_name, "ako_vsphere_workloadset1.yaml")
+        os.makedirs(os.path.dirname(yaml_file_path), exist_ok=True)
+        with open(yaml_file_path, 'w') as outfile:
             yaml = ruamel.yaml.YAML()
             yaml.indent(mapping=2, sequence=4, offset=3)
             yaml.dump(data, outfile)
+        return yaml_file_path
 
     def updateIpam_profile(self, ip, csrf2, network_name, aviVersion):
-        with open("./ipam_details.json", 'r') as file2:
-            ipam_json = json.load(file2)
         headers = {
             "Accept": "application/json",
             "Content-Type": "application/json",
@@ -181,12 +214,14 @@ class RaWorkloadClusterWorkflow:
             "x-csrftoken": csrf2[0]
         }
 
-        for ipam in ipam_json["results"]:
-            if ipam["name"] == Cloud.IPAM_NAME_VSPHERE:
-                ipam_obj = ipam
-                break
+        ipam_obj = AviRegistry.lookup(ip, IPAM, Cloud.IPAM_NAME_VSPHERE)
+        if ipam_obj is None:
+            get_ipam = self.clusterops.getIpam(ip, csrf2, Cloud.IPAM_NAME_VSPHERE, aviVersion)
+            if get_ipam[0] is None or get_ipam[0] == "NOT_FOUND":
+                return None, "Failed to get ipam " + str(get_ipam[1])
+            ipam_obj = AviRegistry.lookup(ip, IPAM, Cloud.IPAM_NAME_VSPHERE)
         ipam_url = ipam_obj["url"]
-        response_csrf = requests.request("GET", ipam_url, headers=headers, verify=False)
+        response_csrf = avi_request("GET", ipam_url, headers=headers, verify=False)
         if response_csrf.status_code != 200:
             return None, response_csrf.text
         update = response_csrf.json()
@@ -208,13 +243,9 @@ class RaWorkloadClusterWorkflow:
         network_url = get_network_pg[0]
         networks.append({"nw_ref": network_url})
         update["internal_profile"]["usable_networks"] = networks
-        with open("./ipam_details_get.json", 'w') as file2:
-            json.dump(update, file2)
-        with open("./ipam_details_get.json", 'r') as file2:
-            updated_body = json.load(file2)
-        json_object = json.dumps(updated_body, indent=4)
-        response_csrf = requests.request("PUT", ipam_url, headers=headers, data=json_object,
-                                         verify=False)
+        json_object = json.dumps(update, indent=4)
+        response_csrf = avi_request("PUT", ipam_url, headers=headers, data=json_object,
+                                    verify=False)
         if response_csrf.status_code != 200:
             return None, response_csrf.text
         else:
@@ -285,7 +316,7 @@ class RaWorkloadClusterWorkflow:
             }
             return json.dumps(d), 500
         avienc_pass = self.jsonspec['tkgComponentSpec']['aviComponents']['aviPasswordBase64']
-        csrf2 = obtain_second_csrf(ip, avienc_pass)
+        csrf2 = obtain_session_csrf(ip, avienc_pass)
         if csrf2 is None:
             logger.error("Failed to get csrf from new set password")
             d = {
@@ -430,15 +461,7 @@ class RaWorkloadClusterWorkflow:
                     "ERROR_CODE": 500
                 }
                 return json.dumps(d), 500
-        with open("./newCloudInfo.json", 'r') as file2:
-            new_cloud_json = json.load(file2)
-        uuid = None
-        try:
-            uuid = new_cloud_json["uuid"]
-        except:
-            for re in new_cloud_json["results"]:
-                if re["name"] == Cloud.CLOUD_NAME_VSPHERE:
-                    uuid = re["uuid"]
+        uuid = avi_object_uuid(ip, csrf2, aviVersion, CLOUD, Cloud.CLOUD_NAME_VSPHERE)
         if uuid is None:
             logger.error("uuid not found ")
             d = {
@@ -468,25 +491,13 @@ class RaWorkloadClusterWorkflow:
                 }
                 return json.dumps(d), 500
             logger.info("Routing is cofigured")
-        commands = ["tanzu", "management-cluster", "kubeconfig", "get", management_cluster,
-                    "--admin"]
-        kubeContextCommand = grabKubectlCommand(commands, RegexPattern.SWITCH_CONTEXT_KUBECTL)
-        if kubeContextCommand is None:
-            logger.error("Failed to get switch to management cluster context command")
-            d = {
-                "responseType": "ERROR",
-                "msg": "Failed to get switch to management cluster context command",
-                "ERROR_CODE": 500
-            }
-            return json.dumps(d), 500
-        lisOfSwitchContextCommand = str(kubeContextCommand).split(" ")
-        status = runShellCommandAndReturnOutputAsList(lisOfSwitchContextCommand)
-        if status[1] != 0:
+        context = KubeContexts.get().use(management_cluster, management=True)
+        if context[0] is None:
             logger.error(
-                "Failed to get switch to management cluster context " + str(status[0]))
+                "Failed to get switch to management cluster context " + context[1])
             d = {
                 "responseType": "ERROR",
-                "msg": "Failed to get switch to management cluster context " + str(status[0]),
+                "msg": "Failed to get switch to management cluster context " + context[1],
                 "ERROR_CODE": 500
             }
             return json.dumps(d), 500
@@ -522,8 +533,9 @@ class RaWorkloadClusterWorkflow:
                 "ERROR_CODE": 500
             }
             return json.dumps(d), 500
-        self.createAkoFile(ip, wip[0], data_network_workload)
-        lisOfCommand = ["kubectl", "apply", "-f", "ako_vsphere_workloadset1.yaml",
+        workload_cluster_name = self.jsonspec['tkgWorkloadComponents']['tkgWorkloadClusterName']
+        yaml_file_path = self.createAkoFile(ip, wip[0], data_network_workload, workload_cluster_name)
+        lisOfCommand = ["kubectl", "apply", "-f", yaml_file_path,
                         "--validate=false"]
         status = runShellCommandAndReturnOutputAsList(lisOfCommand)
         if status[1] != 0:
@@ -546,26 +558,13 @@ class RaWorkloadClusterWorkflow:
     def connectToWorkLoadCluster(self):
         workload_cluster_name = self.jsonspec['tkgWorkloadComponents']['tkgWorkloadClusterName']
         logger.info("Connect to workload cluster")
-        commands_shared = ["tanzu", "cluster", "kubeconfig", "get", workload_cluster_name,
-                           "--admin"]
-        kubeContextCommand_shared = grabKubectlCommand(commands_shared,
-                                                       RegexPattern.SWITCH_CONTEXT_KUBECTL)
-        if kubeContextCommand_shared is None:
-            logger.error("Failed to get switch to workload cluster context command")
-            d = {
-                "responseType": "ERROR",
-                "msg": "Failed to get switch to workload cluster context command",
-                "ERROR_CODE": 500
-            }
-            return json.dumps(d), 500
-        lisOfSwitchContextCommand_shared = str(kubeContextCommand_shared).split(" ")
-        status = runShellCommandAndReturnOutputAsList(lisOfSwitchContextCommand_shared)
-        if status[1] != 0:
+        context = KubeContexts.get().use(workload_cluster_name)
+        if context[0] is None:
             logger.error(
-                "Failed to switch to workload cluster context " + str(status[0]))
+                "Failed to switch to workload cluster context " + context[1])
             d = {
                 "responseType": "ERROR",
-                "msg": "Failed to switch to workload cluster context " + str(status[0]),
+                "msg": "Failed to switch to workload cluster context " + context[1],
                 "ERROR_CODE": 500
             }
             return json.dumps(d), 500
@@ -583,7 +582,7 @@ class RaWorkloadClusterWorkflow:
             vsSpec = VsphereMasterSpec.parse_obj(json_dict)
             aviVersion = Avi_Tkgs_Version.VSPHERE_AVI_VERSION if TkgUtil.isEnvTkgs_ns(self.jsonspec) else Avi_Version.VSPHERE_AVI_VERSION
             vcpass_base64 = self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoPasswordBase64']
-            password = CmdHelper.decode_base64(vcpass_base64)
+            password = decode_secret(vcpass_base64)
             vcenter_username = self.jsonspec['envSpec']['vcenterDetails']['vcenterSsoUser']
             vcenter_ip = self.jsonspec['envSpec']['vcenterDetails']['vcenterAddress']
             cluster_name = self.jsonspec['envSpec']['vcenterDetails']['vcenterCluster']
@@ -592,7 +591,9 @@ class RaWorkloadClusterWorkflow:
             parent_resourcepool = self.jsonspec['envSpec']['vcenterDetails']['resourcePoolName']
 
             logger.info("Setting up SE groups for workload cluster...")
-            network_config = self.networkConfig(aviVersion, cluster_name,data_store)
+            # The SE group, IPAM profile and kubernetes OVA are shared by every workload cluster
+            with network_lock(self.run_config.root_dir, WORKLOAD_PRECONFIG_LOCK):
+                network_config = self.networkConfig(aviVersion, cluster_name,data_store)
             if network_config[1] != 200:
                 logger.error(network_config[0].json['msg'])
                 d = {
@@ -603,7 +604,7 @@ class RaWorkloadClusterWorkflow:
                 raise Exception
             if self.env == Env.VCF:
                 try:
-                    RaNSXTWorkflow(self.run_config).configure_workload_nsxt_config()
+                    self.context.workflow(RaNSXTWorkflow).configure_workload_nsxt_config()
                 except Exception as e:
                     logger.error("Failed to configure vcf for workload " + str(e))
                     d = {
@@ -795,30 +796,19 @@ class RaWorkloadClusterWorkflow:
                     "ERROR_CODE": 500
                 }
                 raise Exception
-            commands = ["tanzu", "management-cluster", "kubeconfig", "get", management_cluster,
-                        "--admin"]
-            kubeContextCommand = grabKubectlCommand(commands, RegexPattern.SWITCH_CONTEXT_KUBECTL)
-            if kubeContextCommand is None:
-                logger.error("Failed to get switch to management cluster context command")
-                d = {
-                    "responseType": "ERROR",
-                    "msg": "Failed to get switch to management cluster context command",
-                    "ERROR_CODE": 500
-                }
-                raise Exception
-            lisOfSwitchContextCommand = str(kubeContextCommand).split(" ")
-            status = runShellCommandAndReturnOutputAsList(lisOfSwitchContextCommand)
-            if status[1] != 0:
+            context = KubeContexts.get().use(management_cluster, management=True)
+            if context[0] is None:
                 logger.error(
-                    "Failed to get switch to management cluster context " + str(status[0]))
+                    "Failed to get switch to management cluster context " + context[1])
                 d = {
                     "responseType": "ERROR",
-                    "msg": "Failed to get switch to management cluster context " + str(status[0]),
+                    "msg": "Failed to get switch to management cluster context " + context[1],
                     "ERROR_CODE": 500
                 }
                 raise Exception
             lisOfCommand = ["kubectl", "label", "cluster",
-                            workload_cluster_name, AkoType.KEY + "=" + AkoType.type_ako_set]
+                            workload_cluster_name, AkoType.KEY + "=" + workload_ako_selector(workload_cluster_name),
+                            "--overwrite=true"]
             status = runShellCommandAndReturnOutputAsList(lisOfCommand)
             if status[1] != 0:
                 if not str(status[0]).__contains__("already has a value"):
@@ -1143,16 +1133,14 @@ class RaWorkloadClusterWorkflow:
     def createTkgWorkloadCluster(self, vc_ip, vc_user, vc_password):
         try:
             url_ = "https://" + vc_ip + "/"
-            sess = requests.post(url_ + "rest/com/vmware/cis/session", auth=(vc_user, vc_password), verify=False)
-            if sess.status_code != 200:
+            session_id = VcenterRestSession.get(vc_ip, vc_user, vc_password).session_id
+            if session_id is None:
                 d = {
                     "responseType": "ERROR",
                     "msg": "Failed to fetch session ID for vCenter - " + vc_ip,
                     "ERROR_CODE": 500
                 }
                 return json.dumps(d), 500
-            else:
-                session_id = sess.json()['value']
 
             header = {
                 "Accept": "application/json",
@@ -1163,9 +1151,9 @@ class RaWorkloadClusterWorkflow:
             id = getClusterID(vc_ip, vc_user, vc_password, cluster_name, self.jsonspec)
             if id[1] != 200:
                 return None, id[0]
-            clusterip_resp = requests.get(url_ + "api/vcenter/namespace-management/clusters/" + str(id[0]),
-                                          verify=False,
-                                          headers=header)
+            clusterip_resp = vcenter_request("GET", url_ + "api/vcenter/namespace-management/clusters/" + str(id[0]),
+                                             verify=False,
+                                             headers=header)
             if clusterip_resp.status_code != 200:
                 d = {
                     "responseType": "ERROR",
@@ -1458,18 +1446,14 @@ class RaWorkloadClusterWorkflow:
 
     def createNameSpace(self, vcenter_ip, vcenter_username, password):
         try:
-            sess = requests.post("https://" + str(vcenter_ip) + "/rest/com/vmware/cis/session",
-                                 auth=(vcenter_username, password),
-                                 verify=False)
-            if sess.status_code != 200:
+            vc_session = VcenterRestSession.get(vcenter_ip, vcenter_username, password).session_id
+            if vc_session is None:
                 d = {
                     "responseType": "ERROR",
                     "msg": "Failed to fetch session ID for vCenter - " + vcenter_ip,
                     "ERROR_CODE": 500
                 }
                 return json.dumps(d), 500
-            else:
-                vc_session = sess.json()['value']
 
             header = {
                 "Accept": "application/json",
@@ -1569,7 +1553,7 @@ class RaWorkloadClusterWorkflow:
             }
             json_object = json.dumps(body, indent=4)
             url = "https://" + str(vcenter_ip) + "/api/vcenter/namespaces/instances"
-            response_csrf = requests.request("POST", url, headers=header, data=json_object, verify=False)
+            response_csrf = vcenter_request("POST", url, headers=header, data=json_object, verify=False)
             if response_csrf.status_code != 204:
                 return None, "Failed to create name-space " + response_csrf.text
             count = 0
@@ -1585,13 +1569,10 @@ class RaWorkloadClusterWorkflow:
             return None, str(e)
 
     def checkWorkloadNetwork(self, vcenter_ip, vc_user, password, cluster_id, workload_network):
-        sess = requests.post("https://" + str(vcenter_ip) + "/rest/com/vmware/cis/session",
-                             auth=(vc_user, password), verify=False)
-        if sess.status_code != 200:
+        vc_session = VcenterRestSession.get(vcenter_ip, vc_user, password).session_id
+        if vc_session is None:
             logger.error("Connection to vCenter failed")
             return "Connection to vCenter failed", False
-        else:
-            vc_session = sess.json()['value']
         header = {
             "Accept": "application/json",
             "Content-Type": "application/json",
@@ -1599,7 +1580,7 @@ class RaWorkloadClusterWorkflow:
         }
 
         url = "https://" + vcenter_ip + "/api/vcenter/namespace-management/clusters/" + cluster_id + "/networks"
-        response_networks = requests.request("GET", url, headers=header, verify=False)
+        response_networks = vcenter_request("GET", url, headers=header, verify=False)
         if response_networks.status_code != 200:
             return "Failed to fetch workload networks for given cluster", False
 
@@ -1625,13 +1606,10 @@ class RaWorkloadClusterWorkflow:
         count_of_ip = getCountOfIpAdress(worker_cidr, start, end)
         worker_network_id = getDvPortGroupId(vCenter, vc_user, password, port_group_name, datacenter)
 
-        sess = requests.post("https://" + str(vCenter) + "/rest/com/vmware/cis/session",
-                             auth=(vc_user, password), verify=False)
-        if sess.status_code != 200:
+        vc_session = VcenterRestSession.get(vCenter, vc_user, password).session_id
+        if vc_session is None:
             logger.error("Connection to vCenter failed")
             return None, "Connection to vCenter failed"
-        else:
-            vc_session = sess.json()['value']
 
         header = {
             "Accept": "application/json",
@@ -1656,7 +1634,7 @@ class RaWorkloadClusterWorkflow:
 
         json_object = json.dumps(body, indent=4)
         url1 = "https://" + vCenter + "/api/vcenter/namespace-management/clusters/" + cluster_id + "/networks"
-        create_response = requests.request("POST", url1, headers=header, data=json_object, verify=False)
+        create_response = vcenter_request("POST", url1, headers=header, data=json_object, verify=False)
         if create_response.status_code == 204:
             return "SUCCESS", "Workload network created successfully"
         else:
@@ -1665,51 +1643,31 @@ class RaWorkloadClusterWorkflow:
     def checkClusterStatus(self, vc_ip, header, name_space, cluster_id):
         try:
             url = "https://" + str(vc_ip) + "/api/vcenter/namespaces/instances"
-            namespace_status = checkNameSpaceRunningStatus(url, header, name_space, cluster_id)
-            running = False
-            if namespace_status[0] != "SUCCESS":
-                logger.info("Namespace is not in running status... retrying")
-            else:
-                running = True
-
-            count = 0
-            while count < 60 and not running:
-                namespace_status = checkNameSpaceRunningStatus(url, header, name_space, cluster_id)
-                if namespace_status[0] == "SUCCESS":
-                    running = True
-                    break
-                count = count + 1
-                time.sleep(5)
-                logger.info("Waited for " + str(count * 1) + "s ...retrying")
-
+            running = wait_until(
+                lambda: checkNameSpaceRunningStatus(url, header, name_space, cluster_id)[0] == "SUCCESS",
+                timeout=300, interval=2, max_interval=5, description="Namespace " + name_space)
             if not running:
                 return None, "Namespace is not in running status - " + name_space + ". Waited for " + str(
-                    count * 5) + "seconds"
+                    int(running.elapsed)) + "seconds"
 
             logger.info("Checking Cluster WCP status...")
             url1 = "https://" + vc_ip + "/api/vcenter/namespace-management/clusters/" + str(cluster_id)
-            count = 0
-            found = False
-            while count < 60 and not found:
-                response_csrf = requests.request("GET", url1, headers=header, verify=False)
-                try:
-                    if response_csrf.json()["config_status"] == "RUNNING":
-                        found = True
-                        break
-                    else:
-                        if response_csrf.json()["config_status"] == "ERROR":
-                            return None, "WCP status in ERROR"
-                    logger.info("Cluster config status " + response_csrf.json()["config_status"])
-                except:
-                    pass
-                time.sleep(20)
-                count = count + 1
-                logger.info("Waited " + str(count * 20) + "s, retrying")
+
+            def _config_status():
+                response_csrf = vcenter_request("GET", url1, headers=header, verify=False)
+                config_status = response_csrf.json()["config_status"]
+                logger.info("Cluster config status " + config_status)
+                return config_status if config_status in ["RUNNING", "ERROR"] else None
+
+            found = wait_until(_config_status, timeout=1200, interval=5, max_interval=20,
+                               description="WCP config status", ignore_errors=True)
+            if found.value == "ERROR":
+                return None, "WCP status in ERROR"
             if not found:
-                logger.error("Cluster is not running on waiting " + str(count * 20))
+                logger.error("Cluster is not running on waiting " + str(int(found.elapsed)))
                 return None, "Failed"
             else:
-                logger.info("WCP config status " + response_csrf.json()["config_status"])
+                logger.info("WCP config status " + found.value)
 
             return "SUCCESS", "WCP and Namespace configuration check pass"
         except Exception as e:
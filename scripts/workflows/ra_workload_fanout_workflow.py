@@ -0,0 +1,165 @@
+#  Copyright 2022 VMware, Inc
+#  SPDX-License-Identifier: BSD-2-Clause
+
+import os
+import shutil
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from constants.constants import Paths
+from lib.kube_context import default_kubeconfig
+from lib.tkg_cli_client import TkgCliClient
+from model.run_config import RunConfig
+from model.spec_store import SpecStore, WORKLOAD_CLUSTER_ENV, workload_cluster_names, workload_cluster_spec
+from model.status import HealthEnum, WorkloadClusterInfo, WorkloadExtensionState, new_extension_state
+from util.file_helper import FileHelper
+from util.git_helper import Git
+from util.logger_helper import LoggerHelper
+from util.state_merge import STATE_FRAGMENT_ENV, fragment_path
+from util.tracing import trace_methods
+
+logger = LoggerHelper.get_logger(name='ra_workload_fanout_workflow')
+
+MAIN_PY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "__main__.py")
+# Files in the working directory up to this size are copied for every worker, larger ones such as
+# downloaded binaries are only read and are linked instead
+WORKER_COPY_MAX_SIZE = 16 * 1024 * 1024
+
+
+@trace_methods()
+class RaWorkloadFanoutWorkflow:
+    """
+    Deploy every workload cluster of tkgWorkloadClusters at once, each one in its own
+    `workload-clusters deploy` process with a private kubeconfig so context switches of one
+    cluster never leak into another. State of each cluster is folded into state.yml as it finishes.
+    """
+
+    def __init__(self, run_config: RunConfig, workers=4):
+        self.run_config = run_config
+        self.workers = max(1, int(workers))
+        self.jsonspec = SpecStore.jsonspec(os.path.join(self.run_config.root_dir, Paths.MASTER_SPEC_PATH))
+        self.state_file_path = os.path.join(self.run_config.root_dir, Paths.STATE_PATH)
+        self._lock = threading.Lock()
+
+    def _worker_dir(self, name):
+        return os.path.abspath(os.path.join(Paths.TMP_DIR, "workload-" + name))
+
+    def _worker_cwd(self, name):
+        """
+        Working directory of the deploy process of one cluster. Files the workflow writes in
+        its working directory, such as tmc_proxy.yaml, stay private to the cluster, while the
+        directories relative helpers are run from, such as ./common, are linked from the current one.
+        """
+        cwd = os.path.join(self._worker_dir(name), "cwd")
+        if os.path.isdir(cwd):
+            shutil.rmtree(cwd)
+        os.makedirs(cwd)
+        for entry in os.scandir(os.getcwd()):
+            if entry.name == Paths.TMP_DIR:
+                continue
+            target = os.path.join(cwd, entry.name)
+            if entry.is_file(follow_symlinks=False) and entry.stat().st_size <= WORKER_COPY_MAX_SIZE:
+                shutil.copy2(entry.path, target)
+            else:
+                os.symlink(os.path.abspath(entry.path), target)
+        return cwd
+
+    def _worker_env(self, name):
+        """
+        Environment of the deploy process of one cluster: the master spec narrowed to the
+        cluster, a state fragment of its own and a copy of the current kubeconfig
+        """
+        worker_dir = self._worker_dir(name)
+        os.makedirs(worker_dir, exist_ok=True)
+        kubeconfig = os.path.join(worker_dir, "config")
+        if os.path.exists(default_kubeconfig()):
+            shutil.copyfile(default_kubeconfig(), kubeconfig)
+        env = dict(os.environ)
+        env[WORKLOAD_CLUSTER_ENV] = name
+        env[STATE_FRAGMENT_ENV] = "workload-" + name
+        env["KUBECONFIG"] = kubeconfig
+        return env
+
+    def _deploy(self, name):
+        logger.info("Deploying workload cluster " + name)
+        env = self._worker_env(name)
+        process = subprocess.Popen([sys.executable, MAIN_PY, "--root-dir", os.path.abspath(self.run_config.root_dir),
+                                    "workload-clusters", "deploy"], env=env, cwd=self._worker_cwd(name),
+                                   stdout=subprocess.PIPE, stderr=subprocess.STDOUT, universal_newlines=True)
+        for line in process.stdout:
+            logger.info("[" + name + "] " + line.rstrip())
+        process.wait()
+        if process.returncode != 0:
+            logger.error("Deploy of workload cluster " + name + " exited with " + str(process.returncode))
+        with self._lock:
+            try:
+                self._merge_kubeconfig(env["KUBECONFIG"])
+                health = self._record(name)
+            except Exception as e:
+                logger.error("Failed to record state of workload cluster " + name + " " + str(e))
+                health = HealthEnum.DOWN
+            fragment = fragment_path(self.state_file_path, env[STATE_FRAGMENT_ENV])
+            if os.path.exists(fragment):
+                os.remove(fragment)
+        return name, health
+
+    def _merge_kubeconfig(self, kubeconfig):
+        """
+        Add the contexts created by a worker to the current kubeconfig
+        """
+        target = default_kubeconfig()
+        configs = [target, kubeconfig] if os.path.exists(target) else [kubeconfig]
+        if not os.path.exists(kubeconfig):
+            return
+        env = dict(os.environ, KUBECONFIG=os.pathsep.join(configs))
+        merged = subprocess.run(["kubectl", "config", "view", "--flatten"], env=env,
+                                capture_output=True).stdout.decode()
+        if not merged:
+            logger.warning("Failed to merge kubeconfig " + kubeconfig)
+            return
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "w") as f:
+            f.write(merged)
+
+    def _record(self, name):
+        """
+        Add or update the state.yml entry of the cluster, the caller holds the lock
+        :return: health of the cluster
+        """
+        clusters = TkgCliClient().get_all_clusters()
+        cluster = next((c for c in clusters if c["name"] == name), None)
+        health = HealthEnum.UP if cluster is not None and cluster["status"] == "running" else HealthEnum.DOWN
+        state = FileHelper.load_state(self.state_file_path)
+        info = next((wl for wl in state.workload_clusters if wl.name == name), None)
+        if info is None:
+            info = next((wl for wl in state.workload_clusters if not wl.name), None)
+        if info is None:
+            extensions = WorkloadExtensionState(certManager=new_extension_state(), contour=new_extension_state(),
+                                                prometheus=new_extension_state(), grafana=new_extension_state())
+            info = WorkloadClusterInfo(deployed=False, version="", extensions=extensions)
+            state.workload_clusters.append(info)
+        info.name = name
+        info.deployed = cluster is not None
+        info.health = health
+        info.version = str(workload_cluster_spec(self.jsonspec, name)['tkgWorkloadComponents']
+                           .get('tkgWorkloadKubeVersion') or info.version)
+        FileHelper.dump_state(state, self.state_file_path)
+        return health
+
+    def deploy_all(self):
+        """
+        :return: dict cluster name -> health
+        """
+        names = workload_cluster_names(self.jsonspec)
+        logger.info("Deploying " + str(len(names)) + " workload clusters, " + str(self.workers) + " at a time")
+        with ThreadPoolExecutor(max_workers=min(self.workers, len(names))) as executor:
+            results = dict(executor.map(self._deploy, names))
+        Git.add_all_and_commit(os.path.dirname(self.state_file_path), "Updated workload clusters")
+        for name, health in results.items():
+            if health == HealthEnum.UP:
+                logger.info("Workload cluster " + name + " is UP")
+            else:
+                logger.error("Workload cluster " + name + " is " + str(health.value))
+        return results